@@ -0,0 +1,95 @@
+"""Benchmark: PyTorch vs ONNX Runtime vs int8-quantized ONNX vs static embedding backends.
+
+Embeds the same corpus (paragraphs and one-line notes from the repository's
+``*.exp.md`` files) with ``Embedder`` on each backend and reports:
+
+- load: constructing the Embedder (the first ONNX run includes the export and
+  its parity check, the first static run the distillation; later runs load
+  them from SEMCHE_ONNX_DIR / SEMCHE_STATIC_DIR)
+- ingest: ``embed_batch`` throughput in texts per second
+- query: ``embed_query`` latency for short queries (query cache disabled)
+- parity: cosine similarity of each text's embedding to the torch backend's;
+  for static (another vector space) the correlation of the pairwise
+  similarities of all texts with the torch backend's
+
+Usage:
+    uv run python benchmarks/bench_embed_backends.py --texts 256
+    uv run python benchmarks/bench_embed_backends.py --model /path/to/sentence-transformer --backends torch onnx-int8
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.semche.embedding import BACKENDS, DEFAULT_BATCH_SIZE, Embedder  # noqa: E402
+from src.semche.onnx_backend import cosine_similarities  # noqa: E402
+from src.semche.static_backend import similarity_correlation  # noqa: E402
+
+ROOT = Path(__file__).resolve().parents[1]
+QUERIES = [
+    "形態素解析",
+    "トークンキャッシュの再利用",
+    "ファイル種別で絞り込む",
+    "ベクトル検索とBM25の統合",
+    "インデックスを再構築する",
+    "hybrid search",
+]
+
+
+def load_texts(n_texts: int, seed: int) -> list:
+    rng = random.Random(seed)
+    texts = []
+    for path in sorted(ROOT.glob("src/**/*.exp.md")):
+        text = path.read_text(encoding="utf-8")
+        texts.extend(p.strip() for p in text.split("\n\n") if len(p.strip()) > 20)
+    return rng.sample(texts, min(n_texts, len(texts)))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/stsb-xlm-r-multilingual")
+    parser.add_argument("--texts", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--queries", type=int, default=60, help="embed_query calls timed per backend")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts = load_texts(args.texts, args.seed)
+    print(f"{len(texts)} texts, {sum(map(len, texts))} characters, batch size {args.batch_size}")
+    reference = None
+    for backend in ["torch"] + [b for b in args.backends if b != "torch"]:
+        start = time.perf_counter()
+        embedder = Embedder(model_name=args.model, backend=backend, query_cache_size=0)
+        t_load = time.perf_counter() - start
+        embedder.embed_batch(texts[:args.batch_size], batch_size=args.batch_size)  # warm-up
+
+        start = time.perf_counter()
+        matrix = embedder.embed_batch(texts, batch_size=args.batch_size)
+        t_ingest = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(args.queries):
+            embedder.embed_query(QUERIES[i % len(QUERIES)])
+        t_query = (time.perf_counter() - start) / args.queries
+
+        if reference is None:
+            reference = matrix
+        if matrix.shape == reference.shape:
+            similarity = cosine_similarities(reference, matrix)
+            parity = f"parity min {similarity.min():.4f} mean {np.mean(similarity):.4f}"
+        else:
+            parity = f"similarity correlation {similarity_correlation(reference, matrix):.4f}"
+        if backend in args.backends:
+            print(f"{backend:10s} load {t_load:6.2f} s  ingest {len(texts) / t_ingest:7.1f} texts/s "
+                  f"({t_ingest:6.2f} s)  query {t_query * 1000:7.3f} ms  {parity}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,96 @@
+"""Benchmark: per-text vs fixed-order vs length-sorted embedding batches.
+
+Embeds a corpus that mixes one-line notes with long design documents (both
+taken from the repository's ``*.exp.md`` files, shuffled) three ways and
+reports throughput in real (non-padding) tokens per second:
+
+- per text: one forward pass per text (``batch_size=1``, what ``doc-update`` did
+  before ``embed_batch``)
+- fixed order: ``embed_batch(sort_by_length=False)``, batches in input order
+- length sorted: ``embed_batch()``, batches of texts with similar token counts
+
+The padded token count (what the model actually computes) is reported next to
+the real token count.
+
+Usage:
+    uv run python benchmarks/bench_embed_batching.py --texts 512
+    uv run python benchmarks/bench_embed_batching.py --model /path/to/sentence-transformer
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.semche.embedding import DEFAULT_BATCH_SIZE, Embedder  # noqa: E402
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def load_corpus(n_texts: int, long_ratio: float, seed: int) -> list:
+    """One-line notes (single lines) mixed with long documents (runs of paragraphs)."""
+    rng = random.Random(seed)
+    lines, paragraphs = [], []
+    for path in sorted(ROOT.glob("src/**/*.exp.md")):
+        text = path.read_text(encoding="utf-8")
+        lines.extend(line.strip("#-* ") for line in text.splitlines() if 10 < len(line.strip()) < 80)
+        paragraphs.extend(p.strip() for p in text.split("\n\n") if len(p.strip()) > 40)
+    n_long = int(n_texts * long_ratio)
+    texts = ["\n\n".join(rng.choices(paragraphs, k=6)) for _ in range(n_long)]
+    texts += rng.choices(lines, k=n_texts - n_long)
+    rng.shuffle(texts)
+    return texts
+
+
+def padded_tokens(lengths: np.ndarray, order: np.ndarray, batch_size: int) -> int:
+    """Tokens computed when every batch is padded to its longest text."""
+    return sum(
+        int(lengths[order[start:start + batch_size]].max()) * len(order[start:start + batch_size])
+        for start in range(0, len(order), batch_size)
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/stsb-xlm-r-multilingual")
+    parser.add_argument("--texts", type=int, default=512)
+    parser.add_argument("--long-ratio", type=float, default=0.2, help="Share of long documents")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    embedder = Embedder(model_name=args.model)
+    texts = load_corpus(args.texts, args.long_ratio, args.seed)
+    start = time.perf_counter()
+    lengths = embedder.token_lengths(texts)
+    t_lengths = time.perf_counter() - start
+    tokens = int(lengths.sum())
+    print(f"{len(texts)} texts, {tokens} tokens (median {int(np.median(lengths))}, max {int(lengths.max())}); "
+          f"counting tokens took {t_lengths * 1000:.0f} ms")
+
+    embedder.embed_batch(texts[:args.batch_size], batch_size=args.batch_size)  # warm-up
+    modes = [
+        ("per text", 1, False, np.arange(len(texts))),
+        ("fixed order", args.batch_size, False, np.arange(len(texts))),
+        ("length sorted", args.batch_size, True, np.argsort(-lengths, kind="stable")),
+    ]
+    results = {}
+    for label, batch_size, sort_by_length, order in modes:
+        start = time.perf_counter()
+        results[label] = embedder.embed_batch(texts, batch_size=batch_size, sort_by_length=sort_by_length)
+        elapsed = time.perf_counter() - start
+        padded = padded_tokens(lengths, order, batch_size)
+        print(f"{label:14s} {elapsed:7.2f} s  {tokens / elapsed:8.0f} tokens/s  "
+              f"padded tokens {padded} ({padded / tokens:.2f}x)")
+
+    diff = np.abs(results["length sorted"] - results["fixed order"]).max()
+    print(f"max |length sorted - fixed order| = {diff:.2e}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
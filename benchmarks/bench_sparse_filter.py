@@ -0,0 +1,71 @@
+"""Benchmark: BM25 search filtered by file type, per-query subset index vs document mask.
+
+Builds a synthetic corpus whose documents are spread over a few file types,
+then answers queries restricted to one file type either by building a
+throwaway index over the matching documents (the previous filtered path of
+``HybridRetriever``, minus the ChromaDB fetch it also paid for) or by masking
+the posting lists of the full index. The first search with a filter builds its
+mask; later ones reuse it.
+
+Usage:
+    uv run python benchmarks/bench_sparse_filter.py --docs 50000 --file-types 4
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.bench_sparse_topk import make_corpus  # noqa: E402
+from src.semche.sparse_encoder import BM25SparseEncoder  # noqa: E402
+
+QUERIES = ["t1 t100 t5000", "t3 t42", "t7 t250 t900 t12000"]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--vocab", type=int, default=20000)
+    parser.add_argument("--file-types", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    texts = [" ".join(tokens) for tokens in make_corpus(args.docs, args.vocab, rng)]
+    ids = [f"/docs/{i}.md" for i in range(len(texts))]
+    file_types = [f"type{i % args.file_types}" for i in range(len(texts))]
+
+    encoder = BM25SparseEncoder(tokenizer=str.split, engine="inverted")
+    encoder.build_index(texts, ids, file_types)
+    subset = [i for i, ft in enumerate(file_types) if ft == "type0"]
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for query in QUERIES:
+            throwaway = BM25SparseEncoder(tokenizer=str.split, engine="inverted")
+            throwaway.build_index([texts[i] for i in subset], [ids[i] for i in subset])
+            throwaway.search(query, top_k=10)
+    t_subset = (time.perf_counter() - start) / (args.repeat * len(QUERIES))
+
+    start = time.perf_counter()
+    encoder.search(QUERIES[0], top_k=10, file_type="type0")
+    t_first = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for query in QUERIES:
+            encoder.search(query, top_k=10, file_type="type0")
+    t_mask = (time.perf_counter() - start) / (args.repeat * len(QUERIES))
+
+    print(f"docs={args.docs} file_types={args.file_types} (filtered to {len(subset)} documents)")
+    print(f"subset index per query: {t_subset * 1000:8.2f} ms/query")
+    print(f"document mask:          {t_mask * 1000:8.2f} ms/query  ({t_subset / t_mask:.0f}x)")
+    print(f"  first query (builds the mask): {t_first * 1000:.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
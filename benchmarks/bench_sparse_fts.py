@@ -0,0 +1,98 @@
+"""Benchmark: in-memory inverted index vs SQLite FTS5 sparse backend.
+
+Builds both persistent backends from the same synthetic corpus (held by a
+stand-in for ChromaDBManager, so no collection or embedding model is needed)
+and reports build time, on-disk size, resident memory added by loading the
+index and running a first query (Linux) and query latency.
+
+Usage:
+    uv run python benchmarks/bench_sparse_fts.py --docs 50000
+"""
+import argparse
+import gc
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.bench_sparse_topk import make_corpus  # noqa: E402
+from src.semche.fts_index import FTS_FILENAME, FTS5SparseIndex  # noqa: E402
+from src.semche.sparse_index import SPARSE_INDEX_DIRNAME, SparseIndex  # noqa: E402
+
+QUERIES = ["t1 t100 t5000", "t3 t42", "t7 t250 t900 t12000"]
+
+
+class CorpusSource:
+    """Serves the synthetic corpus the way ChromaDBManager does for a rebuild."""
+
+    def __init__(self, directory: str, texts: list, ids: list) -> None:
+        self.persist_directory = directory
+        self.items = [{"id": i, "document": t, "metadata": {}} for i, t in zip(ids, texts)]
+
+    def count(self) -> int:
+        return len(self.items)
+
+    def get_all_documents(self, where=None, include_documents=True) -> list:
+        return self.items
+
+
+def rss_mb() -> float:
+    """Current resident set size (Linux)."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--vocab", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    texts = [" ".join(tokens) for tokens in make_corpus(args.docs, args.vocab, rng)]
+    ids = [f"/docs/{i}.md" for i in range(len(texts))]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, cls in [("inverted (in memory)", SparseIndex), ("fts5 (SQLite)", FTS5SparseIndex)]:
+            source = CorpusSource(str(Path(tmp) / label.split()[0]), texts, ids)
+            index = cls(source, tokenizer=str.split)
+            start = time.perf_counter()
+            index.load()
+            t_build = time.perf_counter() - start
+            if cls is SparseIndex:
+                size = sum(
+                    p.stat().st_size
+                    for p in (Path(source.persist_directory) / SPARSE_INDEX_DIRNAME).iterdir()
+                    if p.name.endswith(".npy") or p.suffix in (".json", ".bin")
+                )
+            else:
+                size = (Path(source.persist_directory) / FTS_FILENAME).stat().st_size
+            del index
+            gc.collect()
+
+            before = rss_mb()
+            loaded = cls(source, tokenizer=str.split)
+            loaded.load()
+            loaded.search(QUERIES[0], top_k=10)
+            grown = rss_mb() - before
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                for query in QUERIES:
+                    loaded.search(query, top_k=10)
+            t_query = (time.perf_counter() - start) / (args.repeat * len(QUERIES))
+            print(f"{label:22s} build={t_build:6.2f} s  size={size / 1e6:7.1f} MB  "
+                  f"RSS growth={grown:7.1f} MB  query={t_query * 1000:7.2f} ms")
+            del loaded
+            gc.collect()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,59 @@
+"""Benchmark: BM25 index load time, legacy pickle vs memory-mapped binary format.
+
+Builds a synthetic corpus, saves it with both formats and times
+``BM25SparseEncoder.load`` plus the first query.
+
+Usage:
+    uv run python benchmarks/bench_sparse_load.py --docs 50000
+"""
+import argparse
+import gc
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.bench_sparse_topk import make_corpus  # noqa: E402
+from src.semche.sparse_encoder import BM25SparseEncoder  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--vocab", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    texts = [" ".join(tokens) for tokens in make_corpus(args.docs, args.vocab, rng)]
+    ids = [f"/docs/{i}.md" for i in range(len(texts))]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, engine in [("pickle (rank_bm25)", "rank_bm25"), ("binary mmap (inverted)", "inverted")]:
+            directory = Path(tmp) / engine
+            encoder = BM25SparseEncoder(tokenizer=str.split, engine=engine)
+            encoder.build_index(texts, ids)
+            encoder.save(str(directory))
+            size = sum(p.stat().st_size for p in directory.iterdir())
+            del encoder
+            gc.collect()
+
+            start = time.perf_counter()
+            loaded = BM25SparseEncoder(tokenizer=str.split)
+            loaded.load(str(directory))
+            t_load = time.perf_counter() - start
+            start = time.perf_counter()
+            loaded.search("t1 t100 t5000", top_k=10)
+            t_query = time.perf_counter() - start
+            print(f"{label:26s} size={size / 1e6:7.1f} MB  load={t_load * 1000:8.1f} ms  "
+                  f"first query={t_query * 1000:6.1f} ms")
+            del loaded
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
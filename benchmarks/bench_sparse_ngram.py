@@ -0,0 +1,87 @@
+"""Benchmark: MeCab vs character n-gram tokenizers for the BM25 sparse index.
+
+Builds an ``inverted`` BM25SparseEncoder from the same Japanese corpus with each
+tokenizer (no token cache, serial tokenization) and reports tokenization time
+alone, index build time (tokenization included), on-disk index size and query
+latency. The corpus is made of paragraphs sampled from the repository's
+Japanese design documents (``*.exp.md``).
+
+Usage:
+    uv run python benchmarks/bench_sparse_ngram.py --docs 20000
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.semche.ngram_tokenizer import CharNgramTokenizer  # noqa: E402
+from src.semche.sparse_encoder import BM25SparseEncoder  # noqa: E402
+
+ROOT = Path(__file__).resolve().parents[1]
+QUERIES = [
+    "形態素解析",
+    "トークンキャッシュの再利用",
+    "ファイル種別で絞り込む",
+    "ベクトル検索とBM25の統合",
+    "インデックスを再構築する",
+    "hybrid search",
+]
+
+
+def load_paragraphs() -> list:
+    paragraphs = []
+    for path in sorted(ROOT.glob("src/**/*.exp.md")):
+        paragraphs.extend(p.strip() for p in path.read_text(encoding="utf-8").split("\n\n") if len(p.strip()) > 20)
+    return paragraphs
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--paragraphs", type=int, default=8, help="Paragraphs per document")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    paragraphs = load_paragraphs()
+    texts = ["\n\n".join(rng.choices(paragraphs, k=args.paragraphs)) for _ in range(args.docs)]
+    ids = [f"/docs/{i}.md" for i in range(len(texts))]
+    print(f"{len(texts)} documents, {sum(map(len, texts)) / 1e6:.1f} M characters")
+
+    modes = [
+        ("mecab", None),
+        ("ngram (2)", CharNgramTokenizer(sizes=(2,))),
+        ("ngram (2, 3)", CharNgramTokenizer(sizes=(2, 3))),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, tokenizer in modes:
+            encoder = BM25SparseEncoder(tokenizer=tokenizer, engine="inverted")
+            start = time.perf_counter()
+            encoder.tokenize_documents(texts)
+            t_tokenize = time.perf_counter() - start
+            start = time.perf_counter()
+            encoder.build_index(texts, ids)
+            t_build = time.perf_counter() - start
+
+            directory = Path(tmp) / label.replace(" ", "")
+            encoder.save(str(directory))
+            size = sum(p.stat().st_size for p in directory.iterdir())
+
+            encoder.search(QUERIES[0], top_k=10)
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                for query in QUERIES:
+                    encoder.search(query, top_k=10)
+            t_query = (time.perf_counter() - start) / (args.repeat * len(QUERIES))
+            print(f"{label:13s} tokenize={t_tokenize:6.2f} s  build={t_build:6.2f} s  size={size / 1e6:6.1f} MB  "
+                  f"query={t_query * 1000:6.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
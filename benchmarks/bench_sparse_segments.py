@@ -0,0 +1,107 @@
+"""Benchmark: persisted single-document BM25 writes, segmented save vs full rewrite.
+
+Builds and saves a synthetic corpus, then replaces documents one at a time and
+saves after each write, either by compacting the index and rewriting every
+array (the previous ``save`` behaviour) or by flushing the write into a new
+segment. The segmented writes are timed twice: on the freshly built encoder
+and on an encoder loaded from disk (the MCP server and ``doc-update`` always
+start from a loaded index, whose vocabulary is a memory-mapped string table).
+Finally compares query latency with many small segments against the same
+index after merging them.
+
+Usage:
+    uv run python benchmarks/bench_sparse_segments.py --docs 50000 --updates 50
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.bench_sparse_topk import make_corpus  # noqa: E402
+from src.semche.index_format import write_index  # noqa: E402
+from src.semche.sparse_encoder import BM25SparseEncoder  # noqa: E402
+
+QUERIES = ["t1 t100 t5000", "t3 t42", "t7 t250 t900 t12000"]
+
+
+def _query_ms(encoder: BM25SparseEncoder, repeat: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in QUERIES:
+            encoder.search(query, top_k=10)
+    return (time.perf_counter() - start) / (repeat * len(QUERIES)) * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--vocab", type=int, default=20000)
+    parser.add_argument("--updates", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    texts = [" ".join(tokens) for tokens in make_corpus(args.docs, args.vocab, rng)]
+    ids = [f"/docs/{i}.md" for i in range(len(texts))]
+    new_texts = [" ".join(tokens) for tokens in make_corpus(args.updates, args.vocab, rng)]
+    targets = [ids[i] for i in rng.choice(len(ids), size=args.updates, replace=False)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        full_dir, seg_dir = Path(tmp) / "full", Path(tmp) / "segmented"
+
+        encoder = BM25SparseEncoder(tokenizer=str.split, engine="inverted")
+        encoder.build_index(texts, ids)
+        encoder.save(str(full_dir))
+        start = time.perf_counter()
+        for did, text in zip(targets, new_texts):
+            encoder.add_documents([text], [did])
+            live = encoder.bm25.compact()
+            encoder.corpus_ids = [encoder.corpus_ids[i] for i in live]
+            encoder._positions = None
+            write_index(full_dir, encoder.bm25, encoder.corpus_ids)
+        t_full = (time.perf_counter() - start) / args.updates
+
+        encoder = BM25SparseEncoder(tokenizer=str.split, engine="inverted")
+        encoder.build_index(texts, ids)
+        encoder.save(str(seg_dir))
+        start = time.perf_counter()
+        for did, text in zip(targets, new_texts):
+            encoder.add_documents([text], [did])
+            encoder.save(str(seg_dir))
+        t_segment = (time.perf_counter() - start) / args.updates
+
+        loaded = BM25SparseEncoder(tokenizer=str.split, engine="inverted")
+        loaded.load(str(seg_dir))
+        start = time.perf_counter()
+        for did, text in zip(targets, new_texts):
+            loaded.add_documents([text], [did])
+            loaded.save(str(seg_dir))
+        t_loaded = (time.perf_counter() - start) / args.updates
+
+        bm25 = encoder.bm25
+        n_segments = len(bm25.segments)
+        q_segments = _query_ms(encoder)
+        start = time.perf_counter()
+        plan = bm25.plan_merge(max_segments=1)
+        while plan:
+            bm25.replace_segments(plan, bm25.merge_segments(plan))
+            plan = bm25.plan_merge(max_segments=1)
+        t_merge = time.perf_counter() - start
+        q_merged = _query_ms(encoder)
+
+    print(f"docs={args.docs} updates={args.updates} (each saved to disk)")
+    print(f"full rewrite:   {t_full * 1000:8.2f} ms/write")
+    print(f"new segment:    {t_segment * 1000:8.2f} ms/write  ({t_full / t_segment:.0f}x)")
+    print(f"  after load(): {t_loaded * 1000:8.2f} ms/write  ({t_full / t_loaded:.0f}x)")
+    print(f"query, {n_segments:3d} segments: {q_segments:6.2f} ms")
+    print(f"merge to 1 segment: {t_merge * 1000:6.1f} ms, query: {q_merged:6.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
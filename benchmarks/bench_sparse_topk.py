@@ -0,0 +1,90 @@
+"""Benchmark: MaxScore top-k pruning vs exhaustive BM25 scoring.
+
+Builds a synthetic Zipf-distributed corpus (no MeCab needed) and times long
+multi-term queries with
+  - exhaustive: score every document containing a query term, then select top-k
+  - pruned:     InvertedBM25Index.top_k (MaxScore dynamic pruning)
+
+Usage:
+    uv run python benchmarks/bench_sparse_topk.py --docs 50000 --query-len 12 --top-k 10
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.semche.inverted_index import InvertedBM25Index, select_top_k  # noqa: E402
+
+
+def make_corpus(n_docs: int, vocab_size: int, rng: np.random.Generator) -> list:
+    probs = 1.0 / np.arange(1, vocab_size + 1)
+    probs /= probs.sum()
+    lengths = rng.integers(20, 200, size=n_docs)
+    terms = rng.choice(vocab_size, size=int(lengths.sum()), p=probs)
+    corpus = []
+    offset = 0
+    for n in lengths:
+        corpus.append([f"t{t}" for t in terms[offset:offset + n]])
+        offset += n
+    return corpus
+
+
+def make_queries(n_queries: int, query_len: int, vocab_size: int, rng: np.random.Generator) -> list:
+    # Mix of frequent (head) and rare (tail) terms, like natural-language queries
+    queries = []
+    for _ in range(n_queries):
+        head = rng.integers(0, 50, size=query_len // 2)
+        tail = rng.integers(50, vocab_size, size=query_len - query_len // 2)
+        queries.append([f"t{t}" for t in np.concatenate([head, tail])])
+    return queries
+
+
+def bench(fn, queries) -> float:
+    start = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--vocab", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--query-len", type=int, default=12)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    corpus = make_corpus(args.docs, args.vocab, rng)
+    queries = make_queries(args.queries, args.query_len, args.vocab, rng)
+
+    start = time.perf_counter()
+    index = InvertedBM25Index(corpus)
+    print(f"index: {index!r} built in {time.perf_counter() - start:.2f}s")
+
+    def exhaustive(q):
+        return select_top_k(*index.score_candidates(q), args.top_k)
+
+    def pruned(q):
+        return index.top_k(q, args.top_k)
+
+    # Sanity check: both return the same top-k scores
+    for q in queries[:20]:
+        np.testing.assert_allclose(exhaustive(q)[1], pruned(q)[1], rtol=1e-9)
+
+    t_exhaustive = bench(exhaustive, queries)
+    t_pruned = bench(pruned, queries)
+    print(f"queries: {args.queries} x {args.query_len} terms, top_k={args.top_k}")
+    print(f"exhaustive: {t_exhaustive:8.3f} ms/query")
+    print(f"pruned:     {t_pruned:8.3f} ms/query  ({t_exhaustive / t_pruned:.2f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
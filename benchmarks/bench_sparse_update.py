@@ -0,0 +1,69 @@
+"""Benchmark: single-document BM25 updates, full rebuild vs incremental.
+
+Builds a synthetic corpus, then replaces and removes documents one at a time,
+either by rebuilding the index from the merged corpus (the previous
+``add_documents`` behaviour) or with the incremental ``add_documents`` /
+``remove_documents``, each followed by a query.
+
+Usage:
+    uv run python benchmarks/bench_sparse_update.py --docs 50000 --updates 50
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.bench_sparse_topk import make_corpus  # noqa: E402
+from src.semche.sparse_encoder import BM25SparseEncoder  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--vocab", type=int, default=20000)
+    parser.add_argument("--updates", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    texts = [" ".join(tokens) for tokens in make_corpus(args.docs, args.vocab, rng)]
+    ids = [f"/docs/{i}.md" for i in range(len(texts))]
+    new_texts = [" ".join(tokens) for tokens in make_corpus(args.updates, args.vocab, rng)]
+    targets = [ids[i] for i in rng.choice(len(ids), size=args.updates, replace=False)]
+
+    encoder = BM25SparseEncoder(tokenizer=str.split, engine="inverted")
+    encoder.build_index(texts, ids)
+    corpus = dict(zip(ids, texts))
+    start = time.perf_counter()
+    for did, text in zip(targets, new_texts):
+        corpus[did] = text
+        encoder.build_index(list(corpus.values()), list(corpus))
+        encoder.search("t1 t100 t5000", top_k=10)
+    t_rebuild = (time.perf_counter() - start) / args.updates
+
+    encoder = BM25SparseEncoder(tokenizer=str.split, engine="inverted")
+    encoder.build_index(texts, ids)
+    start = time.perf_counter()
+    for did, text in zip(targets, new_texts):
+        encoder.add_documents([text], [did])
+        encoder.search("t1 t100 t5000", top_k=10)
+    t_update = (time.perf_counter() - start) / args.updates
+    start = time.perf_counter()
+    for did in targets:
+        encoder.remove_documents([did])
+        encoder.search("t1 t100 t5000", top_k=10)
+    t_remove = (time.perf_counter() - start) / args.updates
+
+    print(f"docs={args.docs} updates={args.updates} (each followed by one query)")
+    print(f"rebuild:            {t_rebuild * 1000:8.2f} ms/update")
+    print(f"incremental update: {t_update * 1000:8.2f} ms/update  ({t_rebuild / t_update:.0f}x)")
+    print(f"incremental remove: {t_remove * 1000:8.2f} ms/remove")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
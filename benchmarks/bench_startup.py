@@ -0,0 +1,133 @@
+"""Benchmark: MCP server and doc-update startup time (``python -X importtime``).
+
+Starts each entry point in a fresh interpreter with ``-X importtime`` and reports:
+
+- server: time from process start until the stdio loop answers an MCP
+  ``initialize`` request (``src/semche/mcp_server.py``)
+- cli help: time until ``doc-update --help`` exits
+
+For each run, the total import time and the cumulative import time of the heavy
+third-party packages (torch, transformers, chromadb, ...) are read from the
+importtime log. "-" means the package was not imported at all.
+
+Usage:
+    uv run python benchmarks/bench_startup.py --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+HEAVY = [
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "langchain_huggingface",
+    "langchain_chroma",
+    "chromadb",
+    "onnxruntime",
+    "MeCab",
+    "mcp",
+]
+INITIALIZE = {
+    "jsonrpc": "2.0",
+    "id": 1,
+    "method": "initialize",
+    "params": {
+        "protocolVersion": "2025-06-18",
+        "capabilities": {},
+        "clientInfo": {"name": "bench_startup", "version": "0"},
+    },
+}
+
+
+def parse_importtime(log: str) -> Tuple[float, Dict[str, float]]:
+    """Total import time and cumulative time per top-level package (seconds) of an importtime log."""
+    total = 0.0
+    packages: Dict[str, float] = {}
+    for line in log.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        seconds = int(cumulative) / 1e6
+        if not name.startswith("  "):
+            total += seconds
+        module = name.strip()
+        if module in HEAVY:
+            packages[module] = max(packages.get(module, 0.0), seconds)
+    return total, packages
+
+
+def environment() -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT / "src"), env.get("PYTHONPATH")]))
+    return env
+
+
+def run_server() -> Tuple[float, str]:
+    """Seconds until the server answers initialize, and its importtime log."""
+    # The importtime log goes to a file: a full stderr pipe would block the server
+    with tempfile.TemporaryFile(mode="w+") as stderr:
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "-X", "importtime", str(ROOT / "src/semche/mcp_server.py")],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+            env=environment(),
+            text=True,
+        )
+        assert proc.stdin is not None and proc.stdout is not None
+        proc.stdin.write(json.dumps(INITIALIZE) + "\n")
+        proc.stdin.flush()
+        response = proc.stdout.readline()
+        elapsed = time.perf_counter() - start
+        proc.communicate(timeout=60)  # closes stdin: the server exits
+        stderr.seek(0)
+        log = stderr.read()
+    if '"result"' not in response:
+        raise RuntimeError(f"Server did not answer initialize: {response!r}\n{log[-2000:]}")
+    return elapsed, log
+
+
+def run_cli_help() -> Tuple[float, str]:
+    """Seconds until doc-update --help exits, and its importtime log."""
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "semche.cli.bulk_register", "--help"],
+        capture_output=True,
+        env=environment(),
+        text=True,
+        check=True,
+    )
+    return time.perf_counter() - start, proc.stderr
+
+
+def report(label: str, runs: List[Tuple[float, str]]) -> None:
+    times = [elapsed for elapsed, _ in runs]
+    total, packages = parse_importtime(runs[-1][1])
+    print(f"{label:9s} median {statistics.median(times):6.2f} s (min {min(times):.2f} s)  imports {total:5.2f} s")
+    print("          " + "  ".join(
+        f"{name} {packages[name]:.2f}" if name in packages else f"{name} -" for name in HEAVY
+    ))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    report("server", [run_server() for _ in range(args.repeat)])
+    report("cli help", [run_cli_help() for _ in range(args.repeat)])
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
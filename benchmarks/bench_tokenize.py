@@ -0,0 +1,52 @@
+"""Benchmark: serial vs process-pool MeCab tokenization for BM25 index builds.
+
+Generates Japanese-like documents and times ``BM25SparseEncoder.tokenize_documents``
+for each worker count (requires MeCab + unidic-lite).
+
+Usage:
+    uv run python benchmarks/bench_tokenize.py --docs 20000 --workers 1 2 4 8
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.semche.sparse_encoder import BM25SparseEncoder  # noqa: E402
+
+SENTENCES = [
+    "私は猫が好きです。",
+    "機械学習は人工知能の一分野であり、データからパターンを学習します。",
+    "ハイブリッド検索ではBM25とベクトル検索の結果を統合します。",
+    "形態素解析は日本語の全文検索に欠かせない処理です。",
+    "設計書には変更履歴を必ず記載してください。",
+]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--sentences", type=int, default=40, help="Sentences per document")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    documents = ["".join(rng.choices(SENTENCES, k=args.sentences)) for _ in range(args.docs)]
+
+    baseline = None
+    for workers in args.workers:
+        encoder = BM25SparseEncoder(tokenize_workers=workers)
+        start = time.perf_counter()
+        tokens = encoder.tokenize_documents(documents)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"workers={workers:2d}: {elapsed:7.2f} s  ({baseline / elapsed:.2f}x)  "
+              f"tokens={sum(len(t) for t in tokens)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
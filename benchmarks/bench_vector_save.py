@@ -0,0 +1,64 @@
+"""Benchmark: saving embeddings as Python float lists vs a float32 NumPy matrix.
+
+Saves the same random vectors to a fresh ChromaDB collection with
+``ChromaDBManager.save`` twice and reports wall time and the peak Python heap
+allocation (tracemalloc) of each run:
+
+- lists: ``matrix.tolist()`` (what ``addDocument`` used to return; one Python
+  float object per element), converted to float32 inside ``save``
+- float32: the ``embed_batch`` matrix, passed to ChromaDB without copying
+
+Usage:
+    uv run python benchmarks/bench_vector_save.py --docs 5000 --dim 768
+"""
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.semche.chromadb_manager import ChromaDBManager  # noqa: E402
+
+
+def timed_save(directory: str, name: str, embeddings, documents: list, ids: list) -> tuple:
+    mgr = ChromaDBManager(persist_directory=directory, collection_name=name)
+    tracemalloc.start()
+    start = time.perf_counter()
+    mgr.save(embeddings=embeddings, documents=documents, filepaths=ids)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    matrix = rng.standard_normal((args.docs, args.dim)).astype(np.float32)
+    documents = [f"document {i}" for i in range(args.docs)]
+    ids = [f"/bench/{i}.txt" for i in range(args.docs)]
+    print(f"{args.docs} vectors x {args.dim} dims ({matrix.nbytes / 2**20:.1f} MiB as float32)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        lists = matrix.tolist()
+        t_tolist = time.perf_counter() - start
+        for label, embeddings in (("lists", lists), ("float32", matrix)):
+            elapsed, peak = timed_save(directory, f"bench_{label}", embeddings, documents, ids)
+            print(f"{label:8s} save {elapsed:6.2f} s  peak Python allocations {peak / 2**20:8.1f} MiB")
+        print(f"(building the lists with tolist() took a further {t_tolist:.2f} s)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
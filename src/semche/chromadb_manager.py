@@ -1,16 +1,19 @@
+import importlib.util
 import logging
 import os
 import sqlite3
 from datetime import datetime
 from typing import Any, Dict, List, Optional, Sequence, Union
 
-try:
-    import chromadb
-    from chromadb.config import Settings
-    from langchain_chroma import Chroma
-except ImportError:
-    chromadb = None
-    Chroma = None  # type: ignore[misc]
+import numpy as np
+
+# chromadb / langchain_chroma の import には 1 秒以上かかるため、ChromaDBManager の
+# 生成時まで遅らせる（MCP サーバーの起動や doc-update --help で読み込まない）
+CHROMADB_AVAILABLE = importlib.util.find_spec("chromadb") is not None
+
+# コレクションのメタデータに記録する、ベクトルを作った埋め込みの空間とバックエンド
+EMBEDDING_SPACE_KEY = "semche:embedding_space"
+EMBEDDING_BACKEND_KEY = "semche:embedding_backend"
 
 
 class ChromaDBError(Exception):
@@ -25,6 +28,9 @@ class ChromaDBManager:
       1) コンストラクタ引数 persist_directory
       2) 環境変数 SEMCHE_CHROMA_DIR
       3) デフォルト "./chroma_db"
+
+    embedding_space（Embedder.embedding_space）を指定すると、最初の保存時に
+    コレクションへ記録し、以降は異なる空間のベクトルの保存・検索を拒否する。
     """
 
     def __init__(
@@ -33,10 +39,14 @@ class ChromaDBManager:
         collection_name: str = "documents",
         distance: str = "cosine",
         embedding_function: Optional[Any] = None,
+        embedding_space: Optional[str] = None,
+        embedding_backend: Optional[str] = None,
     ) -> None:
-        if chromadb is None:
+        if not CHROMADB_AVAILABLE:
             logging.error("chromadb がインストールされていません。")
             raise ChromaDBError("chromadb がインストールされていません。")
+        import chromadb
+        from chromadb.config import Settings
 
         self.persist_directory = (
             persist_directory
@@ -46,6 +56,10 @@ class ChromaDBManager:
         self.collection_name = collection_name
         self.distance = distance
         self.embedding_function = embedding_function
+        self.embedding_space = embedding_space
+        self.embedding_backend = embedding_backend
+        # 検索時の確認は記録済みの空間と一致した後は省略する
+        self._space_verified = False
 
         # クライアント初期化（ローカル永続化）
         try:
@@ -70,8 +84,10 @@ class ChromaDBManager:
 
         # LangChain Chroma vectorstore（オプショナル）
         self.vectorstore: Optional[Any] = None
-        if embedding_function and Chroma is not None:
+        if embedding_function:
             try:
+                from langchain_chroma import Chroma
+
                 self.vectorstore = Chroma(
                     client=self.client,
                     collection_name=self.collection_name,
@@ -81,6 +97,69 @@ class ChromaDBManager:
                 logging.warning(f"LangChain Chroma初期化に失敗（フォールバック可能）: {e}")
                 self.vectorstore = None
 
+    def recorded_embedding(self) -> Dict[str, Optional[str]]:
+        """コレクションに記録された埋め込みの空間とバックエンド（未記録なら None）。
+
+        他のプロセス（doc-update など）の記録も読むため、コレクションを取得し直す。
+        """
+        try:
+            metadata = self.client.get_collection(self.collection_name).metadata or {}
+        except Exception as e:
+            logging.error(f"コレクションのメタデータ取得に失敗: {e}")
+            raise ChromaDBError(f"コレクションのメタデータ取得に失敗: {e}")
+        return {
+            "space": metadata.get(EMBEDDING_SPACE_KEY),
+            "backend": metadata.get(EMBEDDING_BACKEND_KEY),
+        }
+
+    def verify_embedding_space(self) -> None:
+        """vectorstore で直接検索する前の確認（HybridRetriever）。query() と同じく一度一致したら省略する。
+
+        Raises:
+            ChromaDBError: コレクションの埋め込み空間が embedding_space と異なる場合
+        """
+        self._check_embedding_space(record=False)
+
+    def _check_embedding_space(self, record: bool) -> None:
+        """コレクションの埋め込み空間が embedding_space と一致するか確認する。
+
+        未記録でドキュメントがあるコレクションは、記録を始める前に作られたもの
+        （モデル本体の空間、つまり "#" 以降の無い embedding_space）とみなす。
+        record=True（保存時）は毎回確認し、未記録なら記録する。検索時は一度一致したら省略する。
+
+        Raises:
+            ChromaDBError: 記録と異なる空間のベクトルを保存・検索しようとした場合
+        """
+        if self.embedding_space is None or (self._space_verified and not record):
+            return
+        stored = self.recorded_embedding()["space"]
+        recorded = stored
+        if recorded is None and self.count() > 0:
+            recorded = self.embedding_space.split("#", 1)[0]
+        if recorded is not None and recorded != self.embedding_space:
+            message = (
+                f"コレクション {self.collection_name} は {recorded} の埋め込みで構築されています"
+                f"（現在: {self.embedding_space}）。同じバックエンドを使うか、コレクションを作り直してください。"
+            )
+            logging.error(message)
+            raise ChromaDBError(message)
+        if stored is None and record:
+            try:
+                # hnsw:* （距離関数）は作成後に変更できないため含めない（作成時の設定は保持される）
+                metadata = {
+                    k: v for k, v in (self.collection.metadata or {}).items() if not k.startswith("hnsw:")
+                }
+                metadata[EMBEDDING_SPACE_KEY] = self.embedding_space
+                if self.embedding_backend is not None:
+                    metadata[EMBEDDING_BACKEND_KEY] = self.embedding_backend
+                self.collection.modify(metadata=metadata)
+            except Exception as e:
+                logging.error(f"埋め込み空間の記録に失敗: {e}")
+                raise ChromaDBError(f"埋め込み空間の記録に失敗: {e}")
+            recorded = self.embedding_space
+        # 空の未記録コレクションは、他のプロセスが先に記録する可能性があるため次回も確認する
+        self._space_verified = recorded is not None
+
     def _to_iso8601(self, value: Optional[Union[str, datetime]]) -> Optional[str]:
         if value is None:
             return None
@@ -108,9 +187,23 @@ class ChromaDBManager:
             metas.append(md)
         return metas
 
+    def _as_matrix(self, embeddings: Union[np.ndarray, Sequence[Sequence[float]]]) -> np.ndarray:
+        """ベクトル群を float32 の C 連続な 2 次元配列にする（float32 の連続配列ならコピーしない）。
+
+        ChromaDB は 2 次元配列を行のビューに分けて受け取るため、要素ごとの
+        Python の float を作らずに保存・検索できる。
+        """
+        try:
+            matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        except (TypeError, ValueError) as e:
+            raise ChromaDBError(f"embeddings を数値の行列に変換できません: {e}")
+        if matrix.ndim != 2 or matrix.shape[1] == 0:
+            raise ChromaDBError(f"embeddings は (件数, 次元数) の行列である必要があります: shape={matrix.shape}")
+        return matrix
+
     def _validate_lengths(
         self,
-        embeddings: Sequence[Sequence[float]],
+        embeddings: np.ndarray,
         documents: Sequence[str],
         filepaths: Sequence[str],
         updated_at: Optional[Sequence[Optional[Union[str, datetime]]]] = None,
@@ -128,7 +221,7 @@ class ChromaDBManager:
 
     def save(
         self,
-        embeddings: Sequence[Sequence[float]],
+        embeddings: Union[np.ndarray, Sequence[Sequence[float]]],
         documents: Sequence[str],
         filepaths: Sequence[str],
         updated_at: Optional[Sequence[Optional[Union[str, datetime]]]] = None,
@@ -136,17 +229,22 @@ class ChromaDBManager:
     ) -> Dict[str, Any]:
         """ベクトルとドキュメント、メタデータを保存（id は filepaths を使用）。
 
-        既存の id は更新（upsert）。
+        既存の id は更新（upsert）。embeddings は float32 の 2 次元配列に 1 回だけ
+        変換し、そのまま ChromaDB に渡す。
         """
         try:
-            self._validate_lengths(embeddings, documents, filepaths, updated_at, file_types)
+            if len(documents) == 0:
+                raise ChromaDBError("空のデータは保存できません。")
+            matrix = self._as_matrix(embeddings)
+            self._validate_lengths(matrix, documents, filepaths, updated_at, file_types)
+            self._check_embedding_space(record=True)
             metadatas = self._build_metadatas(filepaths, updated_at, file_types)
 
             # upsert が利用可能なら優先して使用
             if hasattr(self.collection, "upsert"):
                 self.collection.upsert(
                     ids=list(filepaths),
-                    embeddings=list(embeddings),
+                    embeddings=matrix,
                     metadatas=metadatas,  # type: ignore[arg-type] # ChromaDBの型定義が厳格すぎるため
                     documents=list(documents),
                 )
@@ -155,7 +253,7 @@ class ChromaDBManager:
                 try:
                     self.collection.add(
                         ids=list(filepaths),
-                        embeddings=list(embeddings),
+                        embeddings=matrix,
                         metadatas=metadatas,  # type: ignore[arg-type] # ChromaDBの型定義が厳格すぎるため
                         documents=list(documents),
                     )
@@ -163,7 +261,7 @@ class ChromaDBManager:
                     # 既存IDがあると仮定して update
                     self.collection.update(
                         ids=list(filepaths),
-                        embeddings=list(embeddings),
+                        embeddings=matrix,
                         metadatas=metadatas,  # type: ignore[arg-type] # ChromaDBの型定義が厳格すぎるため
                         documents=list(documents),
                     )
@@ -218,6 +316,14 @@ class ChromaDBManager:
             logging.error(f"ChromaDB削除に失敗: {e}")
             raise ChromaDBError(f"ChromaDB削除に失敗: {e}")
 
+    def count(self) -> int:
+        """コレクション内のドキュメント件数を返す。"""
+        try:
+            return int(self.collection.count())
+        except Exception as e:
+            logging.error(f"ChromaDB件数取得に失敗: {e}")
+            raise ChromaDBError(f"ChromaDB件数取得に失敗: {e}")
+
     def get_all_documents(
         self,
         where: Optional[Dict[str, Any]] = None,
@@ -317,7 +423,7 @@ class ChromaDBManager:
 
     def query(
         self,
-        query_embeddings: Sequence[Sequence[float]],
+        query_embeddings: Union[np.ndarray, Sequence[Sequence[float]]],
         top_k: int = 5,
         where: Optional[Dict[str, Any]] = None,
         include_documents: bool = True,
@@ -325,7 +431,7 @@ class ChromaDBManager:
         """クエリベクトルで近傍検索を行う。
 
         Returns ChromaDBのquery結果をラップした辞書。
-        1件のクエリを想定（query_embeddings[0]）。
+        1件のクエリを想定（query_embeddings[0]）。float32 の 1 次元配列のまま渡す。
         
         LangChain Chromaを使用して検索を実行。
         """
@@ -336,11 +442,12 @@ class ChromaDBManager:
                     "embedding_functionを指定してChromaDBManagerを初期化してください。"
                 )
             
-            query_vec = list(query_embeddings[0])
+            self._check_embedding_space(record=False)
+            query_vec = self._as_matrix(query_embeddings)[0]
             
             # similarity_search_by_vector_with_relevance_scores を使用
             results = self.vectorstore.similarity_search_by_vector_with_relevance_scores(
-                embedding=query_vec,
+                embedding=query_vec,  # ChromaDBは numpy 配列をそのまま受け付ける
                 k=int(max(1, top_k)),
                 filter=where if where else None,
             )
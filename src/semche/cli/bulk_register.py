@@ -6,17 +6,27 @@ from files, directories, and wildcard patterns into ChromaDB with vector embeddi
 
 import argparse
 import logging
+import os
 import sys
 from datetime import datetime
 from pathlib import Path
 from typing import List, Optional, Tuple
 
+import numpy as np
+
 from semche.chromadb_manager import ChromaDBError, ChromaDBManager
-from semche.embedding import Embedder, ensure_single_vector
+from semche.embedding import BACKENDS, DEFAULT_BATCH_SIZE, Embedder, EmbeddingError
+from semche.embedding_cache import create_embedding_cache
+from semche.sparse_encoder import TOKENIZERS
+from semche.sparse_index import create_sparse_index
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 logger = logging.getLogger(__name__)
 
+# Batches per embed_batch() call: enough files for length sorting to group
+# similar lengths, few enough that a failure only retries this chunk
+EMBED_CHUNK_BATCHES = 16
+
 
 def parse_args() -> argparse.Namespace:
     """Parse command line arguments."""
@@ -39,6 +49,15 @@ Examples:
 
   # Specify ChromaDB directory
   doc-update ./notes --chroma-dir /tmp/chroma --file-type memo
+
+  # Embed 64 files per forward pass
+  doc-update ./wiki --embed-batch-size 64
+
+  # Tokenize a large BM25 rebuild on every CPU
+  doc-update ./wiki --tokenize-workers 0
+
+  # Switch the collection's BM25 index to character n-grams (no MeCab needed)
+  doc-update ./wiki --sparse-tokenizer ngram
         """,
     )
     parser.add_argument(
@@ -75,6 +94,47 @@ Examples:
         "--chroma-dir",
         help="ChromaDB persist directory (overrides SEMCHE_CHROMA_DIR)",
     )
+    parser.add_argument(
+        "--embed-batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"Files embedded per forward pass of the model (default: {DEFAULT_BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--embed-backend",
+        choices=BACKENDS,
+        default=None,
+        help="Embedding inference backend; onnx / onnx-int8 export the model to ONNX Runtime on first use, "
+        "static distills it into a token lookup table on first use; a collection is searchable only with "
+        "the backend family it was built with (overrides SEMCHE_EMBED_BACKEND, default: torch)",
+    )
+    parser.add_argument(
+        "--embed-workers",
+        type=int,
+        default=1,
+        help="Processes embedding batches in parallel, each loading its own copy of the model "
+        "(0 = one per CPU, default: 1 = no worker processes)",
+    )
+    parser.add_argument(
+        "--embed-worker-threads",
+        type=int,
+        default=None,
+        help="Torch / ONNX Runtime threads per embedding worker (default: CPUs / --embed-workers)",
+    )
+    parser.add_argument(
+        "--tokenize-workers",
+        type=int,
+        default=None,
+        help="Processes for BM25 tokenization of large batches/rebuilds "
+        "(0 = one per CPU; overrides SEMCHE_TOKENIZE_WORKERS, default: 1)",
+    )
+    parser.add_argument(
+        "--sparse-tokenizer",
+        choices=TOKENIZERS,
+        default=None,
+        help="BM25 tokenizer; rebuilds the index when it differs from the one it was built with "
+        "(overrides SEMCHE_SPARSE_TOKENIZER, default: the index's own, else mecab)",
+    )
     return parser.parse_args()
 
 
@@ -262,62 +322,125 @@ def process_files(
     file_type: str,
     embedder: Embedder,
     use_relative_path: bool = False,
-) -> Tuple[List[List[float]], List[str], List[str], List[str], List[str]]:
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    embed_workers: int = 1,
+) -> Tuple[np.ndarray, List[str], List[str], List[str], List[str]]:
     """Process files to prepare for bulk registration.
-    
+
+    Files are read first and then embedded with ``Embedder.embed_batch`` in
+    chunks of ``EMBED_CHUNK_BATCHES`` batches (the embedder sorts each chunk by
+    length into batches of ``batch_size``). When a chunk fails, its files are
+    embedded one by one so that only the failing files are skipped.
+    With an embedder worker pool (``embed_workers`` processes), chunks are
+    ``embed_workers`` times larger so every worker gets batches.
+
     Returns:
-        Tuple of (embeddings, documents, ids, updated_at_list, file_types)
+        Tuple of (embeddings as a float32 matrix, documents, ids, updated_at_list, file_types)
     """
-    embeddings: List[List[float]] = []
     documents: List[str] = []
     ids: List[str] = []
     updated_at_list: List[str] = []
-    file_types: List[str] = []
-    
+
     skipped = 0
-    
+
     for file_path in file_paths:
         # Read content
         content = read_file_content(file_path)
         if content is None:
             skipped += 1
             continue
-        
+
         # Generate ID
         doc_id = generate_document_id(file_path, cwd, id_prefix, use_relative_path)
-        
+
         # Get file modification time
         mtime = datetime.fromtimestamp(file_path.stat().st_mtime)
         updated_at = mtime.isoformat()
-        
-        # Generate embedding
-        try:
-            embedding = embedder.addDocument(content)
-            vector = ensure_single_vector(embedding)
-        except Exception as e:
-            logger.warning(f"Failed to embed: {file_path}: {e}")
-            skipped += 1
-            continue
-        
-        # Add to batch
-        embeddings.append(vector)
+
         documents.append(content)
         ids.append(doc_id)
         updated_at_list.append(updated_at)
-        file_types.append(file_type)
-        
+
+    # Generate embeddings in batches
+    parts: List[np.ndarray] = []
+    keep: List[int] = []
+    chunk_size = batch_size * EMBED_CHUNK_BATCHES * max(1, embed_workers)
+    for start in range(0, len(documents), chunk_size):
+        chunk = documents[start:start + chunk_size]
+        try:
+            parts.append(embedder.embed_batch(chunk, batch_size=batch_size))
+            keep.extend(range(start, start + len(chunk)))
+        except EmbeddingError as e:
+            logger.warning(f"Failed to embed a chunk, retrying one by one: {e}")
+            for i in range(start, start + len(chunk)):
+                try:
+                    parts.append(embedder.embed_batch([documents[i]], batch_size=1))
+                    keep.append(i)
+                except EmbeddingError as e:
+                    logger.warning(f"Failed to embed: {ids[i]}: {e}")
+                    skipped += 1
+        logger.info(f"Embedded {start + len(chunk)}/{len(documents)} files")
+
+    if len(keep) < len(documents):
+        documents = [documents[i] for i in keep]
+        ids = [ids[i] for i in keep]
+        updated_at_list = [updated_at_list[i] for i in keep]
+    embeddings = np.concatenate(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+    for doc_id in ids:
         logger.info(f"Processed: {doc_id}")
-    
+
     if skipped > 0:
         logger.info(f"Skipped {skipped} files (binary/empty/error)")
-    
-    return embeddings, documents, ids, updated_at_list, file_types
+
+    return embeddings, documents, ids, updated_at_list, [file_type] * len(ids)
+
+
+def update_sparse_index(
+    chroma_mgr: ChromaDBManager,
+    documents: List[str],
+    ids: List[str],
+    file_types: Optional[List[str]] = None,
+    tokenize_workers: Optional[int] = None,
+    tokenizer: Optional[str] = None,
+) -> None:
+    """Reflect registered documents in the persistent BM25 index.
+
+    The index is derived data: on failure it is discarded and the MCP server
+    rebuilds it from ChromaDB on next use, so errors are only logged. The
+    backend follows SEMCHE_SPARSE_BACKEND, like the MCP server. A tokenizer
+    other than the one the index was built with rebuilds it; the MCP server
+    then keeps using the recorded one.
+    """
+    try:
+        sparse = create_sparse_index(chroma_mgr, tokenizer=tokenizer, tokenize_workers=tokenize_workers)
+    except Exception as e:
+        logger.warning(f"Failed to open sparse index (it will be rebuilt on next search): {e}")
+        return
+    try:
+        sparse.upsert(documents, ids, file_types)
+        # The process exits next: finish the segment merge the write may have started
+        sparse.wait_for_merge()
+        logger.info(f"  Sparse index: {sparse.count} documents ({sparse.directory})")
+    except Exception as e:
+        logger.warning(f"Failed to update sparse index (it will be rebuilt on next search): {e}")
+        try:
+            sparse.invalidate()
+        except Exception:
+            pass
 
 
 def main() -> int:
     """Main entry point for CLI."""
     args = parse_args()
     
+    if args.embed_batch_size < 1:
+        logger.error(f"--embed-batch-size must be at least 1: {args.embed_batch_size}")
+        return 1
+    if args.embed_worker_threads is not None and args.embed_worker_threads < 1:
+        logger.error(f"--embed-worker-threads must be at least 1: {args.embed_worker_threads}")
+        return 1
+    embed_workers = args.embed_workers if args.embed_workers > 0 else os.cpu_count() or 1
+
     # Get current working directory
     cwd = Path.cwd()
     
@@ -352,13 +475,19 @@ def main() -> int:
     
     # Initialize embedder and ChromaDB manager
     try:
-        embedder = Embedder()
+        embedder = Embedder(backend=args.embed_backend)
         # EmbedderのHuggingFaceEmbeddingsインスタンスをembedding_functionとして渡す
         chroma_mgr = ChromaDBManager(
             persist_directory=args.chroma_dir,
-            embedding_function=embedder.embeddings
+            embedding_function=embedder.embeddings,
+            embedding_space=embedder.embedding_space,
+            embedding_backend=embedder.backend,
         )
         logger.info(f"ChromaDB directory: {chroma_mgr.persist_directory}")
+        # 変更の無いファイルはキャッシュ済みのベクトルを使う（SEMCHE_EMBED_CACHE_SIZE=0 で無効）
+        embedder.cache = create_embedding_cache(chroma_mgr.persist_directory)
+        if embed_workers > 1:
+            embedder.start_pool(embed_workers, threads_per_worker=args.embed_worker_threads)
     except Exception as e:
         logger.error(f"Failed to initialize: {e}")
         return 1
@@ -373,10 +502,16 @@ def main() -> int:
             args.file_type,
             embedder,
             use_relative_path=args.use_relative_path,
+            batch_size=args.embed_batch_size,
+            embed_workers=embed_workers,
         )
     except Exception as e:
         logger.error(f"Failed to process files: {e}")
         return 1
+    finally:
+        embedder.close_pool()
+    if embedder.cache is not None:
+        logger.info(f"Embedding cache: {embedder.cache.hits} hits, {embedder.cache.misses} misses")
     
     if not ids:
         logger.error("No documents to register (all files skipped)")
@@ -395,7 +530,6 @@ def main() -> int:
         logger.info(f"✓ Successfully registered {result['count']} documents")
         logger.info(f"  Collection: {result['collection']}")
         logger.info(f"  Directory: {result['persist_directory']}")
-        return 0
     except ChromaDBError as e:
         logger.error(f"Failed to save to ChromaDB: {e}")
         return 1
@@ -403,6 +537,16 @@ def main() -> int:
         logger.error(f"Unexpected error: {e}")
         return 1
 
+    update_sparse_index(
+        chroma_mgr,
+        documents,
+        ids,
+        file_types,
+        tokenize_workers=args.tokenize_workers,
+        tokenizer=args.sparse_tokenizer,
+    )
+    return 0
+
 
 if __name__ == "__main__":
     sys.exit(main())
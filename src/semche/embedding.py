@@ -1,33 +1,108 @@
 import logging
-from typing import List, Union
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Union
 
-try:
-    from langchain_huggingface import HuggingFaceEmbeddings
-except ImportError:
-    HuggingFaceEmbeddings = None  # type: ignore[misc] # Optional dependency
+import numpy as np
+
+from .embedding_cache import EmbeddingCache, EmbeddingCacheError, cache_key
+
+# 1回の順伝播にまとめるテキスト数（SentenceTransformer.encode の既定値と同じ）
+DEFAULT_BATCH_SIZE = 32
+# embed_query() の LRU キャッシュに保持するクエリ数
+QUERY_CACHE_SIZE = 256
+# warm_up() でモデルに通すダミーテキスト
+WARM_UP_TEXT = "ウォームアップ warm-up"
+# 推論バックエンド: PyTorch（HuggingFaceEmbeddings）/ ONNX Runtime / ONNX Runtime + int8 動的量子化 /
+# 静的埋め込み（トークンごとのベクトル表の平均。モデルから蒸留、static_backend.py）
+BACKENDS = ("torch", "onnx", "onnx-int8", "static")
+# モデルと別のベクトル空間になるバックエンド（コレクションに混在させない）
+SEPARATE_SPACE_BACKENDS = ("static",)
 
 
 class EmbeddingError(Exception):
     pass
 
 
-def ensure_single_vector(embedding: Union[List[float], List[List[float]]]) -> List[float]:
+# ワーカープロセスごとの Embedder（_init_embed_worker で作成）
+_worker_embedder: Optional["Embedder"] = None
+
+
+def _init_embed_worker(model_name: str, backend: str, threads: int, embeddings: Optional[Any]) -> None:
+    """プロセスプールの initializer: スレッド数を制限してワーカーごとにモデルを1つロードする。"""
+    global _worker_embedder
+    # ワーカー数 × スレッド数が CPU 数を超えないよう、各ライブラリのスレッドプールを制限する
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    if embeddings is None and backend != "torch":
+        embeddings = _load_backend_embeddings(model_name, backend, threads=threads)
+    _worker_embedder = Embedder(model_name, embeddings=embeddings, query_cache_size=0, backend=backend)
+
+
+def _load_backend_embeddings(model_name: str, backend: str, threads: Optional[int] = None) -> Any:
+    """torch 以外のバックエンドの Embeddings をロードする（ONNX の書き出し・静的表の蒸留は初回のみ）。
+
+    onnxruntime / tokenizers はそのバックエンドを選んだ場合のみ読み込む。
+
+    Raises:
+        EmbeddingError: 書き出し・蒸留・ロードに失敗した場合
+    """
+    if backend == "static":
+        from .static_backend import StaticBackendError, load_static_embeddings
+
+        try:
+            return load_static_embeddings(model_name)
+        except StaticBackendError as e:
+            logging.error(f"{backend} モデルのロードに失敗しました: {e}")
+            raise EmbeddingError(f"{backend} モデルのロードに失敗しました: {e}")
+    from .onnx_backend import OnnxBackendError, load_onnx_embeddings
+
+    try:
+        return load_onnx_embeddings(model_name, backend, threads=threads)
+    except OnnxBackendError as e:
+        logging.error(f"{backend} モデルのロードに失敗しました: {e}")
+        raise EmbeddingError(f"{backend} モデルのロードに失敗しました: {e}")
+
+
+def _embed_worker_batch(texts: List[str], batch_size: int) -> np.ndarray:
+    """ワーカープロセスで1バッチを順伝播する（正規化は親プロセスで行う）。"""
+    assert _worker_embedder is not None
+    return _worker_embedder._encode_batch(texts, batch_size)
+
+
+def ensure_single_vector(
+    embedding: Union[np.ndarray, List[float], List[List[float]]],
+) -> Union[np.ndarray, List[float]]:
     """埋め込み結果を単一ベクトル形式に正規化する。
 
-    addDocument()の戻り値は単一テキストの場合List[float]、
-    バッチの場合List[List[float]]になる可能性があるため、
+    埋め込み結果は単一ベクトル（List[float] / 1 次元配列）の場合と
+    バッチ（List[List[float]] / 2 次元配列）の場合があるため、
     常に単一ベクトルを返すように正規化する。
+    addDocument()/embed_batch()/embed_query() の numpy 配列（1 次元または 2 次元）を渡した場合は、
+    要素を Python の float に変換せず float32 の連続した 1 次元配列で返す。
 
     Args:
         embedding: 埋め込みベクトル（単一またはバッチ）
 
     Returns:
-        単一の埋め込みベクトル
+        単一の埋め込みベクトル（リストを渡した場合はリスト、配列の場合は float32 配列）
 
     Raises:
         EmbeddingError: 不正な形式の場合
     """
-    if isinstance(embedding, list) and len(embedding) > 0:
+    if isinstance(embedding, np.ndarray):
+        if embedding.ndim in (1, 2) and embedding.size > 0:
+            vector = embedding if embedding.ndim == 1 else embedding[0]
+            return np.ascontiguousarray(vector, dtype=np.float32)
+    elif isinstance(embedding, list) and len(embedding) > 0:
         if isinstance(embedding[0], list):
             # バッチ処理の結果: 最初の要素を返す
             return embedding[0]
@@ -36,9 +111,45 @@ def ensure_single_vector(embedding: Union[List[float], List[List[float]]]) -> Li
             return embedding  # type: ignore[return-value] # List[float]として安全
     raise EmbeddingError("不正な埋め込み形式です")
 
+
 class Embedder:
-    def __init__(self, model_name: str = "sentence-transformers/stsb-xlm-r-multilingual"):
-        if HuggingFaceEmbeddings is None:
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/stsb-xlm-r-multilingual",
+        embeddings: Optional[Any] = None,
+        cache: Optional[EmbeddingCache] = None,
+        query_cache_size: int = QUERY_CACHE_SIZE,
+        backend: Optional[str] = None,
+    ):
+        self.model_name = model_name
+        # None の場合は環境変数 SEMCHE_EMBED_BACKEND（未設定なら torch）
+        self.backend = backend or os.getenv("SEMCHE_EMBED_BACKEND") or "torch"
+        if self.backend not in BACKENDS:
+            logging.error(f"不明な埋め込みバックエンドです: {self.backend}")
+            raise EmbeddingError(f"不明な埋め込みバックエンドです: {self.backend}（{' / '.join(BACKENDS)}）")
+        # embed_batch() が参照する永続キャッシュ（None ならキャッシュしない）
+        self.cache = cache
+        # embed_query() のプロセス内 LRU キャッシュ（0 ならキャッシュしない）
+        self.query_cache_size = max(query_cache_size, 0)
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_lock = threading.Lock()
+        self._query_hits = 0
+        self._query_misses = 0
+        # start_pool() で起動するワーカープロセスのプール（None なら自プロセスで順伝播）
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.pool_workers = 1
+        # 構築済みの LangChain Embeddings を渡した場合はモデルをロードしない（テスト用など）
+        self._given_embeddings = embeddings
+        if embeddings is not None:
+            self.embeddings = embeddings
+            return
+        if self.backend != "torch":
+            self.embeddings = _load_backend_embeddings(model_name, self.backend)
+            return
+        # langchain_huggingface（と sentence-transformers / torch）はモデルのロード時に読み込む
+        try:
+            from langchain_huggingface import HuggingFaceEmbeddings
+        except ImportError:
             logging.error("langchain_huggingfaceがインストールされていません。")
             raise EmbeddingError("langchain_huggingfaceがインストールされていません。")
         try:
@@ -47,36 +158,285 @@ class Embedder:
             logging.error(f"モデルのロードに失敗しました: {e}")
             raise EmbeddingError(f"モデルのロードに失敗しました: {e}")
 
-    def addDocument(
-        self, text: Union[str, List[str]], normalize: bool = False
-    ) -> Union[List[float], List[List[float]]]:
+    def start_pool(self, workers: int, threads_per_worker: Optional[int] = None) -> None:
+        """embed_batch() のバッチを複数のワーカープロセスに振り分けるプールを起動する。
+
+        各ワーカーは同じモデル・バックエンドを1つずつロードし（メモリはワーカー数分）、
+        PyTorch / ONNX Runtime のスレッド数を threads_per_worker に制限する。
+        ワーカーは spawn で起動する（マルチスレッドのプロセスの fork は安全でない）。
+
+        Args:
+            workers: ワーカープロセス数（0 以下で CPU 数、1 ならプールを使わない）
+            threads_per_worker: ワーカーごとのスレッド数（None で CPU 数 / workers、最低 1）
+        """
+        self.close_pool()
+        cpus = os.cpu_count() or 1
+        workers = workers if workers > 0 else cpus
+        if workers <= 1:
+            return
+        threads = threads_per_worker or max(1, cpus // workers)
+        logging.info(f"埋め込みワーカーを {workers} プロセス（各 {threads} スレッド）で起動します")
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_embed_worker,
+            initargs=(self.model_name, self.backend, threads, self._given_embeddings),
+        )
+        self.pool_workers = workers
+
+    def close_pool(self) -> None:
+        """start_pool() のワーカープロセスを終了する（起動していなければ何もしない）。"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        self.pool_workers = 1
+
+    @property
+    def cache_model_name(self) -> str:
+        """埋め込みキャッシュのキーに使うモデル名（torch 以外はバックエンド名を付ける）。
+
+        int8 量子化ではベクトルが変わるため、バックエンドごとに別のエントリにする。
+        """
+        return self.model_name if self.backend == "torch" else f"{self.model_name}#{self.backend}"
+
+    @property
+    def embedding_space(self) -> str:
+        """ベクトル空間の識別子（ChromaDBManager がコレクションに記録し、異なる空間のベクトルの混在を拒否する）。
+
+        torch / onnx / onnx-int8 はモデルとの一致を検証済みのため同じ空間（モデル名）、
+        static はモデルと別の空間（"モデル名#static"）。
+        """
+        return f"{self.model_name}#{self.backend}" if self.backend in SEPARATE_SPACE_BACKENDS else self.model_name
+
+    def addDocument(self, text: Union[str, List[str]], normalize: bool = False) -> np.ndarray:
+        """テキストを float32 のベクトル（str なら 1 次元、リストなら (件数, 次元数) の行列）にする。
+
+        embed_batch() を通すため、ベクトルを Python の float のリストに変換しない
+        （リストが必要な LangChain の呼び出し側でのみ変換する）。
+        """
         if text is None or (isinstance(text, str) and text.strip() == "") or (isinstance(text, list) and not text):
             logging.error("空文字列または空リストが入力されました。")
             raise EmbeddingError("空文字列または空リストが入力されました。")
         try:
             if isinstance(text, str):
-                vec = self.embeddings.embed_query(text)
-                if normalize:
-                    vec = self._normalize(vec)
-                return vec
+                return self.embed_batch([text], normalize=normalize)[0]
             elif isinstance(text, list):
-                vecs = self.embeddings.embed_documents(text)
-                if normalize:
-                    vecs = [self._normalize(v) for v in vecs]
-                return vecs
+                return self.embed_batch(text, normalize=normalize)
             else:
                 logging.error("不正な入力形式です。strまたはList[str]のみ対応。")
                 raise EmbeddingError("不正な入力形式です。strまたはList[str]のみ対応。")
+        except EmbeddingError:
+            raise
+        except MemoryError:
+            logging.error("メモリ不足です。入力サイズを減らしてください。")
+            raise EmbeddingError("メモリ不足です。入力サイズを減らしてください。")
+        except Exception as e:
+            logging.error(f"埋め込み処理でエラー: {e}")
+            raise EmbeddingError(f"埋め込み処理でエラー: {e}")
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """検索クエリを float32 の 1 次元ベクトルにする（プロセス内 LRU キャッシュ付き）。
+
+        Embeddings.embed_query と同じベクトルを返すため、ChromaDB の検索に
+        テキストの代わりに渡せる。同じクエリの 2 回目以降はモデルを通さない。
+        返す配列はキャッシュと共有するため書き込み不可。
+
+        Raises:
+            EmbeddingError: 空のクエリ、または埋め込み処理に失敗した場合
+        """
+        if not isinstance(query, str) or not query.strip():
+            logging.error("空文字列または空リストが入力されました。")
+            raise EmbeddingError("空文字列または空リストが入力されました。")
+        with self._query_lock:
+            vector = self._query_cache.get(query)
+            if vector is None:
+                self._query_misses += 1
+            else:
+                self._query_hits += 1
+                self._query_cache.move_to_end(query)
+        if vector is not None:
+            return vector
+        try:
+            vector = self._encode_query(query)
         except MemoryError:
             logging.error("メモリ不足です。入力サイズを減らしてください。")
             raise EmbeddingError("メモリ不足です。入力サイズを減らしてください。")
         except Exception as e:
             logging.error(f"埋め込み処理でエラー: {e}")
             raise EmbeddingError(f"埋め込み処理でエラー: {e}")
+        vector.setflags(write=False)
+        if self.query_cache_size:
+            with self._query_lock:
+                self._query_cache[query] = vector
+                self._query_cache.move_to_end(query)
+                while len(self._query_cache) > self.query_cache_size:
+                    self._query_cache.popitem(last=False)
+        return vector
+
+    def warm_up(self) -> None:
+        """ダミーテキストを 1 回ベクトル化し、初回推論の準備（スレッドプール・カーネル選択など）を済ませる。
+
+        埋め込みキャッシュとクエリキャッシュには登録しない。
+
+        Raises:
+            EmbeddingError: 埋め込み処理に失敗した場合
+        """
+        try:
+            self._encode_batch([WARM_UP_TEXT], 1)
+        except Exception as e:
+            logging.error(f"ウォームアップの埋め込み処理でエラー: {e}")
+            raise EmbeddingError(f"ウォームアップの埋め込み処理でエラー: {e}")
+
+    def query_cache_info(self) -> Dict[str, int]:
+        """embed_query() のキャッシュ統計: size（上限）, entries, hits, misses。"""
+        with self._query_lock:
+            return {
+                "size": self.query_cache_size,
+                "entries": len(self._query_cache),
+                "hits": self._query_hits,
+                "misses": self._query_misses,
+            }
+
+    def embed_batch(
+        self,
+        texts: Sequence[str],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        normalize: bool = False,
+        sort_by_length: bool = True,
+    ) -> np.ndarray:
+        """複数テキストを batch_size 件ずつの順伝播でベクトル化し、float32 の行列で返す。
+
+        sort_by_length=True の場合、テキストをトークン数の降順に並べてからバッチに
+        分ける。バッチ内のテキストの長さが揃うため、短いテキストを最長のテキストに
+        合わせてパディングする計算が減る。結果は入力順の行に戻す。
+
+        cache が設定されている場合は (モデル名, normalize, 本文の SHA-256) で
+        キャッシュを引き、キャッシュに無いテキスト（同一本文は 1 回）のみモデルに
+        通して結果をキャッシュへ追加する。キャッシュのエラーは警告に留める。
+
+        HuggingFaceEmbeddings の場合は内部の SentenceTransformer.encode を直接呼び、
+        ベクトルを Python の float のリストに変換しない。それ以外の Embeddings は
+        embed_documents をバッチごとに呼ぶ。
+
+        Args:
+            texts: テキストのリスト
+            batch_size: 1回の順伝播にまとめるテキスト数
+            normalize: 各行をL2正規化するか
+            sort_by_length: トークン数で並べ替えてからバッチに分けるか
+
+        Returns:
+            (len(texts), 次元数) の float32 行列（行は texts の順）
+
+        Raises:
+            EmbeddingError: 空リスト・不正な入力・埋め込み処理の失敗
+        """
+        if isinstance(texts, str) or not texts:
+            logging.error("空リストまたは不正な入力形式です。List[str]のみ対応。")
+            raise EmbeddingError("空リストまたは不正な入力形式です。List[str]のみ対応。")
+        if not all(isinstance(t, str) for t in texts):
+            logging.error("不正な入力形式です。List[str]のみ対応。")
+            raise EmbeddingError("不正な入力形式です。List[str]のみ対応。")
+        if batch_size < 1:
+            raise EmbeddingError(f"batch_size は1以上を指定してください: {batch_size}")
+        if self.cache is None:
+            return self._embed_texts(texts, batch_size, normalize, sort_by_length)
+
+        keys = [cache_key(self.cache_model_name, normalize, t) for t in texts]
+        try:
+            found = self.cache.get_many(keys)
+        except EmbeddingCacheError as e:
+            logging.warning(f"埋め込みキャッシュを読めないためモデルで処理します: {e}")
+            found = {}
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            computed = self._embed_texts(list(missing.values()), batch_size, normalize, sort_by_length)
+            new = dict(zip(missing, computed))
+            try:
+                self.cache.put_many(new.items())
+            except EmbeddingCacheError as e:
+                logging.warning(f"埋め込みキャッシュへの書き込みに失敗しました: {e}")
+            found.update(new)
+        return np.ascontiguousarray(np.stack([found[key] for key in keys]), dtype=np.float32)
+
+    def _embed_texts(
+        self, texts: Sequence[str], batch_size: int, normalize: bool, sort_by_length: bool
+    ) -> np.ndarray:
+        """キャッシュを介さずにモデルでベクトル化する（embed_batch の本体）。"""
+        try:
+            if sort_by_length and len(texts) > batch_size:
+                # 降順: 最も長いバッチを最初に処理し、メモリ不足を早く検出する
+                order = np.argsort(-self.token_lengths(texts), kind="stable")
+            else:
+                order = np.arange(len(texts))
+            batches = [order[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+            if self._pool is not None and len(batches) > 1:
+                # バッチ単位でワーカーに振り分ける（map は投入順に結果を返す）
+                parts = self._pool.map(
+                    _embed_worker_batch, [[texts[i] for i in rows] for rows in batches], [batch_size] * len(batches)
+                )
+            else:
+                parts = (self._encode_batch([texts[i] for i in rows], batch_size) for rows in batches)
+            matrix = np.zeros((0, 0), dtype=np.float32)
+            for n, (rows, part) in enumerate(zip(batches, parts)):
+                if n == 0:
+                    matrix = np.empty((len(texts), part.shape[1]), dtype=np.float32)
+                matrix[rows] = part
+        except MemoryError:
+            logging.error("メモリ不足です。入力サイズを減らしてください。")
+            raise EmbeddingError("メモリ不足です。入力サイズを減らしてください。")
+        except Exception as e:
+            logging.error(f"埋め込み処理でエラー: {e}")
+            raise EmbeddingError(f"埋め込み処理でエラー: {e}")
+        if normalize:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix /= norms
+        return matrix
+
+    def token_lengths(self, texts: Sequence[str]) -> np.ndarray:
+        """各テキストのトークン数（特殊トークン込み、モデルの max_seq_length で切り詰め）。
+
+        モデルのトークナイザを持たない Embeddings の場合は文字数を返す。
+        """
+        client = getattr(self.embeddings, "_client", None)
+        tokenizer = getattr(client, "tokenizer", None)
+        if tokenizer is None:
+            return np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+        max_length = getattr(client, "max_seq_length", None)
+        encoded = tokenizer(
+            [t.replace("\n", " ") for t in texts],
+            truncation=max_length is not None,
+            max_length=max_length,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+            return_length=True,
+        )
+        return np.asarray(encoded["length"], dtype=np.int64)
+
+    def _encode_query(self, query: str) -> np.ndarray:
+        """クエリ 1 件を float32 の 1 次元ベクトルにする（Python の float のリストを経由しない）。"""
+        client = getattr(self.embeddings, "_client", None)
+        if client is None or not hasattr(client, "encode"):
+            return np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        # HuggingFaceEmbeddings.embed_query と同じく query_encode_kwargs を優先する
+        kwargs = getattr(self.embeddings, "query_encode_kwargs", None) or getattr(self.embeddings, "encode_kwargs", {})
+        encode_kwargs = {"show_progress_bar": False, "convert_to_numpy": True, **kwargs}
+        vector = client.encode([query.replace("\n", " ")], **encode_kwargs)[0]
+        return np.ascontiguousarray(vector, dtype=np.float32)
 
-    def _normalize(self, vec: List[float]) -> List[float]:
-        import math
-        norm = math.sqrt(sum(x * x for x in vec))
-        if norm == 0:
-            return vec
-        return [x / norm for x in vec]
+    def _encode_batch(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """1バッチ分のテキストを (件数, 次元数) の行列にする。"""
+        client = getattr(self.embeddings, "_client", None)
+        if client is None or not hasattr(client, "encode"):
+            return np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        # HuggingFaceEmbeddings.embed_documents と同じ前処理・引数（encode_kwargs）で呼ぶ
+        encode_kwargs = {
+            "show_progress_bar": False,
+            "convert_to_numpy": True,
+            **getattr(self.embeddings, "encode_kwargs", {}),
+            "batch_size": batch_size,
+        }
+        return np.asarray(client.encode([t.replace("\n", " ") for t in texts], **encode_kwargs))
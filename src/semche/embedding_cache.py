@@ -0,0 +1,185 @@
+"""Persistent embedding cache for document writes.
+
+Re-running ``doc-update`` on a mostly unchanged tree, or ``put_document`` with
+unchanged text, used to run the embedding model again for every text.
+``EmbeddingCache`` stores float32 vectors in a SQLite file in the ChromaDB
+persist directory, keyed by a SHA-256 hash of the model name, the normalize
+flag and the text, so the model only runs for new or changed texts.
+
+The cache is bounded: every hit refreshes an entry's last-used time, and once
+the number of entries exceeds ``max_entries`` the least recently used ones are
+deleted.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_FILENAME = "embedding_cache.sqlite3"
+# Default bound: about 300 MB of 768-dimensional float32 vectors
+DEFAULT_MAX_ENTRIES = 100_000
+
+# Stay well below SQLite's default limit on bound parameters per statement
+_BATCH_SIZE = 500
+
+
+class EmbeddingCacheError(Exception):
+    """Embedding cache operation errors"""
+
+    pass
+
+
+def cache_key(model_name: str, normalize: bool, text: str) -> str:
+    """Return the cache key of a text embedded by a model (with or without L2 normalization)."""
+    h = hashlib.sha256()
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\x00normalize\x00" if normalize else b"\x00raw\x00")
+    h.update(text.encode("utf-8"))
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite-backed LRU cache of float32 embedding vectors keyed by content hash.
+
+    The connection is opened lazily and shared between threads under a lock;
+    SQLite's own locking (WAL mode) handles other processes using the same file.
+
+    Attributes:
+        path: SQLite database file path
+        max_entries: Entries kept after each write (least recently used ones are evicted)
+        hits, misses: Lookups answered / not answered by this instance
+    """
+
+    def __init__(self, path: Union[str, Path], max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        """Initialize the cache (the database is created on first use).
+
+        Args:
+            path: SQLite database file path
+            max_entries: Maximum number of cached vectors
+        """
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Look up cached vectors and mark them as recently used.
+
+        Args:
+            keys: Cache keys (see cache_key)
+
+        Returns:
+            Dictionary of key -> float32 vector for the keys found in the cache
+
+        Raises:
+            EmbeddingCacheError: If the database cannot be read
+        """
+        found: Dict[str, np.ndarray] = {}
+        unique = list(dict.fromkeys(keys))
+        try:
+            with self._lock:
+                conn = self._connect()
+                now = time.time()
+                with conn:
+                    for i in range(0, len(unique), _BATCH_SIZE):
+                        batch = unique[i:i + _BATCH_SIZE]
+                        placeholders = ",".join("?" * len(batch))
+                        rows = conn.execute(
+                            f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                        ).fetchall()
+                        for key, blob in rows:
+                            found[key] = np.frombuffer(blob, dtype=np.float32)
+                        if rows:
+                            hit = [key for key, _ in rows]
+                            conn.execute(
+                                f"UPDATE embeddings SET last_used = ? WHERE key IN ({','.join('?' * len(hit))})",
+                                [now, *hit],
+                            )
+                self.hits += len(found)
+                self.misses += len(unique) - len(found)
+            return found
+        except sqlite3.Error as e:
+            raise EmbeddingCacheError(f"Failed to read embedding cache: {e}")
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]]) -> None:
+        """Store vectors, then evict the least recently used entries beyond max_entries.
+
+        Args:
+            items: (key, vector) pairs
+
+        Raises:
+            EmbeddingCacheError: If the database cannot be written
+        """
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items]
+        if not rows:
+            return
+        try:
+            with self._lock:
+                conn = self._connect()
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+                    )
+                    excess = int(conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]) - self.max_entries
+                    if excess > 0:
+                        conn.execute(
+                            "DELETE FROM embeddings WHERE key IN "
+                            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                            (excess,),
+                        )
+        except sqlite3.Error as e:
+            raise EmbeddingCacheError(f"Failed to write embedding cache: {e}")
+
+    def count(self) -> int:
+        """Number of cached entries."""
+        try:
+            with self._lock:
+                return int(self._connect().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0])
+        except sqlite3.Error as e:
+            raise EmbeddingCacheError(f"Failed to read embedding cache: {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def create_embedding_cache(persist_directory: Union[str, Path]) -> Optional[EmbeddingCache]:
+    """Open the embedding cache of a ChromaDB persist directory.
+
+    The bound comes from SEMCHE_EMBED_CACHE_SIZE (entries, default
+    DEFAULT_MAX_ENTRIES); 0 disables the cache.
+
+    Returns:
+        EmbeddingCache, or None when disabled
+    """
+    max_entries = int(os.getenv("SEMCHE_EMBED_CACHE_SIZE") or DEFAULT_MAX_ENTRIES)
+    if max_entries <= 0:
+        return None
+    return EmbeddingCache(Path(persist_directory) / EMBEDDING_CACHE_FILENAME, max_entries=max_entries)
@@ -0,0 +1,423 @@
+"""SQLite FTS5 sparse index stored in the ChromaDB persist directory.
+
+An alternative to ``SparseIndex`` whose posting lists live on disk instead of
+in memory: documents are tokenized with the same tokenizer as
+``BM25SparseEncoder`` (MeCab or character n-grams, reusing its token cache), the tokens
+are stored space-separated in an FTS5 table in
+``<persist_directory>/sparse_fts.sqlite3`` and queries are ranked with FTS5's
+built-in ``bm25()``. Memory use does not grow with the corpus, and every write
+is a single SQLite transaction, so other processes (``doc-update`` while the
+MCP server is running) see either all or none of it.
+
+FTS5's ``bm25()`` uses fixed parameters (k1=1.2, b=0.75), and its
+``unicode61`` tokenizer lower-cases the stored tokens and splits them on
+punctuation, so scores are close to but not identical with the ``inverted``
+engine.
+"""
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .sparse_encoder import TOKENIZERS, BM25SparseEncoder
+from .sparse_index import SPARSE_INDEX_DIRNAME, SparseIndexError
+from .token_cache import TOKEN_CACHE_FILENAME, TokenCache
+
+logger = logging.getLogger(__name__)
+
+FTS_FILENAME = "sparse_fts.sqlite3"
+# Stored in the meta table: a different tokenizer invalidates the stored tokens
+_CUSTOM_TOKENIZER = "custom"
+_BATCH_SIZE = 500
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS docs ("
+    "rowid INTEGER PRIMARY KEY, doc_id TEXT NOT NULL UNIQUE, file_type TEXT)",
+    "CREATE INDEX IF NOT EXISTS docs_file_type ON docs (file_type)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS fts USING fts5(tokens, tokenize='unicode61 remove_diacritics 0')",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+)
+
+
+def match_expression(tokens: Sequence[str]) -> Optional[str]:
+    """Build an FTS5 MATCH expression that ORs the given tokens.
+
+    Each token is quoted as a string (``"`` doubled), so FTS5 operators and
+    punctuation in tokens are taken literally. Tokens without any letter or
+    digit are dropped, since ``unicode61`` would index nothing for them.
+
+    Returns:
+        The expression, or None when no token is left
+    """
+    terms = dict.fromkeys(
+        '"' + token.replace('"', '""') + '"' for token in tokens if any(ch.isalnum() for ch in token)
+    )
+    return " OR ".join(terms) if terms else None
+
+
+class FTS5SparseIndex:
+    """BM25 index in an SQLite FTS5 table, kept in sync with ChromaDB writes.
+
+    Offers the same operations as ``SparseIndex`` (load, upsert, remove,
+    search, invalidate), so callers can switch backends with
+    ``create_sparse_index``. ChromaDB stays the source of truth: when the table
+    is empty, was built with another tokenizer or its document count disagrees
+    with the collection, it is rebuilt from ``ChromaDBManager.get_all_documents()``.
+
+    Attributes:
+        chroma: ChromaDBManager used as the source of truth
+        directory: Persist directory holding the database
+        path: Path of the FTS5 database file
+        token_cache: TokenCache shared with the ``inverted`` backend
+        encoder: BM25SparseEncoder used only for tokenization
+    """
+
+    def __init__(
+        self,
+        chroma_manager: Any,
+        tokenizer: Optional[Any] = None,
+        tokenize_workers: Optional[int] = None,
+    ) -> None:
+        """Initialize the index (the database is opened on ``load()``).
+
+        Args:
+            chroma_manager: ChromaDBManager whose collection is indexed
+            tokenizer: Tokenizer passed to BM25SparseEncoder: "mecab", "ngram" or a
+                function (default: SEMCHE_SPARSE_TOKENIZER, else the tokenizer
+                recorded in the database, else "mecab")
+            tokenize_workers: Tokenization processes for large rebuilds
+                (default: SEMCHE_TOKENIZE_WORKERS, else 1; 0 = one per CPU)
+        """
+        self.chroma = chroma_manager
+        self.directory = str(chroma_manager.persist_directory)
+        self.path = str(Path(self.directory) / FTS_FILENAME)
+        if tokenize_workers is None:
+            tokenize_workers = int(os.getenv("SEMCHE_TOKENIZE_WORKERS") or 1)
+        self.tokenize_workers = tokenize_workers
+        self.token_cache = TokenCache(Path(self.directory) / SPARSE_INDEX_DIRNAME / TOKEN_CACHE_FILENAME)
+        tokenizer = tokenizer or os.getenv("SEMCHE_SPARSE_TOKENIZER") or None
+        # Without an explicit choice, the tokenizer recorded in the database is kept
+        self._tokenizer_explicit = tokenizer is not None
+        self.encoder = self._create_encoder(tokenizer or self._recorded_tokenizer())
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._loaded = False
+
+    def _create_encoder(self, tokenizer: Optional[Any]) -> BM25SparseEncoder:
+        return BM25SparseEncoder(
+            tokenizer=tokenizer,
+            token_cache=self.token_cache,
+            tokenize_workers=self.tokenize_workers,
+        )
+
+    def _recorded_tokenizer(self) -> Optional[str]:
+        """Name of the built-in tokenizer recorded in an existing database (read-only peek)."""
+        if not Path(self.path).exists():
+            return None
+        try:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=30)
+            try:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'tokenizer_name'").fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to read FTS5 index metadata: {e}")
+            return None
+        return row[0] if row is not None and row[0] in TOKENIZERS else None
+
+    @property
+    def _tokenizer_id(self) -> str:
+        return self.encoder.tokenizer_signature or _CUSTOM_TOKENIZER
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.directory).mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+    @property
+    def count(self) -> int:
+        """Number of indexed documents."""
+        with self._lock:
+            try:
+                return int(self._connect().execute("SELECT COUNT(*) FROM docs").fetchone()[0])
+            except sqlite3.Error as e:
+                raise SparseIndexError(f"Failed to read FTS5 index: {e}")
+
+    def load(self) -> Dict[str, Any]:
+        """Open the index, rebuilding it from ChromaDB when empty or out of sync.
+
+        Returns:
+            Dictionary with status, count and whether a rebuild happened
+
+        Raises:
+            SparseIndexError: If neither opening nor rebuilding succeeds
+        """
+        return self._load()
+
+    def _load(self, added: Sequence[str] = (), removed: Sequence[str] = ()) -> Dict[str, Any]:
+        """Open the index; ``added`` / ``removed`` are IDs already written to / deleted from ChromaDB."""
+        with self._lock:
+            try:
+                conn = self._connect()
+                meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+                name = meta.get("tokenizer_name")
+                if not self._tokenizer_explicit and name in TOKENIZERS and name != self.encoder.tokenizer_name:
+                    logger.info(f"FTS5 index was built with the {name} tokenizer; using it")
+                    self.encoder = self._create_encoder(name)
+                built = meta.get("tokenizer")
+                expected = self.chroma.count()
+                rebuilt = False
+                if built != self._tokenizer_id:
+                    if built is not None:
+                        logger.info("FTS5 index was built with another tokenizer; rebuilding")
+                    self._rebuild()
+                    rebuilt = True
+                elif expected != self._count_after(added, removed):
+                    logger.info(f"FTS5 index is out of sync ({self.count} vs {expected} documents); rebuilding")
+                    self._rebuild()
+                    rebuilt = True
+                self._loaded = True
+                return {"status": "success", "directory": self.directory, "count": self.count, "rebuilt": rebuilt}
+            except SparseIndexError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to load FTS5 index: {e}")
+                raise SparseIndexError(f"Failed to load FTS5 index: {e}")
+
+    def _count_after(self, added: Sequence[str], removed: Sequence[str]) -> int:
+        """Document count once the pending write is applied (what ChromaDB already holds)."""
+        count = self.count
+        if not added and not removed:
+            return count
+        indexed = set(self._existing(list(added) + list(removed)))
+        return count + len(set(added) - indexed) - len((set(removed) & indexed) - set(added))
+
+    def _existing(self, doc_ids: Sequence[str]) -> Dict[str, int]:
+        """Map the given IDs that are indexed to their rowid."""
+        conn = self._connect()
+        unique = list(dict.fromkeys(doc_ids))
+        found: Dict[str, int] = {}
+        for i in range(0, len(unique), _BATCH_SIZE):
+            batch = unique[i:i + _BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(f"SELECT doc_id, rowid FROM docs WHERE doc_id IN ({placeholders})", batch)
+            found.update((doc_id, int(rowid)) for doc_id, rowid in rows)
+        return found
+
+    def _rebuild(self) -> None:
+        """Replace the table contents with every document stored in ChromaDB."""
+        items = self.chroma.get_all_documents(include_documents=True)
+        texts = [it.get("document") or "" for it in items]
+        ids = [it.get("id") for it in items]
+        file_types = [(it.get("metadata") or {}).get("file_type") for it in items]
+        rows = self._rows(texts, ids, file_types)
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM docs")
+            conn.execute("DELETE FROM fts")
+            conn.executemany("INSERT INTO docs (rowid, doc_id, file_type) VALUES (?, ?, ?)",
+                             ((i, doc_id, ft) for i, (doc_id, ft, _) in enumerate(rows, start=1)))
+            conn.executemany("INSERT INTO fts (rowid, tokens) VALUES (?, ?)",
+                             ((i, tokens) for i, (_, _, tokens) in enumerate(rows, start=1)))
+            conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [
+                    ("tokenizer", self._tokenizer_id),
+                    ("tokenizer_name", self.encoder.tokenizer_name or _CUSTOM_TOKENIZER),
+                ],
+            )
+        logger.info(f"Built FTS5 index with {len(rows)} documents ({self.path})")
+
+    def _rows(
+        self,
+        documents: Sequence[str],
+        doc_ids: Sequence[str],
+        file_types: Optional[Sequence[Optional[str]]],
+    ) -> List[Tuple[str, Optional[str], str]]:
+        """Tokenize documents into (doc_id, file_type, space-joined tokens), last one per ID winning."""
+        tokenized = self.encoder.tokenize_documents(documents)
+        rows: Dict[str, Tuple[str, Optional[str], str]] = {}
+        for i, (doc_id, tokens) in enumerate(zip(doc_ids, tokenized)):
+            file_type = file_types[i] if file_types is not None else None
+            rows[doc_id] = (doc_id, file_type or None, " ".join(tokens))
+        return list(rows.values())
+
+    def _ensure_current(self, added: Sequence[str] = (), removed: Sequence[str] = ()) -> None:
+        """Load on first use, and again when another process invalidated or rebuilt the table.
+
+        Other processes' upserts and removals need no reload (they are in the same
+        database), but ``invalidate()`` empties the table and its meta rows, and a
+        rebuild with another tokenizer changes the ``tokenizer`` row. Either shows
+        up as a ``tokenizer`` row that differs from this instance's, and reloading
+        rebuilds from ChromaDB (or adopts the recorded tokenizer).
+        """
+        if not self._loaded or self._stored_tokenizer_id() != self._tokenizer_id:
+            self._load(added, removed)
+
+    def _stored_tokenizer_id(self) -> Optional[str]:
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'tokenizer'").fetchone()
+        return row[0] if row is not None else None
+
+    def invalidate(self) -> None:
+        """Empty the index so the next operation rebuilds it from ChromaDB.
+
+        Used when a write reached ChromaDB but the sparse update failed.
+        """
+        with self._lock:
+            try:
+                conn = self._connect()
+                with conn:
+                    conn.execute("DELETE FROM docs")
+                    conn.execute("DELETE FROM fts")
+                    conn.execute("DELETE FROM meta")
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to clear FTS5 index: {e}")
+            self._loaded = False
+
+    def upsert(
+        self,
+        documents: Sequence[str],
+        doc_ids: Sequence[str],
+        file_types: Optional[Sequence[Optional[str]]] = None,
+    ) -> Dict[str, Any]:
+        """Insert or replace documents in the index.
+
+        Args:
+            documents: Document texts
+            doc_ids: Document IDs (ChromaDB ids / filepaths)
+            file_types: ``file_type`` metadata saved with each document (None: none)
+
+        Returns:
+            Dictionary with status and total count
+
+        Raises:
+            SparseIndexError: If validation or the update fails
+        """
+        if len(documents) != len(doc_ids):
+            raise SparseIndexError(f"Length mismatch: {len(documents)} documents vs {len(doc_ids)} IDs")
+        if file_types is not None and len(file_types) != len(doc_ids):
+            raise SparseIndexError(f"Length mismatch: {len(file_types)} file types vs {len(doc_ids)} IDs")
+        with self._lock:
+            try:
+                self._ensure_current(added=doc_ids)
+                if documents:
+                    rows = self._rows(documents, doc_ids, file_types)
+                    conn = self._connect()
+                    with conn:
+                        existing = self._existing([doc_id for doc_id, _, _ in rows])
+                        for doc_id, file_type, tokens in rows:
+                            rowid = existing.get(doc_id)
+                            if rowid is None:
+                                cur = conn.execute(
+                                    "INSERT INTO docs (doc_id, file_type) VALUES (?, ?)", (doc_id, file_type)
+                                )
+                                rowid = cur.lastrowid
+                            else:
+                                conn.execute("UPDATE docs SET file_type = ? WHERE rowid = ?", (file_type, rowid))
+                                conn.execute("DELETE FROM fts WHERE rowid = ?", (rowid,))
+                            conn.execute("INSERT INTO fts (rowid, tokens) VALUES (?, ?)", (rowid, tokens))
+                return {"status": "success", "count": self.count}
+            except SparseIndexError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to update FTS5 index: {e}")
+                raise SparseIndexError(f"Failed to update FTS5 index: {e}")
+
+    def remove(self, doc_ids: Sequence[str]) -> Dict[str, Any]:
+        """Remove documents from the index. Unknown IDs are ignored.
+
+        Args:
+            doc_ids: Document IDs to remove
+
+        Returns:
+            Dictionary with status, removed count and total count
+
+        Raises:
+            SparseIndexError: If the update fails
+        """
+        with self._lock:
+            try:
+                self._ensure_current(removed=doc_ids)
+                conn = self._connect()
+                with conn:
+                    rowids = list(self._existing(doc_ids).values())
+                    conn.executemany("DELETE FROM fts WHERE rowid = ?", ((r,) for r in rowids))
+                    conn.executemany("DELETE FROM docs WHERE rowid = ?", ((r,) for r in rowids))
+                return {"status": "success", "removed_count": len(rowids), "count": self.count}
+            except SparseIndexError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to update FTS5 index: {e}")
+                raise SparseIndexError(f"Failed to update FTS5 index: {e}")
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        file_type: Optional[str] = None,
+        id_prefix: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Rank documents with FTS5's ``bm25()``.
+
+        Filters restrict which documents are returned; BM25 statistics stay
+        those of the whole table.
+
+        Args:
+            query: Search query text
+            top_k: Number of results to return
+            file_type: Only documents with this ``file_type`` metadata
+            id_prefix: Only documents whose ID (filepath) starts with this prefix
+
+        Returns:
+            List of {id, score} sorted by score (descending). Texts are not
+            stored; callers fetch them from ChromaDB (same as SparseIndex).
+
+        Raises:
+            SparseIndexError: If loading or the query fails
+        """
+        with self._lock:
+            try:
+                self._ensure_current()
+                expression = match_expression(self.encoder.tokenizer(query))
+                if expression is None:
+                    return []
+                sql = (
+                    "SELECT d.doc_id, -bm25(fts) FROM fts JOIN docs d ON d.rowid = fts.rowid "
+                    "WHERE fts MATCH ?"
+                )
+                params: List[Any] = [expression]
+                if file_type is not None:
+                    sql += " AND d.file_type = ?"
+                    params.append(file_type)
+                if id_prefix is not None:
+                    sql += " AND substr(d.doc_id, 1, ?) = ?"
+                    params.extend([len(id_prefix), id_prefix])
+                sql += " ORDER BY bm25(fts) LIMIT ?"
+                params.append(max(1, int(top_k)))
+                rows = self._connect().execute(sql, params).fetchall()
+                return [{"id": doc_id, "score": float(score)} for doc_id, score in rows]
+            except SparseIndexError:
+                raise
+            except Exception as e:
+                logger.error(f"FTS5 index search failed: {e}")
+                raise SparseIndexError(f"FTS5 index search failed: {e}")
+
+    def wait_for_merge(self, timeout: Optional[float] = None) -> bool:
+        """No-op: FTS5 merges its b-tree segments itself during writes. Always True."""
+        return True
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self.token_cache.close()
@@ -10,10 +10,13 @@ Default weights are 0.5 for dense and 0.5 for sparse as agreed.
 from __future__ import annotations
 
 import logging
+import os
 from typing import Any, Dict, List, Optional
 
 from .chromadb_manager import ChromaDBError, ChromaDBManager
-from .sparse_encoder import BM25SparseEncoder
+from .embedding import Embedder
+from .sparse_encoder import TOKENIZERS, BM25SparseEncoder
+from .sparse_index import SparseBackend, SparseIndexError, create_sparse_index
 
 logger = logging.getLogger(__name__)
 
@@ -22,12 +25,24 @@ class HybridRetrieverError(Exception):
     pass
 
 
+def _indexable_filter(where: Optional[Dict[str, Any]]) -> bool:
+    """True if SparseIndex.search can apply the filter: none, or an exact ``file_type`` match."""
+    if not where:
+        return True
+    return list(where) == ["file_type"] and isinstance(where["file_type"], str)
+
+
 class HybridRetriever:
     """Hybrid search using EnsembleRetriever (dense + sparse).
 
     - Dense: Chroma vectorstore retriever (provided by ChromaDBManager.vectorstore)
-    - Sparse: BM25 retriever built from all documents in ChromaDB
+    - Sparse: persistent BM25 index (SparseIndex, or FTS5SparseIndex with
+      ``sparse_backend="fts5"``) when provided, otherwise a BM25 index built
+      from all documents in ChromaDB per query
     - Fusion: RRF via EnsembleRetriever with weights [0.5, 0.5]
+
+    When an ``embedder`` is given, the dense search embeds the query with
+    ``Embedder.embed_query`` (cached per process) and searches by vector.
     """
 
     def __init__(
@@ -35,15 +50,37 @@ class HybridRetriever:
         chroma_manager: ChromaDBManager,
         dense_weight: float = 0.5,
         sparse_weight: float = 0.5,
+        sparse_index: Optional[SparseBackend] = None,
+        sparse_backend: Optional[str] = None,
+        embedder: Optional[Embedder] = None,
     ) -> None:
+        """
+        Args:
+            sparse_index: Loaded persistent sparse index to score against
+            sparse_backend: When no sparse_index is given, open and load the
+                persistent index of this backend ("inverted" or "fts5", see
+                create_sparse_index); if that fails, BM25 is built per query
+            embedder: Embedder producing the same vectors as the vectorstore's
+                embedding function; its query cache is used for the dense search
+                (without it the vectorstore embeds the query text on every call)
+        """
         self.chroma = chroma_manager
         self.dense_weight = dense_weight
         self.sparse_weight = sparse_weight
+        self.sparse_index = sparse_index
+        self.embedder = embedder
 
         if self.chroma.vectorstore is None:
             raise HybridRetrieverError(
                 "Chroma vectorstore is not initialized. Provide embedding_function when creating ChromaDBManager."
             )
+        if sparse_index is None and sparse_backend is not None:
+            try:
+                index = create_sparse_index(self.chroma, sparse_backend)
+                index.load()
+                self.sparse_index = index
+            except SparseIndexError as e:
+                logger.warning(f"Failed to open the {sparse_backend} sparse index, building BM25 per query: {e}")
 
     def _sparse_scores(
         self, query: str, where: Optional[Dict[str, Any]] = None, top_k: int = 5
@@ -51,36 +88,87 @@ class HybridRetriever:
         """Compute BM25 scores and return top results as list of {id, score, metadata, document}.
         
         Only returns items with score > eps (1e-12) to avoid zero-score items affecting RRF ranking.
+        When a persistent sparse index is configured, unfiltered queries and queries filtered by
+        ``file_type`` alone are scored against it (the filter masks its posting lists). Other
+        filters, and queries the index fails to answer, build a throwaway index over the matching
+        documents. Either way the sparse engine only keeps IDs and statistics: the bodies and
+        metadata of the returned top_k are fetched with one batched ``get_by_ids`` call.
         """
+        if self.sparse_index is not None and _indexable_filter(where):
+            file_type = where.get("file_type") if where else None
+            try:
+                return self._indexed_sparse_scores(query, top_k, file_type=file_type)
+            except SparseIndexError as e:
+                logger.warning(f"Sparse index search failed, building a BM25 index for this query: {e}")
+
         items = self.chroma.get_all_documents(where=where, include_documents=True)
         if not items:
             return []
         texts = [it.get("document") or "" for it in items]
-        ids = [it.get("metadata", {}).get("filepath") or it.get("id") for it in items]
-
-        encoder = BM25SparseEncoder()
+        ids = [it.get("id") for it in items]
+        # Only the texts are needed to build the index; drop the item dicts before it is built
+        del items
+
+        # Reuse the persistent index's tokenizer and token cache so the subset is not re-tokenized on every query
+        if self.sparse_index is not None:
+            indexed = self.sparse_index.encoder
+            encoder = BM25SparseEncoder(
+                tokenizer=indexed.tokenizer_name if indexed.tokenizer_name in TOKENIZERS else indexed.tokenizer,
+                engine="inverted",
+                token_cache=self.sparse_index.token_cache,
+                tokenizer_signature=indexed.tokenizer_signature,
+            )
+        else:
+            encoder = BM25SparseEncoder(tokenizer=os.getenv("SEMCHE_SPARSE_TOKENIZER") or None, engine="inverted")
         encoder.build_index(texts, ids)
-        sparse_top = encoder.search(query, top_k=max(1, int(top_k)))
+        del texts
+        return self._hydrate(encoder.search(query, top_k=max(1, int(top_k))))
 
-        # Map scores back to full item info
-        id_to_item = {}
-        for it in items:
-            key = (it.get("metadata", {}).get("filepath") or it.get("id"))
-            id_to_item[key] = it
+    def _indexed_sparse_scores(
+        self, query: str, top_k: int, file_type: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Score against the persistent sparse index."""
+        sparse_top = self.sparse_index.search(query, top_k=max(1, int(top_k)), file_type=file_type)
+        return self._hydrate(sparse_top, file_type=file_type)
 
+    def _hydrate(
+        self, sparse_top: List[Dict[str, Any]], file_type: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Attach bodies and metadata to sparse results ({id, score}) with one batched lookup.
+
+        Results with score <= eps (1e-12) are dropped so that unrelated items do not affect RRF.
+        """
         eps = 1e-12
+        sparse_top = [r for r in sparse_top if float(r["score"]) > eps]
+        if not sparse_top:
+            return []
+
+        got = self.chroma.get_by_ids([r["id"] for r in sparse_top])
+        metadatas = got.get("metadatas") or []
+        documents = got.get("documents") or []
+        id_to_metadata = {
+            _id: (metadatas[i] if i < len(metadatas) else None) or {}
+            for i, _id in enumerate(got.get("ids") or [])
+        }
+        id_to_document = {
+            _id: documents[i] if i < len(documents) else None
+            for i, _id in enumerate(got.get("ids") or [])
+        }
+
         results: List[Dict[str, Any]] = []
         for r in sparse_top:
-            score = float(r["score"])
-            # Filter out zero or near-zero scores to prevent unrelated items from affecting RRF
-            if score <= eps:
+            md = id_to_metadata.get(r["id"])
+            if md is None:
+                # Deleted from ChromaDB but not (yet) from the sparse index
+                continue
+            if file_type is not None and md.get("file_type") != file_type:
+                # Re-typed in ChromaDB but not (yet) in the sparse index
                 continue
-            it = id_to_item.get(r["id"]) or {}
             results.append({
-                "id": r["id"],
-                "score": score,
-                "metadata": it.get("metadata", {}),
-                "document": it.get("document"),
+                "id": md.get("filepath") or r["id"],
+                "score": float(r["score"]),
+                "metadata": md,
+                "document": id_to_document.get(r["id"]),
             })
         return results
 
@@ -97,12 +185,23 @@ class HybridRetriever:
         """
         try:
             k = max(1, int(top_k))
-            # Dense: similarity_search_with_relevance_scores (text)
-            dense_pairs = self.chroma.vectorstore.similarity_search_with_relevance_scores(
-                query=query,
-                k=k * 2,
-                filter=where if where else None,
-            )
+            # The vectorstore is queried directly, so reject a collection built in another
+            # embedding space here (e.g. static vs transformer vectors; ChromaDBError)
+            self.chroma.verify_embedding_space()
+            # Dense: by the cached query vector when an embedder is set, else by text
+            # (only the order of the results is used, so raw distances are fine)
+            if self.embedder is not None:
+                dense_pairs = self.chroma.vectorstore.similarity_search_by_vector_with_relevance_scores(
+                    embedding=self.embedder.embed_query(query),  # Chroma accepts the float32 array as is
+                    k=k * 2,
+                    filter=where if where else None,
+                )
+            else:
+                dense_pairs = self.chroma.vectorstore.similarity_search_with_relevance_scores(
+                    query=query,
+                    k=k * 2,
+                    filter=where if where else None,
+                )
             dense_rank: Dict[str, int] = {}
             id_to_item: Dict[str, Dict[str, Any]] = {}
             for idx, (doc, _score) in enumerate(dense_pairs, start=1):
@@ -0,0 +1,539 @@
+"""Versioned, memory-mappable on-disk format for the BM25 index.
+
+The legacy format pickles the whole scorer and dumps every corpus text into an
+indented JSON file, so each process that loads it holds a private copy of
+everything. This format stores the inverted index as plain NumPy arrays
+(``.npy``) that ``load`` memory-maps read-only: startup only parses a small
+manifest, and several server processes share the same page cache.
+
+Layout of an index directory::
+
+    bm25_metadata.json                   manifest (format, version, parameters, file names)
+    bm25-seg-<segment>-<name>.npy        arrays of one posting segment (SEGMENT_FILES)
+    bm25-vocab-<vocab id>-<part>.npy     sorted base vocabulary (string table)
+    bm25-<generation>-<name>.npy         terms added since the base vocabulary, tombstones
+                                         and the file type of each document
+
+Strings (vocabulary, document IDs) are stored as string tables: UTF-8 bytes
+concatenated in a ``uint8`` array plus ``int64`` offsets. The vocabulary is
+sorted by UTF-8 bytes, so term lookups are a binary search over the mapped
+table instead of a dict built at load time. Each segment stores the IDs of its
+own document range. Document texts are not stored: ChromaDB holds them.
+
+Segments are immutable, so a save only writes the segments created since the
+previous save (plus the small per-generation files) and then atomically
+replaces the manifest, which is the commit point. Readers that still have
+previous files mapped keep working; files no longer referenced by the manifest
+are removed on the next save.
+
+Version 5 dropped the per-segment document texts; the texts of older segments
+are ignored when reading and their files are removed once a save references
+the segment again. Version 4 added the per-document file types (a code per document index into a
+string table of file type names), which filtered searches turn into document
+masks. Version 3 introduced segments. Versions 1 and 2 (a single set of arrays per
+generation, see ARRAY_FILES) are still readable and load as a single segment;
+version 1 lacks the arrays used for incremental updates (forward index and
+per-term max tf / min document length), which are then derived from the postings.
+"""
+import bisect
+import json
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union, overload
+
+import numpy as np
+
+from .inverted_index import (
+    ARRAY_NAMES,
+    SEGMENT_ARRAY_NAMES,
+    UPDATE_ARRAY_NAMES,
+    InvertedBM25Index,
+    PostingSegment,
+)
+
+logger = logging.getLogger(__name__)
+
+FORMAT_NAME = "semche-bm25"
+FORMAT_VERSION = 5
+MANIFEST_NAME = "bm25_metadata.json"
+LEGACY_INDEX_NAME = "bm25_index.pkl"
+ARRAY_FILE_PREFIX = "bm25-"
+
+STRING_TABLES = ("vocab", "ids", "texts")
+# Array files of a version 1/2 generation
+ARRAY_FILES = ARRAY_NAMES + tuple(f"{t}_{part}" for t in STRING_TABLES for part in ("offsets", "data"))
+# String tables no longer read (document texts, versions 1 to 4)
+_UNUSED_TABLE_FILES = ("texts_offsets", "texts_data")
+# Array files of the base vocabulary
+VOCAB_FILES = ("vocab_offsets", "vocab_data")
+# Generation array files holding the file type of each document (version 4)
+FILE_TYPE_FILES = ("file_types_offsets", "file_types_data", "file_type_codes")
+# Array files of a segment (version 3/4 segments also have texts tables, which are not read)
+SEGMENT_FILES = SEGMENT_ARRAY_NAMES + ("ids_offsets", "ids_data")
+
+
+class IndexFormatError(Exception):
+    """On-disk BM25 index format errors"""
+
+    pass
+
+
+class StringTable(Sequence[str]):
+    """Read-only list of strings backed by UTF-8 bytes + offsets (memory-mappable).
+
+    Attributes:
+        offsets: int64 array of length n + 1; string i is data[offsets[i]:offsets[i + 1]]
+        data: uint8 array with the concatenated UTF-8 bytes
+    """
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray) -> None:
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def from_strings(cls, strings: Sequence[str]) -> "StringTable":
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(offsets, data)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _bytes(self, i: int) -> bytes:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    @overload
+    def __getitem__(self, i: int) -> str: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> List[str]: ...
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("StringTable index out of range")
+        return self._bytes(i).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self._bytes(i).decode("utf-8")
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (list, tuple, StringTable)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"StringTable(len={len(self)})"
+
+
+class VocabTable(Mapping[str, int]):
+    """Term -> term id lookup over a sorted StringTable (binary search, no dict).
+
+    Term ids are positions in the table, which is sorted by UTF-8 bytes
+    (the order InvertedBM25Index assigns term ids in).
+    """
+
+    def __init__(self, terms: StringTable) -> None:
+        self.terms = terms
+
+    def _find(self, term: str) -> Optional[int]:
+        key = term.encode("utf-8")
+        lo, hi = 0, len(self.terms)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.terms._bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.terms) and self.terms._bytes(lo) == key:
+            return lo
+        return None
+
+    def get(self, term: str, default: Any = None) -> Any:
+        # Overridden so that a miss does not raise and catch a KeyError
+        tid = self._find(term)
+        return default if tid is None else tid
+
+    def __getitem__(self, term: str) -> int:
+        tid = self._find(term)
+        if tid is None:
+            raise KeyError(term)
+        return tid
+
+    def __contains__(self, term: object) -> bool:
+        return isinstance(term, str) and self._find(term) is not None
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.terms)
+
+
+class StringTableChain(Sequence[str]):
+    """Read-only concatenation of the per-segment string tables (document IDs).
+
+    Attributes:
+        starts: Position of the first string of each table
+        tables: StringTables in order
+    """
+
+    def __init__(self, tables: Sequence[Sequence[str]]) -> None:
+        self.tables = list(tables)
+        self.starts: List[int] = []
+        total = 0
+        for table in self.tables:
+            self.starts.append(total)
+            total += len(table)
+        self._len = total
+
+    def __len__(self) -> int:
+        return self._len
+
+    @overload
+    def __getitem__(self, i: int) -> str: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> List[str]: ...
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError("StringTableChain index out of range")
+        t = bisect.bisect_right(self.starts, i) - 1
+        return self.tables[t][i - self.starts[t]]
+
+    def __iter__(self) -> Iterator[str]:
+        for table in self.tables:
+            yield from table
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Sequence):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"StringTableChain(len={len(self)}, tables={len(self.tables)})"
+
+
+def read_manifest(directory: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    """Return the parsed manifest (or legacy metadata) file, or None when it does not exist."""
+    path = Path(directory) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def is_binary_manifest(manifest: Dict[str, Any]) -> bool:
+    """True for this format; the legacy pickle format's metadata has no ``format`` key."""
+    return manifest.get("format") == FORMAT_NAME
+
+
+def _save_array(path: Path, array: np.ndarray) -> None:
+    """Write an array file atomically (a concurrent reader never sees a partial file)."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(array), allow_pickle=False)
+    os.replace(tmp_path, path)
+
+
+def _write_arrays(
+    dir_path: Path,
+    prefix: str,
+    arrays: Dict[str, np.ndarray],
+    written: List[str],
+) -> Dict[str, str]:
+    """Write ``<prefix>-<name>.npy`` files, skipping files that already exist (they are immutable)."""
+    files: Dict[str, str] = {}
+    for name, array in arrays.items():
+        filename = f"{prefix}-{name}.npy"
+        path = dir_path / filename
+        if not path.exists():
+            _save_array(path, array)
+            written.append(str(path))
+        files[name] = filename
+    return files
+
+
+def _table_arrays(name: str, strings: Sequence[str]) -> Dict[str, np.ndarray]:
+    table = StringTable.from_strings(strings)
+    return {f"{name}_offsets": table.offsets, f"{name}_data": table.data}
+
+
+def _vocab_arrays(vocab: Mapping[str, int]) -> Dict[str, np.ndarray]:
+    """String table arrays of a base vocabulary, sorted by term id."""
+    if isinstance(vocab, VocabTable):
+        # Loaded vocabulary: already a sorted string table, no per-term lookups
+        return {"vocab_offsets": vocab.terms.offsets, "vocab_data": vocab.terms.data}
+    return _table_arrays("vocab", sorted(vocab, key=vocab.__getitem__))
+
+
+def write_segment(
+    directory: Union[str, Path],
+    segment: PostingSegment,
+    ids: Sequence[str],
+    written: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Write the files of one segment unless they exist already.
+
+    Args:
+        directory: Index directory (created if missing)
+        segment: Segment to write
+        ids: Document IDs of the whole index (indexed by document index)
+        written: Optional list the paths of written files are appended to
+
+    Returns:
+        Manifest entry of the segment
+    """
+    dir_path = Path(directory)
+    dir_path.mkdir(parents=True, exist_ok=True)
+    start, end = segment.doc_start, segment.doc_start + segment.doc_count
+    if written is None:
+        written = []
+    prefix = f"{ARRAY_FILE_PREFIX}seg-{segment.name}"
+    if not all((dir_path / f"{prefix}-{name}.npy").exists() for name in SEGMENT_FILES):
+        arrays = segment.arrays()
+        arrays.update(_table_arrays("ids", ids[start:end]))
+        _write_arrays(dir_path, prefix, arrays, written)
+    return {
+        "name": segment.name,
+        "doc_start": segment.doc_start,
+        "doc_count": segment.doc_count,
+        "postings": segment.n_postings,
+        "arrays": {name: f"{prefix}-{name}.npy" for name in SEGMENT_FILES},
+    }
+
+
+def write_index(
+    directory: Union[str, Path],
+    index: InvertedBM25Index,
+    ids: Sequence[str],
+    engine: str = "inverted",
+    file_types: Optional[Tuple[Sequence[str], np.ndarray]] = None,
+    tokenizer: Optional[Dict[str, str]] = None,
+) -> List[str]:
+    """Write the segments not yet on disk and commit the index via a new manifest.
+
+    Args:
+        directory: Index directory (created if missing)
+        index: InvertedBM25Index without buffered documents (see InvertedBM25Index.flush)
+        ids: Document IDs aligned with the index's document indices
+        engine: Engine name recorded in the manifest
+        file_types: (file type names, int32 code per document index; -1 for none).
+            Omitted: every document is stored without a file type
+        tokenizer: {"name", "signature"} of the tokenizer that produced the terms,
+            recorded in the manifest (omitted: not recorded)
+
+    Returns:
+        Paths of the files written by this call (manifest last)
+
+    Raises:
+        IndexFormatError: If the index has buffered documents
+    """
+    if index.buffered_count:
+        raise IndexFormatError("Index has buffered documents; call flush() before writing")
+    dir_path = Path(directory)
+    dir_path.mkdir(parents=True, exist_ok=True)
+
+    written: List[str] = []
+    segments = []
+    for segment in index.segments:
+        segments.append(write_segment(dir_path, segment, ids, written))
+
+    # The base vocabulary only changes with a rebuild or compaction, which assign a new vocab_id
+    vocab_prefix = f"{ARRAY_FILE_PREFIX}vocab-{index.vocab_id}"
+    vocab_files = {name: f"{vocab_prefix}-{name}.npy" for name in VOCAB_FILES}
+    if not all((dir_path / filename).exists() for filename in vocab_files.values()):
+        _write_arrays(dir_path, vocab_prefix, _vocab_arrays(index.vocab), written)
+    generation = uuid.uuid4().hex[:12]
+    generation_arrays = _table_arrays("extra_terms", index.extra_terms())
+    generation_arrays["tombstones"] = index.deleted
+    names, codes = file_types if file_types is not None else ([], np.full(len(index.deleted), -1, dtype=np.int32))
+    generation_arrays.update(_table_arrays("file_types", names))
+    generation_arrays["file_type_codes"] = np.asarray(codes, dtype=np.int32)
+    generation_files = _write_arrays(dir_path, f"{ARRAY_FILE_PREFIX}{generation}", generation_arrays, written)
+
+    manifest = {
+        "format": FORMAT_NAME,
+        "format_version": FORMAT_VERSION,
+        "engine": engine,
+        "generation": generation,
+        "count": index.corpus_size,
+        "params": {
+            "k1": index.k1,
+            "b": index.b,
+            "epsilon": index.epsilon,
+            "corpus_size": index.corpus_size,
+            "total_len": index.total_len,
+            "avgdl": index.avgdl,
+            "average_idf": index.average_idf,
+        },
+        "vocab": {"id": index.vocab_id, "arrays": vocab_files},
+        "arrays": generation_files,
+        "segments": segments,
+    }
+    if tokenizer is not None:
+        manifest["tokenizer"] = tokenizer
+    manifest_path = dir_path / MANIFEST_NAME
+    tmp_path = manifest_path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+    written.append(str(manifest_path))
+
+    remove_stale_files(dir_path, keep=_manifest_files(manifest))
+    return written
+
+
+def _manifest_files(manifest: Dict[str, Any]) -> List[str]:
+    """Names of every array file referenced by a manifest."""
+    files = list(manifest.get("arrays", {}).values())
+    files.extend(manifest.get("vocab", {}).get("arrays", {}).values())
+    for segment in manifest.get("segments", []):
+        files.extend(segment["arrays"].values())
+    return files
+
+
+def _load_array(path: Path, mmap: bool) -> np.ndarray:
+    if not mmap:
+        return np.load(path, allow_pickle=False)
+    try:
+        return np.load(path, mmap_mode="r", allow_pickle=False)
+    except ValueError:
+        # Zero-length arrays cannot be memory-mapped
+        return np.load(path, allow_pickle=False)
+
+
+def _load_arrays(dir_path: Path, files: Dict[str, str], names: Sequence[str], mmap: bool) -> Dict[str, np.ndarray]:
+    arrays: Dict[str, np.ndarray] = {}
+    for name in names:
+        filename = files.get(name)
+        if filename is None or not (dir_path / filename).exists():
+            raise IndexFormatError(f"BM25 index array file not found: {name} ({filename})")
+        arrays[name] = _load_array(dir_path / filename, mmap)
+    return arrays
+
+
+def _table(arrays: Dict[str, np.ndarray], name: str) -> StringTable:
+    return StringTable(arrays[f"{name}_offsets"], arrays[f"{name}_data"])
+
+
+def read_index(
+    directory: Union[str, Path],
+    manifest: Optional[Dict[str, Any]] = None,
+    mmap: bool = True,
+) -> Tuple[InvertedBM25Index, Sequence[str], Dict[str, Any]]:
+    """Open an index written by write_index (any supported format version).
+
+    Args:
+        directory: Index directory
+        manifest: Already parsed manifest (read from directory when omitted)
+        mmap: Memory-map the arrays read-only (default) instead of reading them into memory
+
+    Returns:
+        Tuple of (index, document IDs, manifest); IDs are indexed by document
+        index and include removed documents
+
+    Raises:
+        IndexFormatError: If the manifest is missing, of another format or a newer version
+    """
+    dir_path = Path(directory)
+    if manifest is None:
+        manifest = read_manifest(dir_path)
+    if manifest is None:
+        raise IndexFormatError(f"BM25 index manifest not found: {dir_path / MANIFEST_NAME}")
+    if not is_binary_manifest(manifest):
+        raise IndexFormatError("Not a binary BM25 index manifest")
+    version = manifest.get("format_version")
+    if not isinstance(version, int) or version > FORMAT_VERSION:
+        raise IndexFormatError(
+            f"Unsupported BM25 index format version: {version} (supported: <= {FORMAT_VERSION})"
+        )
+
+    if version < 3:
+        names = [
+            name for name in ARRAY_FILES
+            if (version >= 2 or name not in UPDATE_ARRAY_NAMES) and name not in _UNUSED_TABLE_FILES
+        ]
+        arrays = _load_arrays(dir_path, manifest["arrays"], names, mmap)
+        vocab = VocabTable(_table(arrays, "vocab"))
+        index = InvertedBM25Index.from_arrays(arrays, vocab, manifest["params"])
+        return index, _table(arrays, "ids"), manifest
+
+    segments: List[PostingSegment] = []
+    ids: List[StringTable] = []
+    for entry in manifest["segments"]:
+        arrays = _load_arrays(dir_path, entry["arrays"], SEGMENT_FILES, mmap)
+        segments.append(PostingSegment(entry["doc_start"], arrays, name=entry["name"]))
+        ids.append(_table(arrays, "ids"))
+    vocab_arrays = _load_arrays(dir_path, manifest["vocab"]["arrays"], VOCAB_FILES, mmap)
+    generation_arrays = _load_arrays(
+        dir_path, manifest["arrays"], ("extra_terms_offsets", "extra_terms_data", "tombstones"), mmap=False
+    )
+    index = InvertedBM25Index.from_segments(
+        segments,
+        VocabTable(_table(vocab_arrays, "vocab")),
+        manifest["vocab"]["id"],
+        list(_table(generation_arrays, "extra_terms")),
+        generation_arrays["tombstones"],
+        manifest["params"],
+    )
+    return index, StringTableChain(ids), manifest
+
+
+def read_file_types(
+    directory: Union[str, Path],
+    manifest: Dict[str, Any],
+) -> Optional[Tuple[List[str], np.ndarray]]:
+    """Read the per-document file types of an index opened with read_index.
+
+    Args:
+        directory: Index directory
+        manifest: Manifest returned by read_index
+
+    Returns:
+        Tuple of (file type names, int32 code per document index; -1 for none),
+        or None for indexes written before format version 4
+    """
+    if manifest.get("format_version", 0) < 4:
+        return None
+    arrays = _load_arrays(Path(directory), manifest["arrays"], FILE_TYPE_FILES, mmap=False)
+    return list(_table(arrays, "file_types")), arrays["file_type_codes"]
+
+
+def remove_stale_files(directory: Union[str, Path], keep: Sequence[str] = ()) -> None:
+    """Remove array files of old generations (and the legacy pickle), except ``keep``.
+
+    Removal is best effort: a file still mapped by a reader cannot be deleted on
+    Windows and is retried on the next save.
+    """
+    dir_path = Path(directory)
+    keep_set = set(keep)
+    for path in list(dir_path.glob(f"{ARRAY_FILE_PREFIX}*.npy")) + [dir_path / LEGACY_INDEX_NAME]:
+        if path.name in keep_set or not path.exists():
+            continue
+        try:
+            path.unlink()
+        except OSError as e:
+            logger.debug(f"Could not remove stale index file {path}: {e}")
+
+
+def remove_index_files(directory: Union[str, Path]) -> None:
+    """Remove every index file (manifest, arrays of all generations and the legacy pickle)."""
+    remove_stale_files(directory)
+    manifest_path = Path(directory) / MANIFEST_NAME
+    if manifest_path.exists():
+        manifest_path.unlink()
@@ -0,0 +1,972 @@
+"""Inverted-index BM25 scorer.
+
+``rank_bm25.BM25Okapi.get_scores`` walks every document for every query token.
+This module keeps CSR-style posting lists (term -> doc ids + term frequencies)
+together with precomputed IDF and per-document length norms, so scoring a query
+only touches the documents that contain one of its terms.
+
+Scores are identical to ``BM25Okapi`` (same k1/b/epsilon defaults and the same
+``eps * average_idf`` floor for negative IDF), which keeps the engines
+interchangeable behind ``BM25SparseEncoder``.
+
+``top_k`` adds MaxScore-style dynamic pruning: every term stores an upper bound
+of its contribution, and once the remaining terms cannot lift an unseen document
+above the current k-th score, only the surviving candidates are looked up in the
+remaining (usually long, low-IDF) posting lists.
+
+The per-query work before scoring (vocabulary lookups, term weights and bounds)
+is kept in a ``QueryPlan``. A plan records the statistics generation it was made
+for; every refresh of the statistics starts a new generation, so callers can
+cache plans per query and ``plan`` only recomputes the ones that went stale.
+
+Postings are organized like an LSM tree. ``add_documents`` writes to a small
+in-memory buffer, ``flush`` turns the buffer into an immutable
+``PostingSegment``, and ``remove_documents`` only sets a tombstone. Term ids and
+document indices are global across segments, so document frequencies, the
+total length and hence IDF are index-wide statistics: they are adjusted in place
+on every update (a per-segment forward index tells which frequencies a removal
+touches) and derived values are recomputed with a few vectorized passes before
+the next query. ``merge_segments`` rewrites adjacent segments into one without
+the postings of removed documents; it keeps document indices, so merges can run
+in the background while the index keeps taking updates.
+"""
+import bisect
+import itertools
+import threading
+import uuid
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Arrays of a PostingSegment (see PostingSegment.from_arrays / index_format.py)
+SEGMENT_ARRAY_NAMES = (
+    "term_ids", "indptr", "postings_docs", "postings_tfs",
+    "doc_terms_indptr", "doc_terms", "doc_len", "max_tf", "min_dl",
+)
+# Arrays used for incremental updates: forward index and per-term impact bound inputs
+UPDATE_ARRAY_NAMES = ("doc_terms_indptr", "doc_terms", "max_tf", "min_dl")
+# Arrays of a single-segment index (on-disk format versions 1 and 2, see from_arrays)
+ARRAY_NAMES = (
+    "indptr", "postings_docs", "postings_tfs", "doc_len", "doc_norm", "idf", "max_impact",
+) + UPDATE_ARRAY_NAMES
+
+# Merge a run of segments once the next older segment is at most this many times larger
+MERGE_FACTOR = 4
+
+# min_dl of a term without postings (keeps its impact bound at ~0)
+_NO_LENGTH = np.iinfo(np.int32).max
+
+
+# Statistics generations, unique across all indexes of the process (see QueryPlan)
+_generations = itertools.count(1)
+
+# Per-thread scratch buffers of top_k() (zero outside a call; see _scratch_buffers)
+_scratch = threading.local()
+
+
+def _new_name() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def _scratch_buffers(n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """This thread's (score accumulator, touched flags), all zero, covering at least n documents.
+
+    Allocated once per thread (grown geometrically with the corpus) instead of
+    once per query; callers reset only the positions they touched.
+    """
+    acc: Optional[np.ndarray] = getattr(_scratch, "acc", None)
+    if acc is None or len(acc) < n:
+        size = max(n, 2 * len(acc) if acc is not None else 0)
+        _scratch.acc = np.zeros(size, dtype=np.float64)
+        _scratch.touched = np.zeros(size, dtype=bool)
+    return _scratch.acc, _scratch.touched
+
+
+def _range_indices(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concatenation of ``arange(start, start + length)`` for every pair, vectorized."""
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + (np.arange(total) - offsets)
+
+
+class PostingSegment:
+    """Immutable posting lists of the documents ``[doc_start, doc_start + doc_count)``.
+
+    Term ids and document indices are global to the owning index. Only terms
+    that occur in the segment are stored (``term_ids``), so a segment flushed
+    for a few documents stays small however large the vocabulary is.
+
+    Attributes:
+        name: Unique segment name (used in its file names)
+        doc_start: First document index of the segment
+        term_ids: Sorted ids of the terms with postings in this segment
+        indptr: Posting list boundaries per entry of term_ids (CSR)
+        postings_docs: Document indices, ascending within a term
+        postings_tfs: Term frequencies aligned with postings_docs
+        doc_terms_indptr, doc_terms: Forward index (term ids per document of the segment)
+        doc_len: Document lengths (in tokens)
+        max_tf, min_dl: Per entry of term_ids, the largest tf and the shortest document length
+    """
+
+    def __init__(
+        self,
+        doc_start: int,
+        arrays: Mapping[str, np.ndarray],
+        name: Optional[str] = None,
+    ) -> None:
+        self.name = name or _new_name()
+        self.doc_start = int(doc_start)
+        self.term_ids: np.ndarray = arrays["term_ids"]
+        self.indptr: np.ndarray = arrays["indptr"]
+        self.postings_docs: np.ndarray = arrays["postings_docs"]
+        self.postings_tfs: np.ndarray = arrays["postings_tfs"]
+        self.doc_terms_indptr: np.ndarray = arrays["doc_terms_indptr"]
+        self.doc_terms: np.ndarray = arrays["doc_terms"]
+        self.doc_len: np.ndarray = arrays["doc_len"]
+        self.max_tf: np.ndarray = arrays["max_tf"]
+        self.min_dl: np.ndarray = arrays["min_dl"]
+        # The first segment of a fresh build holds every term: look term ids up directly
+        n = len(self.term_ids)
+        self._dense = n == 0 or int(self.term_ids[-1]) == n - 1
+
+    @classmethod
+    def from_postings(
+        cls,
+        doc_start: int,
+        doc_len: np.ndarray,
+        term_ids: np.ndarray,
+        doc_ids: np.ndarray,
+        tfs: np.ndarray,
+    ) -> "PostingSegment":
+        """Build a segment from (term id, document index, tf) triples.
+
+        Args:
+            doc_start: First document index of the segment
+            doc_len: Lengths of the documents [doc_start, doc_start + len(doc_len))
+            term_ids, doc_ids, tfs: Postings in any order
+        """
+        n_docs = len(doc_len)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        tfs = np.asarray(tfs, dtype=np.float32)
+        # Term-major with documents ascending inside each posting list
+        order = np.lexsort((doc_ids, term_ids))
+        t = term_ids[order]
+        docs = doc_ids[order]
+        starts = np.flatnonzero(np.r_[True, t[1:] != t[:-1]]) if len(t) else np.zeros(0, dtype=np.int64)
+        indptr = np.append(starts, len(t)).astype(np.int64)
+        fwd = np.argsort(doc_ids, kind="stable")
+        doc_terms_indptr = np.zeros(n_docs + 1, dtype=np.int64)
+        np.cumsum(np.bincount(doc_ids - doc_start, minlength=n_docs), out=doc_terms_indptr[1:])
+        doc_len = np.asarray(doc_len, dtype=np.int32)
+        if len(t):
+            max_tf = np.maximum.reduceat(tfs[order], starts)
+            min_dl = np.minimum.reduceat(doc_len[docs - doc_start], starts)
+        else:
+            max_tf = np.zeros(0, dtype=np.float32)
+            min_dl = np.zeros(0, dtype=np.int32)
+        return cls(doc_start, {
+            "term_ids": t[starts].astype(np.int32),
+            "indptr": indptr,
+            "postings_docs": docs,
+            "postings_tfs": tfs[order],
+            "doc_terms_indptr": doc_terms_indptr,
+            "doc_terms": term_ids[fwd].astype(np.int32),
+            "doc_len": doc_len,
+            "max_tf": max_tf,
+            "min_dl": min_dl,
+        })
+
+    @property
+    def doc_count(self) -> int:
+        return len(self.doc_len)
+
+    @property
+    def n_postings(self) -> int:
+        return len(self.postings_docs)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in SEGMENT_ARRAY_NAMES}
+
+    def postings(self, tid: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(document indices, tfs) of a term, or None when the term has no postings here."""
+        if self._dense:
+            if tid >= len(self.term_ids):
+                return None
+            i = tid
+        else:
+            i = int(np.searchsorted(self.term_ids, tid))
+            if i == len(self.term_ids) or self.term_ids[i] != tid:
+                return None
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.postings_docs[start:end], self.postings_tfs[start:end]
+
+    def posting_terms(self) -> np.ndarray:
+        """Term id of every posting (aligned with postings_docs)."""
+        return np.repeat(np.asarray(self.term_ids, dtype=np.int64), np.diff(self.indptr))
+
+    def doc_term_ids(self, doc: int) -> np.ndarray:
+        local = doc - self.doc_start
+        return self.doc_terms[self.doc_terms_indptr[local]:self.doc_terms_indptr[local + 1]]
+
+    def __repr__(self) -> str:
+        return (
+            f"PostingSegment(name={self.name}, docs={self.doc_start}+{self.doc_count}, "
+            f"terms={len(self.term_ids)}, postings={self.n_postings})"
+        )
+
+
+class QueryPlan:
+    """Query terms resolved against one statistics generation of an InvertedBM25Index.
+
+    Attributes:
+        token_counts: (token, query term frequency) of the query, in first-seen order
+        generation: InvertedBM25Index.generation the plan was made for
+        terms: (term id, query term frequency) of tokens present in a live document
+        weights: ``qtf * idf`` per entry of terms
+        bounds: Score upper bound per entry of terms (``weights * max_impact``)
+    """
+
+    def __init__(
+        self,
+        token_counts: Sequence[Tuple[str, int]],
+        generation: int,
+        terms: List[Tuple[int, int]],
+        weights: np.ndarray,
+        bounds: np.ndarray,
+    ) -> None:
+        self.token_counts = tuple(token_counts)
+        self.generation = generation
+        self.terms = terms
+        self.weights = weights
+        self.bounds = bounds
+
+    def __repr__(self) -> str:
+        return f"QueryPlan(tokens={len(self.token_counts)}, terms={len(self.terms)}, generation={self.generation})"
+
+
+class InvertedBM25Index:
+    """BM25 (Okapi) scorer backed by posting lists in immutable segments plus a write buffer.
+
+    Document indices only grow: added documents get new indices after the
+    existing ones and removed documents stay tombstoned (``compact`` renumbers).
+
+    Attributes:
+        k1, b, epsilon: BM25Okapi parameters
+        corpus_size: Number of live (not removed) documents
+        avgdl: Average document length (in tokens) of live documents
+        vocab: Term -> term id of the sorted base vocabulary (ids follow the UTF-8
+            byte order of the terms); terms first seen later get ids after it
+        vocab_id: Unique name of the base vocabulary (used in its file names)
+        segments: Immutable PostingSegments, ordered by document index
+        doc_len: Document lengths (in tokens), including buffered and removed documents
+        deleted: Tombstone flag per document index
+        df: Document frequency per term id (live documents only)
+        max_tf, min_dl: Per-term maximum tf and minimum document length over its postings
+        doc_norm: Per-document ``k1 * (1 - b + b * doc_len / avgdl)``
+        idf: IDF per term id
+        max_impact: Per-term upper bound of ``tf * (k1 + 1) / (tf + doc_norm)`` (score upper bound / idf)
+        generation: Changes whenever the statistics above (or term ids) change; unique per process
+    """
+
+    def __init__(
+        self,
+        tokenized_corpus: Sequence[Sequence[str]],
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+    ) -> None:
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+
+        vocab: Dict[str, int] = {}
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        tfs: List[int] = []
+        doc_len = np.zeros(len(tokenized_corpus), dtype=np.int32)
+        for d, tokens in enumerate(tokenized_corpus):
+            doc_len[d] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(d)
+                tfs.append(tf)
+        self._set_postings(
+            list(vocab),
+            np.asarray(term_ids, dtype=np.int64),
+            np.asarray(doc_ids, dtype=np.int32),
+            np.asarray(tfs, dtype=np.float32),
+            doc_len,
+        )
+
+    def _set_postings(
+        self,
+        terms: Sequence[str],
+        term_ids: np.ndarray,
+        doc_ids: np.ndarray,
+        tfs: np.ndarray,
+        doc_len: np.ndarray,
+    ) -> None:
+        """Make a single segment from (term id, document, tf) triples and reset all state.
+
+        ``terms[i]`` is the string of provisional term id ``i``; every term must have a posting.
+        """
+        n_terms = len(terms)
+        # Renumber terms in UTF-8 byte order so the vocabulary can be stored as a
+        # sorted string table and binary-searched without building a dict (index_format.py)
+        sorted_ids = sorted(range(n_terms), key=lambda i: terms[i].encode("utf-8"))
+        rank = np.zeros(n_terms, dtype=np.int64)
+        rank[sorted_ids] = np.arange(n_terms)
+        self.vocab: Mapping[str, int] = {terms[i]: r for r, i in enumerate(sorted_ids)}
+        self.vocab_id = _new_name()
+        self._new_terms: Dict[str, int] = {}
+        segment = PostingSegment.from_postings(0, doc_len, rank[term_ids], doc_ids, tfs)
+        self._set_segments([segment], np.zeros(len(doc_len), dtype=bool))
+
+    def _set_segments(self, segments: Sequence[PostingSegment], deleted: np.ndarray) -> None:
+        """Derive document and term statistics from segments (covering every document) and tombstones."""
+        self.segments = list(segments)
+        self._segment_starts = [seg.doc_start for seg in self.segments]
+        self.doc_len = (
+            np.concatenate([np.asarray(seg.doc_len, dtype=np.int32) for seg in self.segments])
+            if self.segments else np.zeros(0, dtype=np.int32)
+        )
+        self.deleted = deleted
+        self.n_deleted = int(deleted.sum())
+
+        n_terms = self.vocab_size
+        self.df = np.zeros(n_terms, dtype=np.int64)
+        self.max_tf = np.zeros(n_terms, dtype=np.float32)
+        self.min_dl = np.full(n_terms, _NO_LENGTH, dtype=np.int32)
+        for seg in self.segments:
+            # term_ids are unique within a segment, so fancy-index updates are safe
+            tids = np.asarray(seg.term_ids, dtype=np.int64)
+            self.df[tids] += np.diff(seg.indptr)
+            self.max_tf[tids] = np.maximum(self.max_tf[tids], seg.max_tf)
+            self.min_dl[tids] = np.minimum(self.min_dl[tids], seg.min_dl)
+            # Removed documents whose postings are still in the segment
+            local = np.flatnonzero(deleted[seg.doc_start:seg.doc_start + seg.doc_count])
+            if len(local):
+                starts = np.asarray(seg.doc_terms_indptr[local])
+                lengths = np.asarray(seg.doc_terms_indptr[local + 1]) - starts
+                removed_terms = np.asarray(seg.doc_terms)[_range_indices(starts, lengths)]
+                self.df -= np.bincount(removed_terms, minlength=n_terms)
+
+        self._buffer_start = len(self.doc_len)
+        # term id -> (document indices, tfs) of buffered documents
+        self._delta_postings: Dict[int, Tuple[List[int], List[float]]] = {}
+        self._delta_arrays: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        # buffered document index -> term ids
+        self._delta_doc_terms: Dict[int, np.ndarray] = {}
+        self.corpus_size = len(self.doc_len) - self.n_deleted
+        self._total_len = int(self.doc_len[~deleted].sum())
+        self._refresh_stats()
+
+    @classmethod
+    def from_arrays(
+        cls,
+        arrays: Mapping[str, np.ndarray],
+        vocab: Mapping[str, int],
+        params: Mapping[str, Any],
+    ) -> "InvertedBM25Index":
+        """Rebuild a single-segment index from saved arrays (possibly memory-mapped).
+
+        Args:
+            arrays: Arrays named in ARRAY_NAMES (UPDATE_ARRAY_NAMES are derived from
+                the postings when missing, as in format version 1)
+            vocab: Term -> term id mapping (e.g. index_format.VocabTable)
+            params: k1, b, epsilon
+        """
+        n_terms = len(arrays["indptr"]) - 1
+        seg_arrays = {name: arrays[name] for name in ("indptr", "postings_docs", "postings_tfs", "doc_len")}
+        seg_arrays["term_ids"] = np.arange(n_terms, dtype=np.int32)
+        if all(name in arrays for name in UPDATE_ARRAY_NAMES):
+            seg_arrays.update({name: arrays[name] for name in UPDATE_ARRAY_NAMES})
+            segment = PostingSegment(0, seg_arrays)
+        else:
+            posting_terms = np.repeat(np.arange(n_terms, dtype=np.int64), np.diff(arrays["indptr"]))
+            segment = PostingSegment.from_postings(
+                0, arrays["doc_len"], posting_terms, arrays["postings_docs"], arrays["postings_tfs"]
+            )
+        return cls.from_segments([segment], vocab, _new_name(), [], np.zeros(segment.doc_count, dtype=bool), params)
+
+    @classmethod
+    def from_segments(
+        cls,
+        segments: Sequence[PostingSegment],
+        vocab: Mapping[str, int],
+        vocab_id: str,
+        extra_terms: Sequence[str],
+        deleted: np.ndarray,
+        params: Mapping[str, Any],
+    ) -> "InvertedBM25Index":
+        """Rebuild an index from saved segments (possibly memory-mapped).
+
+        Postings are not touched: statistics are derived from per-segment term
+        arrays, document lengths and the forward index of removed documents.
+
+        Args:
+            segments: Segments covering every document, ordered by document index
+            vocab: Sorted base vocabulary (e.g. index_format.VocabTable)
+            vocab_id: Name of the base vocabulary
+            extra_terms: Terms added after the base vocabulary, in term id order
+            deleted: Tombstone flag per document index
+            params: k1, b, epsilon
+        """
+        index = cls.__new__(cls)
+        for name in ("k1", "b", "epsilon"):
+            setattr(index, name, float(params[name]))
+        index.vocab = vocab
+        index.vocab_id = vocab_id
+        index._new_terms = {term: len(vocab) + i for i, term in enumerate(extra_terms)}
+        index._set_segments(segments, np.array(deleted, dtype=bool))
+        return index
+
+    @property
+    def vocab_size(self) -> int:
+        """Number of term ids (base vocabulary plus terms first seen in added documents)."""
+        return len(self.vocab) + len(self._new_terms)
+
+    @property
+    def total_len(self) -> int:
+        """Total length (in tokens) of live documents."""
+        return self._total_len
+
+    @property
+    def buffered_count(self) -> int:
+        """Number of documents added since the last flush()."""
+        return len(self.doc_len) - self._buffer_start
+
+    @property
+    def slot_count(self) -> int:
+        """Number of document indices in use (live, removed and buffered documents)."""
+        return len(self.doc_len)
+
+    @property
+    def dead_term_count(self) -> int:
+        """Number of term ids that no live document contains anymore."""
+        return int(np.count_nonzero(self.df == 0))
+
+    def extra_terms(self) -> List[str]:
+        """Terms added after the base vocabulary, in term id order."""
+        return list(self._new_terms)
+
+    def terms(self) -> List[str]:
+        """Term strings in term id order."""
+        return list(self.vocab) + list(self._new_terms)
+
+    def _term_id(self, term: str) -> Any:
+        tid = self.vocab.get(term)
+        if tid is None:
+            tid = self._new_terms.get(term)
+        return tid
+
+    def add_documents(self, tokenized_docs: Sequence[Sequence[str]]) -> np.ndarray:
+        """Add documents to the write buffer without touching the segments.
+
+        The cost is proportional to the new documents' tokens; statistics that
+        depend on the whole corpus are refreshed lazily before the next query.
+
+        Args:
+            tokenized_docs: Token lists of the new documents
+
+        Returns:
+            Document indices assigned to the new documents
+        """
+        start = len(self.doc_len)
+        lens = np.array([len(tokens) for tokens in tokenized_docs], dtype=np.int32)
+        term_ids: List[int] = []
+        tfs: List[int] = []
+        posting_lens: List[int] = []
+        for offset, tokens in enumerate(tokenized_docs):
+            d = start + offset
+            doc_terms: List[int] = []
+            for term, tf in Counter(tokens).items():
+                tid = self._term_id(term)
+                if tid is None:
+                    tid = self.vocab_size
+                    self._new_terms[term] = tid
+                docs, delta_tfs = self._delta_postings.setdefault(tid, ([], []))
+                docs.append(d)
+                delta_tfs.append(tf)
+                self._delta_arrays.pop(tid, None)
+                doc_terms.append(tid)
+                tfs.append(tf)
+                posting_lens.append(len(tokens))
+            self._delta_doc_terms[d] = np.asarray(doc_terms, dtype=np.int64)
+            term_ids.extend(doc_terms)
+
+        extra = self.vocab_size - len(self.df)
+        self.df = np.concatenate((self.df, np.zeros(extra, dtype=self.df.dtype)))
+        self.max_tf = np.concatenate((self.max_tf, np.zeros(extra, dtype=np.float32)))
+        self.min_dl = np.concatenate((self.min_dl, np.full(extra, _NO_LENGTH, dtype=np.int32)))
+        # Terms are unique within a document but not across the batch, hence ufunc.at
+        t = np.asarray(term_ids, dtype=np.int64)
+        np.add.at(self.df, t, 1)
+        np.maximum.at(self.max_tf, t, np.asarray(tfs, dtype=np.float32))
+        np.minimum.at(self.min_dl, t, np.asarray(posting_lens, dtype=np.int32))
+
+        self.doc_len = np.concatenate((self.doc_len, lens))
+        self.deleted = np.concatenate((self.deleted, np.zeros(len(lens), dtype=bool)))
+        self.corpus_size += len(lens)
+        self._total_len += int(lens.sum())
+        self._stale = True
+        return np.arange(start, start + len(lens))
+
+    def _doc_term_ids(self, d: int) -> np.ndarray:
+        if d >= self._buffer_start:
+            return self._delta_doc_terms.pop(d)
+        seg = self.segments[bisect.bisect_right(self._segment_starts, d) - 1]
+        return seg.doc_term_ids(d)
+
+    def remove_documents(self, doc_indices: Iterable[int]) -> int:
+        """Tombstone documents and subtract them from the document frequencies.
+
+        Their postings stay in place (skipped when scoring) until the segment is
+        merged. The per-term max tf / min length are left as they are, which
+        keeps the impact bounds valid (only less tight).
+
+        Args:
+            doc_indices: Document indices to remove (unknown or already removed ones are ignored)
+
+        Returns:
+            Number of removed documents
+        """
+        removed = 0
+        for d in doc_indices:
+            d = int(d)
+            if not 0 <= d < len(self.doc_len) or self.deleted[d]:
+                continue
+            # Term ids are unique within a document
+            self.df[self._doc_term_ids(d)] -= 1
+            self.deleted[d] = True
+            self._total_len -= int(self.doc_len[d])
+            removed += 1
+        if removed:
+            self.corpus_size -= removed
+            self.n_deleted += removed
+            self._stale = True
+        return removed
+
+    def _buffer_postings(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(term ids, document indices, tfs) of the buffered postings."""
+        t_parts = [np.zeros(0, dtype=np.int64)]
+        d_parts = [np.zeros(0, dtype=np.int32)]
+        tf_parts = [np.zeros(0, dtype=np.float32)]
+        for tid in self._delta_postings:
+            docs, tfs = self._delta_postings_arrays(tid)
+            t_parts.append(np.full(len(docs), tid, dtype=np.int64))
+            d_parts.append(docs)
+            tf_parts.append(tfs)
+        return np.concatenate(t_parts), np.concatenate(d_parts), np.concatenate(tf_parts)
+
+    def flush(self) -> Optional[PostingSegment]:
+        """Turn the write buffer into a new immutable segment.
+
+        Postings of buffered documents that were already removed are dropped.
+
+        Returns:
+            The new segment, or None when the buffer is empty
+        """
+        start, end = self._buffer_start, len(self.doc_len)
+        if start == end:
+            return None
+        t, d, tf = self._buffer_postings()
+        keep = ~self.deleted[d]
+        segment = PostingSegment.from_postings(start, self.doc_len[start:end], t[keep], d[keep], tf[keep])
+        self.segments.append(segment)
+        self._segment_starts.append(start)
+        self._buffer_start = end
+        self._delta_postings = {}
+        self._delta_arrays = {}
+        self._delta_doc_terms = {}
+        return segment
+
+    def plan_merge(self, max_segments: int, factor: int = MERGE_FACTOR) -> List[PostingSegment]:
+        """Choose adjacent segments to merge (size-tiered), or [] when there are at most max_segments.
+
+        Starting from the newest segment, older segments are added while each is
+        at most ``factor`` times larger than everything newer, so a large old
+        segment is only rewritten once the segments after it have grown
+        comparable to it.
+        """
+        if len(self.segments) <= max(max_segments, 1):
+            return []
+        start = len(self.segments) - 1
+        newer = self.segments[start].n_postings
+        while start > 0 and self.segments[start - 1].n_postings <= factor * max(newer, 1):
+            start -= 1
+            newer += self.segments[start].n_postings
+        start = min(start, len(self.segments) - 2)
+        return self.segments[start:]
+
+    def merge_segments(self, segments: Sequence[PostingSegment]) -> PostingSegment:
+        """Merge adjacent segments into one, dropping the postings of removed documents.
+
+        Document indices are kept, so the result can replace the inputs
+        (replace_segments) even if documents were added or removed meanwhile.
+        Only immutable segment data and tombstones are read, so this can run
+        outside the lock that serializes updates.
+
+        Raises:
+            ValueError: If the segments are not adjacent
+        """
+        for prev, seg in zip(segments, segments[1:]):
+            if prev.doc_start + prev.doc_count != seg.doc_start:
+                raise ValueError("Only adjacent segments can be merged")
+        t = np.concatenate([seg.posting_terms() for seg in segments])
+        d = np.concatenate([np.asarray(seg.postings_docs) for seg in segments])
+        tf = np.concatenate([np.asarray(seg.postings_tfs) for seg in segments])
+        keep = ~self.deleted[d]
+        doc_len = np.concatenate([np.asarray(seg.doc_len) for seg in segments])
+        return PostingSegment.from_postings(segments[0].doc_start, doc_len, t[keep], d[keep], tf[keep])
+
+    def replace_segments(self, old: Sequence[PostingSegment], new: PostingSegment) -> bool:
+        """Swap a run of segments for their merge result.
+
+        Returns:
+            False (and changes nothing) when ``old`` is no longer a run of this index's segments
+        """
+        for i, seg in enumerate(self.segments):
+            if seg is old[0]:
+                break
+        else:
+            return False
+        if len(self.segments) < i + len(old) or any(a is not b for a, b in zip(self.segments[i:], old)):
+            return False
+        self.segments[i:i + len(old)] = [new]
+        self._segment_starts = [seg.doc_start for seg in self.segments]
+        return True
+
+    def compact(self) -> np.ndarray:
+        """Rebuild the index as a single segment of live documents.
+
+        Live documents are renumbered densely in their current order, the
+        buffer is folded in, and the vocabulary is re-sorted without terms that
+        lost all postings. Costs a pass over all postings but no tokenization.
+
+        Returns:
+            Previous document index of every live document (new index i was result[i])
+        """
+        live = np.flatnonzero(~self.deleted)
+        if self.n_deleted == 0 and self.buffered_count == 0 and len(self.segments) == 1:
+            return live
+        parts = [(seg.posting_terms(), np.asarray(seg.postings_docs), np.asarray(seg.postings_tfs))
+                 for seg in self.segments]
+        parts.append(self._buffer_postings())
+        t = np.concatenate([p[0] for p in parts])
+        d = np.concatenate([p[1] for p in parts]).astype(np.int32)
+        tf = np.concatenate([p[2] for p in parts]).astype(np.float32)
+        keep = ~self.deleted[d]
+        t, d, tf = t[keep], d[keep], tf[keep]
+
+        new_index = np.full(len(self.doc_len), -1, dtype=np.int64)
+        new_index[live] = np.arange(len(live))
+        used = np.unique(t)
+        all_terms = self.terms()
+        self._set_postings(
+            [all_terms[i] for i in used],
+            np.searchsorted(used, t),
+            new_index[d].astype(np.int32),
+            tf,
+            np.asarray(self.doc_len[live], dtype=np.int32),
+        )
+        return live
+
+    def _refresh_stats(self) -> None:
+        """Recompute avgdl, length norms, IDF and impact bounds from df / doc_len / total length."""
+        self.avgdl = self._total_len / self.corpus_size if self.corpus_size else 0.0
+        self.doc_norm = self._length_norm(self.doc_len)
+        self.idf = self._calc_idf(self.df)
+        self.max_impact = self._max_impact()
+        self.generation = next(_generations)
+        self._stale = False
+
+    def _ensure_stats(self) -> None:
+        if self._stale:
+            self._refresh_stats()
+
+    def _length_norm(self, doc_len: np.ndarray) -> np.ndarray:
+        avgdl = self.avgdl or 1.0
+        return self.k1 * (1 - self.b + self.b * doc_len / avgdl)
+
+    def _max_impact(self) -> np.ndarray:
+        """Per-term upper bound of the tf/length part of the score, used by MaxScore.
+
+        The impact grows with tf and shrinks with document length, so the
+        term's largest tf combined with its shortest document bounds every
+        posting. Only per-term values are needed, so updates stay cheap.
+        """
+        tf = self.max_tf
+        return tf * (self.k1 + 1) / (tf + self._length_norm(self.min_dl))
+
+    def _calc_idf(self, df: np.ndarray) -> np.ndarray:
+        """IDF with the BM25Okapi floor: negative values become ``epsilon * average_idf``.
+
+        The average is taken over terms that occur in a live document, which is
+        the vocabulary BM25Okapi would see for the same corpus.
+        """
+        if len(df) == 0:
+            self.average_idf = 0.0
+            return np.zeros(0, dtype=np.float64)
+        idf = np.log(self.corpus_size - df + 0.5) - np.log(df + 0.5)
+        present = df > 0
+        self.average_idf = float(idf[present].mean()) if present.any() else 0.0
+        idf[idf < 0] = self.epsilon * self.average_idf
+        return idf
+
+    def plan(self, query: Union[Sequence[str], QueryPlan]) -> QueryPlan:
+        """Resolve query tokens to term ids, weights and score bounds.
+
+        A plan of the current generation is returned as is; a stale plan is
+        rebuilt from its tokens, so callers can cache plans without tracking updates.
+
+        Args:
+            query: Tokenized query, or a plan made earlier (by this or another index)
+
+        Returns:
+            QueryPlan of the current generation
+        """
+        self._ensure_stats()
+        if isinstance(query, QueryPlan):
+            if query.generation == self.generation:
+                return query
+            token_counts: Sequence[Tuple[str, int]] = query.token_counts
+        else:
+            token_counts = list(Counter(query).items())
+        terms = []
+        for term, qtf in token_counts:
+            tid = self._term_id(term)
+            if tid is not None and self.df[tid] > 0:
+                terms.append((tid, qtf))
+        tids = [tid for tid, _ in terms]
+        weights = np.array([qtf for _, qtf in terms], dtype=np.float64) * self.idf[tids]
+        bounds = weights * self.max_impact[tids]
+        return QueryPlan(token_counts, self.generation, terms, weights, bounds)
+
+    def _delta_postings_arrays(self, tid: int) -> Tuple[np.ndarray, np.ndarray]:
+        arrays = self._delta_arrays.get(tid)
+        if arrays is None:
+            docs, tfs = self._delta_postings[tid]
+            arrays = (np.asarray(docs, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            self._delta_arrays[tid] = arrays
+        return arrays
+
+    def _postings(self, tid: int, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Live postings (document indices ascending, tfs) of a term across segments and the buffer.
+
+        ``mask`` (a flag per document index) additionally drops documents whose flag is False.
+        """
+        parts = []
+        for seg in self.segments:
+            found = seg.postings(tid)
+            if found is not None:
+                parts.append(found)
+        if tid in self._delta_postings:
+            parts.append(self._delta_postings_arrays(tid))
+        if not parts:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        if len(parts) == 1:
+            docs, tfs = parts[0]
+        else:
+            # Segments cover increasing document ranges, so the concatenation stays sorted
+            docs = np.concatenate([p[0] for p in parts])
+            tfs = np.concatenate([p[1] for p in parts])
+        if mask is not None:
+            keep = mask[docs]
+            if self.n_deleted:
+                keep &= ~self.deleted[docs]
+            docs, tfs = docs[keep], tfs[keep]
+        elif self.n_deleted:
+            live = ~self.deleted[docs]
+            docs, tfs = docs[live], tfs[live]
+        return docs, tfs
+
+    def _term_contributions(
+        self, tid: int, qtf: int, mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        docs, tf = self._postings(tid, mask)
+        contrib = (qtf * self.idf[tid]) * (tf * (self.k1 + 1) / (tf + self.doc_norm[docs]))
+        return docs, contrib
+
+    def score_candidates(
+        self, query_tokens: Union[Sequence[str], QueryPlan], mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Score only documents containing at least one query term.
+
+        Repeated query tokens count once per occurrence, as in ``BM25Okapi``.
+
+        Args:
+            query_tokens: Tokenized query, or its QueryPlan
+            mask: Optional bool flag per document index; only flagged documents
+                are scored (IDF and length norms stay index-wide)
+
+        Returns:
+            Tuple of (document indices ascending, scores)
+        """
+        plan = self.plan(query_tokens)
+        parts = [self._term_contributions(tid, qtf, mask) for tid, qtf in plan.terms]
+        if not parts:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float64)
+        if len(parts) == 1:
+            docs, contrib = parts[0]
+            return docs, contrib.astype(np.float64)
+        docs = np.concatenate([p[0] for p in parts])
+        contrib = np.concatenate([p[1] for p in parts])
+        uniq, inverse = np.unique(docs, return_inverse=True)
+        return uniq, np.bincount(inverse, weights=contrib, minlength=len(uniq))
+
+    def top_k(
+        self, query_tokens: Union[Sequence[str], QueryPlan], k: int, mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k documents with MaxScore dynamic pruning.
+
+        Terms are processed in decreasing order of their score upper bound. While
+        the bounds of the remaining terms could still lift an unseen document into
+        the top k, whole posting lists are accumulated. Afterwards only the
+        current candidates are binary-searched in the remaining posting lists, and
+        candidates whose partial score plus the remaining bound falls below the
+        k-th score are dropped. The returned top k equals exhaustive scoring (up
+        to the order of tied scores).
+
+        A ``mask`` restricts scoring to a subset of documents (e.g. one file
+        type) by filtering the posting lists; the score bounds stay valid, so
+        pruning works unchanged.
+
+        Args:
+            query_tokens: Tokenized query, or its QueryPlan
+            k: Number of documents to return
+            mask: Optional bool flag per document index; only flagged documents are scored
+
+        Returns:
+            Tuple of (document indices, scores) sorted by score (descending)
+        """
+        plan = self.plan(query_tokens)
+        terms = plan.terms
+        k = min(k, self.corpus_size)
+        if k <= 0 or not terms:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float64)
+        if len(terms) == 1 or np.any(plan.weights < 0):
+            # Nothing to prune, or negative contributions break the upper-bound argument
+            return select_top_k(*self.score_candidates(plan, mask), k)
+
+        order = np.argsort(-plan.bounds, kind="stable")
+        sorted_bounds = plan.bounds[order]
+        # remaining[i]: best score the terms after position i can still add
+        remaining = np.append(np.cumsum(sorted_bounds[::-1])[::-1][1:], 0.0)
+        # seen[i]: best score the terms up to position i can give (an upper bound of the k-th score)
+        seen = np.cumsum(sorted_bounds)
+
+        # Phase 1: accumulate whole posting lists until unseen documents are out of reach.
+        # The dense buffers are reused across queries and reset only where touched,
+        # so the cost stays proportional to the postings, not to the corpus
+        acc, touched = _scratch_buffers(len(self.doc_len))
+        touched_docs: List[np.ndarray] = []
+        try:
+            n_touched = 0
+            pos = 0
+            threshold = 0.0
+            for pos, i in enumerate(order):
+                tid, qtf = terms[i]
+                docs, contrib = self._term_contributions(tid, qtf, mask)
+                new_docs = docs[~touched[docs]]
+                touched[new_docs] = True
+                touched_docs.append(new_docs)
+                acc[docs] += contrib
+                n_touched += len(new_docs)
+                if n_touched < k or remaining[pos] >= seen[pos]:
+                    continue  # cannot prune yet; skip computing the k-th score
+                # The k-th score is taken over touched documents only (all others are 0)
+                touched_docs = [np.concatenate(touched_docs)]
+                threshold = np.partition(acc[touched_docs[0]], -k)[-k]
+                if remaining[pos] < threshold:
+                    break
+            else:
+                docs = np.sort(np.concatenate(touched_docs))
+                return select_top_k(*_nonzero_scores(docs, acc[docs]), k)
+
+            # Phase 2: only candidates that can still reach the k-th score are looked up
+            cand_docs = np.sort(touched_docs[0])
+            cand_docs = cand_docs[acc[cand_docs] + remaining[pos] >= threshold]
+            cand_scores = acc[cand_docs]
+        finally:
+            for docs in touched_docs:
+                acc[docs] = 0.0
+                touched[docs] = False
+        for pos in range(pos + 1, len(order)):
+            tid, qtf = terms[order[pos]]
+            # Candidates already passed the mask
+            self._add_to_candidates(tid, qtf, cand_docs, cand_scores)
+            threshold = np.partition(cand_scores, -k)[-k]
+            keep = cand_scores + remaining[pos] >= threshold
+            cand_docs, cand_scores = cand_docs[keep], cand_scores[keep]
+
+        return select_top_k(cand_docs, cand_scores, k)
+
+    def _add_to_candidates(self, tid: int, qtf: int, cand_docs: np.ndarray, cand_scores: np.ndarray) -> None:
+        """Add one term's contribution to the (sorted) candidate documents in place."""
+        plist, ptfs = self._postings(tid)
+        # Binary-search the shorter sorted array in the longer one
+        if len(cand_docs) <= len(plist):
+            at = np.searchsorted(plist, cand_docs)
+            hit = at < len(plist)
+            hit[hit] = plist[at[hit]] == cand_docs[hit]
+            cand_idx = np.nonzero(hit)[0]
+            post_idx = at[hit]
+        else:
+            at = np.searchsorted(cand_docs, plist)
+            hit = at < len(cand_docs)
+            hit[hit] = cand_docs[at[hit]] == plist[hit]
+            cand_idx = at[hit]
+            post_idx = np.nonzero(hit)[0]
+        if len(cand_idx) == 0:
+            return
+        tf = ptfs[post_idx]
+        docs = cand_docs[cand_idx]
+        cand_scores[cand_idx] += (qtf * self.idf[tid]) * (tf * (self.k1 + 1) / (tf + self.doc_norm[docs]))
+
+    def get_scores(self, query_tokens: Sequence[str]) -> np.ndarray:
+        """Dense score array over all document indices (``BM25Okapi.get_scores`` compatible).
+
+        Removed documents keep their index and score 0.
+        """
+        scores = np.zeros(len(self.doc_len), dtype=np.float64)
+        docs, doc_scores = self.score_candidates(query_tokens)
+        scores[docs] = doc_scores
+        return scores
+
+    def __repr__(self) -> str:
+        return (
+            f"InvertedBM25Index(docs={self.corpus_size}, terms={self.vocab_size}, "
+            f"segments={len(self.segments)}, postings={sum(seg.n_postings for seg in self.segments)}, "
+            f"deleted={self.n_deleted}, avgdl={self.avgdl:.2f})"
+        )
+
+
+def _nonzero_scores(docs: np.ndarray, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    nonzero = scores != 0
+    return docs[nonzero], scores[nonzero]
+
+
+def select_top_k(doc_indices: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Select the k highest scores with argpartition and sort only those.
+
+    Args:
+        doc_indices: Document indices aligned with scores
+        scores: Scores
+        k: Number of documents to return
+
+    Returns:
+        Tuple of (document indices, scores) sorted by score (descending)
+    """
+    if k <= 0 or len(scores) == 0:
+        return doc_indices[:0], scores[:0]
+    if len(scores) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(len(scores))
+    order = part[np.argsort(-scores[part], kind="stable")]
+    return doc_indices[order], scores[order]
@@ -4,18 +4,100 @@ This module hosts the FastMCP server instance and registers tools.
 Actual tool implementations live under src.semche.tools.*
 """
 
-from typing import Annotated
+import atexit
+import logging
+import os
+import threading
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Annotated, Optional
 
 from mcp.server.fastmcp import FastMCP
 from pydantic import Field
 
+from semche.services import get_services
 from semche.tools.delete import delete_document as _delete_document_tool
 from semche.tools.document import put_document as _put_document_tool
 from semche.tools.get_by_prefix import get_documents_by_prefix as _get_documents_by_prefix_tool
 from semche.tools.search import search as _search_tool
 
+logger = logging.getLogger(__name__)
+
+# Opt-in: load the model, ChromaDB client and BM25 index in the background at startup
+WARMUP_ENV = "SEMCHE_WARMUP"
+
+_warm_up_thread: Optional[threading.Thread] = None
+_warm_up_lock = threading.Lock()
+
+
+def warm_up_enabled() -> bool:
+    """True when SEMCHE_WARMUP is set to 1 / true / yes / on."""
+    return os.getenv(WARMUP_ENV, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _warm_up() -> None:
+    """Create the shared services (ServiceRegistry.warm) and run one dummy encode.
+
+    Failures are only logged: the first request then initializes lazily
+    (and reports the error) as it does without warm-up.
+    """
+    start = time.perf_counter()
+    try:
+        get_services().warm()
+    except Exception as e:
+        logger.warning(f"Warm-up failed; services will be initialized on first use: {e}")
+        return
+    logger.info(f"Warm-up finished in {time.perf_counter() - start:.1f} s")
+
+
+def start_warm_up() -> threading.Thread:
+    """Start the warm-up thread (once per process) and return it."""
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=_warm_up, name="semche-warm-up", daemon=True)
+            _warm_up_thread.start()
+        return _warm_up_thread
+
+
+def wait_for_warm_up(timeout: Optional[float] = None) -> bool:
+    """Block until a started warm-up finishes; returns False only on timeout."""
+    thread = _warm_up_thread
+    if thread is None:
+        return True
+    thread.join(timeout)
+    return not thread.is_alive()
+
+
+@asynccontextmanager
+async def _lifespan(server: FastMCP) -> AsyncIterator[dict]:
+    # Start warm-up before the first request is read; the server does not wait for it
+    if warm_up_enabled():
+        start_warm_up()
+    yield {}
+
+
+def _close_services() -> None:
+    """atexit hook: finish background BM25 merges and close the caches.
+
+    Runs at interpreter exit rather than at the end of the lifespan, which
+    HTTP transports enter once per session. While warm-up is still loading, no request has
+    run yet, so there is nothing to flush and the exit does not wait for it.
+    """
+    services = get_services()
+    stats = services.stats()
+    if stats["unloads"]:
+        logger.info(f"Idle unloading: {stats}")
+    if wait_for_warm_up(timeout=0):
+        services.close()
+
+
+atexit.register(_close_services)
+
+
 # Create FastMCP server instance
-mcp = FastMCP("semche")
+mcp = FastMCP("semche", lifespan=_lifespan)
 
 
 @mcp.tool(
@@ -28,12 +110,14 @@ def put_document(
     file_type: Annotated[str | None, Field(description="ドキュメントの種類（任意）")] = None,
     normalize: Annotated[bool, Field(description="埋め込みベクトルを正規化するか（デフォルトFalse）")] = False,
 ) -> dict:
-    return _put_document_tool(
-        text=text,
-        filepath=filepath,
-        file_type=file_type,
-        normalize=normalize,
-    )
+    wait_for_warm_up()
+    with get_services().activity():
+        return _put_document_tool(
+            text=text,
+            filepath=filepath,
+            file_type=file_type,
+            normalize=normalize,
+        )
 
 
 @mcp.tool(
@@ -49,13 +133,15 @@ def search(
         int | None, Field(description="ドキュメント内容の最大文字数。Noneで全文取得（デフォルト: None）")
     ] = None,
 ) -> dict:
-    return _search_tool(
-        query=query,
-        top_k=top_k,
-        file_type=file_type,
-        include_documents=include_documents,
-        max_content_length=max_content_length,
-    )
+    wait_for_warm_up()
+    with get_services().activity():
+        return _search_tool(
+            query=query,
+            top_k=top_k,
+            file_type=file_type,
+            include_documents=include_documents,
+            max_content_length=max_content_length,
+        )
 
 
 @mcp.tool(
@@ -65,7 +151,9 @@ def search(
 def delete_document(
     filepath: Annotated[str, Field(description="削除対象のドキュメントID（filepath）")]
 ) -> dict:
-    return _delete_document_tool(filepath=filepath)
+    wait_for_warm_up()
+    with get_services().activity():
+        return _delete_document_tool(filepath=filepath)
 
 
 @mcp.tool(
@@ -78,12 +166,14 @@ def get_documents_by_prefix(
     include_documents: Annotated[bool, Field(description="本文を含めるか（デフォルトTrue）")] = True,
     top_k: Annotated[int | None, Field(description="最大取得件数（省略時は全件）")] = None,
 ) -> dict:
-    return _get_documents_by_prefix_tool(
-        prefix=prefix,
-        file_type=file_type,
-        include_documents=include_documents,
-        top_k=top_k,
-    )
+    wait_for_warm_up()
+    with get_services().activity():
+        return _get_documents_by_prefix_tool(
+            prefix=prefix,
+            file_type=file_type,
+            include_documents=include_documents,
+            top_k=top_k,
+        )
 
 
 if __name__ == "__main__":
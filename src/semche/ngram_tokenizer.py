@@ -0,0 +1,149 @@
+"""Character n-gram tokenizer: a MeCab-free tokenizer for the BM25 sparse index.
+
+Text is case- and width-folded (NFKC + lower case per character), then split
+by script: runs of Japanese characters (kana, kanji; also Hangul) become
+overlapping character n-grams, while runs of other letters and digits (ASCII
+words, numbers, identifiers) are kept whole. Queries are tokenized the same
+way, so a query matches documents sharing its n-grams without any dictionary.
+
+The work is vectorized with NumPy over the text's code points: folding and
+character classes are lookup tables over the BMP, and the n-grams of every
+Japanese run are gathered at once and read back as ``<U{n}`` strings, so
+Python-level work is per word, not per character.
+"""
+import functools
+import unicodedata
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+# Kana (without the middle dot), iteration marks, CJK ideographs and Hangul syllables
+_CJK_RANGES = (
+    (0x3005, 0x3006),
+    (0x3041, 0x309F),
+    (0x30A1, 0x30FA),
+    (0x30FC, 0x30FF),
+    (0x3400, 0x4DBF),
+    (0x4E00, 0x9FFF),
+    (0xF900, 0xFAFF),
+    (0xAC00, 0xD7AF),
+)
+# Character classes
+_OTHER, _WORD, _CJK = 0, 1, 2
+_BMP = 0x10000
+
+DEFAULT_NGRAM_SIZES = (2,)
+
+
+@functools.lru_cache(maxsize=1)
+def _tables() -> Tuple[np.ndarray, np.ndarray]:
+    """(fold, class) lookup tables over the BMP, built on first use.
+
+    fold maps a code point to its NFKC + lower-case form when that is a single
+    BMP code point (other characters are kept); class is _WORD for letters, digits
+    and "_", _CJK for Japanese characters, _OTHER for separators.
+    """
+    fold = np.arange(_BMP, dtype=np.uint32)
+    classes = np.zeros(_BMP, dtype=np.uint8)
+    for code in range(_BMP):
+        if 0xD800 <= code < 0xE000:
+            continue
+        char = chr(code)
+        folded = unicodedata.normalize("NFKC", char).lower()
+        if len(folded) == 1 and ord(folded) < _BMP:
+            fold[code] = ord(folded)
+        if char.isalnum() or char == "_":
+            classes[code] = _WORD
+    for start, end in _CJK_RANGES:
+        classes[start:end + 1] = _CJK
+    return fold, classes
+
+
+def _runs(mask: np.ndarray) -> Tuple[List[int], List[int]]:
+    """Start and end offsets of the runs of True in a bool array."""
+    edges = np.flatnonzero(np.diff(mask.view(np.int8), prepend=0, append=0))
+    return edges[0::2].tolist(), edges[1::2].tolist()
+
+
+class CharNgramTokenizer:
+    """Script-aware character n-gram tokenizer (picklable, so it runs in tokenization workers).
+
+    Attributes:
+        sizes: N-gram sizes emitted for Japanese runs, ascending
+        name: Tokenizer name recorded in the sparse index ("ngram")
+        signature: Token cache signature (differs for every sizes setting)
+    """
+
+    name = "ngram"
+
+    def __init__(self, sizes: Sequence[int] = DEFAULT_NGRAM_SIZES) -> None:
+        """Initialize the tokenizer.
+
+        Args:
+            sizes: N-gram sizes for Japanese runs (e.g. (2,) for bigrams only)
+
+        Raises:
+            ValueError: If sizes is empty or contains a size below 1
+        """
+        if not sizes or min(sizes) < 1:
+            raise ValueError(f"Invalid n-gram sizes: {sizes}")
+        self.sizes: Tuple[int, ...] = tuple(sorted(set(sizes)))
+        self.signature = f"char-ngram-{'-'.join(map(str, self.sizes))}:nfkc-lower:v1"
+
+    def __call__(self, text: str) -> List[str]:
+        """Tokenize text into whole words and character n-grams of Japanese runs.
+
+        Runs shorter than the smallest n-gram size are kept as one token.
+        Tokens are grouped by kind (words, then n-grams by size), not in text
+        order, which BM25 does not use.
+
+        Args:
+            text: Input text
+
+        Returns:
+            List of tokens
+        """
+        fold, classes = _tables()
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype="<u4")
+        if len(codes) and codes.max() >= _BMP:
+            # Characters outside the BMP are kept unfolded and act as separators
+            bmp = codes < _BMP
+            codes = np.where(bmp, fold[np.where(bmp, codes, 0)], codes)
+            kinds = np.where(bmp, classes[np.where(bmp, codes, 0)], _OTHER)
+        else:
+            codes = fold[codes]
+            kinds = classes[codes]
+        folded = codes.astype("<u4", copy=False).tobytes().decode("utf-32-le")
+
+        starts, ends = _runs(kinds == _WORD)
+        tokens = [folded[s:e] for s, e in zip(starts, ends)]
+        cjk = kinds == _CJK
+        for n in self.sizes:
+            tokens.extend(self._ngrams(codes, cjk, n))
+        starts, ends = _runs(cjk)
+        tokens.extend(folded[s:e] for s, e in zip(starts, ends) if e - s < self.sizes[0])
+        return tokens
+
+    @staticmethod
+    def _ngrams(codes: np.ndarray, cjk: np.ndarray, n: int) -> List[str]:
+        """Every n-gram of consecutive Japanese characters, gathered at once and viewed as strings."""
+        count = len(codes) - n + 1
+        if count <= 0:
+            return []
+        starts = cjk[:count].copy()
+        for k in range(1, n):
+            starts &= cjk[k:k + count]
+        positions = np.flatnonzero(starts)
+        if not len(positions):
+            return []
+        grams = codes[positions[:, None] + np.arange(n)].astype(np.uint32, copy=False)
+        return grams.view(f"U{n}").ravel().tolist()
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, CharNgramTokenizer) and other.sizes == self.sizes
+
+    def __hash__(self) -> int:
+        return hash(self.sizes)
+
+    def __repr__(self) -> str:
+        return f"CharNgramTokenizer(sizes={self.sizes})"
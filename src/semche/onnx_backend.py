@@ -0,0 +1,325 @@
+"""ONNX Runtime backend for Embedder (CPU inference without PyTorch).
+
+The sentence-transformers model behind ``HuggingFaceEmbeddings`` (transformer
+plus pooling and, if the model has one, normalization) is exported once to an
+ONNX graph that outputs the sentence embedding directly, optionally quantized
+to int8 with ONNX Runtime's dynamic quantization, and run with ONNX Runtime.
+
+``OnnxEmbeddings`` has the same interface as ``HuggingFaceEmbeddings``
+(``embed_documents`` / ``embed_query`` and an ``encode`` client), so
+``Embedder`` and ChromaDB use it unchanged. Every export is checked against the
+torch model: the cosine similarity of both backends' embeddings of
+``PARITY_TEXTS`` must reach ``MIN_PARITY_COSINE``, otherwise the export is
+rejected.
+"""
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None  # Optional dependency
+
+logger = logging.getLogger(__name__)
+
+ONNX_BACKENDS = ("onnx", "onnx-int8")
+ONNX_MODEL_FILENAME = "model.onnx"
+QUANTIZED_MODEL_FILENAME = "model_int8.onnx"
+CONFIG_FILENAME = "semche_onnx.json"
+# Bump when the exported graph or its inputs change, so old exports are redone
+EXPORT_VERSION = 1
+
+# Minimum cosine similarity to the torch backend accepted for an export
+MIN_PARITY_COSINE = {"onnx": 0.999, "onnx-int8": 0.98}
+
+# Probe texts for the parity check: Japanese and English, short and long
+PARITY_TEXTS = [
+    "猫が好きです。",
+    "形態素解析とベクトル検索を組み合わせたハイブリッド検索",
+    "ChromaDB にドキュメントを登録し、BM25 とベクトル検索の結果を RRF で統合します。",
+    "Python programming language",
+    "The quick brown fox jumps over the lazy dog.",
+    "doc-update は指定したファイルを一括でベクトル化して ChromaDB に保存する CLI です。"
+    " 変更の無いファイルは埋め込みキャッシュのベクトルを使い、モデルには通しません。",
+    "README",
+    "semche: MCP server for semantic search over local documents",
+]
+
+
+class OnnxBackendError(Exception):
+    """ONNX backend export / load errors"""
+
+    pass
+
+
+def default_export_dir(model_name: str) -> Path:
+    """Directory of a model's ONNX export: SEMCHE_ONNX_DIR (default ~/.cache/semche/onnx) / model name."""
+    root = os.getenv("SEMCHE_ONNX_DIR") or Path.home() / ".cache" / "semche" / "onnx"
+    return Path(root) / re.sub(r"[^A-Za-z0-9._-]+", "_", model_name).strip("_")
+
+
+def cosine_similarities(reference: np.ndarray, candidate: np.ndarray) -> np.ndarray:
+    """Row-wise cosine similarity of two (n, dim) matrices."""
+    reference = np.asarray(reference, dtype=np.float64)
+    candidate = np.asarray(candidate, dtype=np.float64)
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    return np.einsum("ij,ij->i", reference, candidate) / np.where(norms == 0, 1.0, norms)
+
+
+def _load_sentence_transformer(model_name: str) -> Any:
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        raise OnnxBackendError("sentence-transformers is required to export the ONNX model")
+    return SentenceTransformer(model_name, device="cpu")
+
+
+def export_onnx(
+    model_name: str,
+    output_dir: Union[str, Path],
+    quantize: bool = False,
+    reference: Optional[Any] = None,
+) -> Path:
+    """Export a sentence-transformers model to ONNX and check it against the torch model.
+
+    Writes ``model.onnx`` (and ``model_int8.onnx`` with ``quantize``), the
+    tokenizer and ``semche_onnx.json`` (source model, inputs, parity) to
+    output_dir. An existing export of the same EXPORT_VERSION is extended
+    rather than redone.
+
+    Args:
+        model_name: Model name or path, as given to Embedder
+        output_dir: Export directory (see default_export_dir)
+        quantize: Also write the dynamically int8-quantized model
+        reference: Already loaded SentenceTransformer of model_name (loaded if None)
+
+    Returns:
+        output_dir
+
+    Raises:
+        OnnxBackendError: If a dependency is missing, the export fails, or the
+            parity check fails (the failing model file is removed)
+    """
+    if ort is None:
+        raise OnnxBackendError("onnxruntime is not installed (pip install 'semche[onnx]')")
+    try:
+        import torch
+    except ImportError:
+        raise OnnxBackendError("torch is required to export the ONNX model")
+
+    out = Path(output_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    config = _read_config(out)
+    st = reference if reference is not None else _load_sentence_transformer(model_name)
+
+    if config is None or not (out / ONNX_MODEL_FILENAME).exists():
+        sample = st.tokenizer(["semche", "ONNX export sample text"], padding=True, return_tensors="pt")
+        input_names = list(sample.keys())
+
+        class _SentenceEmbedding(torch.nn.Module):
+            """Transformer + pooling (+ normalization) as one graph from token ids to sentence embeddings."""
+
+            def __init__(self) -> None:
+                super().__init__()
+                self.model = st
+
+            def forward(self, *inputs: Any) -> Any:
+                return self.model(dict(zip(input_names, inputs)))["sentence_embedding"]
+
+        logger.info(f"Exporting {model_name} to ONNX: {out}")
+        try:
+            with torch.no_grad():
+                torch.onnx.export(
+                    _SentenceEmbedding().eval(),
+                    tuple(sample[name] for name in input_names),
+                    str(out / ONNX_MODEL_FILENAME),
+                    input_names=input_names,
+                    output_names=["sentence_embedding"],
+                    dynamic_axes={
+                        **{name: {0: "batch", 1: "sequence"} for name in input_names},
+                        "sentence_embedding": {0: "batch"},
+                    },
+                    opset_version=17,
+                    dynamo=False,
+                )
+            st.tokenizer.save_pretrained(str(out))
+        except Exception as e:
+            raise OnnxBackendError(f"Failed to export {model_name} to ONNX: {e}")
+        config = {
+            "version": EXPORT_VERSION,
+            "model_name": model_name,
+            "input_names": input_names,
+            "max_seq_length": st.max_seq_length,
+            "parity": {},
+        }
+        _check_and_record(out, config, "onnx", st)
+
+    if quantize and not (out / QUANTIZED_MODEL_FILENAME).exists():
+        try:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+        except ImportError as e:
+            raise OnnxBackendError(f"int8 quantization needs the onnx package (pip install 'semche[onnx]'): {e}")
+        logger.info(f"Quantizing {out / ONNX_MODEL_FILENAME} to int8")
+        try:
+            quantize_dynamic(
+                str(out / ONNX_MODEL_FILENAME), str(out / QUANTIZED_MODEL_FILENAME), weight_type=QuantType.QInt8
+            )
+        except Exception as e:
+            raise OnnxBackendError(f"Failed to quantize the ONNX model: {e}")
+        _check_and_record(out, config, "onnx-int8", st)
+    return out
+
+
+def _check_and_record(out: Path, config: Dict[str, Any], backend: str, st: Any) -> None:
+    """Parity check of one exported model file against the torch model; record it or remove the file."""
+    encoder = OnnxSentenceEncoder(out, quantized=backend == "onnx-int8", config=config)
+    expected = st.encode(PARITY_TEXTS, convert_to_numpy=True, show_progress_bar=False)
+    similarity = float(cosine_similarities(expected, encoder.encode(PARITY_TEXTS)).min())
+    if similarity < MIN_PARITY_COSINE[backend]:
+        (out / encoder.model_path.name).unlink()
+        raise OnnxBackendError(
+            f"The {backend} export of {config['model_name']} does not match the torch model: "
+            f"minimum cosine similarity {similarity:.5f} < {MIN_PARITY_COSINE[backend]}"
+        )
+    config["parity"][backend] = similarity
+    (out / CONFIG_FILENAME).write_text(json.dumps(config, ensure_ascii=False, indent=2), encoding="utf-8")
+    logger.info(f"{backend} parity with the torch model: minimum cosine similarity {similarity:.5f}")
+
+
+def _read_config(out: Path) -> Optional[Dict[str, Any]]:
+    try:
+        config = json.loads((out / CONFIG_FILENAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return config if config.get("version") == EXPORT_VERSION else None
+
+
+class OnnxSentenceEncoder:
+    """ONNX Runtime counterpart of ``SentenceTransformer.encode`` for an exported model.
+
+    Attributes:
+        tokenizer: Tokenizer of the exported model
+        max_seq_length: Inputs are truncated to this many tokens
+        model_path: ONNX model file in use
+    """
+
+    def __init__(
+        self,
+        model_dir: Union[str, Path],
+        quantized: bool = False,
+        config: Optional[Dict[str, Any]] = None,
+        threads: Optional[int] = None,
+    ) -> None:
+        """
+        Args:
+            threads: Intra-op threads of the ONNX Runtime session (None: ONNX Runtime's default)
+        """
+        if ort is None:
+            raise OnnxBackendError("onnxruntime is not installed (pip install 'semche[onnx]')")
+        from transformers import AutoTokenizer
+
+        model_dir = Path(model_dir)
+        config = config or _read_config(model_dir)
+        if config is None:
+            raise OnnxBackendError(f"No ONNX export in {model_dir}")
+        self.model_path = model_dir / (QUANTIZED_MODEL_FILENAME if quantized else ONNX_MODEL_FILENAME)
+        self.max_seq_length = config["max_seq_length"]
+        self._input_names = config["input_names"]
+        try:
+            self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+            options = ort.SessionOptions()
+            if threads:
+                options.intra_op_num_threads = threads
+            self._session = ort.InferenceSession(
+                str(self.model_path), sess_options=options, providers=["CPUExecutionProvider"]
+            )
+        except Exception as e:
+            raise OnnxBackendError(f"Failed to load the ONNX model {self.model_path}: {e}")
+
+    def encode(
+        self,
+        sentences: Union[str, Sequence[str]],
+        batch_size: int = 32,
+        normalize_embeddings: bool = False,
+        **kwargs: Any,
+    ) -> np.ndarray:
+        """Embed sentences in batches; returns a float32 (n, dim) matrix (a vector for a single str).
+
+        Other SentenceTransformer.encode keyword arguments (show_progress_bar,
+        convert_to_numpy, ...) are accepted and ignored.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        parts = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            inputs = {name: encoded[name].astype(np.int64) for name in self._input_names}
+            parts.append(self._session.run(None, inputs)[0])
+        matrix = np.concatenate(parts).astype(np.float32, copy=False) if parts else np.zeros((0, 0), np.float32)
+        if normalize_embeddings:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1.0, norms)
+        return matrix[0] if single else matrix
+
+
+class OnnxEmbeddings(Embeddings):
+    """LangChain Embeddings backed by OnnxSentenceEncoder (drop-in for HuggingFaceEmbeddings).
+
+    Like HuggingFaceEmbeddings, newlines are replaced by spaces and the encoder
+    is exposed as ``_client`` so Embedder.embed_batch calls it directly.
+    """
+
+    def __init__(self, encoder: OnnxSentenceEncoder) -> None:
+        self._client = encoder
+        self.encode_kwargs: Dict[str, Any] = {}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._client.encode([t.replace("\n", " ") for t in texts]).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def load_onnx_embeddings(
+    model_name: str,
+    backend: str = "onnx",
+    export_dir: Optional[Union[str, Path]] = None,
+    threads: Optional[int] = None,
+) -> OnnxEmbeddings:
+    """Load the ONNX (or int8 ONNX) embeddings of a model, exporting it on first use.
+
+    Args:
+        model_name: Model name or path
+        backend: "onnx" or "onnx-int8"
+        export_dir: Export directory (default: default_export_dir(model_name))
+        threads: Intra-op threads of the ONNX Runtime session (None: ONNX Runtime's default)
+
+    Raises:
+        OnnxBackendError: Unknown backend, or export / parity check / load failure
+    """
+    if backend not in ONNX_BACKENDS:
+        raise OnnxBackendError(f"Unknown ONNX backend: {backend} (expected one of {', '.join(ONNX_BACKENDS)})")
+    out = Path(export_dir) if export_dir is not None else default_export_dir(model_name)
+    quantized = backend == "onnx-int8"
+    config = _read_config(out)
+    model_file = out / (QUANTIZED_MODEL_FILENAME if quantized else ONNX_MODEL_FILENAME)
+    if config is None or config.get("model_name") != model_name or not model_file.exists():
+        if config is not None and config.get("model_name") != model_name:
+            # Export of another model whose name maps to the same directory: replace it
+            for name in (CONFIG_FILENAME, ONNX_MODEL_FILENAME, QUANTIZED_MODEL_FILENAME):
+                (out / name).unlink(missing_ok=True)
+        export_onnx(model_name, out, quantize=quantized)
+    return OnnxEmbeddings(OnnxSentenceEncoder(out, quantized=quantized, threads=threads))
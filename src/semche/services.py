@@ -0,0 +1,287 @@
+"""Process-wide registry of the services shared by the MCP tools.
+
+The embedding model (about 1 GB in memory), the ChromaDB client, the persistent
+BM25 index and the caches attached to them (embedding cache, token cache) are
+created once per process and shared by every tool. ``get_services()`` returns
+the registry; each service is created lazily on first use, ``init()`` /
+``warm()`` create them up front and ``close()`` releases them (the next use
+creates them again).
+
+Memory-budget mode (``SEMCHE_IDLE_UNLOAD_SECONDS``): after that many seconds
+without a tool call, the services are unloaded to give the model's memory
+back, and the next call reloads them. ``stats()`` reports how often that
+happened and what the reloads cost.
+"""
+import ctypes
+import ctypes.util
+import gc
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from .chromadb_manager import ChromaDBManager
+from .embedding import Embedder
+from .embedding_cache import create_embedding_cache
+from .sparse_index import SparseBackend, SparseIndexError, create_sparse_index
+
+logger = logging.getLogger(__name__)
+
+# Seconds without a tool call before the services are unloaded (unset / 0: never)
+IDLE_UNLOAD_ENV = "SEMCHE_IDLE_UNLOAD_SECONDS"
+
+
+def _rss_bytes() -> Optional[int]:
+    """Resident set size of this process (Linux only; None elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _release_memory() -> None:
+    """Collect the dropped objects and return free heap pages to the OS (glibc malloc_trim)."""
+    gc.collect()
+    if sys.platform.startswith("linux"):
+        try:
+            ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6").malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+
+class ServiceRegistry:
+    """Owner of the Embedder, ChromaDBManager and sparse index of one process.
+
+    Creation is serialized by one re-entrant lock, so concurrent first uses
+    (for example the server's warm-up thread and a request) load each service
+    only once. Services passed to the constructor are used as is (tests).
+
+    With ``idle_timeout`` (seconds; default SEMCHE_IDLE_UNLOAD_SECONDS, None
+    or 0 disables it), a watcher thread unloads the services once no
+    ``activity()`` has been running for that long.
+    """
+
+    def __init__(
+        self,
+        embedder: Optional[Embedder] = None,
+        chromadb_manager: Optional[ChromaDBManager] = None,
+        sparse_index: Optional[SparseBackend] = None,
+        idle_timeout: Optional[float] = None,
+    ) -> None:
+        self._embedder = embedder
+        self._chromadb_manager = chromadb_manager
+        self._sparse_index = sparse_index
+        self._lock = threading.RLock()
+        if idle_timeout is None:
+            idle_timeout = float(os.getenv(IDLE_UNLOAD_ENV) or 0)
+        self.idle_timeout = idle_timeout if idle_timeout > 0 else None
+        # Running activities and the end of the last one; guarded by _usage.
+        # Lock order: _usage before _lock (the watcher unloads holding both)
+        self._usage = threading.Condition()
+        self._active = 0
+        self._last_used = time.monotonic()
+        self._watcher: Optional[threading.Thread] = None
+        self._unloaded = False
+        self._unloads = 0
+        self._reloads = 0
+        self._reload_seconds = 0.0
+        self._last_reload_seconds = 0.0
+        self._freed_bytes = 0
+
+    def embedder(self) -> Embedder:
+        """The shared Embedder (loads the model on first use)."""
+        with self._lock:
+            if self._embedder is None:
+                start = time.perf_counter()
+                self._embedder = Embedder()
+                if self._unloaded:
+                    self._reloads += 1
+                    elapsed = self._record_reload(start)
+                    logger.info(f"Reloaded the embedding model in {elapsed:.1f} s (reload {self._reloads})")
+            return self._embedder
+
+    def chromadb_manager(self) -> ChromaDBManager:
+        """The shared ChromaDBManager, with the embedding cache attached to the Embedder."""
+        with self._lock:
+            if self._chromadb_manager is None:
+                embedder = self.embedder()
+                start = time.perf_counter()
+                # EmbedderのEmbeddingsインスタンスをembedding_functionとして渡す
+                self._chromadb_manager = ChromaDBManager(
+                    embedding_function=embedder.embeddings,
+                    embedding_space=embedder.embedding_space,
+                    embedding_backend=embedder.backend,
+                )
+                # 埋め込みキャッシュは永続化ディレクトリに置く（SEMCHE_EMBED_CACHE_SIZE=0 で無効）
+                if embedder.cache is None:
+                    embedder.cache = create_embedding_cache(self._chromadb_manager.persist_directory)
+                if self._unloaded:
+                    self._record_reload(start)
+            return self._chromadb_manager
+
+    def sparse_index(self) -> SparseBackend:
+        """The shared persistent BM25 index, loaded (or built once from ChromaDB) on first use.
+
+        The backend comes from SEMCHE_SPARSE_BACKEND (inverted / fts5).
+
+        Raises:
+            SparseIndexError: If the index can neither be loaded nor rebuilt
+        """
+        with self._lock:
+            if self._sparse_index is None:
+                chroma = self.chromadb_manager()
+                start = time.perf_counter()
+                self._sparse_index = create_sparse_index(chroma)
+                try:
+                    self._sparse_index.load()
+                finally:
+                    if self._unloaded:
+                        self._record_reload(start)
+            return self._sparse_index
+
+    def invalidate_sparse_index(self) -> None:
+        """Discard the BM25 index after a failed update, so its next use rebuilds it from ChromaDB."""
+        with self._lock:
+            if self._sparse_index is not None:
+                self._sparse_index.invalidate()
+
+    def init(self) -> None:
+        """Create the Embedder and ChromaDBManager now instead of on first use."""
+        self.chromadb_manager()
+
+    def warm(self) -> None:
+        """init(), load the BM25 index (and its tokenizer) and run one dummy encode.
+
+        A BM25 index that cannot be loaded is only logged; the tools fall back
+        as they do on first use.
+
+        Raises:
+            EmbeddingError, ChromaDBError: If the model or the ChromaDB client cannot be loaded
+        """
+        self.init()
+        try:
+            self.sparse_index()
+        except SparseIndexError as e:
+            logger.warning(f"Could not load the BM25 index: {e}")
+        self.embedder().warm_up()
+        # The idle period starts now, not at the last request before warm-up
+        with self._usage:
+            self._last_used = time.monotonic()
+            self._usage.notify_all()
+        self._start_watcher()
+
+    def close(self) -> None:
+        """Release every service: finish background merges, close caches and worker pools.
+
+        The registry stays usable; the next use creates the services again.
+        """
+        with self._lock:
+            if self._sparse_index is not None:
+                self._sparse_index.close()
+            if self._embedder is not None:
+                self._embedder.close_pool()
+                if self._embedder.cache is not None:
+                    self._embedder.cache.close()
+            self._sparse_index = None
+            self._chromadb_manager = None
+            self._embedder = None
+
+    @property
+    def loaded(self) -> bool:
+        """True while any service is in memory."""
+        return any(s is not None for s in (self._embedder, self._chromadb_manager, self._sparse_index))
+
+    @contextmanager
+    def activity(self) -> Iterator[None]:
+        """Mark a tool call: services are not unloaded while one runs, and the idle period restarts after it."""
+        with self._usage:
+            self._active += 1
+        self._start_watcher()
+        try:
+            yield
+        finally:
+            with self._usage:
+                self._active -= 1
+                self._last_used = time.monotonic()
+                self._usage.notify_all()
+
+    def unload(self) -> None:
+        """close() the services to free their memory and record it; the next use reloads them."""
+        with self._lock:
+            if not self.loaded:
+                return
+            before = _rss_bytes()
+            self.close()
+            _release_memory()
+            after = _rss_bytes()
+            freed = max(before - after, 0) if before is not None and after is not None else 0
+            self._unloaded = True
+            self._unloads += 1
+            self._freed_bytes += freed
+            self._last_reload_seconds = 0.0
+        logger.info(f"Unloaded idle services (unload {self._unloads}, RSS freed {freed / 2**20:.0f} MiB)")
+
+    def stats(self) -> dict:
+        """Memory-budget metrics.
+
+        Returns:
+            dict: idle_timeout (seconds or None), loaded, unloads, reloads (model
+            reloads after an unload), reload_seconds (total time spent reloading
+            services), last_reload_seconds (since the last unload) and
+            freed_bytes (total RSS given back by unloads; 0 where unknown)
+        """
+        return {
+            "idle_timeout": self.idle_timeout,
+            "loaded": self.loaded,
+            "unloads": self._unloads,
+            "reloads": self._reloads,
+            "reload_seconds": self._reload_seconds,
+            "last_reload_seconds": self._last_reload_seconds,
+            "freed_bytes": self._freed_bytes,
+        }
+
+    def _record_reload(self, start: float) -> float:
+        elapsed = time.perf_counter() - start
+        self._reload_seconds += elapsed
+        self._last_reload_seconds += elapsed
+        return elapsed
+
+    def _start_watcher(self) -> None:
+        if self.idle_timeout is None:
+            return
+        with self._usage:
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch_idle, name="semche-idle-unload", daemon=True)
+                self._watcher.start()
+
+    def _watch_idle(self) -> None:
+        """Unload the services once they have been idle for idle_timeout seconds."""
+        assert self.idle_timeout is not None
+        with self._usage:
+            while True:
+                if self._active or not self.loaded:
+                    # Woken by the end of the next activity
+                    self._usage.wait()
+                    continue
+                remaining = self._last_used + self.idle_timeout - time.monotonic()
+                if remaining > 0:
+                    self._usage.wait(remaining)
+                    continue
+                # Holding _usage: no activity can start while the services are closed
+                try:
+                    self.unload()
+                except Exception as e:
+                    logger.warning(f"Unloading idle services failed: {e}")
+                    self._last_used = time.monotonic()
+
+
+_services = ServiceRegistry()
+
+
+def get_services() -> ServiceRegistry:
+    """The process-wide ServiceRegistry used by the MCP tools."""
+    return _services
@@ -3,20 +3,38 @@
 This module provides BM25 sparse encoding functionality for keyword-based search,
 which is combined with dense vector search in hybrid retrieval.
 """
+import importlib.metadata
+import importlib.util
 import json
 import logging
+import multiprocessing
+import os
 import pickle
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Sequence
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union, overload
 
+import numpy as np
 from rank_bm25 import BM25Okapi
 
-try:
-    import MeCab
-    import unidic_lite
-    MECAB_AVAILABLE = True
-except ImportError:
-    MECAB_AVAILABLE = False
+from .index_format import (
+    LEGACY_INDEX_NAME,
+    MANIFEST_NAME,
+    is_binary_manifest,
+    read_file_types,
+    read_index,
+    read_manifest,
+    remove_stale_files,
+    write_index,
+)
+from .inverted_index import InvertedBM25Index, QueryPlan, select_top_k
+from .ngram_tokenizer import CharNgramTokenizer
+from .token_cache import TokenCache, TokenCacheError, cache_key
+
+# MeCab and its dictionary are imported when a MeCab tokenizer is created (_create_mecab_tagger)
+MECAB_AVAILABLE = all(importlib.util.find_spec(name) is not None for name in ("MeCab", "unidic_lite"))
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -28,45 +46,301 @@ class SparseEncoderError(Exception):
     pass
 
 
+ENGINES = ("rank_bm25", "inverted")
+# Built-in tokenizers selectable by name: MeCab morphemes, or character n-grams (no dictionary)
+TOKENIZERS = ("mecab", "ngram")
+
+# Distinct queries whose tokens (and query plan) are cached per encoder (0 disables the cache)
+QUERY_CACHE_SIZE = 256
+
+# Below this many documents, starting worker processes costs more than it saves
+PARALLEL_MIN_DOCUMENTS = 1000
+# Chunks per worker: small enough to balance uneven document lengths
+_CHUNKS_PER_WORKER = 4
+
+# Custom tokenizer output is joined with this separator to cross the process boundary
+_TOKEN_SEPARATOR = "\x1f"
+
+# Per-process state of a tokenization worker (see _init_tokenize_worker)
+_worker_tokenizer: Optional[Any] = None
+_worker_tagger: Optional[Any] = None
+
+
+def _create_mecab_tagger() -> Any:
+    """A MeCab wakati tagger on the unidic-lite dictionary."""
+    import MeCab
+    import unidic_lite
+
+    return MeCab.Tagger(f"-Owakati -d {unidic_lite.DICDIR}")
+
+
+def _init_tokenize_worker(tokenizer: Optional[Any]) -> None:
+    """Process pool initializer: create one tokenizer (MeCab tagger) per worker process."""
+    global _worker_tokenizer, _worker_tagger
+    if tokenizer is None:
+        _worker_tagger = _create_mecab_tagger()
+    else:
+        _worker_tokenizer = tokenizer
+
+
+def _tokenize_chunk(texts: List[str]) -> List[str]:
+    """Tokenize a chunk in a worker and return one joined string per text.
+
+    Pickling a flat list of strings is far cheaper than a list of token lists,
+    which would cost about as much as tokenizing. MeCab's wakati output is
+    returned as-is (space separated).
+    """
+    if _worker_tagger is not None:
+        return [_worker_tagger.parse(text).strip() for text in texts]
+    return [_TOKEN_SEPARATOR.join(_worker_tokenizer(text)) for text in texts]
+
+
+def resolve_workers(workers: Optional[int]) -> int:
+    """Normalize a worker count: None -> 1, 0 or negative -> number of CPUs."""
+    if workers is None:
+        return 1
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+class _AppendedCorpus(Sequence[str]):
+    """A read-only sequence (e.g. a memory-mapped StringTable) followed by appended strings.
+
+    Lets documents be added to a loaded index without decoding the whole table.
+    """
+
+    def __init__(self, base: Sequence[str]) -> None:
+        self.base = base
+        self.extra: List[str] = []
+
+    def extend(self, items: Iterable[str]) -> None:
+        self.extra.extend(items)
+
+    def __len__(self) -> int:
+        return len(self.base) + len(self.extra)
+
+    @overload
+    def __getitem__(self, i: int) -> str: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> List[str]: ...
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        n_base = len(self.base)
+        return self.base[i] if i < n_base else self.extra[i - n_base]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.base
+        yield from self.extra
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Sequence):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+
+# Document IDs: appendable, possibly backed by memory-mapped string tables
+Corpus = Union[List[str], _AppendedCorpus]
+
+
+def _mecab_signature() -> str:
+    """Token cache signature of the built-in MeCab tokenizer (MeCab and dictionary versions)."""
+    import MeCab
+
+    try:
+        dic_version = importlib.metadata.version("unidic-lite")
+    except importlib.metadata.PackageNotFoundError:
+        dic_version = "unknown"
+    return f"mecab-{getattr(MeCab, 'VERSION', 'unknown')}:unidic-lite-{dic_version}:-Owakati"
+
+
 class BM25SparseEncoder:
     """BM25-based sparse encoder with persistence support.
 
     This encoder builds a BM25 index from documents and provides keyword-based
     search functionality. The index can be persisted to disk for reuse.
 
+    Two scoring engines share the same build_index/search API:
+      - "rank_bm25": rank_bm25.BM25Okapi, scores every document for every query token
+      - "inverted": InvertedBM25Index, posting lists that only touch documents
+        containing a query term (same scores as BM25Okapi)
+
+    Document tokenization can be served from a persistent TokenCache so that
+    rebuilding the index only tokenizes new or changed documents.
+
+    add_documents / update_documents / remove_documents update the "inverted"
+    engine in place (only the changed documents are tokenized); removed
+    documents keep their slot in corpus_ids (their postings are dropped when
+    segments are merged) until compact() renumbers the live documents. The
+    "rank_bm25" engine rebuilds its model instead, from the term frequencies
+    it already holds for the unchanged documents.
+
+    Only document IDs and term statistics are kept: search() returns IDs and
+    scores, and callers fetch the texts of the results from ChromaDB.
+
+    Each document may carry a file type. search() can be restricted to one file
+    type and/or an ID prefix: the matching documents are kept as a bool mask
+    per document index (cached per filter and extended as documents are
+    added), and only their postings are scored, with index-wide IDF and
+    length statistics.
+
+    Repeated queries skip tokenization: a bounded LRU cache maps the query text
+    (whitespace-normalized) to its tokens and, with the "inverted" engine, its
+    QueryPlan (term ids, weights and score bounds). Plans carry the index
+    statistics generation they were made for and are re-planned from the
+    cached tokens once the index changes.
+
     Attributes:
         tokenizer: Function to tokenize text (default: str.split)
-        bm25: BM25Okapi instance (None until index is built)
-        corpus_texts: Original document texts
-        corpus_ids: Document IDs corresponding to corpus_texts
+        tokenizer_name: Built-in tokenizer name ("mecab" or "ngram"), None for a custom tokenizer
+        tokenizer_signature: Identifies the tokenizer configuration in the token
+            cache (None disables the cache for custom tokenizers)
+        index_tokenizer: {"name", "signature"} of the tokenizer the loaded index was
+            built with (None until load(), or for an index that did not record it)
+        token_cache: Optional TokenCache used by tokenize_documents()
+        tokenize_workers: Number of processes used to tokenize large batches
+        query_cache_size: Maximum number of cached queries (0: no query cache)
+        engine: Scoring engine name ("rank_bm25" or "inverted")
+        bm25: BM25Okapi or InvertedBM25Index instance (None until index is built)
+        corpus_ids: Document IDs (aligned with the engine's document indices)
+        file_type_names: Distinct file types, indexed by file type code
+        file_type_codes: int32 file type code per document index (-1: none), or
+            None for an index loaded from a format without file types
     """
 
-    def __init__(self, tokenizer: Optional[Any] = None):
+    def __init__(
+        self,
+        tokenizer: Optional[Any] = None,
+        engine: str = "rank_bm25",
+        token_cache: Optional[TokenCache] = None,
+        tokenizer_signature: Optional[str] = None,
+        tokenize_workers: Optional[int] = 1,
+        query_cache_size: int = QUERY_CACHE_SIZE,
+    ):
         """Initialize BM25 sparse encoder.
 
         Args:
-            tokenizer: Optional tokenizer function. If not provided, MeCab is required.
-                      Should accept a string and return List[str].
-        
+            tokenizer: Optional tokenizer function, or the name of a built-in
+                      tokenizer ("mecab" or "ngram"). If not provided, MeCab is required.
+                      Should accept a string and return List[str]; a ``signature``
+                      attribute is used as its cache signature.
+            engine: Scoring engine, "rank_bm25" (default) or "inverted"
+            token_cache: Optional persistent cache of document tokens
+            tokenizer_signature: Cache signature of a custom tokenizer. The MeCab
+                tokenizer derives its own; a custom tokenizer without one is never cached.
+            tokenize_workers: Processes used to tokenize batches of at least
+                PARALLEL_MIN_DOCUMENTS documents (1: serial, 0: one per CPU).
+                Custom tokenizers must be picklable to run in workers.
+            query_cache_size: Distinct queries whose tokens and query plan are
+                kept in the LRU query cache (0 disables it)
+
         Raises:
-            SparseEncoderError: If tokenizer is not provided and MeCab is not available.
+            SparseEncoderError: If the engine or tokenizer name is unknown, or MeCab
+                is selected (the default) and not available.
         """
+        if engine not in ENGINES:
+            raise SparseEncoderError(f"Unknown BM25 engine: {engine} (expected one of {ENGINES})")
+        if isinstance(tokenizer, str):
+            if tokenizer not in TOKENIZERS:
+                raise SparseEncoderError(f"Unknown tokenizer: {tokenizer} (expected one of {TOKENIZERS})")
+            tokenizer = CharNgramTokenizer() if tokenizer == "ngram" else None
+        self.engine = engine
+        self.token_cache = token_cache
+        self.tokenize_workers = resolve_workers(tokenize_workers)
+        self._custom_tokenizer = tokenizer
         if tokenizer:
             self.tokenizer = tokenizer
+            self.tokenizer_name: Optional[str] = getattr(tokenizer, "name", None)
+            self.tokenizer_signature = tokenizer_signature or getattr(tokenizer, "signature", None)
         elif MECAB_AVAILABLE:
             self.tokenizer = self._mecab_tokenizer
+            self.tokenizer_name = "mecab"
             # Use unidic-lite dictionary
-            dic_dir = unidic_lite.DICDIR
-            self._mecab_tagger = MeCab.Tagger(f"-Owakati -d {dic_dir}")
+            self._mecab_tagger = _create_mecab_tagger()
+            self.tokenizer_signature = tokenizer_signature or _mecab_signature()
             logger.info("Using MeCab tokenizer with unidic-lite for Japanese text support")
         else:
             raise SparseEncoderError(
                 "MeCab is not available. Please install mecab-python3 and unidic-lite, "
-                "or provide a custom tokenizer function."
+                "use tokenizer=\"ngram\", or provide a custom tokenizer function."
             )
-        self.bm25: Optional[BM25Okapi] = None
-        self.corpus_texts: List[str] = []
-        self.corpus_ids: List[str] = []
+        self.index_tokenizer: Optional[Dict[str, str]] = None
+        self.bm25: Optional[Union[BM25Okapi, InvertedBM25Index]] = None
+        # Lists after build_index; memory-mapped string tables after loading the binary format
+        self.corpus_ids: Corpus = []
+        self.file_type_names: List[str] = []
+        self.file_type_codes: Optional[np.ndarray] = np.zeros(0, dtype=np.int32)
+        # Document ID -> document index of live documents (built on first update)
+        self._positions: Optional[Dict[str, int]] = None
+        # (filter kind, value) -> document mask, see _filter_mask
+        self._masks: Dict[Tuple[str, str], np.ndarray] = {}
+        # Normalized query -> (tokens, QueryPlan or None), least recently used first
+        self.query_cache_size = max(query_cache_size, 0)
+        self._query_cache: "OrderedDict[str, Tuple[List[str], Optional[QueryPlan]]]" = OrderedDict()
+        self._query_lock = threading.Lock()
+        self._query_hits = 0
+        self._query_misses = 0
+
+    @property
+    def document_count(self) -> int:
+        """Number of indexed documents (removed documents excluded)."""
+        if isinstance(self.bm25, InvertedBM25Index):
+            return self.bm25.corpus_size
+        return len(self.corpus_ids)
+
+    @property
+    def tokenizer_info(self) -> Optional[Dict[str, str]]:
+        """{"name", "signature"} recorded in saved indexes (None for a custom tokenizer without signature)."""
+        if self.tokenizer_signature is None:
+            return None
+        return {"name": self.tokenizer_name or "custom", "signature": self.tokenizer_signature}
+
+    def query_cache_info(self) -> Dict[str, int]:
+        """Query cache statistics: size (limit), entries, hits and misses."""
+        with self._query_lock:
+            return {
+                "size": self.query_cache_size,
+                "entries": len(self._query_cache),
+                "hits": self._query_hits,
+                "misses": self._query_misses,
+            }
+
+    def _prepare_query(self, query: str) -> Union[List[str], QueryPlan]:
+        """Tokens of a query, or its QueryPlan with the "inverted" engine, via the query cache.
+
+        The cache key is the query with runs of whitespace collapsed. A cached
+        plan of an older index generation is re-planned from its tokens
+        (no tokenization) and stored again.
+        """
+        key = " ".join(query.split())
+        with self._query_lock:
+            entry = self._query_cache.get(key)
+            if entry is None:
+                self._query_misses += 1
+            else:
+                self._query_hits += 1
+                self._query_cache.move_to_end(key)
+        if entry is None:
+            tokens, plan = self.tokenizer(key), None
+        else:
+            tokens, plan = entry
+        if not isinstance(self.bm25, InvertedBM25Index):
+            prepared: Union[List[str], QueryPlan] = tokens
+        else:
+            prepared = self.bm25.plan(tokens if plan is None else plan)
+        if self.query_cache_size and (entry is None or prepared is not plan):
+            stored = (tokens, prepared if isinstance(prepared, QueryPlan) else plan)
+            with self._query_lock:
+                self._query_cache[key] = stored
+                self._query_cache.move_to_end(key)
+                while len(self._query_cache) > self.query_cache_size:
+                    self._query_cache.popitem(last=False)
+        return prepared
 
     def _mecab_tokenizer(self, text: str) -> List[str]:
         """MeCab tokenizer for Japanese text.
@@ -79,6 +353,75 @@ class BM25SparseEncoder:
         """
         return self._mecab_tagger.parse(text).strip().split()
 
+    def tokenize_documents(self, documents: Sequence[str]) -> List[List[str]]:
+        """Tokenize documents, reusing the token cache when configured.
+
+        Only documents missing from the cache are passed to the tokenizer. Cache
+        errors are logged and tokenization falls back to the tokenizer.
+
+        Args:
+            documents: Document texts
+
+        Returns:
+            Token lists aligned with documents
+        """
+        if self.token_cache is None or self.tokenizer_signature is None:
+            return self._tokenize_many(documents)
+
+        keys = [cache_key(self.tokenizer_signature, doc) for doc in documents]
+        try:
+            cached = self.token_cache.get_many(keys)
+        except TokenCacheError as e:
+            logger.warning(f"Token cache unavailable, tokenizing all documents: {e}")
+            return self._tokenize_many(documents)
+
+        pending: Dict[str, str] = {}
+        for key, doc in zip(keys, documents):
+            if key not in cached:
+                pending.setdefault(key, doc)
+        missing = dict(zip(pending, self._tokenize_many(list(pending.values()))))
+        if missing:
+            try:
+                self.token_cache.put_many(missing.items())
+            except TokenCacheError as e:
+                logger.warning(f"Failed to update token cache: {e}")
+        logger.debug(f"Tokenized {len(missing)} of {len(documents)} documents (others from cache)")
+        return [cached[key] if key in cached else missing[key] for key in keys]
+
+    def _tokenize_many(self, texts: Sequence[str]) -> List[List[str]]:
+        """Tokenize texts in order, fanning out over a process pool for large batches.
+
+        Each worker process gets its own tokenizer (one MeCab tagger per worker),
+        input is split into contiguous chunks, and results keep the input order.
+        """
+        workers = min(self.tokenize_workers, max(1, len(texts) // (PARALLEL_MIN_DOCUMENTS // 2)))
+        if workers <= 1 or len(texts) < PARALLEL_MIN_DOCUMENTS:
+            return [self.tokenizer(text) for text in texts]
+        if self._custom_tokenizer is not None:
+            try:
+                pickle.dumps(self._custom_tokenizer)
+            except Exception as e:
+                logger.warning(f"Tokenizer cannot be sent to worker processes, tokenizing serially: {e}")
+                return [self.tokenizer(text) for text in texts]
+
+        chunk_size = -(-len(texts) // (workers * _CHUNKS_PER_WORKER))
+        chunks = [list(texts[i:i + chunk_size]) for i in range(0, len(texts), chunk_size)]
+        logger.info(f"Tokenizing {len(texts)} documents with {workers} processes")
+        # spawn: forking a multi-threaded server process is unsafe
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_tokenize_worker,
+            initargs=(self._custom_tokenizer,),
+        ) as pool:
+            tokenized: List[List[str]] = []
+            for joined_chunk in pool.map(_tokenize_chunk, chunks):
+                if self._custom_tokenizer is None:
+                    tokenized.extend(joined.split() for joined in joined_chunk)
+                else:
+                    tokenized.extend(joined.split(_TOKEN_SEPARATOR) if joined else [] for joined in joined_chunk)
+        return tokenized
+
     def _default_tokenizer(self, text: str) -> List[str]:
         """Default tokenizer: simple whitespace split and lowercase.
 
@@ -94,12 +437,14 @@ class BM25SparseEncoder:
         self,
         documents: Sequence[str],
         doc_ids: Sequence[str],
+        file_types: Optional[Sequence[Optional[str]]] = None,
     ) -> Dict[str, Any]:
         """Build BM25 index from documents.
 
         Args:
             documents: List of document texts
             doc_ids: List of document IDs (must match length of documents)
+            file_types: Optional file type of each document (None entries: no file type)
 
         Returns:
             Dictionary with status and count
@@ -116,16 +461,10 @@ class BM25SparseEncoder:
 
             if len(documents) == 0:
                 raise SparseEncoderError("Cannot build index from empty document list")
+            self._check_file_types(file_types, len(documents))
 
-            # Tokenize all documents
-            tokenized_corpus = [self.tokenizer(doc) for doc in documents]
-
-            # Build BM25 index
-            self.bm25 = BM25Okapi(tokenized_corpus)
-            self.corpus_texts = list(documents)
-            self.corpus_ids = list(doc_ids)
-
-            logger.info(f"Built BM25 index with {len(documents)} documents")
+            # Tokenize all documents (cached token lists are reused)
+            self._build_tokenized(self.tokenize_documents(documents), doc_ids, file_types)
 
             return {
                 "status": "success",
@@ -139,20 +478,124 @@ class BM25SparseEncoder:
             logger.error(f"Failed to build BM25 index: {e}")
             raise SparseEncoderError(f"Failed to build BM25 index: {e}")
 
+    def _build_tokenized(
+        self,
+        tokenized_corpus: List[List[str]],
+        doc_ids: Sequence[str],
+        file_types: Optional[Sequence[Optional[str]]],
+    ) -> None:
+        """Build the engine from token lists (texts are not kept)."""
+        if self.engine == "inverted":
+            self.bm25 = InvertedBM25Index(tokenized_corpus)
+        else:
+            self.bm25 = BM25Okapi(tokenized_corpus)
+        self.corpus_ids = list(doc_ids)
+        self.file_type_names = []
+        self.file_type_codes = self._encode_file_types(file_types, len(doc_ids))
+        self._positions = None
+        self._masks = {}
+        logger.info(f"Built BM25 index with {len(doc_ids)} documents (engine: {self.engine})")
+
+    @staticmethod
+    def _check_file_types(file_types: Optional[Sequence[Optional[str]]], n: int) -> None:
+        if file_types is not None and len(file_types) != n:
+            raise SparseEncoderError(f"Length mismatch: {len(file_types)} file types vs {n} documents")
+
+    def _encode_file_types(self, file_types: Optional[Sequence[Optional[str]]], n: int) -> np.ndarray:
+        """File type codes of n documents, adding unseen names to file_type_names."""
+        if file_types is None:
+            return np.full(n, -1, dtype=np.int32)
+        codes = {name: i for i, name in enumerate(self.file_type_names)}
+        for name in file_types:
+            if name and name not in codes:
+                codes[name] = len(self.file_type_names)
+                self.file_type_names.append(name)
+        return np.array([codes[name] if name else -1 for name in file_types], dtype=np.int32)
+
+    def _file_type_at(self, i: int) -> Optional[str]:
+        if self.file_type_codes is None or self.file_type_codes[i] < 0:
+            return None
+        return self.file_type_names[self.file_type_codes[i]]
+
+    @property
+    def has_file_types(self) -> bool:
+        """False when the index was loaded from a format that did not store file types."""
+        return self.file_type_codes is not None
+
+    def _filter_mask(self, kind: str, value: str) -> np.ndarray:
+        """Bool mask over document indices of one filter ("file_type" or "id_prefix").
+
+        Masks are cached per filter. Documents are only ever appended (compact(),
+        build_index() and load() reset the cache), so a cached mask is extended
+        to the documents added since it was built instead of being recomputed.
+        """
+        n = len(self.corpus_ids)
+        mask = self._masks.get((kind, value))
+        if mask is not None and len(mask) == n:
+            return mask
+        start = 0 if mask is None else len(mask)
+        if kind == "file_type":
+            if self.file_type_codes is None:
+                raise SparseEncoderError("Index has no file types; rebuild it to filter by file type")
+            code = self.file_type_names.index(value) if value in self.file_type_names else -2
+            tail = self.file_type_codes[start:n] == code
+        else:
+            tail = np.fromiter(
+                (self.corpus_ids[i].startswith(value) for i in range(start, n)), dtype=bool, count=n - start
+            )
+        mask = tail if mask is None else np.concatenate([mask, tail])
+        self._masks[(kind, value)] = mask
+        return mask
+
+    def document_mask(
+        self, file_type: Optional[str] = None, id_prefix: Optional[str] = None
+    ) -> Optional[np.ndarray]:
+        """Bool mask over document indices matching every given filter.
+
+        Args:
+            file_type: Only documents of this file type
+            id_prefix: Only documents whose ID starts with this prefix
+
+        Returns:
+            Mask aligned with corpus_ids (removed documents are not cleared), or None without filters
+
+        Raises:
+            SparseEncoderError: If filtering an index without file types by file type
+        """
+        mask: Optional[np.ndarray] = None
+        for kind, value in (("file_type", file_type), ("id_prefix", id_prefix)):
+            if value is None:
+                continue
+            part = self._filter_mask(kind, value)
+            mask = part if mask is None else mask & part
+        return mask
+
     def search(
         self,
         query: str,
         top_k: int = 5,
+        pruning: bool = True,
+        file_type: Optional[str] = None,
+        id_prefix: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
         """Search documents using BM25 scoring.
 
+        Filters only select which documents are scored: IDF and document length
+        norms come from the whole index, so a document scores the same with and
+        without a filter.
+
         Args:
             query: Search query text
             top_k: Number of results to return
+            pruning: Use MaxScore dynamic pruning with the "inverted" engine
+                (same top-k as exhaustive scoring; ignored by "rank_bm25")
+            file_type: Only return documents of this file type
+            id_prefix: Only return documents whose ID starts with this prefix
 
         Returns:
-            List of dictionaries with 'id', 'text', and 'score' keys,
-            sorted by score (descending)
+            List of dictionaries with 'id' and 'score' keys, sorted by score
+            (descending); texts are not kept. The "inverted" engine only returns
+            documents that contain at least one query term.
 
         Raises:
             SparseEncoderError: If index is not built or search fails
@@ -163,24 +606,31 @@ class BM25SparseEncoder:
                     "BM25 index not built. Call build_index() first."
                 )
 
-            # Tokenize query
-            query_tokens = self.tokenizer(query)
-
-            # Get BM25 scores
-            scores = self.bm25.get_scores(query_tokens)
-
-            # Get top-k indices (sorted by score, descending)
-            top_indices = scores.argsort()[-top_k:][::-1]
+            mask = self.document_mask(file_type, id_prefix)
+            if mask is not None and not mask.any():
+                return []
+
+            # Tokenize query (or reuse its cached tokens / plan)
+            prepared = self._prepare_query(query)
+
+            if isinstance(self.bm25, InvertedBM25Index):
+                if pruning:
+                    doc_indices, scores = self.bm25.top_k(prepared, top_k, mask)
+                else:
+                    # Only documents sharing a term with the query are scored
+                    doc_indices, scores = select_top_k(*self.bm25.score_candidates(prepared, mask), top_k)
+            else:
+                # Get BM25 scores
+                all_scores = self.bm25.get_scores(prepared)
+                candidates = np.arange(len(all_scores)) if mask is None else np.flatnonzero(mask)
+                doc_indices, scores = select_top_k(candidates, all_scores[candidates], top_k)
+            ranked = [(int(idx), float(score)) for idx, score in zip(doc_indices, scores)]
 
             # Build results
             results = []
-            for idx in top_indices:
+            for idx, score in ranked:
                 if idx < len(self.corpus_ids):
-                    results.append({
-                        "id": self.corpus_ids[idx],
-                        "text": self.corpus_texts[idx],
-                        "score": float(scores[idx]),
-                    })
+                    results.append({"id": self.corpus_ids[idx], "score": score})
 
             return results
 
@@ -193,6 +643,12 @@ class BM25SparseEncoder:
     def save(self, directory: str) -> Dict[str, Any]:
         """Save BM25 index to disk.
 
+        The "inverted" engine is written in the versioned binary format of
+        index_format.py (NumPy arrays that load() memory-maps): documents added
+        since the last save are flushed into a new segment, and only files of
+        new segments are written. The "rank_bm25" engine keeps the legacy
+        pickle + JSON format.
+
         Args:
             directory: Directory path to save index files
 
@@ -212,27 +668,29 @@ class BM25SparseEncoder:
             dir_path = Path(directory)
             dir_path.mkdir(parents=True, exist_ok=True)
 
-            # Save BM25 model
-            bm25_path = dir_path / "bm25_index.pkl"
-            with open(bm25_path, "wb") as f:
-                pickle.dump(self.bm25, f)
-
-            # Save corpus metadata (texts and IDs)
-            metadata = {
-                "corpus_texts": self.corpus_texts,
-                "corpus_ids": self.corpus_ids,
-            }
-            metadata_path = dir_path / "bm25_metadata.json"
-            with open(metadata_path, "w", encoding="utf-8") as f:
-                json.dump(metadata, f, ensure_ascii=False, indent=2)
+            if isinstance(self.bm25, InvertedBM25Index):
+                self.bm25.flush()
+                file_types = (
+                    (self.file_type_names, self.file_type_codes) if self.file_type_codes is not None else None
+                )
+                files = write_index(
+                    dir_path,
+                    self.bm25,
+                    self.corpus_ids,
+                    engine=self.engine,
+                    file_types=file_types,
+                    tokenizer=self.tokenizer_info,
+                )
+            else:
+                files = self._save_legacy(dir_path)
 
             logger.info(f"Saved BM25 index to {directory}")
 
             return {
                 "status": "success",
                 "directory": directory,
-                "files": [str(bm25_path), str(metadata_path)],
-                "count": len(self.corpus_ids),
+                "files": files,
+                "count": self.document_count,
             }
 
         except SparseEncoderError:
@@ -241,6 +699,35 @@ class BM25SparseEncoder:
             logger.error(f"Failed to save BM25 index: {e}")
             raise SparseEncoderError(f"Failed to save BM25 index: {e}")
 
+    def _save_legacy(self, dir_path: Path) -> List[str]:
+        """Pickle the BM25Okapi model and write the IDs as JSON (rank_bm25 engine)."""
+        # Files are written to a temporary name and renamed so that a reader in
+        # another process never sees a half-written index.
+        bm25_path = dir_path / LEGACY_INDEX_NAME
+        tmp_path = bm25_path.with_suffix(".pkl.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self.bm25, f)
+        os.replace(tmp_path, bm25_path)
+
+        # Save corpus metadata (IDs)
+        metadata: Dict[str, Any] = {
+            "engine": self.engine,
+            "corpus_ids": list(self.corpus_ids),
+        }
+        if self.tokenizer_info is not None:
+            metadata["tokenizer"] = self.tokenizer_info
+        if self.file_type_codes is not None:
+            metadata["corpus_file_types"] = [self._file_type_at(i) for i in range(len(self.file_type_codes))]
+        metadata_path = dir_path / MANIFEST_NAME
+        tmp_path = metadata_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, metadata_path)
+
+        # Array files of a previously saved binary index are no longer referenced
+        remove_stale_files(dir_path, keep=[LEGACY_INDEX_NAME])
+        return [str(bm25_path), str(metadata_path)]
+
     def load(self, directory: str) -> Dict[str, Any]:
         """Load BM25 index from disk.
 
@@ -255,41 +742,48 @@ class BM25SparseEncoder:
         """
         try:
             dir_path = Path(directory)
-
-            # Check if files exist
-            bm25_path = dir_path / "bm25_index.pkl"
-            metadata_path = dir_path / "bm25_metadata.json"
-
-            if not bm25_path.exists():
-                raise SparseEncoderError(
-                    f"BM25 index file not found: {bm25_path}"
-                )
-
+            metadata_path = dir_path / MANIFEST_NAME
             if not metadata_path.exists():
                 raise SparseEncoderError(
                     f"BM25 metadata file not found: {metadata_path}"
                 )
+            metadata = read_manifest(dir_path)
+
+            if is_binary_manifest(metadata):
+                # Arrays are memory-mapped read-only: nothing is copied until it is touched
+                self.bm25, ids, manifest = read_index(dir_path, metadata)
+                # Wrapped so that added documents can be appended without decoding the table
+                self.corpus_ids = _AppendedCorpus(ids)
+                file_types = read_file_types(dir_path, manifest)
+                self.file_type_names, self.file_type_codes = file_types if file_types is not None else ([], None)
+            else:
+                # Legacy format: pickled model + IDs in the JSON metadata (older files also hold texts, unused)
+                bm25_path = dir_path / LEGACY_INDEX_NAME
+                if not bm25_path.exists():
+                    raise SparseEncoderError(
+                        f"BM25 index file not found: {bm25_path}"
+                    )
+                with open(bm25_path, "rb") as f:
+                    self.bm25 = pickle.load(f)
+                self.corpus_ids = metadata["corpus_ids"]
+                self.file_type_names = []
+                legacy_types = metadata.get("corpus_file_types")
+                self.file_type_codes = (
+                    self._encode_file_types(legacy_types, len(legacy_types)) if legacy_types is not None else None
+                )
+            self.engine = metadata.get("engine", "rank_bm25")
+            self.index_tokenizer = metadata.get("tokenizer")
+            self._positions = None
+            self._masks = {}
 
-            # Load BM25 model
-            with open(bm25_path, "rb") as f:
-                self.bm25 = pickle.load(f)
-
-            # Load corpus metadata
-            with open(metadata_path, "r", encoding="utf-8") as f:
-                metadata = json.load(f)
-
-            self.corpus_texts = metadata["corpus_texts"]
-            self.corpus_ids = metadata["corpus_ids"]
-
-            logger.info(
-                f"Loaded BM25 index from {directory} ({len(self.corpus_ids)} documents)"
-            )
+            count = self.document_count
+            logger.info(f"Loaded BM25 index from {directory} ({count} documents)")
 
             return {
                 "status": "success",
                 "directory": directory,
-                "count": len(self.corpus_ids),
-                "message": f"Loaded {len(self.corpus_ids)} documents",
+                "count": count,
+                "message": f"Loaded {count} documents",
             }
 
         except SparseEncoderError:
@@ -298,21 +792,89 @@ class BM25SparseEncoder:
             logger.error(f"Failed to load BM25 index: {e}")
             raise SparseEncoderError(f"Failed to load BM25 index: {e}")
 
+    def _document_positions(self) -> Dict[str, int]:
+        """Document ID -> document index of live documents."""
+        if self._positions is None:
+            deleted = self.bm25.deleted if isinstance(self.bm25, InvertedBM25Index) else None
+            self._positions = {
+                did: i for i, did in enumerate(self.corpus_ids) if deleted is None or not deleted[i]
+            }
+        return self._positions
+
+    def document_ids(self) -> List[str]:
+        """IDs of the indexed documents (removed documents excluded)."""
+        return list(self._document_positions()) if self.bm25 is not None else []
+
+    def _remaining_corpus(self, excluded: Any) -> Tuple[List[List[str]], List[str], List[Optional[str]]]:
+        """Tokens, IDs and file types of live documents whose ID is not in ``excluded`` ("rank_bm25" engine).
+
+        Token lists are rebuilt from BM25Okapi's per-document term frequencies
+        (term order is lost, which BM25 does not use).
+        """
+        bm25 = self.bm25
+        if not isinstance(bm25, BM25Okapi):
+            raise SparseEncoderError("Remaining corpus is only rebuilt for the rank_bm25 engine")
+        positions = self._document_positions()
+        kept = [i for did, i in positions.items() if did not in excluded]
+        doc_freqs = bm25.doc_freqs
+        return (
+            [[term for term, freq in doc_freqs[i].items() for _ in range(freq)] for i in kept],
+            [self.corpus_ids[i] for i in kept],
+            [self._file_type_at(i) for i in kept],
+        )
+
+    def compact(self) -> bool:
+        """Reclaim the slots of removed documents and terms without postings ("inverted" engine).
+
+        Live documents are renumbered densely in their current order (see
+        ``InvertedBM25Index.compact``) and corpus_ids shrinks to match. No document is re-tokenized.
+
+        Returns:
+            True if the index was rebuilt (False for other engines or an already compact index)
+        """
+        bm25 = self.bm25
+        if not isinstance(bm25, InvertedBM25Index):
+            return False
+        if bm25.n_deleted == 0 and bm25.buffered_count == 0 and len(bm25.segments) <= 1:
+            return False
+        live = bm25.compact()
+        self.corpus_ids = [self.corpus_ids[i] for i in live]
+        if self.file_type_codes is not None:
+            self.file_type_codes = self.file_type_codes[live]
+        self._positions = None
+        self._masks = {}
+        return True
+
+    def clear(self) -> None:
+        """Drop the index and the corpus."""
+        self.bm25 = None
+        self.corpus_ids = []
+        self.file_type_names = []
+        self.file_type_codes = np.zeros(0, dtype=np.int32)
+        self._positions = None
+        self._masks = {}
+
     def add_documents(
         self,
         documents: Sequence[str],
         doc_ids: Sequence[str],
+        file_types: Optional[Sequence[Optional[str]]] = None,
     ) -> Dict[str, Any]:
-        """Add new documents to existing index.
+        """Add documents to the index, replacing documents whose ID is already indexed.
 
-        This rebuilds the entire BM25 index with the new documents added.
+        With the "inverted" engine only the given documents are tokenized and
+        their postings appended, and replaced documents are tombstoned, so the
+        cost is proportional to the change instead of the corpus. The
+        "rank_bm25" engine rebuilds its model from the term frequencies of the
+        unchanged documents plus the tokens of the given ones.
 
         Args:
-            documents: List of new document texts
-            doc_ids: List of new document IDs
+            documents: List of document texts
+            doc_ids: List of document IDs (a repeated ID keeps its last text)
+            file_types: Optional file type of each document (None entries: no file type)
 
         Returns:
-            Dictionary with status and total count
+            Dictionary with status, total count and the number of replaced documents
 
         Raises:
             SparseEncoderError: If validation fails
@@ -323,16 +885,108 @@ class BM25SparseEncoder:
                 raise SparseEncoderError(
                     f"Length mismatch: {len(documents)} documents vs {len(doc_ids)} IDs"
                 )
+            self._check_file_types(file_types, len(documents))
 
-            # Merge with existing corpus
-            all_texts = list(self.corpus_texts) + list(documents)
-            all_ids = list(self.corpus_ids) + list(doc_ids)
+            types: Sequence[Optional[str]] = file_types if file_types is not None else [None] * len(doc_ids)
+            latest = dict(zip(doc_ids, zip(documents, types)))
+            texts = [text for text, _ in latest.values()]
+            latest_types = [file_type for _, file_type in latest.values()]
+            if self.bm25 is None:
+                if not latest:
+                    raise SparseEncoderError("Cannot build index from empty document list")
+                result = self.build_index(texts, list(latest), latest_types)
+                result["replaced_count"] = 0
+                return result
+
+            positions = self._document_positions()
+            replaced = [positions[did] for did in latest if did in positions]
+            if isinstance(self.bm25, InvertedBM25Index):
+                tokenized = self.tokenize_documents(texts)
+                self.bm25.remove_documents(replaced)
+                new_positions = self.bm25.add_documents(tokenized)
+                self.corpus_ids.extend(latest)
+                if self.file_type_codes is not None:
+                    self.file_type_codes = np.concatenate([
+                        self.file_type_codes, self._encode_file_types(latest_types, len(latest_types))
+                    ])
+                positions.update(zip(latest, (int(i) for i in new_positions)))
+            else:
+                kept_tokens, ids, kept_types = self._remaining_corpus(latest)
+                self._build_tokenized(
+                    kept_tokens + self.tokenize_documents(texts), ids + list(latest), kept_types + latest_types
+                )
 
-            # Rebuild index
-            return self.build_index(all_texts, all_ids)
+            return {
+                "status": "success",
+                "count": self.document_count,
+                "replaced_count": len(replaced),
+                "message": f"Added {len(latest)} documents ({len(replaced)} replaced)",
+            }
 
         except SparseEncoderError:
             raise
         except Exception as e:
             logger.error(f"Failed to add documents: {e}")
             raise SparseEncoderError(f"Failed to add documents: {e}")
+
+    def update_documents(
+        self,
+        documents: Sequence[str],
+        doc_ids: Sequence[str],
+        file_types: Optional[Sequence[Optional[str]]] = None,
+    ) -> Dict[str, Any]:
+        """Replace the text of indexed documents.
+
+        Args:
+            documents: New document texts
+            doc_ids: IDs of indexed documents
+            file_types: Optional new file type of each document
+
+        Returns:
+            Dictionary with status, total count and the number of replaced documents
+
+        Raises:
+            SparseEncoderError: If an ID is not indexed or validation fails
+        """
+        positions = self._document_positions() if self.bm25 is not None else {}
+        unknown = [did for did in doc_ids if did not in positions]
+        if unknown:
+            raise SparseEncoderError(f"Documents not in index: {unknown[:5]}")
+        return self.add_documents(documents, doc_ids, file_types)
+
+    def remove_documents(self, doc_ids: Sequence[str]) -> Dict[str, Any]:
+        """Remove documents from the index. Unknown IDs are ignored.
+
+        The "inverted" engine only subtracts the removed documents' terms from
+        the document frequencies; the "rank_bm25" engine rebuilds its model.
+
+        Args:
+            doc_ids: Document IDs to remove
+
+        Returns:
+            Dictionary with status, removed count and total count
+
+        Raises:
+            SparseEncoderError: If the update fails
+        """
+        try:
+            removed = 0
+            if self.bm25 is not None:
+                positions = self._document_positions()
+                targets = [positions.pop(did) for did in dict.fromkeys(doc_ids) if did in positions]
+                removed = len(targets)
+                if isinstance(self.bm25, InvertedBM25Index):
+                    self.bm25.remove_documents(targets)
+                elif removed:
+                    tokens, ids, file_types = self._remaining_corpus(set(doc_ids))
+                    if ids:
+                        self._build_tokenized(tokens, ids, file_types)
+                    else:
+                        self.clear()
+            return {"status": "success", "removed_count": removed, "count": self.document_count}
+
+        except SparseEncoderError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to remove documents: {e}")
+            raise SparseEncoderError(f"Failed to remove documents: {e}")
@@ -0,0 +1,653 @@
+"""Persistent BM25 sparse index kept in sync with ChromaDB writes.
+
+``HybridRetriever`` used to rebuild a BM25 index from every document in ChromaDB
+on each search. This module keeps one long-lived ``BM25SparseEncoder`` per
+persist directory instead: it is loaded (or built once from ChromaDB) at startup,
+updated by ``put_document`` / ``delete_document`` / ``doc-update`` writes, and
+persisted under ``<persist_directory>/sparse_index`` so that searches only pay
+for query-time scoring. Writes update the posting lists in place, tokenizing
+only the written documents. Document tokens are cached in a SQLite sidecar in
+the same directory, so rebuilds only tokenize new or changed documents.
+
+Each write is saved as a small new segment, so its cost does not depend on the
+corpus size. A background thread merges segments (size-tiered, see
+``InvertedBM25Index.plan_merge``) to keep their number bounded and to drop the
+postings of removed documents; searches and writes only wait for it while the
+merged segment is swapped in. Merges drop the postings of removed documents
+but keep their document indices; once removed slots (or terms no live document
+contains) make up more than ``COMPACT_RATIO`` of the index, the same thread
+compacts it, renumbering the live documents, so that its size follows the
+corpus instead of its write history.
+
+The index also records each document's ``file_type`` metadata, so searches
+filtered by file type (or by ID prefix) are answered from per-filter document
+masks over the same posting lists, without fetching the matching documents
+from ChromaDB.
+
+The manifest records the tokenizer the index was built with ("mecab" or the
+dictionary-free "ngram"). Unless one is chosen explicitly (argument or
+SEMCHE_SPARSE_TOKENIZER), that recorded tokenizer is used, so the choice is
+made once per collection; an index built with a different tokenizer
+configuration is rebuilt.
+
+``create_sparse_index`` selects between this index and the disk-resident
+SQLite FTS5 backend (``fts_index.FTS5SparseIndex``).
+"""
+import logging
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+from .index_format import MANIFEST_NAME, read_manifest, remove_index_files, write_segment
+from .inverted_index import InvertedBM25Index
+from .sparse_encoder import TOKENIZERS, BM25SparseEncoder
+from .token_cache import TOKEN_CACHE_FILENAME, TokenCache, TokenCacheError, cache_key
+
+if TYPE_CHECKING:
+    from .fts_index import FTS5SparseIndex
+
+logger = logging.getLogger(__name__)
+
+SPARSE_INDEX_DIRNAME = "sparse_index"
+LOCK_FILENAME = ".lock"
+# Segment count above which segments are merged
+MAX_SEGMENTS = 8
+# Share of removed document slots (or of term ids without live documents) above which the index is compacted
+COMPACT_RATIO = 0.5
+# Backends accepted by create_sparse_index
+SPARSE_BACKENDS = ("inverted", "fts5")
+
+
+class SparseIndexError(Exception):
+    """Persistent sparse index operation errors"""
+
+    pass
+
+
+class _FileLock:
+    """Exclusive inter-process lock on a lock file (``fcntl.flock``, ``msvcrt.locking`` on Windows).
+
+    Not reentrant: ``SparseIndex._locked`` counts nested acquisitions.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if sys.platform == "win32":
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def release(self) -> None:
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        try:
+            if sys.platform == "win32":
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+class SparseIndex:
+    """Long-lived BM25 index stored next to the ChromaDB persist directory.
+
+    ChromaDB stays the source of truth. When the index files are missing or
+    their document count disagrees with the collection, the index is rebuilt
+    from ``ChromaDBManager.get_all_documents()``; documents a write is about to
+    apply (already written to ChromaDB) are allowed for in that comparison.
+
+    Several processes may share the index (e.g. the ``doc-update`` CLI while
+    the MCP server is running). Every load, update and save holds an exclusive
+    lock on ``<directory>/.lock``, and changes saved by another process are
+    picked up by comparing the on-disk file stamp before each operation, so a
+    write is always applied on top of the latest saved index.
+
+    Attributes:
+        chroma: ChromaDBManager used as the source of truth
+        directory: Directory the index files are saved to
+        token_cache: TokenCache stored in the same directory (kept across invalidate())
+        encoder: Underlying BM25SparseEncoder
+    """
+
+    def __init__(
+        self,
+        chroma_manager: Any,
+        tokenizer: Optional[Any] = None,
+        tokenize_workers: Optional[int] = None,
+        max_segments: int = MAX_SEGMENTS,
+        background_merge: bool = True,
+    ) -> None:
+        """Initialize the sparse index (nothing is read until ``load()``).
+
+        Args:
+            chroma_manager: ChromaDBManager whose collection is indexed
+            tokenizer: Tokenizer passed to BM25SparseEncoder: "mecab", "ngram" or a
+                function (default: SEMCHE_SPARSE_TOKENIZER, else the tokenizer
+                recorded in the index, else "mecab")
+            tokenize_workers: Tokenization processes for large rebuilds
+                (default: SEMCHE_TOKENIZE_WORKERS, else 1; 0 = one per CPU)
+            max_segments: Segment count above which segments are merged
+            background_merge: Merge in a background thread after writes
+                (otherwise only when ``merge()`` is called)
+        """
+        self.chroma = chroma_manager
+        self.directory = str(Path(chroma_manager.persist_directory) / SPARSE_INDEX_DIRNAME)
+        if tokenize_workers is None:
+            tokenize_workers = int(os.getenv("SEMCHE_TOKENIZE_WORKERS") or 1)
+        self.tokenize_workers = tokenize_workers
+        self.token_cache = TokenCache(Path(self.directory) / TOKEN_CACHE_FILENAME)
+        tokenizer = tokenizer or os.getenv("SEMCHE_SPARSE_TOKENIZER") or None
+        # Without an explicit choice, the tokenizer recorded in the index is kept
+        self._tokenizer_explicit = tokenizer is not None
+        self.encoder = self._create_encoder(tokenizer or self._recorded_tokenizer())
+        self.max_segments = max_segments
+        self.background_merge = background_merge
+        self._lock = threading.RLock()
+        # Serializes merges; held while the merged segment is built outside _lock
+        self._merge_lock = threading.Lock()
+        self._merge_thread: Optional[threading.Thread] = None
+        self._file_lock = _FileLock(Path(self.directory) / LOCK_FILENAME)
+        # Nesting depth of _locked() (the file lock is only taken by the outermost one)
+        self._lock_depth = 0
+        self._loaded = False
+        self._stamp: Optional[Tuple[int, int]] = None
+
+    @property
+    def count(self) -> int:
+        """Number of indexed documents."""
+        return self.encoder.document_count
+
+    def _create_encoder(self, tokenizer: Optional[Any]) -> BM25SparseEncoder:
+        return BM25SparseEncoder(
+            tokenizer=tokenizer,
+            engine="inverted",
+            token_cache=self.token_cache,
+            tokenize_workers=self.tokenize_workers,
+        )
+
+    def _recorded_tokenizer(self) -> Optional[str]:
+        """Name of the built-in tokenizer recorded in the saved index, if any."""
+        try:
+            manifest = read_manifest(self.directory) or {}
+        except Exception as e:
+            logger.warning(f"Failed to read sparse index manifest: {e}")
+            return None
+        name = (manifest.get("tokenizer") or {}).get("name")
+        return name if name in TOKENIZERS else None
+
+    def _adopt_index_tokenizer(self) -> None:
+        """Switch to the tokenizer the loaded index was built with, unless one was chosen explicitly."""
+        name = (self.encoder.index_tokenizer or {}).get("name")
+        if self._tokenizer_explicit or name not in TOKENIZERS or name == self.encoder.tokenizer_name:
+            return
+        logger.info(f"Sparse index was built with the {name} tokenizer; using it")
+        self.encoder = self._create_encoder(name)
+        self.encoder.load(self.directory)
+
+    def _tokenizer_changed(self) -> bool:
+        """Whether the loaded index was built with another tokenizer (configuration) than the encoder's."""
+        signature = self.encoder.tokenizer_signature
+        return signature is not None and (self.encoder.index_tokenizer or {}).get("signature") != signature
+
+    def _metadata_path(self) -> Path:
+        return Path(self.directory) / MANIFEST_NAME
+
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        """Return (mtime_ns, size) of the manifest, which is written last by save()."""
+        try:
+            st = os.stat(self._metadata_path())
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold the thread lock and the inter-process file lock (reentrant)."""
+        with self._lock:
+            if self._lock_depth == 0:
+                self._file_lock.acquire()
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    self._file_lock.release()
+
+    def load(self) -> Dict[str, Any]:
+        """Load the index from disk, rebuilding it from ChromaDB when missing or out of sync.
+
+        Returns:
+            Dictionary with status, count and whether a rebuild happened
+
+        Raises:
+            SparseIndexError: If neither loading nor rebuilding succeeds
+        """
+        return self._load()
+
+    def _load(self, added: Sequence[str] = (), removed: Sequence[str] = ()) -> Dict[str, Any]:
+        """Load the index; ``added`` / ``removed`` are IDs already written to / deleted from ChromaDB."""
+        with self._locked():
+            try:
+                rebuilt = False
+                if self._file_stamp() is None:
+                    self._rebuild()
+                    rebuilt = True
+                else:
+                    self.encoder.load(self.directory)
+                    self._adopt_index_tokenizer()
+                    self._stamp = self._file_stamp()
+                    expected = self.chroma.count()
+                    if not self.encoder.has_file_types:
+                        logger.info("Sparse index predates file type filters; rebuilding")
+                        self._rebuild()
+                        rebuilt = True
+                    elif self._tokenizer_changed():
+                        logger.info("Sparse index was built with another tokenizer; rebuilding")
+                        self._rebuild()
+                        rebuilt = True
+                    elif expected != self._count_after(added, removed):
+                        logger.info(
+                            f"Sparse index is out of sync ({self.count} vs {expected} documents); rebuilding"
+                        )
+                        self._rebuild()
+                        rebuilt = True
+                self._loaded = True
+                return {
+                    "status": "success",
+                    "directory": self.directory,
+                    "count": self.count,
+                    "rebuilt": rebuilt,
+                }
+            except SparseIndexError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to load sparse index: {e}")
+                raise SparseIndexError(f"Failed to load sparse index: {e}")
+
+    def _count_after(self, added: Sequence[str], removed: Sequence[str]) -> int:
+        """Document count once the pending write is applied (what ChromaDB already holds)."""
+        if not added and not removed:
+            return self.count
+        indexed = set(self.encoder.document_ids())
+        return (
+            self.count
+            + len(set(added) - indexed)
+            - len((set(removed) & indexed) - set(added))
+        )
+
+    def _rebuild(self) -> None:
+        """Rebuild the index from every document stored in ChromaDB and persist it."""
+        items = self.chroma.get_all_documents(include_documents=True)
+        texts = [it.get("document") or "" for it in items]
+        ids = [it.get("id") for it in items]
+        file_types = [(it.get("metadata") or {}).get("file_type") for it in items]
+        self._replace_corpus(texts, ids, file_types)
+        self._prune_token_cache(texts)
+
+    def _prune_token_cache(self, texts: Sequence[str]) -> None:
+        """Drop cached tokens of documents that are no longer in the corpus (after a full rebuild)."""
+        signature = self.encoder.tokenizer_signature
+        if signature is None:
+            return
+        try:
+            removed = self.token_cache.retain(cache_key(signature, text) for text in texts)
+            if removed:
+                logger.info(f"Pruned {removed} stale entries from the token cache")
+        except TokenCacheError as e:
+            logger.warning(f"Failed to prune token cache: {e}")
+
+    def _replace_corpus(
+        self, texts: Sequence[str], ids: Sequence[str], file_types: Sequence[Optional[str]]
+    ) -> None:
+        """Rebuild the encoder from the given corpus and save it (an empty corpus clears the index)."""
+        if texts:
+            self.encoder.build_index(texts, ids, file_types)
+        else:
+            self.encoder.clear()
+        self._save()
+
+    def _save(self) -> None:
+        if self.count == 0:
+            # Nothing to save: remove stale files so the next load rebuilds from ChromaDB
+            self._remove_files()
+        else:
+            self.encoder.save(self.directory)
+        self._stamp = self._file_stamp()
+
+    def invalidate(self) -> None:
+        """Discard the index so the next operation rebuilds it from ChromaDB.
+
+        Used when a write reached ChromaDB but the sparse update failed.
+        """
+        with self._locked():
+            self._remove_files()
+            self._loaded = False
+            self._stamp = None
+
+    def _remove_files(self) -> None:
+        if Path(self.directory).exists():
+            remove_index_files(self.directory)
+
+    def _ensure_current(self, added: Sequence[str] = (), removed: Sequence[str] = ()) -> None:
+        """Load on first use and reload when another process rewrote the index files.
+
+        Args:
+            added: IDs the caller is about to upsert (already in ChromaDB)
+            removed: IDs the caller is about to remove (already deleted from ChromaDB)
+        """
+        if self._loaded and self._file_stamp() == self._stamp:
+            return
+        with self._locked():
+            if not self._loaded:
+                self._load(added, removed)
+                return
+            stamp = self._file_stamp()
+            if stamp == self._stamp:
+                return
+            if stamp is None:
+                # Invalidated by another process
+                self._load(added, removed)
+            else:
+                logger.info("Sparse index changed on disk; reloading")
+                self.encoder.load(self.directory)
+                self._adopt_index_tokenizer()
+                self._stamp = stamp
+                if self._tokenizer_changed():
+                    logger.info("Sparse index was rebuilt with another tokenizer; rebuilding")
+                    self._rebuild()
+
+    def upsert(
+        self,
+        documents: Sequence[str],
+        doc_ids: Sequence[str],
+        file_types: Optional[Sequence[Optional[str]]] = None,
+    ) -> Dict[str, Any]:
+        """Insert or replace documents in the index and persist it.
+
+        Only the given documents are tokenized; the rest of the index is updated in place.
+
+        Args:
+            documents: Document texts
+            doc_ids: Document IDs (ChromaDB ids / filepaths)
+            file_types: ``file_type`` metadata saved with each document (None: none)
+
+        Returns:
+            Dictionary with status and total count
+
+        Raises:
+            SparseIndexError: If validation or the update fails
+        """
+        if len(documents) != len(doc_ids):
+            raise SparseIndexError(
+                f"Length mismatch: {len(documents)} documents vs {len(doc_ids)} IDs"
+            )
+        if file_types is not None and len(file_types) != len(doc_ids):
+            raise SparseIndexError(
+                f"Length mismatch: {len(file_types)} file types vs {len(doc_ids)} IDs"
+            )
+        with self._lock:
+            try:
+                if documents and self.encoder.token_cache is not None and self.encoder.tokenizer_signature:
+                    # Tokenize before taking the file lock: other processes can keep writing
+                    # meanwhile, and add_documents() below then reads the tokens from the cache
+                    self.encoder.tokenize_documents(documents)
+                with self._locked():
+                    self._ensure_current(added=doc_ids)
+                    if documents:
+                        self.encoder.add_documents(documents, doc_ids, file_types)
+                        self._save()
+                        self._schedule_merge()
+                    return {"status": "success", "count": self.count}
+            except SparseIndexError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to update sparse index: {e}")
+                raise SparseIndexError(f"Failed to update sparse index: {e}")
+
+    def remove(self, doc_ids: Sequence[str]) -> Dict[str, Any]:
+        """Remove documents from the index and persist it. Unknown IDs are ignored.
+
+        Args:
+            doc_ids: Document IDs to remove
+
+        Returns:
+            Dictionary with status, removed count and total count
+
+        Raises:
+            SparseIndexError: If the update fails
+        """
+        with self._locked():
+            try:
+                self._ensure_current(removed=doc_ids)
+                removed = self.encoder.remove_documents(doc_ids)["removed_count"]
+                if removed:
+                    self._save()
+                    self._schedule_merge()
+                return {"status": "success", "removed_count": removed, "count": self.count}
+            except SparseIndexError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to update sparse index: {e}")
+                raise SparseIndexError(f"Failed to update sparse index: {e}")
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        file_type: Optional[str] = None,
+        id_prefix: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Score the query against the index.
+
+        Filters restrict which documents are scored; BM25 statistics stay those
+        of the whole index.
+
+        Args:
+            query: Search query text
+            top_k: Number of results to return
+            file_type: Only documents with this ``file_type`` metadata
+            id_prefix: Only documents whose ID (filepath) starts with this prefix
+
+        Returns:
+            List of {id, score} sorted by score (descending); empty when the index is empty.
+            Texts are not kept; callers fetch them from ChromaDB.
+
+        Raises:
+            SparseIndexError: If loading or scoring fails
+        """
+        with self._lock:
+            try:
+                self._ensure_current()
+                if self.count == 0:
+                    return []
+                return self.encoder.search(query, top_k=top_k, file_type=file_type, id_prefix=id_prefix)
+            except SparseIndexError:
+                raise
+            except Exception as e:
+                logger.error(f"Sparse index search failed: {e}")
+                raise SparseIndexError(f"Sparse index search failed: {e}")
+
+    def merge(self) -> bool:
+        """Merge one run of segments chosen by ``InvertedBM25Index.plan_merge`` and persist it.
+
+        The merged segment is built and written without holding the index lock,
+        so searches and writes continue meanwhile; it is swapped in only if the
+        merged segments are still current (otherwise the work is discarded).
+
+        Returns:
+            True if segments were merged
+
+        Raises:
+            SparseIndexError: If the merge fails
+        """
+        with self._merge_lock:
+            try:
+                with self._lock:
+                    self._ensure_current()
+                    bm25 = self.encoder.bm25
+                    if not isinstance(bm25, InvertedBM25Index):
+                        return False
+                    plan = bm25.plan_merge(self.max_segments)
+                    if not plan:
+                        return False
+                    ids = self.encoder.corpus_ids
+
+                # Merged segments only cover flushed documents, whose IDs never change
+                merged = bm25.merge_segments(plan)
+                write_segment(self.directory, merged, ids)
+
+                with self._locked():
+                    self._ensure_current()
+                    if self.encoder.bm25 is not bm25 or not bm25.replace_segments(plan, merged):
+                        logger.debug("Sparse index changed during merge; discarding merged segment")
+                        return False
+                    self._save()
+                logger.info(f"Merged {len(plan)} sparse index segments ({merged.n_postings} postings)")
+                return True
+            except SparseIndexError:
+                raise
+            except Exception as e:
+                logger.error(f"Sparse index merge failed: {e}")
+                raise SparseIndexError(f"Sparse index merge failed: {e}")
+
+    def compact(self, force: bool = False) -> bool:
+        """Renumber live documents and drop terms without postings, then persist the index.
+
+        Unlike merge() this rewrites the whole index under the lock, so it only
+        runs when removed slots or dead terms exceed ``COMPACT_RATIO``.
+
+        Args:
+            force: Compact even below the threshold
+
+        Returns:
+            True if the index was compacted
+
+        Raises:
+            SparseIndexError: If the compaction fails
+        """
+        with self._merge_lock, self._locked():
+            try:
+                self._ensure_current()
+                if not (force or self._needs_compaction()) or not self.encoder.compact():
+                    return False
+                self._save()
+                logger.info(f"Compacted sparse index ({self.count} documents)")
+                return True
+            except SparseIndexError:
+                raise
+            except Exception as e:
+                logger.error(f"Sparse index compaction failed: {e}")
+                raise SparseIndexError(f"Sparse index compaction failed: {e}")
+
+    def _needs_merge(self) -> bool:
+        bm25 = self.encoder.bm25
+        return isinstance(bm25, InvertedBM25Index) and bool(bm25.plan_merge(self.max_segments))
+
+    def _needs_compaction(self) -> bool:
+        bm25 = self.encoder.bm25
+        if not isinstance(bm25, InvertedBM25Index):
+            return False
+        return (
+            bm25.n_deleted > COMPACT_RATIO * bm25.slot_count
+            or bm25.dead_term_count > COMPACT_RATIO * bm25.vocab_size
+        )
+
+    def _schedule_merge(self) -> None:
+        """Start the background merge thread when segments need merging or compaction (called under _lock)."""
+        if not self.background_merge or self._merge_thread is not None:
+            return
+        if not (self._needs_merge() or self._needs_compaction()):
+            return
+        self._merge_thread = threading.Thread(
+            target=self._merge_in_background, name="sparse-index-merge", daemon=True
+        )
+        self._merge_thread.start()
+
+    def _merge_in_background(self) -> None:
+        try:
+            while True:
+                if self.merge() or self.compact():
+                    continue
+                with self._lock:
+                    # Writes made while merge() was running may need another merge
+                    if not (self._needs_merge() or self._needs_compaction()):
+                        self._merge_thread = None
+                        return
+        except SparseIndexError as e:
+            logger.warning(f"Background sparse index merge failed: {e}")
+            with self._lock:
+                self._merge_thread = None
+
+    def wait_for_merge(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the background merge thread to finish.
+
+        Args:
+            timeout: Seconds to wait at most (None: no limit)
+
+        Returns:
+            True if no merge is running anymore
+        """
+        thread = self._merge_thread
+        if thread is None:
+            return True
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def close(self) -> None:
+        """Wait for a running merge and close the token cache (reopened on next use)."""
+        self.wait_for_merge()
+        self.token_cache.close()
+
+
+# Either persistent sparse index backend (same load / upsert / remove / search API)
+SparseBackend = Union[SparseIndex, "FTS5SparseIndex"]
+
+
+def create_sparse_index(chroma_manager: Any, backend: Optional[str] = None, **kwargs: Any) -> "SparseBackend":
+    """Create the persistent sparse index of the selected backend.
+
+    Args:
+        chroma_manager: ChromaDBManager whose collection is indexed
+        backend: "inverted" (in-memory posting lists, ``SparseIndex``) or
+            "fts5" (SQLite FTS5 table, ``FTS5SparseIndex``); default:
+            SEMCHE_SPARSE_BACKEND, else "inverted"
+        **kwargs: Passed to the backend (``tokenizer``: "mecab", "ngram" or a
+            function; ``tokenize_workers``; ``SparseIndex`` also takes
+            ``max_segments`` and ``background_merge``)
+
+    Returns:
+        The sparse index (not loaded yet)
+
+    Raises:
+        SparseIndexError: If the backend is unknown
+    """
+    backend = backend or os.getenv("SEMCHE_SPARSE_BACKEND") or "inverted"
+    if backend == "inverted":
+        return SparseIndex(chroma_manager, **kwargs)
+    if backend == "fts5":
+        from .fts_index import FTS5SparseIndex
+
+        return FTS5SparseIndex(chroma_manager, **kwargs)
+    raise SparseIndexError(f"Unknown sparse backend: {backend} (expected one of {SPARSE_BACKENDS})")
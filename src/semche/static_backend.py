@@ -0,0 +1,298 @@
+"""Static embedding backend for Embedder (model2vec-style token lookup table).
+
+The configured sentence-transformers model is distilled once into a table with
+one vector per vocabulary token: every token is run through the model on its
+own (with the tokenizer's special tokens around it, through the model's own
+pooling), the table is reduced with PCA to ``dims`` dimensions and each row is
+weighted by SIF (smooth inverse frequency, with the token's vocabulary rank as
+a Zipf estimate of its frequency). A text is then embedded by tokenizing it
+with the model's fast tokenizer and averaging the rows of its tokens - no
+neural network runs at query time.
+
+Static vectors live in a different vector space than the transformer's, so a
+collection must be built and searched with the same backend (see
+``Embedder.embedding_space`` and ``ChromaDBManager``). How well the static
+space preserves the model's similarities is measured on the probe texts of
+the ONNX parity check and recorded in the export's config.
+"""
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILENAME = "embeddings.npy"
+TOKENIZER_FILENAME = "tokenizer.json"
+CONFIG_FILENAME = "semche_static.json"
+# Bump when the distillation changes, so old tables are redone
+DISTILL_VERSION = 1
+
+# Output dimensions after PCA (capped by the model's dimension and vocabulary size)
+DEFAULT_DIMS = 256
+# SIF weight a / (a + p(token)); None disables the weighting
+DEFAULT_SIF_COEFFICIENT = 1e-4
+# Tokens run through the model per forward pass during distillation
+DISTILL_BATCH_SIZE = 1024
+
+
+class StaticBackendError(Exception):
+    """Static backend distillation / load errors"""
+
+    pass
+
+
+def default_static_dir(model_name: str) -> Path:
+    """Directory of a model's static table: SEMCHE_STATIC_DIR (default ~/.cache/semche/static) / model name."""
+    root = os.getenv("SEMCHE_STATIC_DIR") or Path.home() / ".cache" / "semche" / "static"
+    return Path(root) / re.sub(r"[^A-Za-z0-9._-]+", "_", model_name).strip("_")
+
+
+def _special_template(tokenizer: Any) -> Tuple[List[int], List[int]]:
+    """Special token ids the tokenizer puts before and after a single text, e.g. ([<s>], [</s>])."""
+    probe = "a"
+    plain = tokenizer(probe, add_special_tokens=False)["input_ids"]
+    wrapped = tokenizer(probe)["input_ids"]
+    for start in range(len(wrapped) - len(plain) + 1):
+        if wrapped[start:start + len(plain)] == plain:
+            return wrapped[:start], wrapped[start + len(plain):]
+    raise StaticBackendError("Could not find where the tokenizer puts its special tokens")
+
+
+def _token_vectors(st: Any, token_ids: Sequence[int], batch_size: int) -> np.ndarray:
+    """Sentence embeddings of each token alone, e.g. "<s> token </s>" (n, model dim)."""
+    import torch
+
+    prefix, suffix = _special_template(st.tokenizer)
+    parts = []
+    for start in range(0, len(token_ids), batch_size):
+        # Every sequence has the same length: one token plus the special tokens
+        ids = torch.tensor([prefix + [i] + suffix for i in token_ids[start:start + batch_size]])
+        features = {"input_ids": ids, "attention_mask": torch.ones_like(ids)}
+        if "token_type_ids" in st.tokenizer.model_input_names:
+            features["token_type_ids"] = torch.zeros_like(ids)
+        with torch.no_grad():
+            parts.append(st(features)["sentence_embedding"].float().cpu().numpy())
+    return np.concatenate(parts)
+
+
+def _pca(matrix: np.ndarray, dims: int) -> np.ndarray:
+    """Project rows onto their first `dims` principal components."""
+    centered = matrix - matrix.mean(axis=0)
+    _, _, vt = np.linalg.svd(centered, full_matrices=False)
+    return centered @ vt[:dims].T
+
+
+def similarity_correlation(reference: np.ndarray, candidate: np.ndarray) -> float:
+    """Pearson correlation of the pairwise cosine similarities of two embeddings of the same texts."""
+    def pairwise(matrix: np.ndarray) -> np.ndarray:
+        matrix = np.asarray(matrix, dtype=np.float64)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        unit = matrix / np.where(norms == 0, 1.0, norms)
+        return (unit @ unit.T)[np.triu_indices(len(matrix), k=1)]
+
+    return float(np.corrcoef(pairwise(reference), pairwise(candidate))[0, 1])
+
+
+def distill_static(
+    model_name: str,
+    output_dir: Union[str, Path],
+    dims: int = DEFAULT_DIMS,
+    sif_coefficient: Optional[float] = DEFAULT_SIF_COEFFICIENT,
+    reference: Optional[Any] = None,
+    batch_size: int = DISTILL_BATCH_SIZE,
+) -> Path:
+    """Distill a sentence-transformers model into a static token table.
+
+    Writes ``embeddings.npy`` (float32, vocabulary size x dims; special tokens
+    are zero rows), the fast tokenizer and ``semche_static.json`` (source
+    model, dims, special token ids, similarity correlation) to output_dir.
+
+    Args:
+        model_name: Model name or path, as given to Embedder
+        output_dir: Output directory (see default_static_dir)
+        dims: Dimensions after PCA (capped by the model dimension and vocabulary size)
+        sif_coefficient: SIF weighting coefficient (None: no weighting)
+        reference: Already loaded SentenceTransformer of model_name (loaded if None)
+        batch_size: Tokens per forward pass
+
+    Returns:
+        output_dir
+
+    Raises:
+        StaticBackendError: If a dependency is missing, the model has no fast
+            tokenizer, or the distillation fails
+    """
+    if reference is None:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise StaticBackendError("sentence-transformers is required to distill the static model")
+        try:
+            reference = SentenceTransformer(model_name, device="cpu")
+        except Exception as e:
+            raise StaticBackendError(f"Failed to load {model_name}: {e}")
+    st = reference
+    tokenizer = st.tokenizer
+    if not getattr(tokenizer, "is_fast", False):
+        raise StaticBackendError(f"{model_name} has no fast tokenizer (tokenizer.json) to embed texts with")
+
+    out = Path(output_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    vocab_size = len(tokenizer)
+    special_ids = sorted(i for i in set(tokenizer.all_special_ids) if 0 <= i < vocab_size)
+    special = set(special_ids)
+    token_ids = [i for i in range(vocab_size) if i not in special]
+    logger.info(f"Distilling {model_name} into a static table of {len(token_ids)} tokens: {out}")
+    try:
+        vectors = _token_vectors(st, token_ids, batch_size)
+    except Exception as e:
+        raise StaticBackendError(f"Failed to embed the vocabulary of {model_name}: {e}")
+
+    dims = min(dims, vectors.shape[1], len(token_ids))
+    vectors = _pca(vectors.astype(np.float64), dims)
+    if sif_coefficient is not None:
+        # Vocabulary rank as a Zipf estimate of token frequency (sentencepiece vocabularies are frequency-ordered)
+        ranks = np.arange(1, len(token_ids) + 1, dtype=np.float64)
+        probabilities = (1.0 / ranks) / np.sum(1.0 / ranks)
+        vectors *= (sif_coefficient / (sif_coefficient + probabilities))[:, None]
+    table = np.zeros((vocab_size, dims), dtype=np.float32)
+    table[token_ids] = vectors
+
+    np.save(out / EMBEDDINGS_FILENAME, table)
+    tokenizer.backend_tokenizer.save(str(out / TOKENIZER_FILENAME))
+    config: Dict[str, Any] = {
+        "version": DISTILL_VERSION,
+        "model_name": model_name,
+        "dims": dims,
+        "vocab_size": vocab_size,
+        "special_ids": special_ids,
+        "sif_coefficient": sif_coefficient,
+    }
+    # How well the static space keeps the model's similarities (informational, no threshold)
+    from .onnx_backend import PARITY_TEXTS
+
+    expected = st.encode(PARITY_TEXTS, convert_to_numpy=True, show_progress_bar=False)
+    actual = StaticSentenceEncoder(out, config=config).encode(PARITY_TEXTS)
+    config["similarity_correlation"] = similarity_correlation(expected, actual)
+    (out / CONFIG_FILENAME).write_text(json.dumps(config, ensure_ascii=False, indent=2), encoding="utf-8")
+    logger.info(
+        f"Static table: {vocab_size} x {dims}; pairwise similarity correlation with the model "
+        f"{config['similarity_correlation']:.3f}"
+    )
+    return out
+
+
+def _read_config(out: Path) -> Optional[Dict[str, Any]]:
+    try:
+        config = json.loads((out / CONFIG_FILENAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return config if config.get("version") == DISTILL_VERSION else None
+
+
+class StaticSentenceEncoder:
+    """Static counterpart of ``SentenceTransformer.encode``: token lookup and mean pooling.
+
+    The table is memory-mapped, so only the rows of tokens that occur are read.
+
+    Attributes:
+        dims: Embedding dimensions
+        table: (vocabulary size, dims) float32 token table
+    """
+
+    def __init__(self, model_dir: Union[str, Path], config: Optional[Dict[str, Any]] = None) -> None:
+        try:
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise StaticBackendError("The tokenizers package is required for the static backend")
+
+        model_dir = Path(model_dir)
+        config = config or _read_config(model_dir)
+        if config is None:
+            raise StaticBackendError(f"No static table in {model_dir}")
+        try:
+            self.table = np.load(model_dir / EMBEDDINGS_FILENAME, mmap_mode="r")
+            self._tokenizer = Tokenizer.from_file(str(model_dir / TOKENIZER_FILENAME))
+        except Exception as e:
+            raise StaticBackendError(f"Failed to load the static table in {model_dir}: {e}")
+        # Static embeddings have no sequence limit: embed the whole text
+        self._tokenizer.no_truncation()
+        self._tokenizer.no_padding()
+        self.dims = int(self.table.shape[1])
+        self._pooled = np.ones(len(self.table), dtype=bool)
+        self._pooled[config["special_ids"]] = False  # e.g. <unk> does not dilute the mean
+
+    def _pool(self, ids: List[int]) -> np.ndarray:
+        token_ids = np.asarray(ids, dtype=np.int64)
+        token_ids = token_ids[self._pooled[token_ids]]
+        if token_ids.size == 0:
+            return np.zeros(self.dims, dtype=np.float32)
+        return self.table[token_ids].mean(axis=0)
+
+    def encode(
+        self,
+        sentences: Union[str, Sequence[str]],
+        batch_size: int = 32,
+        normalize_embeddings: bool = False,
+        **kwargs: Any,
+    ) -> np.ndarray:
+        """Embed sentences; returns a float32 (n, dims) matrix (a vector for a single str).
+
+        batch_size and the other SentenceTransformer.encode keyword arguments
+        (show_progress_bar, convert_to_numpy, ...) are accepted and ignored.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if len(texts) == 1:
+            encodings = [self._tokenizer.encode(texts[0], add_special_tokens=False)]
+        else:
+            encodings = self._tokenizer.encode_batch(texts, add_special_tokens=False)
+        matrix = np.zeros((len(texts), self.dims), dtype=np.float32)
+        for row, encoding in enumerate(encodings):
+            matrix[row] = self._pool(encoding.ids)
+        if normalize_embeddings:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1.0, norms)
+        return matrix[0] if single else matrix
+
+
+class StaticEmbeddings(Embeddings):
+    """LangChain Embeddings backed by StaticSentenceEncoder (drop-in for HuggingFaceEmbeddings).
+
+    Like HuggingFaceEmbeddings, newlines are replaced by spaces and the encoder
+    is exposed as ``_client`` so Embedder calls it directly.
+    """
+
+    def __init__(self, encoder: StaticSentenceEncoder) -> None:
+        self._client = encoder
+        self.encode_kwargs: Dict[str, Any] = {}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._client.encode([t.replace("\n", " ") for t in texts]).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def load_static_embeddings(model_name: str, output_dir: Optional[Union[str, Path]] = None) -> StaticEmbeddings:
+    """Load the static embeddings of a model, distilling it on first use.
+
+    Args:
+        model_name: Model name or path
+        output_dir: Table directory (default: default_static_dir(model_name))
+
+    Raises:
+        StaticBackendError: Distillation or load failure
+    """
+    out = Path(output_dir) if output_dir is not None else default_static_dir(model_name)
+    config = _read_config(out)
+    if config is None or config.get("model_name") != model_name or not (out / EMBEDDINGS_FILENAME).exists():
+        distill_static(model_name, out)
+        config = None
+    return StaticEmbeddings(StaticSentenceEncoder(out, config=config))
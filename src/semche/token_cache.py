@@ -0,0 +1,159 @@
+"""Persistent tokenization cache for BM25 index builds.
+
+MeCab tokenization dominates BM25 index build time, and every build used to
+tokenize every document again. ``TokenCache`` stores token lists in a SQLite
+sidecar file, keyed by a SHA-256 hash of the tokenizer signature and the
+document text, so only new or changed documents are tokenized.
+
+The signature identifies the tokenizer configuration (e.g. MeCab version and
+dictionary); a different signature never reuses cached tokens.
+"""
+import hashlib
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+TOKEN_CACHE_FILENAME = "token_cache.sqlite3"
+
+# Tokens are stored joined by the ASCII unit separator, which tokenizers do not emit
+_SEPARATOR = "\x1f"
+# Stay well below SQLite's default limit on bound parameters per statement
+_BATCH_SIZE = 500
+
+
+class TokenCacheError(Exception):
+    """Token cache operation errors"""
+
+    pass
+
+
+def cache_key(signature: str, text: str) -> str:
+    """Return the cache key for a text tokenized with the given tokenizer signature."""
+    h = hashlib.sha256()
+    h.update(signature.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(text.encode("utf-8"))
+    return h.hexdigest()
+
+
+class TokenCache:
+    """SQLite-backed cache of token lists keyed by content hash.
+
+    The connection is opened lazily and shared between threads under a lock;
+    SQLite's own locking (WAL mode) handles other processes using the same file.
+
+    Attributes:
+        path: SQLite database file path
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """Initialize the cache (the database is created on first use).
+
+        Args:
+            path: SQLite database file path
+        """
+        self.path = str(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, tokens TEXT NOT NULL)")
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[str]]:
+        """Look up cached token lists.
+
+        Args:
+            keys: Cache keys (see cache_key)
+
+        Returns:
+            Dictionary of key -> tokens for the keys found in the cache
+
+        Raises:
+            TokenCacheError: If the database cannot be read
+        """
+        found: Dict[str, List[str]] = {}
+        unique = list(dict.fromkeys(keys))
+        try:
+            with self._lock:
+                conn = self._connect()
+                for i in range(0, len(unique), _BATCH_SIZE):
+                    batch = unique[i:i + _BATCH_SIZE]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = conn.execute(
+                        f"SELECT key, tokens FROM tokens WHERE key IN ({placeholders})", batch
+                    ).fetchall()
+                    for key, joined in rows:
+                        found[key] = joined.split(_SEPARATOR) if joined else []
+            return found
+        except sqlite3.Error as e:
+            raise TokenCacheError(f"Failed to read token cache: {e}")
+
+    def put_many(self, items: Iterable[Tuple[str, Sequence[str]]]) -> None:
+        """Store token lists.
+
+        Args:
+            items: (key, tokens) pairs
+
+        Raises:
+            TokenCacheError: If the database cannot be written
+        """
+        rows = [(key, _SEPARATOR.join(tokens)) for key, tokens in items]
+        if not rows:
+            return
+        try:
+            with self._lock:
+                conn = self._connect()
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO tokens (key, tokens) VALUES (?, ?)", rows)
+        except sqlite3.Error as e:
+            raise TokenCacheError(f"Failed to write token cache: {e}")
+
+    def retain(self, keys: Iterable[str]) -> int:
+        """Delete every entry whose key is not in ``keys`` (entries of changed or deleted documents).
+
+        Args:
+            keys: Keys to keep
+
+        Returns:
+            Number of deleted entries
+
+        Raises:
+            TokenCacheError: If the database cannot be written
+        """
+        try:
+            with self._lock:
+                conn = self._connect()
+                with conn:
+                    conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (key TEXT PRIMARY KEY)")
+                    conn.execute("DELETE FROM keep")
+                    conn.executemany("INSERT OR IGNORE INTO keep (key) VALUES (?)", ((k,) for k in keys))
+                    cur = conn.execute("DELETE FROM tokens WHERE key NOT IN (SELECT key FROM keep)")
+                    conn.execute("DELETE FROM keep")
+                    return cur.rowcount
+        except sqlite3.Error as e:
+            raise TokenCacheError(f"Failed to prune token cache: {e}")
+
+    def count(self) -> int:
+        """Number of cached entries."""
+        try:
+            with self._lock:
+                return int(self._connect().execute("SELECT COUNT(*) FROM tokens").fetchone()[0])
+        except sqlite3.Error as e:
+            raise TokenCacheError(f"Failed to read token cache: {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
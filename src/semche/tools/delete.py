@@ -1,27 +1,23 @@
-from typing import Optional
+import logging
 
-from ..chromadb_manager import ChromaDBError, ChromaDBManager
-from ..embedding import Embedder
+from ..chromadb_manager import ChromaDBError
+from ..services import get_services
+from ..sparse_index import SparseIndexError
 
-# Module-level singletons (lazy init)
-_embedder: Optional[Embedder] = None
-_chromadb_manager: Optional[ChromaDBManager] = None
 
-
-def _get_embedder() -> Embedder:
-    global _embedder
-    if _embedder is None:
-        _embedder = Embedder()
-    return _embedder
-
-
-def _get_chromadb_manager() -> ChromaDBManager:
-    global _chromadb_manager
-    if _chromadb_manager is None:
-        embedder = _get_embedder()
-        # EmbedderのHuggingFaceEmbeddingsインスタンスをembedding_functionとして渡す
-        _chromadb_manager = ChromaDBManager(embedding_function=embedder.embeddings)
-    return _chromadb_manager
+def _remove_from_sparse_index(filepaths: list[str]) -> None:
+    """BM25インデックスから削除を反映する。失敗時は次回利用時の再構築に委ねる。"""
+    services = get_services()
+    try:
+        sparse = services.sparse_index()
+    except SparseIndexError as e:
+        logging.warning(f"BM25インデックスの読み込みに失敗しました: {e}")
+        return
+    try:
+        sparse.remove(filepaths)
+    except SparseIndexError as e:
+        logging.warning(f"BM25インデックスの更新に失敗したため次回利用時に再構築します: {e}")
+        services.invalidate_sparse_index()
 
 
 def delete_document(filepath: str) -> dict:
@@ -39,9 +35,11 @@ def delete_document(filepath: str) -> dict:
                 "error_type": "ValidationError",
             }
 
-        chroma = _get_chromadb_manager()
+        chroma = get_services().chromadb_manager()
         res = chroma.delete([filepath])
         deleted_count = int(res.get("deleted_count", 0))
+        if deleted_count > 0:
+            _remove_from_sparse_index([filepath])
 
         if deleted_count == 0:
             return {
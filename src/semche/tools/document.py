@@ -1,28 +1,22 @@
+import logging
 from datetime import datetime
-from typing import Optional
 
-from ..chromadb_manager import ChromaDBError, ChromaDBManager
-from ..embedding import Embedder, EmbeddingError, ensure_single_vector
+from ..chromadb_manager import ChromaDBError
+from ..embedding import EmbeddingError
+from ..services import get_services
+from ..sparse_index import SparseIndexError
 
-# Module-level singletons (lazy init)
-_embedder: Optional[Embedder] = None
-_chromadb_manager: Optional[ChromaDBManager] = None
 
-
-def _get_embedder() -> Embedder:
-    global _embedder
-    if _embedder is None:
-        _embedder = Embedder()
-    return _embedder
-
-
-def _get_chromadb_manager() -> ChromaDBManager:
-    global _chromadb_manager
-    if _chromadb_manager is None:
-        embedder = _get_embedder()
-        # EmbedderのHuggingFaceEmbeddingsインスタンスをembedding_functionとして渡す
-        _chromadb_manager = ChromaDBManager(embedding_function=embedder.embeddings)
-    return _chromadb_manager
+def _update_sparse_index(
+    documents: list[str], filepaths: list[str], file_types: list[str | None] | None = None
+) -> None:
+    """BM25インデックスへ書き込みを反映する。失敗時は次回利用時の再構築に委ねる。"""
+    services = get_services()
+    try:
+        services.sparse_index().upsert(documents, filepaths, file_types)
+    except SparseIndexError as e:
+        logging.warning(f"BM25インデックスの更新に失敗したため次回利用時に再構築します: {e}")
+        services.invalidate_sparse_index()
 
 
 def put_document(
@@ -51,21 +45,24 @@ def put_document(
                 "error_type": "ValidationError",
             }
 
-        # ベクトル化
-        embedder = _get_embedder()
-        embedding = embedder.addDocument(text, normalize=normalize)
-        embedding_vec = ensure_single_vector(embedding)
+        # 埋め込みキャッシュを付けるため、ベクトル化の前にマネージャーを用意する
+        services = get_services()
+        chromadb_manager = services.chromadb_manager()
+
+        # ベクトル化（float32 の 1 行行列のまま保存する）
+        embedder = services.embedder()
+        embeddings = embedder.embed_batch([text], batch_size=1, normalize=normalize)
 
         # ChromaDBに保存
-        chromadb_manager = _get_chromadb_manager()
         now = datetime.now().isoformat()
         result = chromadb_manager.save(
-            embeddings=[embedding_vec],
+            embeddings=embeddings,
             documents=[text],
             filepaths=[filepath],
             updated_at=[now],
             file_types=[file_type] if file_type else None,
         )
+        _update_sparse_index([text], [filepath], [file_type or None])
 
         return {
             "status": "success",
@@ -74,7 +71,7 @@ def put_document(
                 "count": result["count"],
                 "collection": result["collection"],
                 "filepath": filepath,
-                "vector_dimension": len(embedding_vec),
+                "vector_dimension": int(embeddings.shape[1]),
                 "persist_directory": result["persist_directory"],
                 "normalized": normalize,
             },
@@ -1,13 +1,7 @@
 from typing import Any, Dict, List, Optional
 
-from ..chromadb_manager import ChromaDBError, ChromaDBManager
-from .document import _get_chromadb_manager  # reuse the same singleton
-
-# Module-level singletons (lazy init)
-_chromadb_manager: Optional[ChromaDBManager] = None
-
-
-# _get_chromadb_manager is imported from document.py to share the same instance
+from ..chromadb_manager import ChromaDBError
+from ..services import get_services
 
 
 def get_documents_by_prefix(
@@ -53,7 +47,7 @@ def get_documents_by_prefix(
             }
 
         # ChromaDBManagerインスタンス取得
-        mgr = _get_chromadb_manager()
+        mgr = get_services().chromadb_manager()
 
         # 検索実行
         results = mgr.get_documents_by_prefix(
@@ -1,14 +1,10 @@
+import logging
 from typing import Any, Dict, List, Optional
 
-from ..chromadb_manager import ChromaDBError, ChromaDBManager
+from ..chromadb_manager import ChromaDBError
 from ..hybrid_retriever import HybridRetriever, HybridRetrieverError
-from .document import _get_chromadb_manager  # reuse the same singleton
-
-# Module-level singletons (lazy init)
-_chromadb_manager: Optional[ChromaDBManager] = None
-
-
-# _get_chromadb_manager is imported from document.py to share the same instance
+from ..services import get_services
+from ..sparse_index import SparseBackend, SparseIndexError
 
 
 def search(
@@ -48,10 +44,24 @@ def search(
         if file_type:
             where["file_type"] = file_type
 
-        chroma = _get_chromadb_manager()
+        services = get_services()
+        chroma = services.chromadb_manager()
+
+        # 永続BM25インデックス（読み込めない場合はクエリ毎の構築にフォールバック）
+        sparse_index: Optional[SparseBackend] = None
+        try:
+            sparse_index = services.sparse_index()
+        except SparseIndexError as e:
+            logging.warning(f"BM25インデックスを利用できません（クエリ毎に構築します）: {e}")
 
         # ハイブリッド検索実行
-        retriever = HybridRetriever(chroma_manager=chroma, dense_weight=0.5, sparse_weight=0.5)
+        retriever = HybridRetriever(
+            chroma_manager=chroma,
+            dense_weight=0.5,
+            sparse_weight=0.5,
+            sparse_index=sparse_index,
+            embedder=services.embedder(),  # クエリベクトルをプロセス内でキャッシュ
+        )
         items = retriever.search(query=query, top_k=top_k, where=where or None)
 
     # 結果の整形
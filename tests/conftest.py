@@ -2,6 +2,8 @@ import uuid
 
 import pytest
 
+from semche.embedding import Embedder
+
 
 @pytest.fixture(autouse=True)
 def _isolate_chroma_dir(tmp_path, monkeypatch):
@@ -15,3 +17,78 @@ def _isolate_chroma_dir(tmp_path, monkeypatch):
     monkeypatch.setenv("SEMCHE_CHROMA_DIR", str(unique_dir))
     yield
     # No explicit cleanup required; tmp_path is ephemeral per test
+
+
+class FakeEmbeddings:
+    """Deterministic bag-of-vowels embeddings, so tests need no model download."""
+
+    def _vector(self, text):
+        return [float(text.lower().count(c)) + 0.01 for c in "aeiou"]
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+class FakeEmbedder(Embedder):
+    """semche.embedding.Embedder backed by FakeEmbeddings, so no model is loaded."""
+
+    def __init__(self):
+        super().__init__(embeddings=FakeEmbeddings())
+
+
+@pytest.fixture
+def fake_embeddings():
+    return FakeEmbeddings()
+
+
+@pytest.fixture(scope="session")
+def tiny_model(tmp_path_factory):
+    """A randomly initialized 2-layer BERT sentence-transformers model saved locally (no download)."""
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+    from tokenizers import Tokenizer, normalizers, pre_tokenizers, processors
+    from tokenizers.models import WordPiece
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    root = tmp_path_factory.mktemp("tiny_model")
+    letters = "abcdefghijklmnopqrstuvwxyz0123456789"
+    words = ["the", "cat", "python", "programming", "language", "long", "text", "much"]
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *letters, ".", "猫", "好", "き", *words]
+    vocab += [f"##{c}" for c in letters]
+    # Built with the tokenizers library: BertTokenizerFast(vocab_file=...) ignores the file on some versions
+    backend = Tokenizer(WordPiece({token: i for i, token in enumerate(vocab)}, unk_token="[UNK]"))
+    backend.normalizer = normalizers.BertNormalizer(lowercase=True)
+    backend.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    backend.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]", pair="[CLS] $A [SEP] $B [SEP]", special_tokens=[("[CLS]", 2), ("[SEP]", 3)]
+    )
+    BertTokenizerFast(tokenizer_object=backend).save_pretrained(str(root / "hf"))
+    torch.manual_seed(0)
+    config = BertConfig(
+        vocab_size=len(vocab),
+        hidden_size=32,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        intermediate_size=64,
+        max_position_embeddings=128,
+    )
+    BertModel(config).save_pretrained(str(root / "hf"))
+    word = models.Transformer(str(root / "hf"), max_seq_length=64)
+    pooling = models.Pooling(word.get_word_embedding_dimension(), pooling_mode="mean")
+    SentenceTransformer(modules=[word, pooling], device="cpu").save(str(root / "st"))
+    return str(root / "st")
+
+
+@pytest.fixture
+def tool_services(tmp_path, monkeypatch):
+    """Point the MCP tools' service registry at a fresh ChromaDB using fake embeddings; returns the manager."""
+    from semche import services
+    from semche.chromadb_manager import ChromaDBManager
+
+    embedder = FakeEmbedder()
+    mgr = ChromaDBManager(persist_directory=str(tmp_path / "tools_chroma"), embedding_function=embedder.embeddings)
+    monkeypatch.setattr(services, "_services", services.ServiceRegistry(embedder=embedder, chromadb_manager=mgr))
+    return mgr
@@ -174,3 +174,73 @@ def test_get_documents_by_prefix(tmp_path, embedder):
         prefix="/src/", file_type="nonexistent"
     )
     assert len(results_no_type) == 0
+
+
+def test_save_and_query_float32_arrays(tmp_path, fake_embeddings):
+    import numpy as np
+
+    mgr = ChromaDBManager(
+        persist_directory=str(tmp_path),
+        collection_name="docs_array",
+        embedding_function=fake_embeddings,
+    )
+    # float64 の行列も list の行列も float32 の 2 次元配列に変換して保存される
+    mgr.save(
+        embeddings=np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]),
+        documents=["x", "y"],
+        filepaths=["/x", "/y"],
+    )
+    mgr.save(embeddings=[[0.0, 0.0, 1.0]], documents=["z"], filepaths=["/z"])
+    got = mgr.collection.get(ids=["/x", "/z"], include=["embeddings"])
+    assert np.asarray(got["embeddings"]).tolist() == [[1.0, 0.0, 0.0], [0.0, 0.0, 1.0]]
+
+    query = np.array([[0.0, 0.9, 0.1]], dtype=np.float32)
+    res = mgr.query(query_embeddings=query, top_k=1)
+    assert [r["filepath"] for r in res["results"]] == ["/y"]
+    assert mgr.query(query_embeddings=query[0].reshape(1, -1).tolist(), top_k=1)["results"] == res["results"]
+
+    with pytest.raises(ChromaDBError):
+        mgr.save(embeddings=np.zeros((1, 2, 3)), documents=["a"], filepaths=["/a"])
+    with pytest.raises(ChromaDBError):
+        mgr.save(embeddings=[[0.0, 1.0], [0.0]], documents=["a", "b"], filepaths=["/a", "/b"])
+
+
+def test_embedding_space_is_recorded_and_enforced(tmp_path, fake_embeddings):
+    import numpy as np
+
+    def manager(space, backend=None):
+        return ChromaDBManager(
+            persist_directory=str(tmp_path),
+            collection_name="docs_space",
+            embedding_function=fake_embeddings,
+            embedding_space=space,
+            embedding_backend=backend,
+        )
+
+    vectors = np.eye(3, dtype=np.float32)
+    # A collection written before spaces were recorded holds the model's (transformer) vectors
+    manager(None).save(embeddings=vectors[:1], documents=["a"], filepaths=["/a"])
+    static = manager("model#static", "static")
+    with pytest.raises(ChromaDBError):
+        static.save(embeddings=vectors[1:2], documents=["b"], filepaths=["/b"])
+    with pytest.raises(ChromaDBError):
+        static.query(query_embeddings=vectors[:1], top_k=1)
+    assert static.recorded_embedding() == {"space": None, "backend": None}
+
+    torch = manager("model", "onnx-int8")
+    torch.save(embeddings=vectors[1:2], documents=["b"], filepaths=["/b"])
+    assert torch.recorded_embedding() == {"space": "model", "backend": "onnx-int8"}
+    assert torch.query(query_embeddings=vectors[:1], top_k=1)["results"][0]["filepath"] == "/a"
+    assert manager("other-model").recorded_embedding()["space"] == "model"
+    with pytest.raises(ChromaDBError):
+        manager("other-model").save(embeddings=vectors[2:], documents=["c"], filepaths=["/c"])
+    # Recording the space keeps the collection's distance function (cosine: 1.0, squared L2 would be 2.0)
+    scores = [r["score"] for r in torch.query(query_embeddings=vectors[:1], top_k=2)["results"]]
+    assert scores == pytest.approx([0.0, 1.0])
+
+    # An empty collection takes the space of its first write
+    empty = ChromaDBManager(
+        persist_directory=str(tmp_path), collection_name="docs_static", embedding_space="model#static"
+    )
+    empty.save(embeddings=vectors[:1], documents=["a"], filepaths=["/a"])
+    assert empty.recorded_embedding()["space"] == "model#static"
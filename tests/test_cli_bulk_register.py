@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
+import numpy as np
 import pytest
 
 from semche.cli.bulk_register import (
@@ -15,6 +16,7 @@ from semche.cli.bulk_register import (
     read_file_content,
     resolve_inputs,
     should_ignore,
+    update_sparse_index,
 )
 
 
@@ -207,6 +209,15 @@ class TestResolveInputs:
         assert len(result) == 0
 
 
+def _mock_embedder():
+    """Embedder mock whose embed_batch returns one 768-dim float32 row per text."""
+    mock_embedder = MagicMock()
+    mock_embedder.embed_batch.side_effect = lambda texts, batch_size=32: np.full(
+        (len(texts), 768), 0.1, dtype=np.float32
+    )
+    return mock_embedder
+
+
 class TestProcessFiles:
     """Tests for process_files function."""
 
@@ -216,8 +227,7 @@ class TestProcessFiles:
         file1.write_text("Test content for embedding")
         
         # Mock embedder
-        mock_embedder = MagicMock()
-        mock_embedder.addDocument.return_value = [0.1] * 768
+        mock_embedder = _mock_embedder()
         
         embeddings, documents, ids, updated_at_list, file_types = process_files(
             [file1],
@@ -242,8 +252,7 @@ class TestProcessFiles:
         file1.write_text("Test content for embedding")
         
         # Mock embedder
-        mock_embedder = MagicMock()
-        mock_embedder.addDocument.return_value = [0.1] * 768
+        mock_embedder = _mock_embedder()
         
         embeddings, documents, ids, updated_at_list, file_types = process_files(
             [file1],
@@ -262,8 +271,7 @@ class TestProcessFiles:
         file1 = tmp_path / "file1.txt"
         file1.write_text("Test content")
         
-        mock_embedder = MagicMock()
-        mock_embedder.addDocument.return_value = [0.1] * 768
+        mock_embedder = _mock_embedder()
         
         embeddings, documents, ids, updated_at_list, file_types = process_files(
             [file1],
@@ -281,8 +289,7 @@ class TestProcessFiles:
         file1 = tmp_path / "file1.txt"
         file1.write_text("Test content")
         
-        mock_embedder = MagicMock()
-        mock_embedder.addDocument.return_value = [0.1] * 768
+        mock_embedder = _mock_embedder()
         
         embeddings, documents, ids, updated_at_list, file_types = process_files(
             [file1],
@@ -302,8 +309,7 @@ class TestProcessFiles:
         text_file.write_text("Text content")
         binary_file.write_bytes(b"\x00\x01\x02")
         
-        mock_embedder = MagicMock()
-        mock_embedder.addDocument.return_value = [0.1] * 768
+        mock_embedder = _mock_embedder()
         
         embeddings, documents, ids, updated_at_list, file_types = process_files(
             [text_file, binary_file],
@@ -316,6 +322,68 @@ class TestProcessFiles:
         # Only text file should be processed
         assert len(embeddings) == 1
 
+    def test_embeds_in_batches(self, tmp_path, monkeypatch):
+        """Files are embedded in chunks of batches and rows stay aligned with the IDs."""
+        monkeypatch.setattr("semche.cli.bulk_register.EMBED_CHUNK_BATCHES", 2)
+        files = []
+        for i in range(5):
+            path = tmp_path / f"file{i}.txt"
+            path.write_text(f"Content {i}")
+            files.append(path)
+
+        mock_embedder = _mock_embedder()
+        embeddings, documents, ids, _, file_types = process_files(
+            files, tmp_path, "", "test", mock_embedder, use_relative_path=True, batch_size=2
+        )
+
+        calls = mock_embedder.embed_batch.call_args_list
+        assert [len(call.args[0]) for call in calls] == [4, 1]
+        assert all(call.kwargs["batch_size"] == 2 for call in calls)
+        assert embeddings.shape == (5, 768) and embeddings.dtype == np.float32
+        assert ids == [f"file{i}.txt" for i in range(5)]
+        assert documents == [f"Content {i}" for i in range(5)]
+        assert file_types == ["test"] * 5
+
+    def test_chunks_scale_with_embed_workers(self, tmp_path, monkeypatch):
+        """With a worker pool, every chunk holds enough batches for all workers."""
+        monkeypatch.setattr("semche.cli.bulk_register.EMBED_CHUNK_BATCHES", 2)
+        files = []
+        for i in range(20):
+            path = tmp_path / f"file{i}.txt"
+            path.write_text(f"Content {i}")
+            files.append(path)
+
+        mock_embedder = _mock_embedder()
+        process_files(files, tmp_path, "", "test", mock_embedder, use_relative_path=True, batch_size=2, embed_workers=3)
+
+        calls = mock_embedder.embed_batch.call_args_list
+        assert [len(call.args[0]) for call in calls] == [12, 8]
+
+    def test_failed_batch_skips_only_failing_files(self, tmp_path):
+        """A failing batch is retried one file at a time."""
+        from semche.embedding import EmbeddingError
+
+        files = []
+        for name in ("good1", "bad", "good2"):
+            path = tmp_path / f"{name}.txt"
+            path.write_text(name)
+            files.append(path)
+
+        def embed_batch(texts, batch_size=32):
+            if "bad" in texts:
+                raise EmbeddingError("boom")
+            return np.full((len(texts), 4), len(texts[0]), dtype=np.float32)
+
+        mock_embedder = MagicMock()
+        mock_embedder.embed_batch.side_effect = embed_batch
+        embeddings, documents, ids, _, _ = process_files(
+            files, tmp_path, "", "test", mock_embedder, use_relative_path=True, batch_size=3
+        )
+
+        assert ids == ["good1.txt", "good2.txt"]
+        assert documents == ["good1", "good2"]
+        assert embeddings[:, 0].tolist() == [5.0, 5.0]
+
 
 class TestCLIIntegration:
     """Integration tests for CLI."""
@@ -329,8 +397,7 @@ class TestCLIIntegration:
         file1.write_text("Content 1")
         
         # Mock embedder
-        mock_embedder = MagicMock()
-        mock_embedder.addDocument.return_value = [0.1] * 768
+        mock_embedder = _mock_embedder()
         mock_embedder_cls.return_value = mock_embedder
         
         # Mock ChromaDB manager
@@ -366,6 +433,115 @@ class TestCLIIntegration:
         
         assert result == 1  # Should fail
 
+    @patch("semche.cli.bulk_register.Embedder")
+    @patch("semche.cli.bulk_register.ChromaDBManager")
+    def test_main_embed_backend(self, mock_chroma_cls, mock_embedder_cls, tmp_path):
+        """--embed-backend selects the Embedder backend."""
+        file1 = tmp_path / "test1.txt"
+        file1.write_text("Content 1")
+        mock_embedder_cls.return_value = _mock_embedder()
+        mock_chroma = MagicMock()
+        mock_chroma.persist_directory = str(tmp_path / "chroma")
+        mock_chroma.save.return_value = {"count": 1, "collection": "documents", "persist_directory": "x"}
+        mock_chroma_cls.return_value = mock_chroma
+
+        from semche.cli.bulk_register import main
+
+        with patch("sys.argv", ["doc-update", str(file1), "--embed-backend", "onnx-int8"]):
+            assert main() == 0
+        mock_embedder_cls.assert_called_once_with(backend="onnx-int8")
+
+    @patch("semche.cli.bulk_register.Embedder")
+    @patch("semche.cli.bulk_register.ChromaDBManager")
+    def test_main_embed_workers(self, mock_chroma_cls, mock_embedder_cls, tmp_path):
+        """--embed-workers starts the embedder's worker pool and closes it afterwards."""
+        file1 = tmp_path / "test1.txt"
+        file1.write_text("Content 1")
+        mock_embedder = _mock_embedder()
+        mock_embedder_cls.return_value = mock_embedder
+        mock_chroma = MagicMock()
+        mock_chroma.persist_directory = str(tmp_path / "chroma")
+        mock_chroma.save.return_value = {"count": 1, "collection": "documents", "persist_directory": "x"}
+        mock_chroma_cls.return_value = mock_chroma
+
+        from semche.cli.bulk_register import main
+
+        argv = ["doc-update", str(file1), "--embed-workers", "4", "--embed-worker-threads", "2"]
+        with patch("sys.argv", argv):
+            assert main() == 0
+        mock_embedder.start_pool.assert_called_once_with(4, threads_per_worker=2)
+        mock_embedder.close_pool.assert_called_once()
+
+        with patch("sys.argv", ["doc-update", str(file1), "--embed-worker-threads", "0"]):
+            assert main() == 1
+
+
+class TestUpdateSparseIndex:
+    """Tests for update_sparse_index function."""
+
+    def test_registers_documents(self, tmp_path):
+        """Registered documents become searchable in the persisted BM25 index."""
+        from semche.chromadb_manager import ChromaDBManager
+        from semche.sparse_index import SparseIndex
+
+        mgr = ChromaDBManager(persist_directory=str(tmp_path / "chroma"))
+        docs = {"/docs/a.md": "Python programming language", "/docs/b.md": "Rust systems programming"}
+        mgr.save(embeddings=[[0.1, 0.2, 0.3] for _ in docs], documents=list(docs.values()), filepaths=list(docs))
+
+        update_sparse_index(mgr, list(docs.values()), list(docs))
+
+        index = SparseIndex(mgr, background_merge=False)
+        assert index.load()["rebuilt"] is False
+        assert index.count == 2
+        assert index.search("Rust", top_k=1)[0]["id"] == "/docs/b.md"
+
+    def test_fts5_backend(self, tmp_path, monkeypatch):
+        """SEMCHE_SPARSE_BACKEND=fts5 writes to the FTS5 index instead."""
+        from semche.chromadb_manager import ChromaDBManager
+        from semche.fts_index import FTS5SparseIndex
+
+        monkeypatch.setenv("SEMCHE_SPARSE_BACKEND", "fts5")
+        mgr = ChromaDBManager(persist_directory=str(tmp_path / "chroma"))
+        docs = {"/docs/a.md": "Python programming language", "/docs/b.md": "Rust systems programming"}
+        mgr.save(embeddings=[[0.1, 0.2, 0.3] for _ in docs], documents=list(docs.values()), filepaths=list(docs))
+
+        update_sparse_index(mgr, list(docs.values()), list(docs))
+
+        index = FTS5SparseIndex(mgr)
+        assert index.load()["rebuilt"] is False
+        assert index.search("Rust", top_k=1)[0]["id"] == "/docs/b.md"
+
+    def test_sparse_tokenizer_is_kept_by_later_opens(self, tmp_path):
+        """--sparse-tokenizer rebuilds the index once; later opens keep the recorded tokenizer."""
+        from semche.chromadb_manager import ChromaDBManager
+        from semche.sparse_index import SparseIndex
+
+        mgr = ChromaDBManager(persist_directory=str(tmp_path / "chroma"))
+        docs = {
+            "/docs/a.md": "形態素解析でテキストを分割します",
+            "/docs/b.md": "ベクトル検索の結果を統合します",
+            "/docs/c.md": "Plain English text",
+        }
+        mgr.save(embeddings=[[0.1, 0.2, 0.3] for _ in docs], documents=list(docs.values()), filepaths=list(docs))
+
+        update_sparse_index(mgr, list(docs.values()), list(docs), tokenizer="ngram")
+
+        index = SparseIndex(mgr, background_merge=False)
+        assert index.load()["rebuilt"] is False
+        assert index.encoder.tokenizer_name == "ngram"
+        assert index.search("ベクトル", top_k=1)[0]["id"] == "/docs/b.md"
+
+    def test_failure_invalidates_index(self, tmp_path):
+        """A failed write discards the index instead of raising."""
+        from semche.chromadb_manager import ChromaDBManager
+        from semche.sparse_index import SparseIndex
+
+        mgr = ChromaDBManager(persist_directory=str(tmp_path / "chroma"))
+        with patch.object(SparseIndex, "upsert", side_effect=RuntimeError("disk full")), \
+                patch.object(SparseIndex, "invalidate") as invalidate:
+            update_sparse_index(mgr, ["text"], ["/docs/a.md"])
+        assert invalidate.called
+
 
 class TestCLIEndToEnd:
     """End-to-end tests using actual CLI (requires environment setup)."""
@@ -33,3 +33,17 @@ def test_delete_validation_error():
     assert res["status"] == "error"
     assert res["error_type"] == "ValidationError"
     assert all(k in res for k in essential_error_keys)
+
+
+def test_delete_document_removes_from_sparse_index(tool_services):
+    from semche.services import get_services
+
+    put_document(text="Rust systems programming", filepath="/tests/rust.md", file_type="tmp")
+    put_document(text="Python programming language", filepath="/tests/python.md", file_type="tmp")
+
+    res = delete_document(filepath="/tests/rust.md")
+    assert res["status"] == "success"
+
+    sparse = get_services().sparse_index()
+    assert sparse.count == 1
+    assert sparse.search("Rust", top_k=5) == []
@@ -1,3 +1,4 @@
+import numpy as np
 import pytest
 
 from src.semche.embedding import Embedder, EmbeddingError
@@ -10,30 +11,27 @@ def embedder():
 def test_single_text_embedding(embedder):
     text = "これはテストです。"
     vec = embedder.addDocument(text)
-    assert isinstance(vec, list)
-    assert len(vec) == 768
-    assert all(isinstance(x, float) for x in vec)
+    assert isinstance(vec, np.ndarray)
+    assert vec.shape == (768,)
+    assert vec.dtype == np.float32
 
 def test_batch_text_embedding(embedder):
     texts = ["テスト1", "テスト2"]
     vecs = embedder.addDocument(texts)
-    assert isinstance(vecs, list)
-    assert len(vecs) == 2
-    for v in vecs:
-        assert isinstance(v, list)
-        assert len(v) == 768
+    assert isinstance(vecs, np.ndarray)
+    assert vecs.shape == (2, 768)
+    assert vecs.dtype == np.float32
 
 def test_english_text_embedding(embedder):
     text = "This is a test."
     vec = embedder.addDocument(text)
-    assert isinstance(vec, list)
-    assert len(vec) == 768
+    assert isinstance(vec, np.ndarray)
+    assert vec.shape == (768,)
 
 def test_normalize_option(embedder):
     text = "正規化テスト"
     vec = embedder.addDocument(text, normalize=True)
-    norm = sum(x * x for x in vec) ** 0.5
-    assert abs(norm - 1.0) < 1e-6
+    assert abs(float(np.linalg.norm(vec)) - 1.0) < 1e-6
 
 def test_empty_string_error(embedder):
     with pytest.raises(EmbeddingError):
@@ -46,3 +44,201 @@ def test_empty_list_error(embedder):
 def test_invalid_input_type(embedder):
     with pytest.raises(EmbeddingError):
         embedder.addDocument(123)
+
+
+class _CountingEmbeddings:
+    """Fake embeddings recording the texts of every embed_documents call."""
+
+    def __init__(self, base):
+        self.base = base
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return self.base.embed_documents(texts)
+
+
+def test_embed_batch_returns_float32_matrix(fake_embeddings):
+    counting = _CountingEmbeddings(fake_embeddings)
+    embedder = Embedder(embeddings=counting)
+    texts = [f"text {'a' * i}" for i in range(7)]
+
+    matrix = embedder.embed_batch(texts, batch_size=3)
+
+    assert [len(batch) for batch in counting.batches] == [3, 3, 1]
+    assert matrix.dtype == np.float32 and matrix.flags["C_CONTIGUOUS"]
+    np.testing.assert_allclose(matrix, np.array(fake_embeddings.embed_documents(texts), dtype=np.float32))
+
+
+def test_add_document_returns_float32_arrays(fake_embeddings):
+    embedder = Embedder(embeddings=fake_embeddings)
+
+    vec = embedder.addDocument("cat")
+    assert vec.dtype == np.float32 and vec.shape == (5,)
+    np.testing.assert_allclose(vec, fake_embeddings.embed_query("cat"), rtol=1e-6)
+
+    matrix = embedder.addDocument(["cat", "aeiou", ""], normalize=True)
+    assert matrix.dtype == np.float32 and matrix.shape == (3, 5)
+    np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), 1.0, rtol=1e-6)
+
+    with pytest.raises(EmbeddingError):
+        embedder.addDocument(["cat", 1])
+
+
+def test_embed_batch_normalize(fake_embeddings):
+    embedder = Embedder(embeddings=fake_embeddings)
+    matrix = embedder.embed_batch(["normalize me", "aeiou"], normalize=True)
+    np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), 1.0, rtol=1e-6)
+
+
+def test_embed_batch_errors(fake_embeddings):
+    embedder = Embedder(embeddings=fake_embeddings)
+    for texts in ([], "not a list", ["ok", 123]):
+        with pytest.raises(EmbeddingError):
+            embedder.embed_batch(texts)
+    with pytest.raises(EmbeddingError):
+        embedder.embed_batch(["ok"], batch_size=0)
+
+
+def test_embed_batch_sorts_by_length_and_restores_order(fake_embeddings):
+    counting = _CountingEmbeddings(fake_embeddings)
+    embedder = Embedder(embeddings=counting)
+    texts = ["a", "aaaaaaaa", "aa", "aaaaaaa", "aaa", "aaaaaa"]
+
+    matrix = embedder.embed_batch(texts, batch_size=2)
+
+    # Longest first, so every batch holds texts of similar length
+    assert counting.batches == [["aaaaaaaa", "aaaaaaa"], ["aaaaaa", "aaa"], ["aa", "a"]]
+    np.testing.assert_allclose(matrix, np.array(fake_embeddings.embed_documents(texts), dtype=np.float32))
+
+    counting.batches.clear()
+    embedder.embed_batch(texts, batch_size=2, sort_by_length=False)
+    assert counting.batches == [texts[0:2], texts[2:4], texts[4:6]]
+
+
+def test_embed_batch_uses_cache(fake_embeddings, tmp_path):
+    from src.semche.embedding_cache import EmbeddingCache
+
+    counting = _CountingEmbeddings(fake_embeddings)
+    embedder = Embedder(embeddings=counting, cache=EmbeddingCache(tmp_path / "emb.sqlite3"))
+    expected = np.array(fake_embeddings.embed_documents(["cat", "dog", "cat"]), dtype=np.float32)
+
+    # Duplicate texts are embedded once
+    np.testing.assert_allclose(embedder.embed_batch(["cat", "dog", "cat"]), expected)
+    assert counting.batches == [["cat", "dog"]]
+
+    # Only the new text runs through the model; cached rows keep their position
+    matrix = embedder.embed_batch(["dog", "bird", "cat"])
+    assert counting.batches[1:] == [["bird"]]
+    expected = np.array(fake_embeddings.embed_documents(["dog", "bird", "cat"]), dtype=np.float32)
+    np.testing.assert_allclose(matrix, expected)
+    assert matrix.dtype == np.float32 and matrix.flags["C_CONTIGUOUS"]
+
+    # Normalized vectors are cached separately
+    embedder.embed_batch(["cat"], normalize=True)
+    assert counting.batches[2:] == [["cat"]]
+
+
+class _QueryCountingEmbeddings:
+    """Fake embeddings counting embed_query calls."""
+
+    def __init__(self, base):
+        self.base = base
+        self.queries = []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return self.base.embed_query(text)
+
+
+def test_embed_query_cache(fake_embeddings):
+    counting = _QueryCountingEmbeddings(fake_embeddings)
+    embedder = Embedder(embeddings=counting, query_cache_size=2)
+
+    vector = embedder.embed_query("cat")
+    assert vector.dtype == np.float32 and not vector.flags.writeable
+    np.testing.assert_allclose(vector, fake_embeddings.embed_query("cat"))
+    assert embedder.embed_query("cat") is vector
+    embedder.embed_query("dog")
+    embedder.embed_query("bird")  # evicts "cat", the least recently used
+    embedder.embed_query("cat")
+
+    assert counting.queries == ["cat", "dog", "bird", "cat"]
+    assert embedder.query_cache_info() == {"size": 2, "entries": 2, "hits": 1, "misses": 4}
+    with pytest.raises(EmbeddingError):
+        embedder.embed_query("  ")
+
+
+class _EncodeClientEmbeddings:
+    """HuggingFaceEmbeddings-like wrapper whose ``_client.encode`` returns an ndarray."""
+
+    class _Client:
+        def __init__(self, base):
+            self.base = base
+            self.calls = []
+
+        def encode(self, sentences, **kwargs):
+            self.calls.append((list(sentences), kwargs))
+            return np.array(self.base.embed_documents(sentences), dtype=np.float64)
+
+    def __init__(self, base):
+        self._client = self._Client(base)
+        self.encode_kwargs = {}
+        self.query_encode_kwargs = {"prompt": "query: "}
+
+    def embed_query(self, text):
+        raise AssertionError("embed_query must not be called when _client.encode exists")
+
+
+def test_embed_query_uses_client_encode(fake_embeddings):
+    wrapper = _EncodeClientEmbeddings(fake_embeddings)
+    embedder = Embedder(embeddings=wrapper, query_cache_size=0)
+
+    vector = embedder.embed_query("two\nlines")
+
+    assert vector.dtype == np.float32 and vector.shape == (5,) and vector.flags["C_CONTIGUOUS"]
+    np.testing.assert_allclose(vector, fake_embeddings.embed_query("two lines"))
+    sentences, kwargs = wrapper._client.calls[0]
+    assert sentences == ["two lines"] and kwargs["prompt"] == "query: "
+
+
+def test_warm_up_bypasses_caches(fake_embeddings, tmp_path):
+    from src.semche.embedding_cache import EmbeddingCache
+
+    counting = _CountingEmbeddings(fake_embeddings)
+    embedder = Embedder(embeddings=counting)
+    embedder.cache = EmbeddingCache(tmp_path / "cache.sqlite3")
+
+    embedder.warm_up()
+
+    assert len(counting.batches) == 1
+    assert embedder.cache.count() == 0
+    assert embedder.query_cache_info()["entries"] == 0
+
+
+def test_embed_query_cache_disabled(fake_embeddings):
+    counting = _QueryCountingEmbeddings(fake_embeddings)
+    embedder = Embedder(embeddings=counting, query_cache_size=0)
+
+    embedder.embed_query("cat")
+    embedder.embed_query("cat")
+
+    assert counting.queries == ["cat", "cat"]
+    assert embedder.query_cache_info()["entries"] == 0
+
+
+def test_embed_batch_worker_pool(fake_embeddings):
+    embedder = Embedder(embeddings=fake_embeddings)
+    texts = [f"text {'a' * i}{'e' * (i % 3)}" for i in range(9)]
+    expected = embedder.embed_batch(texts, batch_size=2, normalize=True)
+
+    embedder.start_pool(2, threads_per_worker=1)
+    try:
+        assert embedder.pool_workers == 2
+        np.testing.assert_allclose(embedder.embed_batch(texts, batch_size=2, normalize=True), expected)
+    finally:
+        embedder.close_pool()
+    assert embedder.pool_workers == 1
+
+    embedder.start_pool(1)  # a single worker runs in-process
+    assert embedder._pool is None
@@ -0,0 +1,75 @@
+"""Tests for embedding_cache.py (persistent embedding cache)"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from src.semche import embedding_cache
+from src.semche.embedding_cache import (
+    EMBEDDING_CACHE_FILENAME,
+    EmbeddingCache,
+    EmbeddingCacheError,
+    cache_key,
+    create_embedding_cache,
+)
+
+
+def test_cache_key_depends_on_model_normalize_and_text():
+    assert cache_key("model-a", False, "猫が好き") == cache_key("model-a", False, "猫が好き")
+    assert cache_key("model-a", False, "猫が好き") != cache_key("model-a", False, "犬が好き")
+    assert cache_key("model-a", False, "text") != cache_key("model-b", False, "text")
+    assert cache_key("model-a", False, "text") != cache_key("model-a", True, "text")
+
+
+def test_put_and_get_many(tmp_path):
+    cache = EmbeddingCache(tmp_path / "emb.sqlite3")
+    cache.put_many([("k1", np.array([0.5, 1.0, 2.0])), ("k2", np.zeros(3, dtype=np.float32))])
+
+    found = cache.get_many(["k1", "missing", "k1"])
+
+    assert set(found) == {"k1"}
+    assert found["k1"].dtype == np.float32
+    np.testing.assert_array_equal(found["k1"], [0.5, 1.0, 2.0])
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.count() == 2
+    cache.close()
+
+    # Persisted across instances
+    np.testing.assert_array_equal(EmbeddingCache(tmp_path / "emb.sqlite3").get_many(["k2"])["k2"], [0, 0, 0])
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    clock = itertools.count(1)
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: float(next(clock)))
+    cache = EmbeddingCache(tmp_path / "emb.sqlite3", max_entries=3)
+    vector = np.ones(2, dtype=np.float32)
+    cache.put_many([("a", vector)])
+    cache.put_many([("b", vector)])
+    cache.put_many([("c", vector)])
+    cache.get_many(["a"])  # "b" is now the least recently used
+
+    cache.put_many([("d", vector)])
+
+    assert cache.count() == 3
+    assert set(cache.get_many(["a", "b", "c", "d"])) == {"a", "c", "d"}
+
+
+def test_unusable_path(tmp_path):
+    # A directory cannot be opened as a database
+    (tmp_path / "dir.sqlite3").mkdir()
+    cache = EmbeddingCache(tmp_path / "dir.sqlite3")
+
+    with pytest.raises(EmbeddingCacheError):
+        cache.get_many(["k"])
+
+
+def test_create_embedding_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("SEMCHE_EMBED_CACHE_SIZE", "10")
+    cache = create_embedding_cache(tmp_path)
+    assert cache is not None
+    assert cache.path == str(tmp_path / EMBEDDING_CACHE_FILENAME)
+    assert cache.max_entries == 10
+
+    monkeypatch.setenv("SEMCHE_EMBED_CACHE_SIZE", "0")
+    assert create_embedding_cache(tmp_path) is None
@@ -1,5 +1,6 @@
 """Tests for embedding helper functions."""
 
+import numpy as np
 import pytest
 
 from src.semche.embedding import EmbeddingError, ensure_single_vector
@@ -34,3 +35,17 @@ def test_ensure_single_vector_with_invalid_type():
     with pytest.raises(EmbeddingError, match="不正な埋め込み形式です"):
         ensure_single_vector("invalid")  # type: ignore[arg-type]
 
+
+
+def test_ensure_single_vector_with_arrays():
+    """numpy inputs come back as contiguous float32 1-D arrays."""
+    batch = np.array([[0.1, 0.2], [0.3, 0.4]])
+    result = ensure_single_vector(batch)
+    assert isinstance(result, np.ndarray)
+    assert result.dtype == np.float32 and result.flags["C_CONTIGUOUS"]
+    np.testing.assert_allclose(result, [0.1, 0.2], rtol=1e-6)
+
+    column = np.asfortranarray(np.arange(6, dtype=np.float32).reshape(2, 3))
+    assert ensure_single_vector(column[:, 1]).flags["C_CONTIGUOUS"]
+    with pytest.raises(EmbeddingError, match="不正な埋め込み形式です"):
+        ensure_single_vector(np.zeros((0, 4), dtype=np.float32))
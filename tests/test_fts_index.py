@@ -0,0 +1,169 @@
+"""Tests for fts_index.py (SQLite FTS5 sparse backend)"""
+
+from pathlib import Path
+
+import pytest
+
+from src.semche.chromadb_manager import ChromaDBManager
+from src.semche.fts_index import FTS_FILENAME, FTS5SparseIndex, match_expression
+from src.semche.sparse_index import SparseIndex, SparseIndexError, create_sparse_index
+
+
+def _save(mgr, docs, file_types=None):
+    """Save {id: text} to ChromaDB with dummy vectors (no embedding model needed)."""
+    ids = list(docs)
+    mgr.save(
+        embeddings=[[0.1, 0.2, 0.3] for _ in ids],
+        documents=[docs[i] for i in ids],
+        filepaths=ids,
+        file_types=file_types,
+    )
+
+
+@pytest.fixture
+def mgr(tmp_path):
+    return ChromaDBManager(persist_directory=str(tmp_path / "chroma"))
+
+
+def test_load_builds_from_chroma_and_persists(mgr):
+    _save(mgr, {
+        "/a": "Python programming language",
+        "/b": "JavaScript web development",
+        "/c": "Machine learning basics",
+    })
+
+    index = FTS5SparseIndex(mgr)
+    res = index.load()
+
+    assert res["rebuilt"] is True
+    assert index.count == 3
+    assert (Path(mgr.persist_directory) / FTS_FILENAME).exists()
+
+    index2 = FTS5SparseIndex(mgr)
+    assert index2.load()["rebuilt"] is False
+    results = index2.search("Python", top_k=1)
+    assert results[0]["id"] == "/a"
+    assert results[0]["score"] > 0
+    assert "text" not in results[0]
+
+
+def test_japanese_text_is_searchable(mgr):
+    _save(mgr, {"/ja": "形態素解析でテキストを分割します", "/en": "Plain English text"})
+
+    index = FTS5SparseIndex(mgr)
+    index.load()
+
+    assert [r["id"] for r in index.search("形態素解析", top_k=5)] == ["/ja"]
+
+
+def test_upsert_replace_and_remove(mgr):
+    index = FTS5SparseIndex(mgr, tokenizer=str.split)
+    index.load()
+
+    _save(mgr, {"/a": "alpha beta", "/b": "gamma delta"})
+    index.upsert(["alpha beta", "gamma delta"], ["/a", "/b"])
+    assert index.count == 2
+
+    _save(mgr, {"/a": "epsilon zeta"})
+    index.upsert(["epsilon zeta"], ["/a"])
+    assert index.count == 2
+    assert index.search("alpha", top_k=5) == []
+    assert [r["id"] for r in index.search("epsilon", top_k=5)] == ["/a"]
+
+    mgr.delete(["/b"])
+    res = index.remove(["/b", "/unknown"])
+    assert res["removed_count"] == 1
+    assert index.search("gamma", top_k=5) == []
+
+
+def test_filters(mgr):
+    docs = {
+        "/docs/a.md": "shared term apple",
+        "/docs/b.md": "shared term banana",
+        "/notes/c.md": "shared term cherry",
+    }
+    _save(mgr, docs, file_types=["doc", "doc", "note"])
+    index = FTS5SparseIndex(mgr, tokenizer=str.split)
+    index.load()
+
+    assert {r["id"] for r in index.search("shared", top_k=5, file_type="doc")} == {"/docs/a.md", "/docs/b.md"}
+    assert [r["id"] for r in index.search("shared", top_k=5, id_prefix="/notes/")] == ["/notes/c.md"]
+    assert index.search("apple", top_k=5, file_type="note") == []
+
+
+def test_rebuilds_when_out_of_sync(mgr):
+    _save(mgr, {"/a": "alpha"})
+    FTS5SparseIndex(mgr, tokenizer=str.split).load()
+
+    # Written to ChromaDB by a process that did not update the index
+    _save(mgr, {"/b": "beta"})
+    index = FTS5SparseIndex(mgr, tokenizer=str.split)
+    assert index.load()["rebuilt"] is True
+    assert index.count == 2
+
+
+def test_upsert_of_pending_write_does_not_rebuild(mgr):
+    _save(mgr, {"/a": "alpha"})
+    index = FTS5SparseIndex(mgr, tokenizer=str.split)
+    index.load()
+    index.invalidate()
+    assert index.count == 0
+
+    # The ChromaDB write already happened; the next load must not count it as drift
+    _save(mgr, {"/b": "beta"})
+    index2 = FTS5SparseIndex(mgr, tokenizer=str.split)
+    index2.load()
+    _save(mgr, {"/c": "gamma"})
+    index2.upsert(["gamma"], ["/c"])
+    assert index2.count == 3
+
+
+def test_invalidate_by_another_instance_rebuilds_on_next_search(mgr):
+    _save(mgr, {"/a": "alpha beta", "/b": "gamma delta"})
+    server = FTS5SparseIndex(mgr, tokenizer=str.split)
+    server.load()
+    assert [r["id"] for r in server.search("alpha", top_k=5)] == ["/a"]
+
+    # doc-update (another process) fails its sparse update and empties the table
+    FTS5SparseIndex(mgr, tokenizer=str.split).invalidate()
+
+    assert [r["id"] for r in server.search("alpha", top_k=5)] == ["/a"]
+    assert server.count == 2
+
+
+def test_tokenizer_is_recorded_and_kept_per_collection(mgr):
+    _save(mgr, {"/ja": "形態素解析でテキストを分割します", "/en": "Plain English text"})
+    FTS5SparseIndex(mgr, tokenizer="ngram").load()
+
+    index = FTS5SparseIndex(mgr)
+    assert index.encoder.tokenizer_name == "ngram"
+    assert index.load()["rebuilt"] is False
+    assert [r["id"] for r in index.search("形態素", top_k=5)] == ["/ja"]
+
+    index = FTS5SparseIndex(mgr, tokenizer="mecab")
+    assert index.load()["rebuilt"] is True
+
+
+def test_match_expression_quotes_tokens():
+    assert match_expression(["a", 'say "hi"', "a", "-"]) == '"a" OR "say ""hi"""'
+    assert match_expression(["(", "*"]) is None
+
+
+def test_search_with_fts_operators_in_query(mgr):
+    _save(mgr, {"/a": "NEAR AND OR NOT"})
+    index = FTS5SparseIndex(mgr, tokenizer=str.split)
+    index.load()
+
+    assert [r["id"] for r in index.search('NOT "AND" (', top_k=5)] == ["/a"]
+    assert index.search("* ( )", top_k=5) == []
+
+
+def test_create_sparse_index_selects_backend(mgr, monkeypatch):
+    assert isinstance(create_sparse_index(mgr, tokenizer=str.split), SparseIndex)
+    assert isinstance(create_sparse_index(mgr, "fts5", tokenizer=str.split), FTS5SparseIndex)
+
+    monkeypatch.setenv("SEMCHE_SPARSE_BACKEND", "fts5")
+    assert isinstance(create_sparse_index(mgr, tokenizer=str.split), FTS5SparseIndex)
+
+    with pytest.raises(SparseIndexError):
+        create_sparse_index(mgr, "lucene")
@@ -0,0 +1,178 @@
+"""Tests for hybrid_retriever.py (dense + sparse fusion)"""
+
+import pytest
+
+from src.semche.chromadb_manager import ChromaDBManager
+from src.semche.embedding import Embedder
+from src.semche.hybrid_retriever import HybridRetriever
+from src.semche.sparse_index import SparseIndex, SparseIndexError
+
+DOCS = {
+    "/docs/python.md": ("Python programming language", "tech"),
+    "/docs/rust.md": ("Rust systems programming", "tech"),
+    "/docs/cat.md": ("Cats are lovely animals", "animal"),
+    "/docs/dog.md": ("Dogs are loyal pets", "animal"),
+}
+
+
+@pytest.fixture
+def mgr(tmp_path, fake_embeddings):
+    mgr = ChromaDBManager(persist_directory=str(tmp_path / "chroma"), embedding_function=fake_embeddings)
+    ids = list(DOCS)
+    mgr.save(
+        embeddings=fake_embeddings.embed_documents([DOCS[i][0] for i in ids]),
+        documents=[DOCS[i][0] for i in ids],
+        filepaths=ids,
+        file_types=[DOCS[i][1] for i in ids],
+    )
+    return mgr
+
+
+def test_indexed_sparse_scores_attach_chroma_metadata(mgr):
+    sparse = SparseIndex(mgr, tokenizer=str.split, background_merge=False)
+    sparse.load()
+    # In the sparse index but already deleted from ChromaDB
+    sparse.upsert(["Python snake facts"], ["/docs/gone.md"])
+    retriever = HybridRetriever(mgr, sparse_index=sparse)
+
+    results = retriever._sparse_scores("Python", top_k=5)
+
+    assert [r["id"] for r in results] == ["/docs/python.md"]
+    assert results[0]["metadata"]["file_type"] == "tech"
+    assert results[0]["document"] == "Python programming language"
+    assert results[0]["score"] > 0
+
+
+def test_search_falls_back_when_sparse_index_fails(mgr, monkeypatch):
+    sparse = SparseIndex(mgr, tokenizer=str.split, background_merge=False)
+
+    def broken_search(query, top_k=5, **filters):
+        raise SparseIndexError("index files are corrupt")
+
+    monkeypatch.setattr(sparse, "search", broken_search)
+    retriever = HybridRetriever(mgr, sparse_index=sparse)
+
+    sparse_results = retriever._sparse_scores("Rust", top_k=5)
+    assert [r["id"] for r in sparse_results] == ["/docs/rust.md"]
+    results = retriever.search("Rust", top_k=3)
+    assert "/docs/rust.md" in [r["id"] for r in results]
+
+
+def test_file_type_filter_uses_sparse_index(mgr, monkeypatch):
+    sparse = SparseIndex(mgr, tokenizer=str.split, background_merge=False)
+    sparse.load()
+    retriever = HybridRetriever(mgr, sparse_index=sparse)
+
+    def full_fetch(*args, **kwargs):
+        raise AssertionError("file_type filters must be answered by the sparse index")
+
+    monkeypatch.setattr(mgr, "get_all_documents", full_fetch)
+    results = retriever._sparse_scores("Dogs", where={"file_type": "animal"}, top_k=5)
+    assert [r["id"] for r in results] == ["/docs/dog.md"]
+    assert retriever._sparse_scores("Rust", where={"file_type": "animal"}, top_k=5) == []
+
+
+def test_fts5_backend_attaches_documents(mgr):
+    retriever = HybridRetriever(mgr, sparse_backend="fts5")
+    assert retriever.sparse_index is not None
+
+    results = retriever._sparse_scores("Rust", top_k=5)
+    assert [r["id"] for r in results] == ["/docs/rust.md"]
+    assert results[0]["document"] == "Rust systems programming"
+    animals = retriever._sparse_scores("loyal", where={"file_type": "animal"}, top_k=5)
+    assert [r["id"] for r in animals] == ["/docs/dog.md"]
+
+
+def test_fallback_fetches_bodies_only_for_top_k(mgr, monkeypatch):
+    retriever = HybridRetriever(mgr)
+    fetched = []
+    get_by_ids = mgr.get_by_ids
+
+    def recording_get_by_ids(ids):
+        fetched.append(list(ids))
+        return get_by_ids(ids)
+
+    monkeypatch.setattr(mgr, "get_by_ids", recording_get_by_ids)
+    # Not answerable by the sparse index: BM25 is built over the matching subset
+    results = retriever._sparse_scores("Dogs", where={"file_type": {"$in": ["animal", "tech"]}}, top_k=1)
+
+    assert [r["id"] for r in results] == ["/docs/dog.md"]
+    assert results[0]["document"] == "Dogs are loyal pets"
+    assert fetched == [["/docs/dog.md"]]
+
+
+def test_fallback_uses_the_sparse_index_tokenizer(mgr, monkeypatch):
+    from src.semche import hybrid_retriever
+
+    sparse = SparseIndex(mgr, tokenizer="ngram", background_merge=False)
+    sparse.load()
+    retriever = HybridRetriever(mgr, sparse_index=sparse)
+    built = []
+
+    class RecordingEncoder(hybrid_retriever.BM25SparseEncoder):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            built.append(self)
+
+    monkeypatch.setattr(hybrid_retriever, "BM25SparseEncoder", RecordingEncoder)
+    results = retriever._sparse_scores("Dogs", where={"file_type": {"$in": ["animal", "tech"]}}, top_k=1)
+
+    assert [r["id"] for r in results] == ["/docs/dog.md"]
+    assert [e.tokenizer_name for e in built] == ["ngram"]
+    assert built[0].tokenizer_signature == sparse.encoder.tokenizer_signature
+
+
+def test_dense_search_uses_cached_query_vector(mgr, fake_embeddings):
+    sparse = SparseIndex(mgr, tokenizer=str.split, background_merge=False)
+    sparse.load()
+    embedder = Embedder(embeddings=fake_embeddings)
+    by_text = HybridRetriever(mgr, sparse_index=sparse).search("loyal dogs", top_k=3)
+    retriever = HybridRetriever(mgr, sparse_index=sparse, embedder=embedder)
+
+    first = retriever.search("loyal dogs", top_k=3)
+    second = retriever.search("loyal dogs", top_k=3, where={"file_type": "animal"})
+
+    assert [r["id"] for r in first] == [r["id"] for r in by_text]
+    assert {r["metadata"]["file_type"] for r in second} == {"animal"}
+    assert embedder.query_cache_info()["misses"] == 1
+    assert embedder.query_cache_info()["hits"] == 1
+
+
+def test_search_rejects_a_collection_of_another_embedding_space(mgr, fake_embeddings):
+    from src.semche.chromadb_manager import ChromaDBError
+
+    def manager(space):
+        return ChromaDBManager(
+            persist_directory=mgr.persist_directory, embedding_function=fake_embeddings, embedding_space=space
+        )
+
+    # Recorded as the transformer space by its first write
+    transformer = manager("model")
+    transformer.save(embeddings=fake_embeddings.embed_documents(["Python"]), documents=["Python"], filepaths=["/p"])
+
+    with pytest.raises(ChromaDBError):
+        HybridRetriever(manager("model#static"), embedder=Embedder(embeddings=fake_embeddings)).search("Python")
+    assert HybridRetriever(transformer).search("Python", top_k=3)[0]["id"] == "/p"
+
+
+def test_search_tool_reports_an_embedding_space_mismatch(tool_services, fake_embeddings, monkeypatch):
+    from semche import services
+    from semche.chromadb_manager import ChromaDBManager as ToolChromaDBManager
+    from semche.mcp_server import put_document, search
+
+    # The tools' collection is recorded as the fake model's space by its first write
+    tool_services.embedding_space = "model"
+    assert put_document(text="Python programming", filepath="/p.md")["status"] == "success"
+
+    static = ToolChromaDBManager(
+        persist_directory=tool_services.persist_directory,
+        embedding_function=fake_embeddings,
+        embedding_space="model#static",
+    )
+    registry = services.ServiceRegistry(embedder=services.get_services().embedder(), chromadb_manager=static)
+    monkeypatch.setattr(services, "_services", registry)
+
+    result = search(query="Python", top_k=3)
+    assert result["status"] == "error"
+    assert result["error_type"] == "ChromaDBError"
+    assert "model#static" in result["message"]
@@ -0,0 +1,281 @@
+"""Tests for index_format.py (memory-mapped on-disk BM25 index)"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from src.semche.index_format import (
+    ARRAY_FILES,
+    FORMAT_NAME,
+    FORMAT_VERSION,
+    MANIFEST_NAME,
+    IndexFormatError,
+    StringTable,
+    StringTableChain,
+    VocabTable,
+    read_file_types,
+    read_index,
+    remove_index_files,
+    write_index,
+)
+from src.semche.inverted_index import UPDATE_ARRAY_NAMES, InvertedBM25Index
+
+CORPUS = [
+    "python programming language".split(),
+    "機械 学習 は 人工 知能 の 一 分野".split(),
+    "python web scraping".split(),
+    "深層 学習 と neural networks".split(),
+]
+IDS = ["/a.md", "/日本語.md", "/c.md", "/d.md"]
+TEXTS = [" ".join(tokens) for tokens in CORPUS]
+
+
+def test_write_and_read_roundtrip(tmp_path):
+    index = InvertedBM25Index(CORPUS)
+    write_index(tmp_path, index, IDS)
+
+    loaded, ids, manifest = read_index(tmp_path)
+
+    assert manifest["format_version"] == FORMAT_VERSION
+    assert list(ids) == IDS
+    # Document texts are not stored (ChromaDB holds them)
+    assert not list(tmp_path.glob("*texts*"))
+    # Arrays are memory-mapped, not copied into the process
+    assert isinstance(loaded.segments[0].postings_docs, np.memmap)
+    for query in [["python"], ["学習", "python"], ["unknown"]]:
+        np.testing.assert_allclose(loaded.get_scores(query), index.get_scores(query))
+        assert loaded.top_k(query, 2)[0].tolist() == index.top_k(query, 2)[0].tolist()
+
+
+def test_new_generation_replaces_old_files(tmp_path):
+    tmp_path = tmp_path / "index"
+    write_index(tmp_path, InvertedBM25Index(CORPUS), IDS)
+    first = set(p.name for p in tmp_path.glob("bm25-*.npy"))
+    (tmp_path / "bm25_index.pkl").write_bytes(b"legacy")
+
+    write_index(tmp_path, InvertedBM25Index(CORPUS[:2]), IDS[:2])
+    second = set(p.name for p in tmp_path.glob("bm25-*.npy"))
+
+    assert first.isdisjoint(second)
+    assert not (tmp_path / "bm25_index.pkl").exists()
+    assert len(read_index(tmp_path)[1]) == 2
+
+    remove_index_files(tmp_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_empty_documents(tmp_path):
+    """Zero-length arrays (no terms) fall back to regular loading"""
+    write_index(tmp_path, InvertedBM25Index([[]]), ["/empty"])
+
+    loaded, ids, _ = read_index(tmp_path)
+
+    assert list(ids) == ["/empty"]
+    assert len(loaded.vocab) == 0
+    assert len(loaded.top_k(["python"], 5)[0]) == 0
+
+
+def test_unsupported_version(tmp_path):
+    write_index(tmp_path, InvertedBM25Index(CORPUS), IDS)
+    manifest = json.loads((tmp_path / MANIFEST_NAME).read_text(encoding="utf-8"))
+    manifest["format_version"] = FORMAT_VERSION + 1
+    (tmp_path / MANIFEST_NAME).write_text(json.dumps(manifest), encoding="utf-8")
+
+    with pytest.raises(IndexFormatError, match="Unsupported BM25 index format version"):
+        read_index(tmp_path)
+
+
+def _write_single_generation(directory, index, ids, texts, version):
+    """Write the version 1/2 layout: one set of arrays per generation, no segments."""
+    segment = index.segments[0]
+    tables = {
+        "vocab": StringTable.from_strings(sorted(index.vocab, key=index.vocab.__getitem__)),
+        "ids": StringTable.from_strings(ids),
+        "texts": StringTable.from_strings(texts),
+    }
+    arrays = {name: getattr(segment, name, None) for name in ARRAY_FILES}
+    for name in ("doc_norm", "idf", "max_impact"):
+        arrays[name] = getattr(index, name)
+    for name, table in tables.items():
+        arrays[f"{name}_offsets"] = table.offsets
+        arrays[f"{name}_data"] = table.data
+    files = {}
+    for name in ARRAY_FILES:
+        if version < 2 and name in UPDATE_ARRAY_NAMES:
+            continue
+        files[name] = f"bm25-old-{name}.npy"
+        np.save(directory / files[name], arrays[name], allow_pickle=False)
+    params = {"k1": index.k1, "b": index.b, "epsilon": index.epsilon}
+    manifest = {"format": FORMAT_NAME, "format_version": version, "params": params, "arrays": files}
+    (directory / MANIFEST_NAME).write_text(json.dumps(manifest), encoding="utf-8")
+
+
+def test_reads_version_1_without_update_arrays(tmp_path):
+    """Version 1 has no forward index; it is derived from the postings so updates still work"""
+    _write_single_generation(tmp_path, InvertedBM25Index(CORPUS), IDS, TEXTS, version=1)
+
+    loaded, ids, _ = read_index(tmp_path)
+    assert list(ids) == IDS
+    loaded.remove_documents([0])
+    loaded.add_documents([["python", "python"]])
+
+    expected = InvertedBM25Index(CORPUS[1:] + [["python", "python"]])
+    np.testing.assert_allclose(loaded.get_scores(["python"])[1:], expected.get_scores(["python"]))
+
+
+def test_reads_version_2_as_single_segment(tmp_path):
+    index = InvertedBM25Index(CORPUS)
+    _write_single_generation(tmp_path, index, IDS, TEXTS, version=2)
+
+    loaded, _, _ = read_index(tmp_path)
+
+    assert len(loaded.segments) == 1
+    np.testing.assert_allclose(loaded.get_scores(["学習", "python"]), index.get_scores(["学習", "python"]))
+
+    # Saving it again upgrades to the current version
+    write_index(tmp_path, loaded, IDS)
+    assert read_index(tmp_path)[2]["format_version"] == FORMAT_VERSION
+    assert not list(tmp_path.glob("bm25-old-*"))
+
+
+def test_version_4_texts_are_dropped_on_next_save(tmp_path):
+    """Segments written with document texts still load; the texts files go once a save references them again"""
+    index = InvertedBM25Index(CORPUS)
+    write_index(tmp_path, index, IDS)
+    manifest = json.loads((tmp_path / MANIFEST_NAME).read_text(encoding="utf-8"))
+    segment = manifest["segments"][0]
+    texts = StringTable.from_strings(TEXTS)
+    for part in ("offsets", "data"):
+        filename = f"bm25-seg-{segment['name']}-texts_{part}.npy"
+        np.save(tmp_path / filename, getattr(texts, part), allow_pickle=False)
+        segment["arrays"][f"texts_{part}"] = filename
+    manifest["format_version"] = 4
+    (tmp_path / MANIFEST_NAME).write_text(json.dumps(manifest), encoding="utf-8")
+
+    loaded, ids, _ = read_index(tmp_path)
+    assert list(ids) == IDS
+    np.testing.assert_allclose(loaded.get_scores(["python"]), index.get_scores(["python"]))
+
+    write_index(tmp_path, loaded, IDS)
+    assert not list(tmp_path.glob("*texts*"))
+    assert read_index(tmp_path)[2]["segments"][0]["name"] == segment["name"]
+
+
+def test_write_requires_flushed_index(tmp_path):
+    index = InvertedBM25Index(CORPUS)
+    index.add_documents([["python", "rust"]])
+    with pytest.raises(IndexFormatError, match="flush"):
+        write_index(tmp_path, index, IDS + ["/e.md"])
+
+    index.flush()
+    write_index(tmp_path, index, IDS + ["/e.md"])
+    loaded, ids, _ = read_index(tmp_path)
+    assert list(ids) == IDS + ["/e.md"]
+    assert len(loaded.segments) == 2
+
+
+def test_segments_and_tombstones_roundtrip(tmp_path):
+    ids = IDS + ["/e.md", "/f.md"]
+    index = InvertedBM25Index(CORPUS)
+    index.add_documents([["rust", "python"]])
+    index.flush()
+    index.add_documents([["新しい", "用語"]])
+    index.remove_documents([0, 4])
+    index.flush()
+    write_index(tmp_path, index, ids)
+
+    loaded, loaded_ids, manifest = read_index(tmp_path)
+
+    assert [seg["doc_count"] for seg in manifest["segments"]] == [4, 1, 1]
+    assert isinstance(loaded_ids, StringTableChain)
+    assert list(loaded_ids) == ids
+    assert loaded.deleted.tolist() == [True, False, False, False, True, False]
+    assert loaded.corpus_size == index.corpus_size
+    assert loaded.total_len == index.total_len
+    np.testing.assert_array_equal(loaded.df, index.df)
+    for query in [["python"], ["rust"], ["用語", "学習"]]:
+        np.testing.assert_allclose(loaded.get_scores(query), index.get_scores(query))
+
+
+def test_file_types_roundtrip(tmp_path):
+    codes = np.array([0, -1, 1, 0], dtype=np.int32)
+    write_index(tmp_path, InvertedBM25Index(CORPUS), IDS, file_types=(["doc", "memo"], codes))
+
+    _, _, manifest = read_index(tmp_path)
+    names, loaded_codes = read_file_types(tmp_path, manifest)
+    assert names == ["doc", "memo"]
+    assert loaded_codes.tolist() == codes.tolist()
+
+    # Older versions did not store file types
+    assert read_file_types(tmp_path, {**manifest, "format_version": 3}) is None
+
+
+def test_save_writes_only_new_segments(tmp_path):
+    index = InvertedBM25Index(CORPUS)
+    first = write_index(tmp_path, index, IDS)
+    base_files = {Path(p).name for p in first if "-seg-" in p}
+
+    index.add_documents([["rust", "python"]])
+    new_segment = index.flush()
+    second = write_index(tmp_path, index, IDS + ["/e.md"])
+
+    written_segments = {Path(p).name for p in second if "-seg-" in p}
+    assert written_segments and all(new_segment.name in name for name in written_segments)
+    # Neither the base segment nor the base vocabulary was rewritten, but both are still referenced
+    assert not any("-vocab-" in p for p in second)
+    assert base_files <= {p.name for p in tmp_path.glob("bm25-*.npy")}
+
+
+def test_save_after_load_reuses_vocab_files(tmp_path, monkeypatch):
+    write_index(tmp_path, InvertedBM25Index(CORPUS), IDS)
+    loaded, ids, _ = read_index(tmp_path)
+    assert isinstance(loaded.vocab, VocabTable)
+
+    def fail_lookup(self, term):
+        raise AssertionError("vocabulary must not be looked up term by term when saving")
+
+    monkeypatch.setattr(VocabTable, "__getitem__", fail_lookup)
+    loaded.add_documents([["rust", "python"]])
+    loaded.flush()
+    written = write_index(tmp_path, loaded, list(ids) + ["/e.md"])
+    assert not any("-vocab-" in p for p in written)
+
+    # A new directory gets the loaded vocabulary copied from its string table
+    other = tmp_path / "copy"
+    written = write_index(other, loaded, list(ids) + ["/e.md"])
+    assert any("-vocab-" in p for p in written)
+    monkeypatch.undo()
+    reloaded, _, _ = read_index(other)
+    assert list(reloaded.vocab) == list(loaded.vocab)
+    np.testing.assert_allclose(reloaded.get_scores(["rust", "学習"]), loaded.get_scores(["rust", "学習"]))
+
+
+def test_missing_manifest(tmp_path):
+    with pytest.raises(IndexFormatError, match="manifest not found"):
+        read_index(tmp_path)
+
+
+def test_string_table():
+    table = StringTable.from_strings(["abc", "", "日本語", "x"])
+
+    assert len(table) == 4
+    assert table[2] == "日本語"
+    assert table[-1] == "x"
+    assert table[1:3] == ["", "日本語"]
+    assert table == ["abc", "", "日本語", "x"]
+    with pytest.raises(IndexError):
+        table[4]
+
+
+def test_vocab_table_matches_dict():
+    index = InvertedBM25Index(CORPUS)
+    terms = sorted(index.vocab, key=index.vocab.__getitem__)
+    vocab = VocabTable(StringTable.from_strings(terms))
+
+    for term, tid in index.vocab.items():
+        assert vocab[term] == tid
+    assert vocab.get("missing") is None
+    assert "学習" in vocab
+    assert len(vocab) == len(index.vocab)
@@ -0,0 +1,323 @@
+"""Tests for inverted_index.py (posting-list BM25 scorer)"""
+
+import numpy as np
+import pytest
+from rank_bm25 import BM25Okapi
+
+from src.semche import inverted_index
+from src.semche.inverted_index import InvertedBM25Index, QueryPlan, select_top_k
+
+CORPUS = [
+    "python programming language for machine learning".split(),
+    "javascript is a web programming language".split(),
+    "machine learning and artificial intelligence".split(),
+    "deep learning with neural networks".split(),
+    "python python web scraping".split(),
+    [],
+]
+
+
+def test_scores_match_bm25okapi():
+    """Scores are identical to rank_bm25 including the negative-IDF floor"""
+    okapi = BM25Okapi(CORPUS)
+    index = InvertedBM25Index(CORPUS)
+
+    for query in [
+        ["python"],
+        ["learning"],  # appears in 3 of 6 documents
+        ["programming", "language"],  # appears in more than half -> floored IDF
+        ["python", "python", "web"],  # repeated query tokens
+        ["unknown"],
+        [],
+    ]:
+        np.testing.assert_allclose(index.get_scores(query), okapi.get_scores(query), rtol=1e-6, atol=1e-9)
+
+
+def test_score_candidates_only_touches_matching_documents():
+    index = InvertedBM25Index(CORPUS)
+
+    docs, scores = index.score_candidates(["python", "neural"])
+
+    assert docs.tolist() == [0, 3, 4]
+    assert len(scores) == 3
+    assert np.all(scores > 0)
+
+
+def test_score_candidates_unknown_terms():
+    index = InvertedBM25Index(CORPUS)
+
+    docs, scores = index.score_candidates(["unknown", "words"])
+
+    assert len(docs) == 0
+    assert len(scores) == 0
+
+
+def test_posting_lists_structure():
+    index = InvertedBM25Index([["a", "b", "a"], ["b", "c"]])
+    (segment,) = index.segments
+
+    tid = index.vocab["a"]
+    start, end = segment.indptr[tid], segment.indptr[tid + 1]
+    assert segment.postings_docs[start:end].tolist() == [0]
+    assert segment.postings_tfs[start:end].tolist() == [2.0]
+
+    tid = index.vocab["b"]
+    start, end = segment.indptr[tid], segment.indptr[tid + 1]
+    assert segment.postings_docs[start:end].tolist() == [0, 1]
+    assert index.doc_len.tolist() == [3, 2]
+
+
+def _random_corpus(n_docs, vocab_size, seed):
+    rng = np.random.default_rng(seed)
+    # Zipf-like term distribution: a few frequent terms, a long tail of rare ones
+    probs = 1.0 / np.arange(1, vocab_size + 1)
+    probs /= probs.sum()
+    return [
+        [f"t{t}" for t in rng.choice(vocab_size, size=rng.integers(5, 40), p=probs)]
+        for _ in range(n_docs)
+    ]
+
+
+def test_top_k_matches_exhaustive_scoring():
+    """MaxScore pruning returns the same top-k scores as scoring every candidate"""
+    corpus = _random_corpus(500, 300, seed=0)
+    index = InvertedBM25Index(corpus)
+    rng = np.random.default_rng(1)
+
+    for _ in range(50):
+        query = [f"t{t}" for t in rng.integers(0, 300, size=rng.integers(2, 12))]
+        k = int(rng.integers(1, 20))
+        docs, scores = index.top_k(query, k)
+
+        expected = np.sort(index.get_scores(query))[::-1][:k]
+        expected = expected[expected > 0]
+        np.testing.assert_allclose(scores, expected, rtol=1e-9)
+        # Returned documents carry their exact scores, sorted descending
+        np.testing.assert_allclose(index.get_scores(query)[docs], scores, rtol=1e-9)
+        assert np.all(np.diff(scores) <= 0)
+
+
+def test_top_k_reuses_scratch_buffers_without_corpus_sized_allocations():
+    """Queries share one per-thread accumulator, reset only where they touched it"""
+    index = InvertedBM25Index(_random_corpus(500, 300, seed=0))
+    index.top_k(["t1", "t2", "t3"], 5)
+    acc = inverted_index._scratch.acc
+
+    rng = np.random.default_rng(2)
+    for _ in range(10):
+        query = [f"t{t}" for t in rng.integers(0, 300, size=6)]
+        index.top_k(query, 3)
+        assert inverted_index._scratch.acc is acc
+        assert not acc.any() and not inverted_index._scratch.touched.any()
+
+    # A larger corpus grows the buffers; the smaller index keeps working with them
+    larger = InvertedBM25Index(_random_corpus(1200, 300, seed=3))
+    expected = np.sort(larger.get_scores(["t1", "t5"]))[::-1][:4]
+    np.testing.assert_allclose(larger.top_k(["t1", "t5"], 4)[1], expected[expected > 0], rtol=1e-9)
+    assert len(inverted_index._scratch.acc) >= 1200
+    expected = np.sort(index.get_scores(["t1", "t5"]))[::-1][:4]
+    np.testing.assert_allclose(index.top_k(["t1", "t5"], 4)[1], expected[expected > 0], rtol=1e-9)
+
+
+def test_top_k_with_floored_idf_falls_back():
+    """Terms in more than half of the documents are handled without pruning errors"""
+    index = InvertedBM25Index(CORPUS)
+
+    docs, scores = index.top_k(["programming", "language", "python"], 2)
+
+    expected = np.sort(index.get_scores(["programming", "language", "python"]))[::-1][:2]
+    np.testing.assert_allclose(scores, expected)
+
+
+def test_top_k_edge_cases():
+    index = InvertedBM25Index(CORPUS)
+
+    assert len(index.top_k(["unknown"], 3)[0]) == 0
+    assert len(index.top_k(["python"], 0)[0]) == 0
+    # Fewer matches than k
+    assert sorted(index.top_k(["python", "neural"], 10)[0].tolist()) == [0, 3, 4]
+
+
+def test_mask_restricts_scoring_with_index_wide_statistics():
+    """Masked documents are skipped; the others keep their unfiltered scores"""
+    corpus = [[f"w{j}" for j in range(8) if (i + 1) % (j + 2) == 0] or ["none"] for i in range(60)]
+    index = InvertedBM25Index(corpus)
+    query = ["w0", "w2", "w4", "w6", "w7"]
+    mask = np.arange(len(corpus)) % 3 == 0
+
+    docs, scores = index.score_candidates(query, mask)
+    assert mask[docs].all()
+    np.testing.assert_allclose(scores, index.get_scores(query)[docs])
+
+    top_docs, top_scores = index.top_k(query, 4, mask)
+    expected_docs, expected_scores = select_top_k(docs, scores, 4)
+    np.testing.assert_allclose(top_scores, expected_scores)
+    assert mask[top_docs].all()
+    assert index.top_k(query, 4, np.zeros(len(corpus), dtype=bool))[0].tolist() == []
+
+
+def _live_scores(index, query):
+    return index.get_scores(query)[~index.deleted]
+
+
+def test_incremental_updates_match_rebuild():
+    """Adding and removing documents gives the same scores as building from the live corpus"""
+    corpus = _random_corpus(300, 200, seed=2)
+    index = InvertedBM25Index(corpus[:200])
+
+    index.add_documents(corpus[200:250])
+    index.remove_documents(range(0, 200, 3))
+    index.add_documents(corpus[250:] + [["brand", "new", "terms"]])
+    index.remove_documents([210, 260, 260, 10_000])
+
+    live = [doc for i, doc in enumerate(corpus + [["brand", "new", "terms"]]) if not index.deleted[i]]
+    okapi = BM25Okapi(live)
+    assert index.corpus_size == len(live)
+    rng = np.random.default_rng(3)
+    for _ in range(30):
+        query = [f"t{t}" for t in rng.integers(0, 200, size=rng.integers(1, 8))] + ["terms"]
+        np.testing.assert_allclose(_live_scores(index, query), okapi.get_scores(query), rtol=1e-6, atol=1e-9)
+        k = int(rng.integers(1, 10))
+        expected = np.sort(okapi.get_scores(query))[::-1][:k]
+        np.testing.assert_allclose(index.top_k(query, k)[1], expected[expected > 0], rtol=1e-6)
+
+
+def test_query_plan_is_reused_until_statistics_change():
+    """A plan of the current generation is returned as is; updates make it re-plan from its tokens"""
+    index = InvertedBM25Index(CORPUS)
+    plan = index.plan(["python", "web", "python", "unknown"])
+    assert isinstance(plan, QueryPlan)
+    assert dict(plan.token_counts) == {"python": 2, "web": 1, "unknown": 1}
+    assert sorted(qtf for _, qtf in plan.terms) == [1, 2]
+    assert index.plan(plan) is plan
+    np.testing.assert_allclose(index.top_k(plan, 3)[1], index.top_k(["python", "web", "python"], 3)[1])
+
+    index.add_documents([["unknown", "web"]])
+    assert index.plan(plan) is not plan
+    replanned = index.plan(plan)
+    assert replanned.generation == index.generation != plan.generation
+    assert len(replanned.terms) == 3
+    np.testing.assert_allclose(index.score_candidates(plan)[1], index.score_candidates(replanned)[1])
+
+    # Plans are tied to the statistics of one index, not just its generation count
+    other = InvertedBM25Index(CORPUS)
+    assert other.plan(replanned).generation == other.generation != replanned.generation
+
+
+def _check_against_okapi(index, live_corpus, seed):
+    okapi = BM25Okapi(live_corpus)
+    rng = np.random.default_rng(seed)
+    for _ in range(20):
+        query = [f"t{t}" for t in rng.integers(0, 200, size=rng.integers(1, 8))]
+        np.testing.assert_allclose(_live_scores(index, query), okapi.get_scores(query), rtol=1e-6, atol=1e-9)
+        expected = np.sort(okapi.get_scores(query))[::-1][:5]
+        np.testing.assert_allclose(index.top_k(query, 5)[1], expected[expected > 0], rtol=1e-6)
+
+
+def test_flushed_segments_match_rebuild():
+    corpus = _random_corpus(300, 200, seed=5)
+    index = InvertedBM25Index(corpus[:100])
+    for start in range(100, 300, 50):
+        index.add_documents(corpus[start:start + 50])
+        index.remove_documents(range(start - 100, start - 50, 4))
+        index.flush()
+
+    assert [seg.doc_start for seg in index.segments] == [0, 100, 150, 200, 250]
+    assert index.buffered_count == 0
+    assert index.flush() is None
+    live = [doc for i, doc in enumerate(corpus) if not index.deleted[i]]
+    assert index.corpus_size == len(live)
+    _check_against_okapi(index, live, seed=6)
+
+
+def test_merge_segments_drops_removed_postings():
+    corpus = _random_corpus(300, 200, seed=7)
+    index = InvertedBM25Index(corpus[:100])
+    for start in range(100, 300, 50):
+        index.add_documents(corpus[start:start + 50])
+        index.flush()
+    index.remove_documents(range(0, 300, 3))
+    old = index.segments[1:]
+    postings_before = sum(seg.n_postings for seg in old)
+
+    merged = index.merge_segments(old)
+    # Removed after the merge started: stays tombstoned in the merged segment
+    index.remove_documents([101])
+    assert index.replace_segments(old, merged)
+    assert not index.replace_segments(old, merged)
+
+    assert len(index.segments) == 2
+    assert (merged.doc_start, merged.doc_count) == (100, 200)
+    assert merged.n_postings < postings_before
+    assert set(merged.postings_docs[index.deleted[merged.postings_docs]].tolist()) == {101}
+    live = [doc for i, doc in enumerate(corpus) if not index.deleted[i]]
+    _check_against_okapi(index, live, seed=8)
+    with pytest.raises(ValueError, match="adjacent"):
+        index.merge_segments([index.segments[1], index.segments[0]])
+
+
+def test_plan_merge_is_size_tiered():
+    index = InvertedBM25Index(_random_corpus(400, 200, seed=9))
+    for i in range(6):
+        index.add_documents(_random_corpus(5, 200, seed=10 + i))
+        index.flush()
+
+    assert index.plan_merge(max_segments=8) == []
+    # The large first segment is left alone while the small ones are merged
+    assert index.plan_merge(max_segments=4) == index.segments[1:]
+    assert index.plan_merge(max_segments=4, factor=1000) == index.segments
+
+
+def test_removed_documents_are_not_returned():
+    index = InvertedBM25Index(CORPUS)
+
+    assert index.remove_documents([0, 4]) == 2
+    assert index.remove_documents([0]) == 0
+
+    assert index.top_k(["python"], 5)[0].tolist() == []
+    assert index.score_candidates(["python", "web"])[0].tolist() == [1]
+    assert index.corpus_size == 4
+
+
+def test_impact_bounds_stay_valid_after_updates():
+    corpus = _random_corpus(200, 100, seed=4)
+    index = InvertedBM25Index(corpus[:150])
+    index.remove_documents(range(0, 150, 2))
+    index.add_documents(corpus[150:])
+    index.top_k(["t1"], 1)  # refresh statistics
+
+    for term in ["t0", "t1", "t5", "t50"]:
+        tid = index._term_id(term)
+        docs, tfs = index._postings(tid)
+        impact = tfs * (index.k1 + 1) / (tfs + index.doc_norm[docs])
+        assert np.all(impact <= index.max_impact[tid] + 1e-12)
+
+
+def test_compact_folds_updates():
+    index = InvertedBM25Index(CORPUS)
+    index.add_documents([["rust", "systems", "programming"]])
+    index.remove_documents([1, 3])
+    before = _live_scores(index, ["programming", "rust", "learning"])
+
+    live = index.compact()
+
+    assert live.tolist() == [0, 2, 4, 5, 6]
+    assert index.buffered_count == 0 and index.n_deleted == 0
+    assert len(index.segments) == 1
+    assert "neural" not in index.vocab
+    assert list(index.vocab) == sorted(index.vocab, key=lambda t: t.encode("utf-8"))
+    np.testing.assert_allclose(index.get_scores(["programming", "rust", "learning"]), before)
+    expected = InvertedBM25Index([CORPUS[i] for i in [0, 2, 4, 5]] + [["rust", "systems", "programming"]])
+    for name in ("indptr", "postings_docs", "postings_tfs"):
+        np.testing.assert_array_equal(getattr(index.segments[0], name), getattr(expected.segments[0], name))
+
+
+def test_select_top_k():
+    docs = np.array([10, 11, 12, 13])
+    scores = np.array([0.5, 2.0, 1.0, 3.0])
+
+    top_docs, top_scores = select_top_k(docs, scores, 2)
+
+    assert top_docs.tolist() == [13, 11]
+    assert top_scores.tolist() == [3.0, 2.0]
+    assert select_top_k(docs, scores, 10)[0].tolist() == [13, 11, 12, 10]
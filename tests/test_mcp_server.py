@@ -118,3 +118,100 @@ def test_put_document_multiple_calls():
         result = put_document(text=txt, filepath=fp, file_type="multi")
         assert result["status"] == "success"
 
+
+
+def test_put_document_updates_sparse_index(tool_services):
+    """put_document writes the document to the persistent BM25 index as well."""
+    from semche.services import get_services
+
+    result = put_document(text="Rust systems programming", filepath="/test/rust.md", file_type="test")
+    assert result["status"] == "success"
+
+    sparse = get_services().sparse_index()
+    assert sparse.search("Rust", top_k=1)[0]["id"] == "/test/rust.md"
+
+
+# Tests for the opt-in background warm-up
+
+
+def test_warm_up_enabled(monkeypatch):
+    from semche.mcp_server import warm_up_enabled
+
+    monkeypatch.delenv("SEMCHE_WARMUP", raising=False)
+    assert not warm_up_enabled()
+    for value in ("1", "true", "ON"):
+        monkeypatch.setenv("SEMCHE_WARMUP", value)
+        assert warm_up_enabled()
+    monkeypatch.setenv("SEMCHE_WARMUP", "0")
+    assert not warm_up_enabled()
+
+
+def test_warm_up_loads_services_once(tool_services, monkeypatch):
+    """Warm-up opens the BM25 index and runs one encode; later calls reuse the thread."""
+    import asyncio
+
+    from semche import mcp_server
+    from semche.services import get_services
+
+    services = get_services()
+    encodes = []
+    monkeypatch.setattr(services.embedder(), "warm_up", lambda: encodes.append(1))
+    monkeypatch.setattr(mcp_server, "_warm_up_thread", None)
+    monkeypatch.setenv("SEMCHE_WARMUP", "1")
+
+    async def run_lifespan():
+        async with mcp_server._lifespan(mcp_server.mcp):
+            pass
+
+    asyncio.run(run_lifespan())
+    thread = mcp_server._warm_up_thread
+    assert thread is not None and mcp_server.start_warm_up() is thread
+    assert mcp_server.wait_for_warm_up(timeout=30)
+    assert services._sparse_index is not None
+    assert encodes == [1]
+
+
+def test_requests_wait_for_warm_up(monkeypatch):
+    """A tool call arriving during warm-up waits for it instead of initializing in parallel."""
+    import threading
+
+    from semche import mcp_server
+
+    release = threading.Event()
+    finished = []
+
+    def slow_warm_up():
+        release.wait(5)
+        finished.append(True)
+
+    def fake_tool(**kwargs):
+        return {"status": "success", "warmed_up": bool(finished)}
+
+    monkeypatch.setattr(mcp_server, "_warm_up_thread", None)
+    monkeypatch.setattr(mcp_server, "_warm_up", slow_warm_up)
+    monkeypatch.setattr(mcp_server, "_put_document_tool", fake_tool)
+    mcp_server.start_warm_up()
+    assert not mcp_server.wait_for_warm_up(timeout=0.05)
+
+    threading.Timer(0.1, release.set).start()
+    result = put_document(text="x", filepath="/test/x.md")
+
+    assert result["warmed_up"] is True
+
+
+def test_startup_does_not_import_heavy_packages():
+    """Importing the server and the CLI defers chromadb, LangChain, torch and MeCab to first use."""
+    import os
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    heavy = ["chromadb", "langchain_chroma", "langchain_huggingface", "sentence_transformers", "torch", "MeCab"]
+    code = (
+        "import sys, semche.mcp_server, semche.cli.bulk_register; "
+        f"print([m for m in {heavy!r} if m in sys.modules])"
+    )
+    src = str(Path(__file__).resolve().parents[1] / "src")
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [src, os.environ.get("PYTHONPATH")]))}
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,55 @@
+"""Tests for ngram_tokenizer.py (character n-gram tokenizer)"""
+
+import pickle
+
+import pytest
+
+from src.semche.ngram_tokenizer import CharNgramTokenizer
+from src.semche.sparse_encoder import BM25SparseEncoder, SparseEncoderError
+
+
+def test_japanese_runs_become_ngrams():
+    assert CharNgramTokenizer(sizes=(2,))("形態素解析") == ["形態", "態素", "素解", "解析"]
+    assert CharNgramTokenizer(sizes=(2, 3))("検索する") == ["検索", "索す", "する", "検索す", "索する"]
+    assert CharNgramTokenizer(sizes=(1, 2))("猫が") == ["猫", "が", "猫が"]
+
+
+def test_ascii_words_are_kept_whole_and_normalized():
+    tokens = CharNgramTokenizer(sizes=(2,))("ＢＭ２５とベクトル・APIを統合 snake_case Café")
+    assert tokens == ["bm25", "api", "snake_case", "café", "とベ", "ベク", "クト", "トル", "を統", "統合"]
+
+
+def test_characters_outside_the_bmp_separate_runs():
+    assert CharNgramTokenizer(sizes=(2,))("絵文字😀ok") == ["ok", "絵文", "文字"]
+    assert CharNgramTokenizer()("") == []
+
+
+def test_run_shorter_than_ngram_is_kept():
+    assert CharNgramTokenizer(sizes=(2, 3))("猫。犬") == ["猫", "犬"]
+    assert CharNgramTokenizer(sizes=(3,))("検索") == ["検索"]
+
+
+def test_signature_and_pickle():
+    tokenizer = CharNgramTokenizer(sizes=(3, 2, 2))
+    assert tokenizer.sizes == (2, 3)
+    assert tokenizer.signature != CharNgramTokenizer(sizes=(2,)).signature
+    assert pickle.loads(pickle.dumps(tokenizer)) == tokenizer
+
+    with pytest.raises(ValueError):
+        CharNgramTokenizer(sizes=())
+
+
+def test_encoder_selects_tokenizer_by_name():
+    encoder = BM25SparseEncoder(tokenizer="ngram", engine="inverted")
+    assert encoder.tokenizer_name == "ngram"
+    assert encoder.tokenizer_signature == CharNgramTokenizer().signature
+
+    encoder.build_index(
+        ["形態素解析でテキストを分割します", "ベクトル検索の結果を統合します", "Plain English text"],
+        ["/ja1", "/ja2", "/en"],
+    )
+    assert encoder.search("形態素", top_k=1)[0]["id"] == "/ja1"
+    assert encoder.search("english", top_k=1)[0]["id"] == "/en"
+
+    with pytest.raises(SparseEncoderError):
+        BM25SparseEncoder(tokenizer="sudachi")
@@ -0,0 +1,87 @@
+"""Tests for onnx_backend.py (ONNX Runtime embedding backend)"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("onnx")
+
+from src.semche import onnx_backend  # noqa: E402
+from src.semche.embedding import Embedder, EmbeddingError  # noqa: E402
+from src.semche.onnx_backend import (  # noqa: E402
+    CONFIG_FILENAME,
+    ONNX_MODEL_FILENAME,
+    QUANTIZED_MODEL_FILENAME,
+    OnnxBackendError,
+    cosine_similarities,
+    export_onnx,
+    load_onnx_embeddings,
+)
+
+TEXTS = ["猫が好きです。", "Python programming language", "a much longer text " * 20, "x"]
+
+
+def _torch_embeddings(model_name, texts):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name, device="cpu").encode(texts, convert_to_numpy=True)
+
+
+def test_cosine_similarities():
+    a = np.array([[1.0, 0.0], [1.0, 1.0], [0.0, 0.0]])
+    b = np.array([[2.0, 0.0], [-1.0, -1.0], [1.0, 0.0]])
+    np.testing.assert_allclose(cosine_similarities(a, b), [1.0, -1.0, 0.0])
+
+
+def test_export_and_load_match_torch(tiny_model, tmp_path):
+    embeddings = load_onnx_embeddings(tiny_model, "onnx", export_dir=tmp_path / "export")
+
+    assert (tmp_path / "export" / ONNX_MODEL_FILENAME).exists()
+    assert not (tmp_path / "export" / QUANTIZED_MODEL_FILENAME).exists()
+    matrix = np.array(embeddings.embed_documents(TEXTS))
+    np.testing.assert_allclose(matrix, _torch_embeddings(tiny_model, TEXTS), atol=1e-5)
+    # Batch of one (no padding) and single-text encode give the same vectors
+    np.testing.assert_allclose(embeddings.embed_query(TEXTS[2]), matrix[2], atol=1e-5)
+    np.testing.assert_allclose(embeddings._client.encode(TEXTS[3]), matrix[3], atol=1e-5)
+
+
+def test_int8_export_records_parity(tiny_model, tmp_path):
+    import json
+
+    embeddings = load_onnx_embeddings(tiny_model, "onnx-int8", export_dir=tmp_path)
+
+    parity = json.loads((tmp_path / CONFIG_FILENAME).read_text(encoding="utf-8"))["parity"]
+    assert parity["onnx"] >= onnx_backend.MIN_PARITY_COSINE["onnx"]
+    assert parity["onnx-int8"] >= onnx_backend.MIN_PARITY_COSINE["onnx-int8"]
+    similarity = cosine_similarities(_torch_embeddings(tiny_model, TEXTS), embeddings._client.encode(TEXTS))
+    assert similarity.min() >= onnx_backend.MIN_PARITY_COSINE["onnx-int8"]
+
+
+def test_failed_parity_check_rejects_export(tiny_model, tmp_path, monkeypatch):
+    export_onnx(tiny_model, tmp_path)
+    monkeypatch.setitem(onnx_backend.MIN_PARITY_COSINE, "onnx-int8", 1.5)
+
+    with pytest.raises(OnnxBackendError):
+        export_onnx(tiny_model, tmp_path, quantize=True)
+    assert not (tmp_path / QUANTIZED_MODEL_FILENAME).exists()
+    assert (tmp_path / ONNX_MODEL_FILENAME).exists()
+
+
+def test_embedder_onnx_backend(tiny_model, tmp_path, monkeypatch):
+    monkeypatch.setenv("SEMCHE_ONNX_DIR", str(tmp_path))
+    monkeypatch.setenv("SEMCHE_EMBED_BACKEND", "onnx")
+
+    embedder = Embedder(model_name=tiny_model)
+
+    assert embedder.backend == "onnx"
+    assert embedder.cache_model_name == f"{tiny_model}#onnx"
+    expected = _torch_embeddings(tiny_model, TEXTS)
+    np.testing.assert_allclose(embedder.embed_batch(TEXTS, batch_size=2), expected, atol=1e-5)
+    np.testing.assert_allclose(embedder.embed_query(TEXTS[0]), expected[0], atol=1e-5)
+
+
+def test_unknown_backend():
+    with pytest.raises(EmbeddingError):
+        Embedder(backend="tensorflow")
+    with pytest.raises(OnnxBackendError):
+        load_onnx_embeddings("any-model", "torch")
@@ -0,0 +1,124 @@
+"""Tests for services.py (process-wide service registry shared by the MCP tools)"""
+
+import threading
+import time
+
+import pytest
+
+from semche import services
+from semche.embedding import Embedder
+from semche.services import ServiceRegistry, get_services
+
+
+@pytest.fixture
+def created(monkeypatch, fake_embeddings):
+    """Embedders created by the registry (fake embeddings instead of loading the model)."""
+    embedders = []
+
+    def make_embedder():
+        embedder = Embedder(embeddings=fake_embeddings)
+        embedders.append(embedder)
+        return embedder
+
+    monkeypatch.setattr(services, "Embedder", make_embedder)
+    return embedders
+
+
+def test_services_are_created_once(created):
+    registry = ServiceRegistry()
+    results = []
+
+    def use():
+        results.append((registry.embedder(), registry.chromadb_manager()))
+
+    threads = [threading.Thread(target=use) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert len({id(embedder) for embedder, _ in results}) == 1
+    assert len({id(mgr) for _, mgr in results}) == 1
+    # The embedding cache lives in the ChromaDB persist directory
+    assert created[0].cache is not None
+    assert created[0].cache.path.startswith(results[0][1].persist_directory)
+
+
+def test_warm_and_close(created, monkeypatch):
+    registry = ServiceRegistry()
+    encodes = []
+    monkeypatch.setattr(Embedder, "warm_up", lambda self: encodes.append(self))
+
+    registry.warm()
+
+    sparse = registry.sparse_index()
+    assert encodes == [created[0]]
+    assert sparse is registry.sparse_index()
+
+    registry.close()
+
+    assert created[0].cache._conn is None
+    # The next use creates the services again
+    assert registry.embedder() is not created[0]
+    assert registry.sparse_index() is not sparse
+
+
+def test_tools_share_the_registry(tool_services):
+    from semche.mcp_server import delete_document, put_document
+
+    assert put_document(text="shared services", filepath="/test/shared.md")["status"] == "success"
+    assert tool_services.count() == 1
+    assert delete_document(filepath="/test/shared.md")["deleted_count"] == 1
+    assert get_services().chromadb_manager() is tool_services
+    assert get_services().sparse_index().count == 0
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_idle_timeout_from_environment(monkeypatch):
+    monkeypatch.setenv(services.IDLE_UNLOAD_ENV, "30")
+    assert ServiceRegistry().idle_timeout == 30
+    monkeypatch.setenv(services.IDLE_UNLOAD_ENV, "0")
+    assert ServiceRegistry().idle_timeout is None
+    monkeypatch.delenv(services.IDLE_UNLOAD_ENV)
+    assert ServiceRegistry().idle_timeout is None
+
+
+def test_idle_services_are_unloaded_and_reloaded(created):
+    registry = ServiceRegistry(idle_timeout=0.2)
+    with registry.activity():
+        first = registry.embedder()
+        sparse = registry.sparse_index()
+
+    assert wait_until(lambda: registry.stats()["unloads"] == 1)
+    stats = registry.stats()
+    assert not stats["loaded"]
+    assert stats["reloads"] == 0
+    assert first.cache._conn is None
+
+    with registry.activity():
+        assert registry.embedder() is not first
+        assert registry.sparse_index() is not sparse
+    stats = registry.stats()
+    assert stats["reloads"] == 1
+    assert len(created) == 2
+    assert stats["reload_seconds"] > 0
+    assert stats["last_reload_seconds"] == stats["reload_seconds"]
+
+
+def test_services_stay_loaded_during_activity(created):
+    registry = ServiceRegistry(idle_timeout=0.1)
+    with registry.activity():
+        registry.embedder()
+        time.sleep(0.3)
+        assert registry.loaded
+    assert registry.stats()["unloads"] == 0
+    assert wait_until(lambda: registry.stats()["unloads"] == 1)
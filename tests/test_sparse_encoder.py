@@ -1,5 +1,7 @@
 """Tests for sparse_encoder.py (BM25 sparse encoder)"""
 
+import json
+
 import pytest
 
 from src.semche.sparse_encoder import BM25SparseEncoder, SparseEncoderError
@@ -9,7 +11,6 @@ def test_initialization():
     """Test BM25SparseEncoder initialization"""
     encoder = BM25SparseEncoder()
     assert encoder.bm25 is None
-    assert encoder.corpus_texts == []
     assert encoder.corpus_ids == []
 
 
@@ -29,8 +30,9 @@ def test_build_index_basic():
     assert result["status"] == "success"
     assert result["count"] == 3
     assert encoder.bm25 is not None
-    assert len(encoder.corpus_texts) == 3
     assert len(encoder.corpus_ids) == 3
+    # Only IDs and statistics are kept; texts live in ChromaDB
+    assert not hasattr(encoder, "corpus_texts")
 
 
 def test_build_index_validation_errors():
@@ -123,7 +125,8 @@ def test_save_and_load(tmp_path):
     assert load_result["status"] == "success"
     assert load_result["count"] == 3
     assert encoder2.corpus_ids == doc_ids
-    assert encoder2.corpus_texts == documents
+    metadata = json.loads((tmp_path / "bm25_metadata.json").read_text(encoding="utf-8"))
+    assert "corpus_texts" not in metadata
 
     # Search should work after loading
     results = encoder2.search("Python", top_k=1)
@@ -163,7 +166,6 @@ def test_add_documents():
 
     assert result["status"] == "success"
     assert result["count"] == 4
-    assert len(encoder.corpus_texts) == 4
     assert len(encoder.corpus_ids) == 4
 
     # Search should work with all documents
@@ -184,6 +186,97 @@ def test_add_documents_validation():
         encoder.add_documents(["new_doc"], ["id1", "id2"])
 
 
+@pytest.mark.parametrize("engine", ["rank_bm25", "inverted"])
+def test_add_documents_replaces_existing_ids(engine):
+    encoder = BM25SparseEncoder(tokenizer=lambda t: t.lower().split(), engine=engine)
+    encoder.build_index(["Python programming", "JavaScript coding"], ["doc1", "doc2"])
+
+    result = encoder.add_documents(["Rust programming", "Machine learning"], ["doc1", "doc3"])
+
+    assert result["count"] == 3
+    assert result["replaced_count"] == 1
+    assert encoder.document_count == 3
+    # The old text of doc1 no longer matches
+    assert all(r["id"] != "doc1" or r["score"] <= 0 for r in encoder.search("python", top_k=3))
+    assert encoder.search("rust", top_k=1)[0]["id"] == "doc1"
+
+
+@pytest.mark.parametrize("engine", ["rank_bm25", "inverted"])
+def test_remove_documents(engine):
+    encoder = BM25SparseEncoder(tokenizer=lambda t: t.lower().split(), engine=engine)
+    encoder.build_index(["Python programming", "JavaScript coding", "Machine learning"], ["d1", "d2", "d3"])
+
+    result = encoder.remove_documents(["d1", "unknown", "d1"])
+
+    assert result["removed_count"] == 1
+    assert result["count"] == 2
+    assert all(r["id"] != "d1" for r in encoder.search("python programming", top_k=3))
+    assert encoder.search("javascript", top_k=1)[0]["id"] == "d2"
+
+    assert encoder.remove_documents(["d2", "d3"])["count"] == 0
+    assert encoder.remove_documents(["d2"])["removed_count"] == 0
+
+
+def test_update_documents_requires_known_ids():
+    encoder = BM25SparseEncoder(tokenizer=lambda t: t.lower().split(), engine="inverted")
+    encoder.build_index(["Python programming"], ["d1"])
+
+    with pytest.raises(SparseEncoderError, match="not in index"):
+        encoder.update_documents(["Rust"], ["d2"])
+
+    encoder.update_documents(["Rust programming"], ["d1"])
+    assert encoder.search("rust", top_k=1)[0]["id"] == "d1"
+    assert encoder.document_count == 1
+
+
+@pytest.mark.parametrize("engine", ["rank_bm25", "inverted"])
+def test_incremental_updates_only_tokenize_changed_documents(engine):
+    """rank_bm25 rebuilds from the term frequencies it holds, not from stored texts"""
+    calls = []
+    encoder = BM25SparseEncoder(tokenizer=_counting_tokenizer(calls), engine=engine)
+    encoder.build_index(["Python programming", "JavaScript coding", "Machine learning"], ["d1", "d2", "d3"])
+    calls.clear()
+
+    encoder.add_documents(["Deep learning"], ["d4"])
+    encoder.update_documents(["Rust programming"], ["d2"])
+    encoder.remove_documents(["d3"])
+
+    assert calls == ["Deep learning", "Rust programming"]
+    rebuilt = BM25SparseEncoder(tokenizer=lambda t: t.lower().split(), engine=engine)
+    rebuilt.build_index(["Python programming", "Deep learning", "Rust programming"], ["d1", "d4", "d2"])
+    for query in ["programming", "learning", "rust python"]:
+        got = {r["id"]: r["score"] for r in encoder.search(query, top_k=5)}
+        expected = {r["id"]: r["score"] for r in rebuilt.search(query, top_k=5)}
+        assert got.keys() == expected.keys()
+        for did, score in expected.items():
+            assert got[did] == pytest.approx(score)
+
+
+def test_incremental_updates_after_load_and_save(tmp_path):
+    """Updates on a memory-mapped index are saved as a new segment next to the loaded one"""
+    encoder = BM25SparseEncoder(tokenizer=lambda t: t.lower().split(), engine="inverted")
+    encoder.build_index(["Python programming", "JavaScript coding"], ["d1", "d2"])
+    encoder.save(str(tmp_path / "bm25"))
+
+    loaded = BM25SparseEncoder(tokenizer=lambda t: t.lower().split(), engine="inverted")
+    loaded.load(str(tmp_path / "bm25"))
+    loaded.add_documents(["Machine learning", "Python scripting"], ["d3", "d1"])
+    loaded.remove_documents(["d2"])
+    top = loaded.search("python", top_k=1)[0]
+    assert top["id"] == "d1"
+    assert set(top) == {"id", "score"}
+
+    loaded.save(str(tmp_path / "bm25"))
+    assert len(loaded.bm25.segments) == 2
+
+    reloaded = BM25SparseEncoder(tokenizer=lambda t: t.lower().split(), engine="inverted")
+    reloaded.load(str(tmp_path / "bm25"))
+    assert sorted(reloaded.document_ids()) == ["d1", "d3"]
+    assert reloaded.document_count == 2
+    assert reloaded.search("learning", top_k=1)[0]["id"] == "d3"
+    assert [r["id"] for r in reloaded.search("python", top_k=5)] == ["d1"]
+
+
 def test_custom_tokenizer():
     """Test custom tokenizer"""
 
@@ -348,3 +441,262 @@ def test_japanese_search_with_particles():
     assert "doc1" in result_ids
     assert "doc2" in result_ids
 
+
+
+def test_inverted_engine_matches_rank_bm25():
+    """The inverted engine ranks and scores like rank_bm25 for matching documents"""
+    documents = [
+        "Python programming language for machine learning",
+        "JavaScript is a web programming language",
+        "Machine learning and artificial intelligence",
+        "Deep learning with neural networks",
+        "機械学習は人工知能の一分野です",
+    ]
+    doc_ids = [f"doc{i}" for i in range(len(documents))]
+
+    default = BM25SparseEncoder()
+    inverted = BM25SparseEncoder(engine="inverted")
+    default.build_index(documents, doc_ids)
+    inverted.build_index(documents, doc_ids)
+
+    for query in ["Python machine learning", "learning", "機械学習"]:
+        expected = {r["id"]: r["score"] for r in default.search(query, top_k=5) if r["score"] > 0}
+        results = inverted.search(query, top_k=5)
+        # Tied documents may come back in a different order, so compare id -> score
+        assert {r["id"] for r in results} == set(expected)
+        for r in results:
+            assert abs(r["score"] - expected[r["id"]]) < 1e-6
+        scores = [r["score"] for r in results]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_inverted_engine_pruning_matches_exhaustive():
+    """search() with MaxScore pruning returns the same top-k as exhaustive scoring"""
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta"]
+    documents = [" ".join(words[j] for j in range(len(words)) if (i + 1) % (j + 2) == 0) or "none"
+                 for i in range(60)]
+    doc_ids = [f"doc{i}" for i in range(len(documents))]
+    encoder = BM25SparseEncoder(engine="inverted")
+    encoder.build_index(documents, doc_ids)
+
+    query = "alpha gamma epsilon eta theta"
+    pruned = encoder.search(query, top_k=3)
+    exhaustive = encoder.search(query, top_k=3, pruning=False)
+
+    assert [r["score"] for r in pruned] == pytest.approx([r["score"] for r in exhaustive])
+    assert len(pruned) == 3
+
+
+def test_inverted_engine_skips_non_matching_documents():
+    encoder = BM25SparseEncoder(engine="inverted")
+    encoder.build_index(["Python programming", "JavaScript coding", "Machine learning"], ["d1", "d2", "d3"])
+
+    results = encoder.search("Python", top_k=3)
+
+    assert [r["id"] for r in results] == ["d1"]
+
+
+def test_inverted_engine_save_and_load(tmp_path):
+    encoder1 = BM25SparseEncoder(engine="inverted")
+    encoder1.build_index(["Python programming", "JavaScript coding", "Machine learning"], ["d1", "d2", "d3"])
+    encoder1.save(str(tmp_path))
+
+    # The engine is restored from the saved metadata
+    encoder2 = BM25SparseEncoder()
+    encoder2.load(str(tmp_path))
+
+    assert encoder2.engine == "inverted"
+    assert encoder2.search("Python", top_k=1)[0]["id"] == "d1"
+    assert list(encoder2.corpus_ids) == ["d1", "d2", "d3"]
+    # Binary format: NumPy arrays + manifest, no pickle
+    assert not (tmp_path / "bm25_index.pkl").exists()
+    assert list(tmp_path.glob("bm25-*.npy"))
+
+
+@pytest.mark.parametrize("engine", ["rank_bm25", "inverted"])
+def test_search_filters_by_file_type_and_id_prefix(engine):
+    encoder = BM25SparseEncoder(tokenizer=str.split, engine=engine)
+    encoder.build_index(
+        ["python guide", "python notes", "java spec", "rust guide", "go tutorial", "c manual"],
+        ["/docs/a", "/memo/b", "/docs/c", "/docs/d", "/docs/e", "/spec/f"],
+        ["doc", "memo", "spec", "doc", "doc", "spec"],
+    )
+    unfiltered = {r["id"]: r["score"] for r in encoder.search("python guide", top_k=6)}
+
+    results = encoder.search("python guide", top_k=6, file_type="doc")
+    assert {r["id"] for r in results if r["score"] > 0} == {"/docs/a", "/docs/d"}
+    # Scores use index-wide statistics, not those of the filtered subset
+    for r in results:
+        assert r["score"] == pytest.approx(unfiltered[r["id"]])
+    assert [r["id"] for r in encoder.search("python", top_k=1, id_prefix="/memo/")] == ["/memo/b"]
+    assert [r["id"] for r in encoder.search("java spec", top_k=1, file_type="spec", id_prefix="/docs/")] == ["/docs/c"]
+    assert encoder.search("python", top_k=6, file_type="unknown") == []
+
+
+def test_file_type_filters_follow_updates(tmp_path):
+    encoder = BM25SparseEncoder(tokenizer=str.split, engine="inverted")
+    encoder.build_index(["python guide", "python notes"], ["/a", "/b"], ["doc", None])
+    assert [r["id"] for r in encoder.search("python", top_k=5, file_type="doc")] == ["/a"]
+
+    # The cached mask is extended to added documents; a re-typed document moves filters
+    encoder.add_documents(["python howto", "python guide"], ["/c", "/a"], ["doc", "memo"])
+    assert [r["id"] for r in encoder.search("python", top_k=5, file_type="doc")] == ["/c"]
+    assert [r["id"] for r in encoder.search("python", top_k=5, file_type="memo")] == ["/a"]
+
+    encoder.save(str(tmp_path))
+    loaded = BM25SparseEncoder(tokenizer=str.split)
+    loaded.load(str(tmp_path))
+    assert loaded.has_file_types
+    assert [r["id"] for r in loaded.search("python", top_k=5, file_type="memo")] == ["/a"]
+    assert loaded.compact() is True
+    assert [r["id"] for r in loaded.search("python", top_k=5, file_type="doc")] == ["/c"]
+
+
+def test_unknown_engine():
+    with pytest.raises(SparseEncoderError, match="Unknown BM25 engine"):
+        BM25SparseEncoder(engine="faiss")
+
+
+def _counting_tokenizer(calls):
+    def tokenize(text):
+        calls.append(text)
+        return text.lower().split()
+    return tokenize
+
+
+@pytest.mark.parametrize("engine", ["rank_bm25", "inverted"])
+def test_query_cache_skips_tokenization_of_repeated_queries(engine):
+    calls = []
+    encoder = BM25SparseEncoder(tokenizer=_counting_tokenizer(calls), engine=engine)
+    encoder.build_index(["python web", "rust systems", "python data", "java tooling"], ["/a", "/b", "/c", "/d"])
+    calls.clear()
+
+    first = encoder.search("python  go", top_k=2)
+    assert encoder.search(" python go ", top_k=2) == first
+    assert calls == ["python go"]
+    assert encoder.query_cache_info() == {"size": 256, "entries": 1, "hits": 1, "misses": 1}
+
+    # Updates invalidate the cached plan, not the tokens: "go" is found once it is indexed
+    encoder.add_documents(["go go tooling"], ["/go"])
+    calls.clear()
+    assert encoder.search("python go", top_k=1)[0]["id"] == "/go"
+    assert calls == []
+
+
+def test_query_cache_is_bounded():
+    calls = []
+    encoder = BM25SparseEncoder(tokenizer=_counting_tokenizer(calls), engine="inverted", query_cache_size=2)
+    encoder.build_index(["a b", "b c", "c d"], ["/1", "/2", "/3"])
+    for query in ["a", "b", "a", "c", "a", "b"]:
+        encoder.search(query)
+    # "b" was evicted by "c" (least recently used), "a" stayed
+    assert calls[-4:] == ["a", "b", "c", "b"]
+    assert encoder.query_cache_info()["entries"] == 2
+
+    uncached = BM25SparseEncoder(tokenizer=_counting_tokenizer(calls), engine="inverted", query_cache_size=0)
+    uncached.build_index(["a b", "b c", "c d"], ["/1", "/2", "/3"])
+    calls.clear()
+    uncached.search("a")
+    uncached.search("a")
+    assert calls == ["a", "a"]
+
+
+def test_token_cache_only_tokenizes_new_documents(tmp_path):
+    from src.semche.token_cache import TokenCache
+
+    calls = []
+    cache = TokenCache(tmp_path / "tokens.sqlite3")
+    encoder = BM25SparseEncoder(
+        tokenizer=_counting_tokenizer(calls), tokenizer_signature="split-v1", token_cache=cache
+    )
+    encoder.build_index(["Python programming", "JavaScript coding"], ["d1", "d2"])
+    assert len(calls) == 2
+
+    calls.clear()
+    encoder.add_documents(["Machine learning"], ["d3"])
+    assert calls == ["Machine learning"]
+    assert encoder.search("Python", top_k=1)[0]["id"] == "d1"
+
+    # A different tokenizer signature does not reuse cached tokens
+    calls.clear()
+    other = BM25SparseEncoder(
+        tokenizer=_counting_tokenizer(calls), tokenizer_signature="split-v2", token_cache=cache
+    )
+    other.build_index(["Python programming"], ["d1"])
+    assert calls == ["Python programming"]
+
+
+def test_token_cache_requires_signature_for_custom_tokenizer(tmp_path):
+    from src.semche.token_cache import TokenCache
+
+    calls = []
+    cache = TokenCache(tmp_path / "tokens.sqlite3")
+    encoder = BM25SparseEncoder(tokenizer=_counting_tokenizer(calls), token_cache=cache)
+    encoder.build_index(["Python programming"], ["d1"])
+    encoder.build_index(["Python programming"], ["d1"])
+
+    assert len(calls) == 2
+    assert cache.count() == 0
+
+
+def test_token_cache_error_falls_back_to_tokenizer(tmp_path):
+    from src.semche.token_cache import TokenCache
+
+    (tmp_path / "broken.sqlite3").mkdir()
+    encoder = BM25SparseEncoder(
+        tokenizer=str.split, tokenizer_signature="split", token_cache=TokenCache(tmp_path / "broken.sqlite3")
+    )
+
+    encoder.build_index(["Python programming", "JavaScript coding", "Machine learning"], ["d1", "d2", "d3"])
+
+    assert encoder.search("Python", top_k=1)[0]["id"] == "d1"
+
+
+def test_mecab_tokenizer_has_cache_signature():
+    encoder = BM25SparseEncoder()
+
+    assert encoder.tokenizer_signature.startswith("mecab-")
+
+
+def test_parallel_tokenization_matches_serial():
+    """Process-pool tokenization (one MeCab tagger per worker) keeps order and output"""
+    from src.semche.sparse_encoder import PARALLEL_MIN_DOCUMENTS
+
+    documents = [f"文書{i}は機械学習と検索について説明します。番号{i % 7}" for i in range(PARALLEL_MIN_DOCUMENTS + 10)]
+    serial = BM25SparseEncoder()
+    parallel = BM25SparseEncoder(tokenize_workers=2)
+
+    assert parallel.tokenize_documents(documents) == serial.tokenize_documents(documents)
+
+
+def test_parallel_tokenization_unpicklable_tokenizer_falls_back():
+    from src.semche.sparse_encoder import PARALLEL_MIN_DOCUMENTS
+
+    documents = [f"doc {i} text" for i in range(PARALLEL_MIN_DOCUMENTS)]
+    encoder = BM25SparseEncoder(tokenizer=lambda text: text.split(), tokenize_workers=2)
+
+    tokens = encoder.tokenize_documents(documents)
+
+    assert tokens[5] == ["doc", "5", "text"]
+
+
+def test_parallel_tokenization_custom_tokenizer():
+    from src.semche.sparse_encoder import PARALLEL_MIN_DOCUMENTS
+
+    documents = [f"doc {i} text" if i % 3 else "" for i in range(PARALLEL_MIN_DOCUMENTS)]
+    encoder = BM25SparseEncoder(tokenizer=str.split, tokenize_workers=2)
+
+    tokens = encoder.tokenize_documents(documents)
+
+    assert tokens[:3] == [[], ["doc", "1", "text"], ["doc", "2", "text"]]
+    assert len(tokens) == len(documents)
+
+
+def test_resolve_workers():
+    import os
+
+    from src.semche.sparse_encoder import resolve_workers
+
+    assert resolve_workers(None) == 1
+    assert resolve_workers(3) == 3
+    assert resolve_workers(0) == (os.cpu_count() or 1)
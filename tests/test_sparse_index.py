@@ -0,0 +1,370 @@
+"""Tests for sparse_index.py (persistent BM25 index kept in sync with ChromaDB)"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from src.semche.chromadb_manager import ChromaDBManager
+from src.semche.sparse_index import SparseIndex, SparseIndexError
+
+
+def _save(mgr, docs):
+    """Save {id: text} to ChromaDB with dummy vectors (no embedding model needed)."""
+    ids = list(docs)
+    mgr.save(
+        embeddings=[[0.1, 0.2, 0.3] for _ in ids],
+        documents=[docs[i] for i in ids],
+        filepaths=ids,
+    )
+
+
+@pytest.fixture
+def mgr(tmp_path):
+    return ChromaDBManager(persist_directory=str(tmp_path / "chroma"))
+
+
+def test_load_builds_from_chroma_and_persists(mgr):
+    _save(mgr, {
+        "/a": "Python programming language",
+        "/b": "JavaScript web development",
+        "/c": "Machine learning basics",
+    })
+
+    index = SparseIndex(mgr)
+    res = index.load()
+
+    assert res["status"] == "success"
+    assert res["rebuilt"] is True
+    assert index.count == 3
+
+    # A second instance loads the saved files without rebuilding
+    index2 = SparseIndex(mgr)
+    res2 = index2.load()
+    assert res2["rebuilt"] is False
+    assert index2.search("Python", top_k=1)[0]["id"] == "/a"
+
+
+def test_load_rebuilds_when_out_of_sync(mgr):
+    _save(mgr, {"/a": "Python programming language"})
+    SparseIndex(mgr).load()
+
+    # Written to ChromaDB behind the index's back
+    _save(mgr, {"/b": "JavaScript web development"})
+
+    index = SparseIndex(mgr)
+    res = index.load()
+    assert res["rebuilt"] is True
+    assert index.count == 2
+
+
+def test_upsert_adds_and_replaces(mgr):
+    index = SparseIndex(mgr)
+    index.upsert(["Python programming language"], ["/a"])
+    index.upsert(["JavaScript web development"], ["/b"])
+    assert index.count == 2
+
+    # Replacing a document drops its old terms
+    index.upsert(["Rust systems programming"], ["/a"])
+    assert index.count == 2
+    assert all(r["id"] != "/a" or r["score"] <= 0 for r in index.search("Python", top_k=2))
+    assert index.search("Rust", top_k=1)[0]["id"] == "/a"
+
+
+def test_remove(mgr):
+    index = SparseIndex(mgr)
+    index.upsert(
+        ["Python programming language", "JavaScript web development", "Machine learning basics"],
+        ["/a", "/b", "/c"],
+    )
+
+    res = index.remove(["/a", "/unknown"])
+    assert res["removed_count"] == 1
+    assert index.count == 2
+    assert index.search("Python", top_k=5) == []
+    assert [r["id"] for r in index.search("JavaScript", top_k=5)] == ["/b"]
+
+    # Removing the last documents leaves an empty, searchable index
+    index.remove(["/b", "/c"])
+    assert index.count == 0
+    assert index.search("Python", top_k=5) == []
+
+
+def test_reloads_changes_from_other_instance(mgr):
+    _save(mgr, {"/a": "Python programming language", "/c": "Machine learning basics"})
+    server = SparseIndex(mgr)
+    server.load()
+
+    # e.g. doc-update running in another process: ChromaDB first, then the index
+    _save(mgr, {"/b": "JavaScript web development"})
+    cli = SparseIndex(mgr)
+    cli.upsert(["JavaScript web development"], ["/b"])
+
+    assert server.search("JavaScript", top_k=1)[0]["id"] == "/b"
+    assert server.count == 3
+
+
+def test_first_write_after_chroma_write_does_not_rebuild(mgr, monkeypatch):
+    _save(mgr, {"/a": "Python programming language", "/b": "JavaScript web development"})
+    SparseIndex(mgr).load()
+
+    def full_fetch(*args, **kwargs):
+        raise AssertionError("the index must not be rebuilt from every ChromaDB document")
+
+    monkeypatch.setattr(mgr, "get_all_documents", full_fetch)
+
+    # A fresh process (doc-update, or the server's first put_document): ChromaDB first, then the index
+    _save(mgr, {"/c": "Rust systems programming", "/a": "Python language reference"})
+    index = SparseIndex(mgr)
+    index.upsert(["Rust systems programming", "Python language reference"], ["/c", "/a"])
+    assert index.count == 3
+    assert index.search("Rust", top_k=1)[0]["id"] == "/c"
+
+    mgr.delete(["/b"])
+    index = SparseIndex(mgr)
+    assert index.remove(["/b"])["removed_count"] == 1
+    assert index.count == 2
+
+
+def test_concurrent_writer_is_not_lost(mgr):
+    _save(mgr, {"/a": "Python programming language"})
+    server = SparseIndex(mgr, background_merge=False)
+    server.load()
+    cli = SparseIndex(mgr, background_merge=False)
+    cli.load()
+
+    tokenize_documents = cli.encoder.tokenize_documents
+    raced = []
+
+    def tokenize_while_server_writes(documents):
+        if not raced:
+            # The server commits a write while doc-update is still tokenizing
+            raced.append(True)
+            _save(mgr, {"/b": "JavaScript web development"})
+            server.upsert(["JavaScript web development"], ["/b"])
+        return tokenize_documents(documents)
+
+    cli.encoder.tokenize_documents = tokenize_while_server_writes
+    _save(mgr, {"/c": "Rust systems programming"})
+    cli.upsert(["Rust systems programming"], ["/c"])
+
+    assert server.search("JavaScript", top_k=1)[0]["id"] == "/b"
+    assert server.search("Rust", top_k=1)[0]["id"] == "/c"
+    assert server.count == 3
+    assert SparseIndex(mgr).load() == {
+        "status": "success", "directory": server.directory, "count": 3, "rebuilt": False,
+    }
+
+
+def test_invalidate_triggers_rebuild(mgr):
+    _save(mgr, {"/a": "Python programming language"})
+    index = SparseIndex(mgr)
+    index.upsert(["stale text"], ["/a"])
+
+    index.invalidate()
+    assert index.search("Python", top_k=1)[0]["id"] == "/a"
+
+
+def test_upsert_length_mismatch(mgr):
+    index = SparseIndex(mgr)
+    with pytest.raises(SparseIndexError, match="Length mismatch"):
+        index.upsert(["a", "b"], ["/a"])
+
+
+def test_search_filters_by_file_type_without_chroma_fetch(mgr, monkeypatch):
+    mgr.save(
+        embeddings=[[0.1, 0.2, 0.3]] * 3,
+        documents=["Python programming language", "Python web scraping", "Rust systems programming"],
+        filepaths=["/docs/a", "/memo/b", "/docs/c"],
+        file_types=["doc", "memo", "doc"],
+    )
+    index = SparseIndex(mgr, tokenizer=str.split, background_merge=False)
+    index.load()
+    index.upsert(["Python language reference"], ["/docs/d"], ["doc"])
+
+    def full_fetch(*args, **kwargs):
+        raise AssertionError("filtered searches must not fetch documents from ChromaDB")
+
+    monkeypatch.setattr(mgr, "get_all_documents", full_fetch)
+    assert {r["id"] for r in index.search("Python", top_k=5, file_type="doc")} == {"/docs/a", "/docs/d"}
+    assert [r["id"] for r in index.search("Python", top_k=5, id_prefix="/memo/")] == ["/memo/b"]
+
+
+def test_load_rebuilds_index_without_file_types(mgr):
+    mgr.save(
+        embeddings=[[0.1, 0.2, 0.3]], documents=["Python programming"], filepaths=["/a"], file_types=["doc"]
+    )
+    index = SparseIndex(mgr, tokenizer=str.split)
+    index.load()
+    # As written by a version without file types
+    manifest_path = Path(index.directory) / "bm25_metadata.json"
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    manifest["format_version"] = 3
+    manifest_path.write_text(json.dumps(manifest), encoding="utf-8")
+
+    reloaded = SparseIndex(mgr, tokenizer=str.split)
+    assert reloaded.load()["rebuilt"] is True
+    assert [r["id"] for r in reloaded.search("Python", top_k=1, file_type="doc")] == ["/a"]
+
+
+def test_tokenizer_is_recorded_and_kept_per_collection(mgr, monkeypatch):
+    _save(mgr, {
+        "/a": "形態素解析でテキストを分割します",
+        "/b": "ベクトル検索の結果を統合します",
+        "/c": "Plain English text",
+    })
+    SparseIndex(mgr, tokenizer="ngram").load()
+    manifest = json.loads((Path(mgr.persist_directory) / "sparse_index" / "bm25_metadata.json").read_text())
+    assert manifest["tokenizer"]["name"] == "ngram"
+
+    # No explicit choice: the recorded tokenizer is used without a rebuild
+    index = SparseIndex(mgr)
+    assert index.load()["rebuilt"] is False
+    assert index.encoder.tokenizer_name == "ngram"
+    assert index.search("形態素", top_k=1)[0]["id"] == "/a"
+
+    # An explicit choice that differs rebuilds the index with it
+    index = SparseIndex(mgr, tokenizer="mecab")
+    assert index.load()["rebuilt"] is True
+    assert index.encoder.tokenizer_name == "mecab"
+    monkeypatch.setenv("SEMCHE_SPARSE_TOKENIZER", "ngram")
+    assert SparseIndex(mgr).load()["rebuilt"] is True
+
+
+def test_reload_adopts_tokenizer_chosen_by_other_instance(mgr):
+    _save(mgr, {"/a": "形態素解析でテキストを分割します", "/c": "Plain English text"})
+    index = SparseIndex(mgr, background_merge=False)
+    index.load()
+    assert index.encoder.tokenizer_name == "mecab"
+
+    SparseIndex(mgr, tokenizer="ngram", background_merge=False).load()
+    _save(mgr, {"/b": "ベクトル検索の結果を統合します"})
+    index.upsert(["ベクトル検索の結果を統合します"], ["/b"])
+    assert index.encoder.tokenizer_name == "ngram"
+    assert [r["id"] for r in index.search("ベクトル", top_k=1)] == ["/b"]
+
+
+def test_load_rebuilds_index_without_recorded_tokenizer(mgr):
+    _save(mgr, {"/a": "Python programming"})
+    SparseIndex(mgr).load()
+    # As written by a version that did not record the tokenizer
+    manifest_path = Path(mgr.persist_directory) / "sparse_index" / "bm25_metadata.json"
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    del manifest["tokenizer"]
+    manifest_path.write_text(json.dumps(manifest), encoding="utf-8")
+
+    assert SparseIndex(mgr).load()["rebuilt"] is True
+    assert SparseIndex(mgr).load()["rebuilt"] is False
+
+
+def test_rebuild_reuses_token_cache(mgr):
+    _save(mgr, {"/a": "Python programming language", "/b": "JavaScript web development"})
+    index = SparseIndex(mgr)
+    index.load()
+    assert index.token_cache.count() == 2
+
+    # Invalidation keeps the token cache; the rebuild prunes entries of changed documents
+    _save(mgr, {"/b": "Rust systems programming"})
+    index.invalidate()
+    index.load()
+    assert index.token_cache.count() == 2
+    assert index.search("Rust", top_k=1)[0]["id"] == "/b"
+
+
+def test_upsert_and_remove_only_tokenize_written_documents(mgr):
+    calls = []
+
+    def tokenize(text):
+        calls.append(text)
+        return text.lower().split()
+
+    _save(mgr, {"/a": "Python programming language", "/b": "JavaScript web development"})
+    index = SparseIndex(mgr, tokenizer=tokenize)
+    index.load()
+    calls.clear()
+
+    index.upsert(["Rust systems programming"], ["/c"])
+    index.remove(["/a"])
+
+    assert calls == ["Rust systems programming"]
+    assert index.count == 2
+    assert [r["id"] for r in index.search("programming", top_k=5)] == ["/c"]
+    reloaded = SparseIndex(mgr, tokenizer=tokenize)
+    assert reloaded.load()["rebuilt"] is False
+    assert sorted(reloaded.encoder.document_ids()) == ["/b", "/c"]
+
+
+def test_writes_add_segments_and_merge_keeps_results(mgr):
+    texts = {f"/{i}": f"document {i} about {'python' if i % 2 else 'rust'} topic{i % 5}" for i in range(12)}
+    index = SparseIndex(mgr, max_segments=3, background_merge=False)
+    for doc_id, text in texts.items():
+        index.upsert([text], [doc_id])
+    index.remove(["/1", "/4"])
+    assert len(index.encoder.bm25.segments) == 12
+    before = index.search("python topic3", top_k=5)
+
+    while index.merge():
+        pass
+
+    assert len(index.encoder.bm25.segments) <= 3
+    assert index.search("python topic3", top_k=5) == before
+    _save(mgr, {doc_id: text for doc_id, text in texts.items() if doc_id not in ("/1", "/4")})
+    reloaded = SparseIndex(mgr, background_merge=False)
+    assert reloaded.load()["rebuilt"] is False
+    assert len(reloaded.encoder.bm25.segments) == len(index.encoder.bm25.segments)
+    assert reloaded.search("python topic3", top_k=5) == before
+    # Files of merged segments were removed
+    segment_names = {seg.name for seg in index.encoder.bm25.segments}
+    on_disk = {p.name.split("-")[2] for p in Path(index.directory).glob("bm25-seg-*.npy")}
+    assert on_disk == segment_names
+
+
+def test_background_merge(mgr):
+    index = SparseIndex(mgr, max_segments=2)
+    for i in range(6):
+        index.upsert([f"python note {i}"], [f"/{i}"])
+
+    assert index.wait_for_merge(timeout=30)
+    assert len(index.encoder.bm25.segments) <= 2
+    assert index.count == 6
+    assert {r["id"] for r in index.search("python", top_k=10)} == {f"/{i}" for i in range(6)}
+
+
+def test_compaction_reclaims_removed_slots_and_dead_terms(mgr):
+    index = SparseIndex(mgr, tokenizer=str.split, background_merge=False)
+    index.upsert([f"document {i} stable" for i in range(10)], [f"/{i}" for i in range(10)])
+    for n in range(30):
+        index.upsert([f"document 0 version{n}"], ["/0"])
+    bm25 = index.encoder.bm25
+    assert bm25.slot_count == 40
+    assert bm25.dead_term_count == 29
+
+    assert index.compact() is True
+    bm25 = index.encoder.bm25
+    assert bm25.slot_count == 10
+    assert bm25.dead_term_count == 0
+    assert len(index.encoder.corpus_ids) == 10
+    assert index.search("version29", top_k=1)[0]["id"] == "/0"
+    assert index.search("version3", top_k=1) == []
+    # Already compact: nothing to do
+    assert index.compact() is False
+
+    _save(mgr, {f"/{i}": f"document {i} stable" for i in range(1, 10)} | {"/0": "document 0 version29"})
+    reloaded = SparseIndex(mgr, tokenizer=str.split, background_merge=False)
+    assert reloaded.load()["rebuilt"] is False
+    assert reloaded.encoder.bm25.slot_count == 10
+    assert reloaded.search("version29", top_k=1)[0]["id"] == "/0"
+
+
+def test_background_compaction_bounds_index_size(mgr):
+    index = SparseIndex(mgr)
+    index.upsert([f"note {i}" for i in range(5)], [f"/{i}" for i in range(5)])
+    for n in range(100):
+        index.upsert([f"note 0 rev{n}"], ["/0"])
+    assert index.wait_for_merge(timeout=30)
+
+    bm25 = index.encoder.bm25
+    assert bm25.slot_count <= 2 * index.count
+    assert bm25.dead_term_count <= bm25.vocab_size // 2
+    assert index.count == 5
+    assert index.search("rev99", top_k=1)[0]["id"] == "/0"
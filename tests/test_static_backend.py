@@ -0,0 +1,95 @@
+"""Tests for static_backend.py (static token-table embedding backend)"""
+
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("tokenizers")
+
+from src.semche.chromadb_manager import ChromaDBManager  # noqa: E402
+from src.semche.embedding import Embedder  # noqa: E402
+from src.semche.static_backend import (  # noqa: E402
+    CONFIG_FILENAME,
+    EMBEDDINGS_FILENAME,
+    distill_static,
+    load_static_embeddings,
+    similarity_correlation,
+)
+
+TEXTS = ["猫が好きです。", "python programming language", "a much longer text " * 20, "x"]
+
+
+@pytest.fixture(scope="module")
+def static_dir(tiny_model, tmp_path_factory):
+    return distill_static(tiny_model, tmp_path_factory.mktemp("static"), dims=16)
+
+
+def test_distill_writes_table_and_config(tiny_model, static_dir):
+    from sentence_transformers import SentenceTransformer
+
+    tokenizer = SentenceTransformer(tiny_model, device="cpu").tokenizer
+    table = np.load(static_dir / EMBEDDINGS_FILENAME)
+    config = json.loads((static_dir / CONFIG_FILENAME).read_text(encoding="utf-8"))
+
+    assert table.shape == (len(tokenizer), 16)
+    assert table.dtype == np.float32
+    assert config["model_name"] == tiny_model
+    assert config["dims"] == 16
+    assert sorted(config["special_ids"]) == sorted(set(tokenizer.all_special_ids))
+    assert not table[config["special_ids"]].any()
+    assert -1.0 <= config["similarity_correlation"] <= 1.0
+
+
+def test_encode_is_mean_of_token_rows(tiny_model, static_dir):
+    from sentence_transformers import SentenceTransformer
+
+    tokenizer = SentenceTransformer(tiny_model, device="cpu").tokenizer
+    embeddings = load_static_embeddings(tiny_model, static_dir)
+    table = np.load(static_dir / EMBEDDINGS_FILENAME)
+
+    matrix = embeddings._client.encode(TEXTS)
+    assert matrix.shape == (len(TEXTS), 16)
+    for text, row in zip(TEXTS, matrix):
+        ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+        # Unknown tokens ([UNK] for "が", "で", ...) are left out of the mean
+        ids = [i for i in ids if i != tokenizer.unk_token_id]
+        np.testing.assert_allclose(row, table[ids].mean(axis=0), atol=1e-6)
+    # No sequence limit: the long text is not truncated to max_seq_length
+    np.testing.assert_allclose(embeddings._client.encode(TEXTS[2]), matrix[2], atol=1e-6)
+    np.testing.assert_allclose(embeddings.embed_query(TEXTS[3]), matrix[3], atol=1e-6)
+    # Texts with no known token embed to zeros
+    assert not embeddings._client.encode("??").any()
+
+
+def test_similarity_correlation():
+    a = np.array([[1.0, 0.0], [0.8, 0.6], [0.0, 1.0]])
+    assert similarity_correlation(a, a * 3) == pytest.approx(1.0)
+    assert similarity_correlation(a, a[:, ::-1]) == pytest.approx(1.0)
+    assert similarity_correlation(a, np.array([[1.0, 0.0], [-0.6, 0.8], [0.0, 1.0]])) < 0.5
+
+
+def test_embedder_static_backend(tiny_model, tmp_path, monkeypatch):
+    monkeypatch.setenv("SEMCHE_STATIC_DIR", str(tmp_path))
+
+    embedder = Embedder(model_name=tiny_model, backend="static", query_cache_size=0)
+
+    assert embedder.cache_model_name == f"{tiny_model}#static"
+    assert embedder.embedding_space == f"{tiny_model}#static"
+    assert Embedder(model_name=tiny_model, backend="torch").embedding_space == tiny_model
+    matrix = embedder.embed_batch(TEXTS, batch_size=2)
+    np.testing.assert_allclose(embedder.embed_query(TEXTS[0]), matrix[0], atol=1e-6)
+    assert embedder.embed_query(TEXTS[0]).dtype == np.float32
+
+    # Collections record the backend family they were built with
+    mgr = ChromaDBManager(
+        persist_directory=str(tmp_path / "chroma"),
+        embedding_function=embedder.embeddings,
+        embedding_space=embedder.embedding_space,
+        embedding_backend=embedder.backend,
+    )
+    mgr.save(embeddings=matrix, documents=TEXTS, filepaths=[f"/t/{i}" for i in range(len(TEXTS))])
+    assert mgr.recorded_embedding() == {"space": f"{tiny_model}#static", "backend": "static"}
+    result = mgr.query(embedder.embed_query(TEXTS[1]).reshape(1, -1), top_k=1)
+    assert result["results"][0]["filepath"] == "/t/1"
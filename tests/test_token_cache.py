@@ -0,0 +1,54 @@
+"""Tests for token_cache.py (persistent tokenization cache)"""
+
+import pytest
+
+from src.semche.token_cache import TokenCache, TokenCacheError, cache_key
+
+
+def test_cache_key_depends_on_signature_and_text():
+    assert cache_key("mecab", "猫が好き") == cache_key("mecab", "猫が好き")
+    assert cache_key("mecab", "猫が好き") != cache_key("mecab", "犬が好き")
+    assert cache_key("mecab", "text") != cache_key("split", "text")
+
+
+def test_put_and_get_many(tmp_path):
+    cache = TokenCache(tmp_path / "tokens.sqlite3")
+    cache.put_many([("k1", ["私", "は", "猫"]), ("k2", [])])
+
+    found = cache.get_many(["k1", "k2", "missing", "k1"])
+
+    assert found == {"k1": ["私", "は", "猫"], "k2": []}
+    assert cache.count() == 2
+    cache.close()
+
+    # Persisted across instances
+    assert TokenCache(tmp_path / "tokens.sqlite3").get_many(["k1"]) == {"k1": ["私", "は", "猫"]}
+
+
+def test_get_many_large_batch(tmp_path):
+    cache = TokenCache(tmp_path / "tokens.sqlite3")
+    cache.put_many((f"k{i}", [str(i)]) for i in range(1200))
+
+    found = cache.get_many([f"k{i}" for i in range(1200)])
+
+    assert len(found) == 1200
+    assert found["k1199"] == ["1199"]
+
+
+def test_retain(tmp_path):
+    cache = TokenCache(tmp_path / "tokens.sqlite3")
+    cache.put_many([("a", ["x"]), ("b", ["y"]), ("c", ["z"])])
+
+    removed = cache.retain(["a", "c", "unknown"])
+
+    assert removed == 1
+    assert set(cache.get_many(["a", "b", "c"])) == {"a", "c"}
+
+
+def test_unusable_path(tmp_path):
+    # A directory cannot be opened as a database
+    (tmp_path / "dir.sqlite3").mkdir()
+    cache = TokenCache(tmp_path / "dir.sqlite3")
+
+    with pytest.raises(TokenCacheError):
+        cache.get_many(["k"])